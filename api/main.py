@@ -2,21 +2,27 @@
 
 import os
 import sys
-import shutil
-from typing import List
+import json
+import uuid
+import asyncio
+from datetime import datetime
+from typing import List, Optional
 
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
-from fastapi import FastAPI, File, UploadFile, HTTPException
-from fastapi.responses import JSONResponse
+from fastapi import FastAPI, File, UploadFile, HTTPException, Header, Request
+from fastapi.responses import JSONResponse, StreamingResponse
 from pydantic import BaseModel
 from dotenv import load_dotenv
 
-from src.agents.ingestion_agent import IngestionAgent
-from src.agents.processing import TextProcessing
-from src.agents.embedding_agent import EmbeddingAgent
-from src.agents.coordinator_agent import CoordinatorAgent
-from src.vector_store.chroma_db import ChromaDBHandler
+from src.agents.ingestion_agent import extract_and_chunk_file
+from src.agents.ingestion_pipeline import IngestionPipeline
+from src.registry import registry
+from src.tenants import normalize_tenant, InvalidTenantError, MigrationRunningError
+from src.vector_store.fingerprint import EmbeddingMismatchError
+from src.vector_store.manifest import chunk_id, hash_file
+from src.executor import ExecutorBusyError
+from src.upload_store import UploadTooLargeError
 from src.exception import CustomException
 
 # --- Load environment variables from .env file ---
@@ -32,130 +38,706 @@ app = FastAPI(
 # --- Setup file and vectorstore directories ---
 UPLOAD_DIRECTORY = os.getenv("UPLOAD_DIR", "./data")
 PERSIST_DIRECTORY = os.getenv("CHROMA_DIR", "./vectorstore/chroma_db")
+INGEST_FILE_TIMEOUT = float(os.getenv("INGEST_FILE_TIMEOUT", "300"))  # Per-file parsing limit (seconds)
+INGEST_TIMEOUT = float(os.getenv("INGEST_TIMEOUT", "3600"))            # Whole-upload limit of ?wait=true uploads
+MIGRATION_START_TIMEOUT = float(os.getenv("MIGRATION_START_TIMEOUT", "600"))  # Loading a migration's target model
+# "stream": page-by-page pipeline with batched commits (flat memory)
+# "parallel": whole files parsed in worker processes, then stored in one go
+INGEST_MODE = os.getenv("INGEST_MODE", "stream")
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", str(500 * 1024 * 1024)))  # Per file
+MAX_UPLOAD_FILES = int(os.getenv("MAX_UPLOAD_FILES", "20"))                    # Per request
+MAX_BATCH_QUERIES = int(os.getenv("MAX_BATCH_QUERIES", "500"))                # Questions per /query/batch request
+MAX_BATCH_CONCURRENCY = int(os.getenv("MAX_BATCH_CONCURRENCY", "16"))          # Upper bound on a request's "concurrency"
 
 # Create necessary directories if they don't exist
 os.makedirs(UPLOAD_DIRECTORY, exist_ok=True)
 os.makedirs(PERSIST_DIRECTORY, exist_ok=True)
 
+# Concurrent uploads per tenant, so one tenant's bulk ingest cannot take over the shared pools
+TENANT_INGEST_CONCURRENCY = int(os.getenv("TENANT_INGEST_CONCURRENCY", "1"))
+
 # --- Initialize core components globally for reuse ---
 try:
-    # Load the embedding model
-    embedding_agent = EmbeddingAgent()
+    # Per-tenant collections, upload directories and answer caches, opened on demand
+    tenants = registry.get_tenants()
+
+    # Load the embedding model, the default collection and its coordinator once at startup
+    tenants.get().coordinator
 
-    # Load or create ChromaDB vector store
-    vector_store = ChromaDBHandler(persist_directory=PERSIST_DIRECTORY)
-    vector_store.create_or_load(embeddings=embedding_agent.embedding_model)
+    # Bounded thread/process pools so blocking work never runs on the event loop
+    executor = registry.get_executor()
 
-    # Coordinator agent orchestrates retrieval and generation
-    coordinator_agent = CoordinatorAgent()
+    # Persistent background ingestion jobs, drained by a bounded number of worker threads
+    job_queue = registry.get_job_queue()
+    job_workers = registry.get_job_workers()
 except Exception as e:
     # If something fails during startup, don't allow the app to run
     raise RuntimeError(f"Failed to initialize core components: {e}") from e
 
-# --- Pydantic model to validate query request payload ---
-class QueryRequest(BaseModel):
-    query: str
+# Tenant name -> semaphore limiting that tenant's concurrent uploads
+_ingest_slots = {}
 
-# --- Upload and process documents ---
-@app.post("/upload-and-process")
-async def upload_and_process_files(files: List[UploadFile] = File(...)):
+
+@app.on_event("startup")
+def start_job_workers():
+    # Requeue jobs interrupted by the last shutdown and start draining the queue
+    job_workers.start()
+
+
+@app.on_event("shutdown")
+def shutdown_executor():
+    # Stop worker threads/processes and close open collections when the server shuts down
+    # (jobs still running are resumed on the next start)
+    job_workers.stop()
+    executor.shutdown()
+    tenants.close_all()
+
+
+def _root_cause(e: Exception) -> Exception:
+    # CustomException keeps the exception it wraps as its first argument
+    while isinstance(e, CustomException) and e.args and isinstance(e.args[0], Exception):
+        e = e.args[0]
+    return e
+
+
+def _raise_for_executor_error(e: Exception):
     """
-    Upload documents, extract text, chunk them, embed them, and store in vector database.
+    Maps execution-layer failures to HTTP errors; anything else is re-raised as CustomException.
     """
-    if not files:
-        raise HTTPException(status_code=400, detail="No files uploaded.")
+    if isinstance(e, HTTPException):
+        raise e
+    cause = _root_cause(e)
+    if isinstance(cause, (EmbeddingMismatchError, MigrationRunningError)):
+        raise HTTPException(status_code=409, detail=str(cause))
+    if isinstance(e, InvalidTenantError):
+        raise HTTPException(status_code=400, detail=str(e))
+    if isinstance(e, UploadTooLargeError):
+        raise HTTPException(status_code=413, detail=str(e))
+    if isinstance(e, ExecutorBusyError):
+        raise HTTPException(status_code=503, detail=str(e))
+    if isinstance(e, asyncio.TimeoutError):
+        raise HTTPException(status_code=504, detail="The request took too long to process.")
+    raise CustomException(e, sys)
+
+
+def normalize_tenant_or_400(tenant: str = None) -> str:
+    # Validated tenant name (the default tenant when empty); invalid names are a client error
+    try:
+        return normalize_tenant(tenant)
+    except InvalidTenantError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
 
-    saved_file_paths = []        # To keep track of saved files
-    all_extracted_text = ""      # To store extracted raw text for response
+async def _acquire_workspace(tenant: str = None):
+    """
+    Opens (if needed) and pins the tenant's workspace for the duration of a request.
+    Callers must pass it to _release_workspace when done.
+    """
+    return await executor.run_io(tenants.acquire, normalize_tenant_or_400(tenant))
 
-    # Save uploaded files to disk
-    for file in files:
-        file_path = os.path.join(UPLOAD_DIRECTORY, file.filename)
+
+async def _release_workspace(workspace):
+    # Unpinning may close idle workspaces (saves their BM25 index), so it runs in the I/O pool
+    await executor.run_io(tenants.release, workspace)
+
+
+class _LeasedStreamingResponse(StreamingResponse):
+    """
+    StreamingResponse that keeps a workspace pinned until the response is over, and unpins it
+    even when the body is never iterated (e.g., the client left before the first event).
+    """
+
+    def __init__(self, content, workspace, **kwargs):
+        super().__init__(content, **kwargs)
+        self.workspace = workspace
+
+    async def __call__(self, scope, receive, send):
         try:
-            with open(file_path, "wb") as buffer:
-                shutil.copyfileobj(file.file, buffer)
-            saved_file_paths.append(file_path)
+            await super().__call__(scope, receive, send)
         finally:
-            file.file.close()
+            # Shielded so a cancelled request still releases its lease
+            await asyncio.shield(_release_workspace(self.workspace))
+
+
+def _sse_response(workspace, messages) -> StreamingResponse:
+    """
+    Streams coordinator messages as Server-Sent Events while the workspace stays pinned.
+    Failures after the headers are sent are reported as a final "ERROR" event.
+    """
+    async def event_stream():
+        try:
+            async for message in messages:
+                yield f"data: {json.dumps({'type': message['type'], **message['payload']})}\n\n"
+        except Exception as e:
+            yield f"data: {json.dumps({'type': 'ERROR', 'detail': str(e)})}\n\n"
+
+    return _LeasedStreamingResponse(
+        event_stream(),
+        workspace,
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}  # Disable proxy buffering
+    )
+
+
+@app.middleware("http")
+async def limit_upload_size(request: Request, call_next):
+    # Reject oversized uploads from the Content-Length header, before the body is read and parsed
+    if request.url.path == "/upload-and-process":
+        length = request.headers.get("content-length")
+        if length and length.isdigit() and int(length) > MAX_UPLOAD_BYTES * MAX_UPLOAD_FILES:
+            return JSONResponse(status_code=413, content={"detail": "Upload is too large."})
+    return await call_next(request)
+
+
+def _save_upload(file: UploadFile, workspace, snapshot: str) -> dict:
+    # Streams one upload into the workspace's content-addressed store, hashing it on the way (I/O pool)
+    try:
+        return workspace.uploads.save(file.file, file.filename, max_bytes=MAX_UPLOAD_BYTES, snapshot=snapshot)
+    finally:
+        file.file.close()
+
+
+async def _save_uploads(files: List[UploadFile], workspace) -> list:
+    """
+    Saves every uploaded file and marks the ones whose identical content is already indexed
+    under the same name, so they are never parsed or embedded again.
+
+    Files to ingest are read from per-request snapshots ("snapshot" path), so a later upload under
+    the same name cannot swap the bytes behind their recorded hash; unchanged files need none.
+
+    Output:
+        list: One UploadStore.save() record per file, plus "unchanged" (bool).
+    """
+    if len(files) > MAX_UPLOAD_FILES:
+        raise HTTPException(status_code=413, detail=f"At most {MAX_UPLOAD_FILES} files per upload.")
+    token = uuid.uuid4().hex
+    saved = []
+    try:
+        for file in files:
+            record = await executor.run_io(_save_upload, file, workspace, token)
+            record["unchanged"] = workspace.vector_store.file_unchanged(record["filename"], record["sha256"])
+            if record["unchanged"]:
+                _release_snapshots(workspace, [record])
+            saved.append(record)
+    except BaseException:
+        _release_snapshots(workspace, saved)
+        raise
+    return saved
+
+
+def _release_snapshots(workspace, saved: list):
+    # Drops the snapshots of records that will not (or no longer) be ingested
+    for record in saved:
+        if record.get("snapshot"):
+            workspace.uploads.release_snapshot(record["snapshot"])
+            record["snapshot"] = None
+
+
+def _upload_summary(saved: list) -> list:
+    # What the client is told about each stored file
+    return [{k: record[k] for k in ("filename", "sha256", "bytes", "duplicate", "replaced", "unchanged")}
+            for record in saved]
+
+
+async def _extract_and_chunk(path: str, slots: asyncio.Semaphore):
+    """
+    Parses and chunks one file in the process pool.
+
+    Args:
+        path (str): Saved file path.
+        slots (asyncio.Semaphore): Limits how many files of one upload are queued at once,
+                                   so large uploads wait instead of hitting the queue limit.
 
+    Output:
+        tuple: (path, (filename, text, docs) or None, error message or None)
+    """
     try:
-        # Step 1: Extract raw text using the ingestion agent
-        ingestion_agent = IngestionAgent()
-        extracted_data = ingestion_agent.ingest_files(saved_file_paths)
+        async with slots:
+            result = await executor.run_cpu(extract_and_chunk_file, path, 500, 50, timeout=INGEST_FILE_TIMEOUT)
+        return path, result, None
+    except ExecutorBusyError:
+        raise
+    except asyncio.TimeoutError:
+        return path, None, f"Timed out after {INGEST_FILE_TIMEOUT}s."
+    except Exception as e:
+        return path, None, str(e)
+
+
+# --- Pydantic models to validate query request payloads ---
+class SearchOptions(BaseModel):
+    mmr: Optional[bool] = None             # Diversify chunks with maximal marginal relevance (default: SEARCH_MMR)
+    max_per_source: Optional[int] = None   # Cap chunks per source file (default: MAX_CHUNKS_PER_SOURCE, 0 = no cap)
+    sources: Optional[List[str]] = None    # Only search these uploaded files
+    file_types: Optional[List[str]] = None # Only search these file types, e.g. ["pdf", "docx"]
+    ingested_after: Optional[datetime] = None
+    ingested_before: Optional[datetime] = None
+
+    def filters(self) -> dict:
+        # Type / date filters in the form expected by the retrieval layer
+        return {
+            "file_types": self.file_types,
+            "ingested_after": self.ingested_after.timestamp() if self.ingested_after else None,
+            "ingested_before": self.ingested_before.timestamp() if self.ingested_before else None,
+        }
+
+class QueryRequest(SearchOptions):
+    query: str
 
-        # Step 2: Process text into chunked documents
-        all_docs = []
-        text_processor = TextProcessing(chunk_size=500, chunk_overlap=50)
+class BatchQueryRequest(SearchOptions):
+    queries: List[str]                     # Questions answered with the same options
+    concurrency: Optional[int] = None      # Concurrent LLM calls (default: BATCH_LLM_CONCURRENCY)
 
-        for filename, text in extracted_data.items():
-            all_extracted_text += f"--- {filename} ---\n{text}\n\n"
-            docs = text_processor.process(text, metadata={"source": filename})
-            all_docs.extend(docs)
+class MigrationRequest(BaseModel):
+    model_name: str                        # HuggingFace model to re-embed with
+    backend: Optional[str] = None          # "huggingface" or "onnx" (default: EMBEDDING_BACKEND)
+    batch_size: Optional[int] = None       # Chunks per step (default: MIGRATION_BATCH_SIZE)
+    duty_cycle: Optional[float] = None     # Share of time spent migrating (default: MIGRATION_DUTY_CYCLE)
 
-        if not all_docs:
+# --- Upload and process documents ---
+@app.post("/upload-and-process")
+async def upload_and_process_files(files: List[UploadFile] = File(...), wait: bool = False,
+                                   x_tenant_id: Optional[str] = Header(default=None)):
+    """
+    Upload documents, extract text, chunk them, embed them, and store in vector database.
+    Documents go to the workspace named by the X-Tenant-ID header (default workspace if absent).
+
+    By default the files are saved and a background job is queued; the response (202) carries
+    the job ID to poll at /jobs/{job_id}. With ?wait=true the whole pipeline runs inside the request.
+    """
+    if not files:
+        raise HTTPException(status_code=400, detail="No files uploaded.")
+
+    workspace = None
+    try:
+        workspace = await _acquire_workspace(x_tenant_id)
+
+        if not wait:
+            saved = await _save_uploads(files, workspace)
+            # Identical re-uploads cost one hash pass: no job, no parsing, no embedding
+            to_ingest = [record for record in saved if not record["unchanged"]]
+            if not to_ingest:
+                return {
+                    "message": "All files are unchanged and already indexed.",
+                    "job_id": None,
+                    "uploads": _upload_summary(saved)
+                }
+            # The job owns the snapshots from here on and releases them when it finishes
+            try:
+                job_id = await executor.run_io(
+                    job_queue.enqueue, workspace.name,
+                    [record["snapshot"] for record in to_ingest],
+                    {record["snapshot"]: record["sha256"] for record in to_ingest}
+                )
+            except BaseException:
+                _release_snapshots(workspace, to_ingest)
+                raise
+            job_workers.notify()
+            return JSONResponse(
+                status_code=202,
+                content={
+                    "message": f"Queued {len(to_ingest)} of {len(saved)} files for processing.",
+                    "job_id": job_id,
+                    "status_url": f"/jobs/{job_id}",
+                    "uploads": _upload_summary(saved)
+                }
+            )
+
+        slots = _ingest_slots.setdefault(workspace.name, asyncio.Semaphore(TENANT_INGEST_CONCURRENCY))
+        async with slots:
+            # Save uploaded files to the tenant's upload store (hashed while writing)
+            saved = await _save_uploads(files, workspace)
+            saved_file_paths = [record["snapshot"] or record["path"] for record in saved]
+            file_hashes = {record["snapshot"] or record["path"]: record["sha256"] for record in saved}
+
+            # Extract, chunk, embed and store (from the snapshots, released once done)
+            try:
+                if INGEST_MODE == "parallel":
+                    processed_files, failed_files, all_extracted_text, chunk_count = await _ingest_parallel(
+                        workspace.vector_store, saved_file_paths, file_hashes
+                    )
+                else:
+                    processed_files, failed_files, all_extracted_text, chunk_count = await _ingest_stream(
+                        workspace.vector_store, saved_file_paths, file_hashes
+                    )
+            finally:
+                _release_snapshots(workspace, saved)
+
+        if not chunk_count:
             return JSONResponse(
                 status_code=200,
                 content={
                     "message": "Files were uploaded, but no text could be extracted or processed.",
-                    "extracted_text": all_extracted_text
+                    "extracted_text": all_extracted_text,
+                    "failed_files": failed_files
                 }
             )
 
-        # Step 3: Embed and store in vector database
-        vector_store.add_documents(all_docs)
-
         return {
-            "message": f"Successfully processed {len(saved_file_paths)} files.",
-            "filenames": [os.path.basename(p) for p in saved_file_paths],
+            "message": f"Successfully processed {len(processed_files)} of {len(saved_file_paths)} files.",
+            "filenames": processed_files,
+            "failed_files": failed_files,
+            "chunks": chunk_count,
             "extracted_text": all_extracted_text
         }
 
     except Exception as e:
-        raise CustomException(e, sys)
+        _raise_for_executor_error(e)
+    finally:
+        if workspace is not None:
+            await _release_workspace(workspace)
+
+
+async def _ingest_stream(vector_store, saved_file_paths: list, file_hashes: dict = None):
+    """
+    Streams the files through the extract -> chunk -> store pipeline (runs in the ingest pool).
+    Chunks become searchable batch by batch; only a preview of each file's text is kept.
+
+    Output:
+        tuple: (processed file names, failed files, extracted text preview, number of chunks indexed)
+    """
+    pipeline = IngestionPipeline(vector_store)
+    try:
+        summary = await executor.run_ingest(pipeline.run, saved_file_paths, file_hashes=file_hashes, timeout=INGEST_TIMEOUT)
+    except (asyncio.TimeoutError, asyncio.CancelledError):
+        # The worker thread is not interrupted by the timeout: stop the pipeline explicitly
+        pipeline.cancel()
+        raise
+
+    processed_files, failed_files, all_extracted_text = [], [], ""
+    for report in summary["files"]:
+        if report["error"] is not None:
+            failed_files.append({"filename": report["filename"], "error": report["error"]})
+            continue
+        if report["skipped"]:
+            all_extracted_text += f"--- {report['filename']} ---\n(unchanged, already indexed)\n\n"
+        else:
+            all_extracted_text += f"--- {report['filename']} ---\n{report['preview']}\n\n"
+        processed_files.append(report["filename"])
+    # Chunks now indexed for these files (unchanged files keep their existing chunks)
+    indexed = sum(
+        vector_store.manifest.get(r["filename"])["chunks"] if r["skipped"] else r["chunks"]
+        for r in summary["files"] if r["error"] is None
+    )
+    return processed_files, failed_files, all_extracted_text, indexed
+
+
+async def _ingest_parallel(vector_store, saved_file_paths: list, known_hashes: dict = None):
+    """
+    Parses and chunks every file in parallel worker processes, then stores all chunks.
+    Results are collected as each file finishes; a bad file is reported, not fatal.
+
+    Output:
+        tuple: (processed file names, failed files, extracted text, number of chunks indexed)
+    """
+    all_docs, processed_files, failed_files, all_extracted_text = [], [], [], ""
+    file_versions = {}   # filename -> (path, chunk IDs of the new version)
+    file_hashes = {}
+
+    # Unchanged re-uploads are skipped before parsing
+    to_parse = []
+    for path in saved_file_paths:
+        filename = os.path.basename(path)
+        file_hashes[filename] = (known_hashes or {}).get(path) or await executor.run_io(hash_file, path)
+        if vector_store.file_unchanged(filename, file_hashes[filename]):
+            all_extracted_text += f"--- {filename} ---\n(unchanged, already indexed)\n\n"
+            processed_files.append(filename)
+        else:
+            to_parse.append(path)
+
+    slots = asyncio.Semaphore(executor.cpu.workers)
+    for task in asyncio.as_completed([_extract_and_chunk(path, slots) for path in to_parse]):
+        path, result, error = await task
+        if error is not None:
+            failed_files.append({"filename": os.path.basename(path), "error": error})
+            continue
+        filename, text, docs = result
+        all_extracted_text += f"--- {filename} ---\n{text}\n\n"
+        all_docs.extend(docs)
+        processed_files.append(filename)
+        file_versions[filename] = (path, [chunk_id(filename, d.page_content) for d in docs])
+
+    if all_docs:
+        # Embed and store in vector database (ingest pool: a whole upload outlasts the I/O timeout)
+        await executor.run_ingest(vector_store.add_documents, all_docs)
+
+    # Drop chunks from previous versions of these files and record the new state
+    for filename, (path, chunk_ids) in file_versions.items():
+        await executor.run_io(
+            vector_store.commit_file, filename, file_hashes[filename], list(dict.fromkeys(chunk_ids)), os.path.getmtime(path)
+        )
+    return processed_files, failed_files, all_extracted_text, len(all_docs) + sum(
+        vector_store.manifest.get(name)["chunks"] for name in processed_files if name not in file_versions
+    )
+
+
+def _job_view(job: dict) -> dict:
+    # Public shape of a job: status, per-file progress, totals and (once finished) the extracted text preview
+    files = job["progress"]["files"]
+    finished = job["status"] in ("done", "failed")
+    return {
+        "job_id": job["id"],
+        "tenant": job["tenant"],
+        "status": job["status"],
+        "error": job["error"],
+        "attempts": job["attempts"],
+        "files_total": len(files),
+        "files_done": sum(1 for f in files if f["stage"] in ("stored", "skipped", "failed")),
+        "chunks": job["progress"]["chunks"],
+        "batches": job["progress"]["batches"],
+        "seconds": job["progress"].get("seconds"),
+        "created_at": job["created_at"],
+        "started_at": job["started_at"],
+        "finished_at": job["finished_at"],
+        "files": [{k: v for k, v in f.items() if k != "preview"} for f in files],
+        "failed_files": [{"filename": f["filename"], "error": f.get("error")} for f in files if f["stage"] == "failed"],
+        "extracted_text": "".join(
+            f"--- {f['filename']} ---\n"
+            + ("(unchanged, already indexed)" if f.get("skipped") else f.get("preview", "")) + "\n\n"
+            for f in files if f["stage"] in ("stored", "skipped")
+        ) if finished else None,
+    }
+
+
+# --- Background ingestion job status ---
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str, x_tenant_id: Optional[str] = Header(default=None)):
+    """
+    Status of an upload job: per-file stage (queued, extracting, extracted, stored, skipped, failed),
+    chunk counts and timings. Jobs are only visible to the workspace that queued them.
+    """
+    tenant = normalize_tenant_or_400(x_tenant_id)
+    try:
+        job = await executor.run_io(job_queue.get, job_id)
+    except Exception as e:
+        _raise_for_executor_error(e)
+    if job is None or job["tenant"] != tenant:
+        raise HTTPException(status_code=404, detail=f"Job {job_id} not found.")
+    return _job_view(job)
+
+
+@app.get("/jobs")
+async def list_jobs(limit: int = 20, x_tenant_id: Optional[str] = Header(default=None)):
+    """
+    Most recent upload jobs of the caller's workspace, newest first.
+    """
+    tenant = normalize_tenant_or_400(x_tenant_id)
+    try:
+        jobs = await executor.run_io(job_queue.list, tenant, min(max(limit, 1), 100))
+        return {"jobs": [{k: v for k, v in _job_view(job).items() if k != "extracted_text"} for job in jobs]}
+    except Exception as e:
+        _raise_for_executor_error(e)
 
 
 # --- Query previously processed documents ---
 @app.post("/query")
-async def handle_query(request: QueryRequest):
+async def handle_query(request: QueryRequest, x_tenant_id: Optional[str] = Header(default=None)):
     """
-    Submit a question and retrieve an answer based on uploaded documents.
+    Submit a question and retrieve an answer based on the documents of the caller's workspace.
     """
     if not request.query:
         raise HTTPException(status_code=400, detail="Query cannot be empty.")
 
+    workspace = None
     try:
-        # Delegate the query to the CoordinatorAgent, which handles retrieval + LLM response
-        result = coordinator_agent.handle_query(query=request.query)
+        workspace = await _acquire_workspace(x_tenant_id)
+
+        # Delegate the query to the tenant's CoordinatorAgent, which handles retrieval + LLM response
+        coordinator = await executor.run_io(lambda: workspace.coordinator)
+        result = await executor.run_io(
+            coordinator.handle_query, query=request.query, documents=request.sources,
+            mmr=request.mmr, max_per_source=request.max_per_source, filters=request.filters()
+        )
 
-        # Respond with both the generated answer and the source documents
+        # Respond with the generated answer, the source documents (with pages) and the context packing stats
         return {
             "answer": result["payload"]["answer"],
-            "sources": result["payload"]["sources"]
+            "sources": result["payload"]["sources"],
+            "citations": result["payload"]["citations"],
+            "context": result["payload"]["context"]
         }
 
     except Exception as e:
-        raise CustomException(e, sys)
+        _raise_for_executor_error(e)
+    finally:
+        if workspace is not None:
+            await _release_workspace(workspace)
 
 
-# --- Clear all stored data (embeddings and uploaded files) ---
+# --- Stream an answer token by token (Server-Sent Events) ---
+@app.post("/query/stream")
+async def handle_query_stream(request: QueryRequest, x_tenant_id: Optional[str] = Header(default=None)):
+    """
+    Same as /query, but streams the response as Server-Sent Events:
+    a "SOURCES" event first, then one "TOKEN" event per chunk of the answer, then "DONE".
+    """
+    if not request.query:
+        raise HTTPException(status_code=400, detail="Query cannot be empty.")
+
+    workspace = None
+    try:
+        workspace = await _acquire_workspace(x_tenant_id)
+        # Building the coordinator may load the LLM client, so it is done off the event loop
+        coordinator = await executor.run_io(lambda: workspace.coordinator)
+        messages = coordinator.stream_query(
+            query=request.query, documents=request.sources,
+            mmr=request.mmr, max_per_source=request.max_per_source, filters=request.filters()
+        )
+        response = _sse_response(workspace, messages)
+        workspace = None    # The response releases it once the stream is over
+        return response
+    except Exception as e:
+        _raise_for_executor_error(e)
+    finally:
+        if workspace is not None:
+            await _release_workspace(workspace)
+
+
+# --- Answer many questions in one request (Server-Sent Events) ---
+@app.post("/query/batch")
+async def handle_query_batch(request: BatchQueryRequest, x_tenant_id: Optional[str] = Header(default=None)):
+    """
+    Answers a list of questions with shared retrieval (one embedding pass, one multi-query vector
+    search, identical questions answered once) and concurrent LLM calls. Results are streamed as
+    Server-Sent Events in completion order: one "RESULT" (or "ERROR") event per question, carrying
+    its `index` in `queries`, then "DONE" with the batch counts.
+    """
+    if not request.queries or any(not query.strip() for query in request.queries):
+        raise HTTPException(status_code=400, detail="Queries cannot be empty.")
+    if len(request.queries) > MAX_BATCH_QUERIES:
+        raise HTTPException(status_code=413, detail=f"At most {MAX_BATCH_QUERIES} queries per batch.")
+    concurrency = min(max(request.concurrency, 1), MAX_BATCH_CONCURRENCY) if request.concurrency else None
+
+    workspace = None
+    try:
+        workspace = await _acquire_workspace(x_tenant_id)
+        coordinator = await executor.run_io(lambda: workspace.coordinator)
+        messages = coordinator.handle_queries(
+            request.queries, documents=request.sources, mmr=request.mmr,
+            max_per_source=request.max_per_source, filters=request.filters(), concurrency=concurrency
+        )
+        response = _sse_response(workspace, messages)
+        workspace = None    # The response releases it once the stream is over
+        return response
+    except Exception as e:
+        _raise_for_executor_error(e)
+    finally:
+        if workspace is not None:
+            await _release_workspace(workspace)
+
+
+# --- Answer cache statistics ---
+@app.get("/cache/stats")
+async def cache_stats(x_tenant_id: Optional[str] = Header(default=None)):
+    """
+    Hit/miss counters and size of the caller's answer cache and of the shared embedding cache,
+    used to tune their budgets.
+    """
+    workspace = None
+    try:
+        workspace = await _acquire_workspace(x_tenant_id)
+        answer_cache = workspace.answer_cache
+        return {
+            "answers": {"enabled": False} if answer_cache is None else {"enabled": True, **answer_cache.stats()},
+            "embeddings": registry.get_embedding_model().stats()
+        }
+    except Exception as e:
+        _raise_for_executor_error(e)
+    finally:
+        if workspace is not None:
+            await _release_workspace(workspace)
+
+
+# --- Clear the caller's stored data (embeddings and uploaded files) ---
 @app.post("/clear")
-async def clear_data():
+async def clear_data(x_tenant_id: Optional[str] = Header(default=None)):
+    """
+    Delete all files and vector embeddings of the caller's workspace (X-Tenant-ID header).
+    Other workspaces are not touched. Use cautiously!
+    """
+    return await clear_tenant(normalize_tenant_or_400(x_tenant_id))
+
+
+# --- Remove a single document (its vectors and uploaded file) ---
+@app.delete("/documents/{filename}")
+async def delete_document(filename: str, x_tenant_id: Optional[str] = Header(default=None)):
+    """
+    Delete one document's chunks from the vector store without clearing everything else.
+    """
+    workspace = None
+    try:
+        workspace = await _acquire_workspace(x_tenant_id)
+        removed = await executor.run_io(workspace.vector_store.delete_by_source, filename)
+
+        # Drops the name, and the stored content once no other name uses it
+        await executor.run_io(workspace.uploads.remove, filename)
+
+        return {"message": f"Removed {filename}.", "vectors_removed": removed}
+
+    except Exception as e:
+        _raise_for_executor_error(e)
+    finally:
+        if workspace is not None:
+            await _release_workspace(workspace)
+
+
+# --- Tenant administration ---
+@app.get("/tenants")
+async def list_tenants():
+    """
+    Lists the workspaces that have data on disk, and which of them are currently open.
+    """
+    names = await executor.run_io(tenants.known_tenants)
+    return {
+        "tenants": [{"tenant": name, "open": tenants.is_open(name)} for name in names],
+        "max_open": tenants.max_open
+    }
+
+
+@app.get("/tenants/{tenant}/stats")
+async def tenant_stats(tenant: str):
     """
-    Delete all files and vector embeddings. Use cautiously!
+    Chunk, file and upload counts of one workspace.
     """
     try:
-        # Step 1: Clear vector store collection
-        vector_store.clear_collection()
+        return await executor.run_io(tenants.stats, normalize_tenant_or_400(tenant))
+    except Exception as e:
+        _raise_for_executor_error(e)
+
 
-        # Step 2: Delete all uploaded files from disk
-        for filename in os.listdir(UPLOAD_DIRECTORY):
-            file_path = os.path.join(UPLOAD_DIRECTORY, filename)
-            if os.path.isfile(file_path) or os.path.islink(file_path):
-                os.unlink(file_path)
-            elif os.path.isdir(file_path):
-                shutil.rmtree(file_path)
+@app.post("/tenants/{tenant}/clear")
+async def clear_tenant(tenant: str):
+    """
+    Deletes one workspace's vectors and uploaded files; other workspaces are untouched.
+    """
+    try:
+        removed = await executor.run_io(tenants.clear, normalize_tenant_or_400(tenant))
+        return {"message": f"All data of '{tenant}' has been cleared successfully.", "vectors_removed": removed}
+    except Exception as e:
+        _raise_for_executor_error(e)
 
-        return {"message": "All data has been cleared successfully."}
 
+@app.post("/tenants/{tenant}/migrate-embeddings")
+async def migrate_embeddings(tenant: str, request: MigrationRequest):
+    """
+    Starts re-embedding one workspace with another model in the background. Queries keep using
+    the current vectors until the re-embedded collection is swapped in; poll GET /tenants/{tenant}/migration.
+    """
+    try:
+        status = await executor.run_io(
+            tenants.migrate_embeddings, normalize_tenant_or_400(tenant), request.model_name, request.backend,
+            request.batch_size, request.duty_cycle, timeout=MIGRATION_START_TIMEOUT
+        )
+        return JSONResponse(status_code=202, content=status)
     except Exception as e:
-        raise CustomException(e, sys)
+        _raise_for_executor_error(e)
+
+
+@app.get("/tenants/{tenant}/migration")
+async def migration_status(tenant: str):
+    """
+    Progress of the workspace's latest embedding migration.
+    """
+    status = tenants.migration_status(normalize_tenant_or_400(tenant))
+    if status is None:
+        raise HTTPException(status_code=404, detail="No embedding migration has been started for this tenant.")
+    return status
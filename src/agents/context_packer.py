@@ -0,0 +1,212 @@
+# This file defines the context packer that fits retrieved chunks into a fixed prompt token budget.
+
+import re
+import sys
+import threading
+from typing import List
+from langchain_core.documents import Document
+from src.exception import CustomException
+from src.logger import logging
+
+# Tokenizer for exact counts, loaded on first use (see _get_encoding)
+_encoding = []
+_encoding_lock = threading.Lock()
+
+# Sentence ends: ., ! or ? followed by whitespace, or a blank line
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+|\n\s*\n")
+
+
+def _get_encoding():
+    # tiktoken (it ships with langchain-openai) reads, or on first use downloads, its BPE file, so it
+    # is loaded when the first context is packed rather than when this module is imported
+    if not _encoding:
+        with _encoding_lock:
+            if not _encoding:
+                try:
+                    import tiktoken
+                    _encoding.append(tiktoken.get_encoding("cl100k_base"))
+                except Exception:
+                    _encoding.append(None)
+    return _encoding[0]
+
+
+def count_tokens(text: str) -> int:
+    """
+    Number of tokens in the text (tiktoken if installed, otherwise ~4 characters per token).
+    """
+    encoding = _get_encoding()
+    if encoding is not None:
+        return len(encoding.encode(text, disallowed_special=()))
+    return (len(text) + 3) // 4
+
+
+def _overlap(left: str, right: str, max_overlap: int = 200) -> int:
+    # Length of the longest suffix of `left` that is also a prefix of `right`
+    for size in range(min(len(left), len(right), max_overlap), 0, -1):
+        if left.endswith(right[:size]):
+            return size
+    return 0
+
+
+def _truncate_to_sentences(text: str, max_tokens: int) -> str:
+    # Longest prefix of whole sentences that fits in max_tokens
+    kept = ""
+    for match in _SENTENCE_END.finditer(text):
+        candidate = text[:match.start()].rstrip()
+        if count_tokens(candidate) > max_tokens:
+            break
+        kept = candidate
+    return kept
+
+
+def chunk_pages(metadata: dict) -> list:
+    """
+    Pages covered by a chunk (from its "page" / "page_end" metadata); empty when unknown.
+    """
+    page = metadata.get("page")
+    if page is None:
+        return []
+    return list(range(int(page), int(metadata.get("page_end", page)) + 1))
+
+
+def cite(source: str, pages) -> str:
+    """
+    Citation label such as "report.pdf (p. 3)" or "report.pdf (pp. 3-5, 9)"; just the source without pages.
+    """
+    pages = sorted(set(pages))
+    if not pages:
+        return source
+    ranges = []
+    for page in pages:
+        if ranges and page == ranges[-1][1] + 1:
+            ranges[-1][1] = page
+        else:
+            ranges.append([page, page])
+    label = ", ".join(str(a) if a == b else f"{a}-{b}" for a, b in ranges)
+    return f"{source} ({'p.' if len(pages) == 1 else 'pp.'} {label})"
+
+
+class ContextPacker:
+    """
+    Packs retrieved chunks into a prompt context under a token budget.
+
+    1. Chunks are taken in relevance order (rerank score when present, otherwise retrieval rank).
+    2. Exact duplicates are dropped.
+    3. A chunk adjacent to an already selected chunk of the same source is only charged for the
+       text that is not covered by the splitter's overlap.
+    4. A chunk that no longer fits is cut at a sentence boundary to fill the remaining budget, or
+       skipped when the fragment would be too short. Scanning continues, so a later, shorter
+       chunk that still fits is packed.
+    5. Selected chunks are grouped per source. Consecutive chunks are merged into one passage,
+       without their overlapping text, and each passage is labelled with its source and pages.
+    """
+
+    def __init__(self, token_budget: int = 3000, min_fragment_tokens: int = 20):
+        """
+        Args:
+            token_budget (int): Maximum tokens of context placed in the prompt.
+            min_fragment_tokens (int): Truncated fragments shorter than this are dropped instead.
+        """
+        self.token_budget = token_budget
+        self.min_fragment_tokens = min_fragment_tokens
+
+    @staticmethod
+    def _relevance_order(docs: List[Document]) -> List[Document]:
+        if docs and all("rerank_score" in d.metadata for d in docs):
+            return sorted(docs, key=lambda d: d.metadata["rerank_score"], reverse=True)
+        return list(docs)
+
+    def pack(self, docs: List[Document]):
+        """
+        Selects and merges chunks for the prompt.
+
+        Args:
+            docs (List[Document]): Retrieved chunks.
+
+        Output:
+            tuple: (list of (citation label, passage text) in relevance order of each source,
+                    dict with packed/dropped token and chunk counts)
+        """
+        try:
+            selected = []              # (doc, text to use)
+            seen_texts = set()
+            by_position = {}           # (source, chunk_index) -> text selected at that position
+            used = 0
+            packed_chunks = dropped_chunks = dropped_tokens = truncated = 0
+
+            for doc in self._relevance_order(docs):
+                text = doc.page_content.strip()
+                tokens = count_tokens(text)
+                if text in seen_texts:
+                    dropped_chunks += 1
+                    continue
+
+                # Only charge for text not already covered by a selected neighbour
+                source = doc.metadata.get("source", "Unknown Document")
+                index = doc.metadata.get("chunk_index")
+                cost = tokens
+                if index is not None:
+                    previous = by_position.get((source, index - 1))
+                    following = by_position.get((source, index + 1))
+                    shared = (_overlap(previous, text) if previous else 0) + (_overlap(text, following) if following else 0)
+                    cost = count_tokens(text[shared:]) if shared else tokens
+
+                if used + cost > self.token_budget:
+                    # Too long for what is left: keep a sentence-aligned fragment, or skip it and try the next chunk
+                    remaining = self.token_budget - used
+                    fragment = _truncate_to_sentences(text, remaining) if remaining >= self.min_fragment_tokens else ""
+                    if fragment and count_tokens(fragment) >= self.min_fragment_tokens:
+                        text, cost = fragment, count_tokens(fragment)
+                        truncated += 1
+                        dropped_tokens += tokens - cost
+                    else:
+                        dropped_chunks += 1
+                        dropped_tokens += tokens
+                        continue
+
+                selected.append((doc, text))
+                seen_texts.add(doc.page_content.strip())
+                if index is not None:
+                    by_position[(source, index)] = text
+                used += cost
+                packed_chunks += 1
+
+            # Group per source (sources ordered by their best chunk) and merge neighbours
+            passages = {}
+            for doc, text in selected:
+                passages.setdefault(doc.metadata.get("source", "Unknown Document"), []).append(
+                    (doc.metadata.get("chunk_index"), text, chunk_pages(doc.metadata))
+                )
+
+            sections = []
+            merged = 0
+            for source, parts in passages.items():
+                ordered = sorted(parts, key=lambda p: (p[0] is None, p[0] if p[0] is not None else 0))
+                blocks = []             # [text, pages]
+                last_index = None
+                for index, text, pages in ordered:
+                    if blocks and index is not None and last_index is not None and index == last_index + 1:
+                        # Adjacent chunks: append without the repeated overlap
+                        blocks[-1][0] += text[_overlap(blocks[-1][0], text):]
+                        blocks[-1][1].extend(pages)
+                        merged += 1
+                    else:
+                        blocks.append([text, list(pages)])
+                    last_index = index
+                for text, pages in blocks:
+                    sections.append((cite(source, pages), text))
+
+            stats = {
+                "budget_tokens": self.token_budget,
+                "packed_tokens": sum(count_tokens(text) for _, text in sections),
+                "dropped_tokens": dropped_tokens,
+                "packed_chunks": packed_chunks,
+                "dropped_chunks": dropped_chunks,
+                "truncated_chunks": truncated,
+                "merged_chunks": merged,
+            }
+            logging.info(f"Context packed: {stats}")
+            return sections, stats
+
+        except Exception as e:
+            raise CustomException(e, sys)
@@ -1,49 +1,58 @@
 # This Agent is responsible for coordinating the flow of data between the retrieval and LLM response agents.
+import os
 import uuid
 import sys
-import os
+import random
+import asyncio
 from src.logger import logging
 from src.exception import CustomException
-from src.agents.embedding_agent import EmbeddingAgent
+from src.executor import ExecutorBusyError
 from src.agents.retrieval_agent import RetrievalAgent
-from src.agents.llm_response_agent import LLMResponseAgent
-from src.vector_store.chroma_db import ChromaDBHandler
+from src.agents.llm_response_agent import LLMResponseAgent, is_rate_limit_error, retry_after_seconds
+from src.cache.answer_cache import normalize_query
+from src.registry import registry
+from src.vector_store.filters import filters_scope
 
 
 class CoordinatorAgent:
-    def __init__(self, retrieval_agent=None, llm_agent=None):
+    def __init__(self, retrieval_agent=None, llm_agent=None, answer_cache=None):
         """
         Initializes the CoordinatorAgent, which orchestrates the full flow:
-        - Load or create the vector database.
+        - Fetch the shared vector database and LLM client from the registry.
         - Initialize the retrieval and LLM agents.
+        - Attach the answer cache that short-circuits repeated questions.
+
+        Args:
+            retrieval_agent: Optional pre-built RetrievalAgent.
+            llm_agent: Optional pre-built LLMResponseAgent.
+            answer_cache: Optional AnswerCache. When both agents are passed in, no cache
+                          is used unless one is given explicitly.
         """
         try:
             # If external agent instances are passed, use them directly
             if retrieval_agent and llm_agent:
                 self.retriever = retrieval_agent
                 self.llm_agent = llm_agent
+                self.answer_cache = answer_cache
             else:
-                # Load environment variables or use defaults
-                chroma_dir = os.getenv("CHROMA_DIR", "./vectorstore/chroma_db")
-                model_name = os.getenv("MODEL_NAME", "sentence-transformers/all-MiniLM-L6-v2")
+                # Reuse the shared vector store and LLM client from the component registry
+                # so the embedding model and Chroma client are only loaded once per process
+                self.retriever = retrieval_agent or RetrievalAgent(vector_db=registry.get_vector_store())
+                self.llm_agent = llm_agent or LLMResponseAgent(llm=registry.get_llm())
+                self.answer_cache = answer_cache or registry.get_answer_cache()
 
-                # Step 1: Load the embedding model
-                embedding_agent = EmbeddingAgent(model_name=model_name)
-                embeddings = embedding_agent.embedding_model
-
-                # Step 2: Create or load vector store with these embeddings
-                vector_db = ChromaDBHandler(persist_directory=chroma_dir)
-                vector_db.create_or_load(embeddings=embeddings)
-
-                # Step 3: Initialize retrieval and LLM agents
-                self.retriever = RetrievalAgent(vector_db=vector_db)
-                self.llm_agent = LLMResponseAgent()
+            # Batch queries (handle_queries): concurrent LLM calls and backoff on throttled calls
+            self.batch_concurrency = int(os.getenv("BATCH_LLM_CONCURRENCY", "4"))
+            self.batch_retries = int(os.getenv("BATCH_LLM_RETRIES", "5"))
+            self.batch_backoff = float(os.getenv("BATCH_BACKOFF_SECONDS", "1.0"))
+            self.batch_backoff_max = float(os.getenv("BATCH_BACKOFF_MAX_SECONDS", "30"))
 
             logging.info("CoordinatorAgent initialized successfully")
         except Exception as e:
             raise CustomException(e, sys)
 
-    def handle_query(self, query: str, documents: list = None) -> dict:
+    def handle_query(self, query: str, documents: list = None, mmr: bool = None, max_per_source: int = None,
+                     filters: dict = None) -> dict:
         """
         Main method that handles a user query by:
         1. Retrieving relevant context from stored documents.
@@ -52,7 +61,10 @@ class CoordinatorAgent:
 
         Args:
             query (str): The user's question or input.
-            documents (list): Optional additional documents (currently unused).
+            documents (list): Optional source file names to restrict the search to.
+            mmr (bool, optional): Diversify retrieved chunks with maximal marginal relevance.
+            max_per_source (int, optional): At most this many chunks per source file.
+            filters (dict, optional): File type / ingestion date filters (see build_where).
 
         Output:
             dict: Final structured response containing the LLM answer and the source files.
@@ -61,12 +73,25 @@ class CoordinatorAgent:
         try:
             logging.info(f"Coordinator started processing query with trace_id: {trace_id}")
 
+            # Step 0: Serve repeated / near-identical questions from the answer cache
+            scope = self._cache_scope(documents, mmr, max_per_source, filters)
+            if self.answer_cache is not None:
+                cached = self.answer_cache.get(query, scope=scope)
+                if cached is not None:
+                    logging.info(f"Answer cache hit ({cached['cache']}) for trace_id: {trace_id}")
+                    return self._final_response(trace_id, cached["answer"], cached["sources"],
+                                                citations=cached["citations"])
+                generation = self.answer_cache.generation
+
             # Step 1: Retrieve relevant document chunks from the vector store
-            retrieval_msg = self.retriever.retrieve_context(query, documents or [], trace_id)
+            retrieval_msg = self.retriever.retrieve_context(
+                query, documents or [], trace_id, mmr=mmr, max_per_source=max_per_source, filters=filters
+            )
 
             # Step 2: Pass the top documents to the LLM agent for answer generation
             top_docs = retrieval_msg["payload"]["top_docs"]
             sources = retrieval_msg["payload"]["sources"]
+            citations = retrieval_msg["payload"]["citations"]
 
             llm_msg = self.llm_agent.generate_response(
                 query=query,
@@ -74,18 +99,278 @@ class CoordinatorAgent:
                 trace_id=trace_id
             )
 
+            answer = llm_msg["payload"]["answer"]
+            if self.answer_cache is not None:
+                self.answer_cache.put(query, answer, sources, scope=scope, generation=generation, citations=citations)
+
             # Step 3: Format and return final response to the UI or API
-            return {
-                "type": "FINAL_RESPONSE",
+            return self._final_response(trace_id, answer, sources, llm_msg["payload"].get("context"), citations)
+
+        except Exception as e:
+            logging.error(f"Error in coordinator: {str(e)}")
+            raise CustomException(e, sys)
+
+    @staticmethod
+    def _cache_scope(documents: list, mmr: bool, max_per_source: int, filters: dict = None) -> tuple:
+        # Answers are only reused for the same documents, filters and retrieval options
+        return (tuple(sorted(documents or [])), mmr, max_per_source, filters_scope(filters))
+
+    @staticmethod
+    def _final_response(trace_id: str, answer: str, sources: list, context: dict = None, citations: list = None) -> dict:
+        # Structured FINAL_RESPONSE message returned to the UI or API
+        return {
+            "type": "FINAL_RESPONSE",
+            "sender": "CoordinatorAgent",
+            "receiver": "UI",
+            "trace_id": trace_id,
+            "payload": {
+                "answer": answer,
+                "sources": sources,  # Show which documents were used
+                "citations": citations if citations is not None else sources,  # ... and which pages
+                "context": context   # Token packing stats (None for cached answers)
+            }
+        }
+
+    async def stream_query(self, query: str, documents: list = None, mmr: bool = None, max_per_source: int = None,
+                           filters: dict = None):
+        """
+        Streaming version of handle_query. Sources are sent first (as soon as retrieval
+        finishes), then answer tokens as the LLM generates them, then a final marker
+        carrying the context packing stats.
+
+        Args:
+            query (str): The user's question or input.
+            documents (list): Optional source file names to restrict the search to.
+            mmr (bool, optional): Diversify retrieved chunks with maximal marginal relevance.
+            max_per_source (int, optional): At most this many chunks per source file.
+            filters (dict, optional): File type / ingestion date filters (see build_where).
+
+        Output:
+            AsyncIterator[dict]: SOURCES, TOKEN and DONE messages for the UI.
+        """
+        trace_id = str(uuid.uuid4())
+        try:
+            logging.info(f"Coordinator started streaming query with trace_id: {trace_id}")
+
+            # Step 0: A cached answer is sent as sources + one token
+            scope = self._cache_scope(documents, mmr, max_per_source, filters)
+            if self.answer_cache is not None:
+                cached = await registry.get_executor().run_io(self.answer_cache.get, query, scope)
+                if cached is not None:
+                    logging.info(f"Answer cache hit ({cached['cache']}) for trace_id: {trace_id}")
+                    for message in self._stream_messages(trace_id, cached["sources"], [cached["answer"]],
+                                                         cached["citations"]):
+                        yield message
+                    return
+                generation = self.answer_cache.generation
+
+            # Step 1: Retrieval is blocking (embedding + Chroma), so run it off the event loop
+            retrieval_msg = await registry.get_executor().run_io(
+                self.retriever.retrieve_context, query, documents or [], trace_id,
+                mmr=mmr, max_per_source=max_per_source, filters=filters
+            )
+            top_docs = retrieval_msg["payload"]["top_docs"]
+            sources = retrieval_msg["payload"]["sources"]
+            citations = retrieval_msg["payload"]["citations"]
+
+            yield {
+                "type": "SOURCES",
                 "sender": "CoordinatorAgent",
                 "receiver": "UI",
                 "trace_id": trace_id,
-                "payload": {
-                    "answer": llm_msg["payload"]["answer"],
-                    "sources": sources  # Show which documents were used
+                "payload": {"sources": sources, "citations": citations}
+            }
+
+            # Step 2: Forward tokens to the UI as the LLM produces them
+            tokens = []
+            context = None
+            async for llm_msg in self.llm_agent.stream_response(query, top_docs, trace_id):
+                if llm_msg["type"] == "LLM_CONTEXT":
+                    context = llm_msg["payload"]["context"]
+                    continue
+                tokens.append(llm_msg["payload"]["token"])
+                yield {
+                    "type": "TOKEN",
+                    "sender": "CoordinatorAgent",
+                    "receiver": "UI",
+                    "trace_id": trace_id,
+                    "payload": {"token": tokens[-1]}
                 }
+
+            yield {
+                "type": "DONE",
+                "sender": "CoordinatorAgent",
+                "receiver": "UI",
+                "trace_id": trace_id,
+                "payload": {"context": context}
             }
 
+            # Cache the fully streamed answer for the next identical question
+            if self.answer_cache is not None:
+                self.answer_cache.put(query, "".join(tokens).strip(), sources, scope=scope, generation=generation,
+                                      citations=citations)
+
         except Exception as e:
-            logging.error(f"Error in coordinator: {str(e)}")
+            logging.error(f"Error in coordinator stream: {str(e)}")
             raise CustomException(e, sys)
+
+    async def handle_queries(self, queries: list, documents: list = None, mmr: bool = None, max_per_source: int = None,
+                             filters: dict = None, concurrency: int = None):
+        """
+        Answers a batch of questions (sharing the same documents / filters / options), yielding each
+        result as soon as it is ready:
+        1. Identical questions (same normalized text) are answered once.
+        2. All distinct questions are embedded in one batched pass; the vectors serve both the
+           answer cache lookups and the search.
+        3. Cached answers are sent first; the rest are retrieved with one multi-query vector search.
+        4. Each question then finishes its retrieval (BM25, rerank) and calls the LLM on its own, so
+           the first LLM calls start while other questions are still being reranked. At most
+           `concurrency` retrievals and `concurrency` LLM calls run at a time; throttled calls
+           (HTTP 429) and calls refused by a full I/O pool are retried with exponential backoff.
+
+        Args:
+            queries (list): The questions.
+            documents (list): Optional source file names to restrict the search to.
+            mmr (bool, optional): Diversify retrieved chunks with maximal marginal relevance.
+            max_per_source (int, optional): At most this many chunks per source file.
+            filters (dict, optional): File type / ingestion date filters (see build_where).
+            concurrency (int, optional): Concurrent LLM calls (BATCH_LLM_CONCURRENCY env by default).
+
+        Output:
+            AsyncIterator[dict]: One RESULT (or ERROR) message per question, in completion order and
+                                 carrying the question's `index` in `queries`, then a DONE summary.
+        """
+        try:
+            executor = registry.get_executor()
+            concurrency = max(1, concurrency or self.batch_concurrency)
+            logging.info(f"Coordinator started a batch of {len(queries)} queries (concurrency={concurrency})")
+
+            # Step 0: Group identical questions; each group is answered once
+            groups = {}
+            for index, query in enumerate(queries):
+                groups.setdefault(normalize_query(query), []).append(index)
+            positions = list(groups.values())
+            unique = [queries[group[0]] for group in positions]
+            trace_ids = [str(uuid.uuid4()) for _ in unique]
+            counts = {"queries": len(queries), "unique": len(unique), "cached": 0, "failed": 0}
+
+            # Step 1: One embedding pass for every distinct question
+            vectors = await executor.run_io(self.retriever.embed_queries, unique)
+
+            # Step 2: Cached answers go out first
+            scope = self._cache_scope(documents, mmr, max_per_source, filters)
+            pending = list(range(len(unique)))
+            if self.answer_cache is not None:
+                generation = self.answer_cache.generation
+                hits = await executor.run_io(
+                    lambda: [self.answer_cache.get(query, scope, vector) for query, vector in zip(unique, vectors)]
+                )
+                pending = [j for j, hit in enumerate(hits) if hit is None]
+                for j, hit in enumerate(hits):
+                    if hit is None:
+                        continue
+                    counts["cached"] += len(positions[j])
+                    response = self._final_response(trace_ids[j], hit["answer"], hit["sources"],
+                                                    citations=hit["citations"])
+                    for message in self._batch_results(queries, positions[j], response, cached=hit["cache"]):
+                        yield message
+
+            # Step 3: One batched dense search for the remaining questions
+            dense_lists = []
+            if pending:
+                dense_lists = await executor.run_io(
+                    self.retriever.dense_search_batch, [unique[j] for j in pending], documents or [],
+                    mmr=mmr, max_per_source=max_per_source, filters=filters,
+                    query_embeddings=[vectors[j] for j in pending]
+                )
+
+            # Step 4: Per question, finish retrieval then call the LLM; results sent in completion order
+            retrieval_slots = asyncio.Semaphore(concurrency)
+            llm_slots = asyncio.Semaphore(concurrency)
+
+            async def answer(j: int, dense: list):
+                retrieval = None
+                try:
+                    async with retrieval_slots:
+                        retrieval = await executor.run_io(
+                            self.retriever.complete_retrieval, unique[j], dense, documents or [], trace_ids[j],
+                            mmr=mmr, max_per_source=max_per_source, filters=filters
+                        )
+                    async with llm_slots:
+                        llm_msg = await self._generate_with_backoff(unique[j], retrieval["payload"]["top_docs"], trace_ids[j])
+                    return j, retrieval, llm_msg, None
+                except Exception as e:
+                    return j, retrieval, None, e
+
+            tasks = [asyncio.ensure_future(answer(j, dense)) for j, dense in zip(pending, dense_lists)]
+            try:
+                for next_done in asyncio.as_completed(tasks):
+                    j, retrieval, llm_msg, error = await next_done
+                    if error is not None:
+                        # One failed question does not fail the batch
+                        logging.error(f"Batch query failed for trace_id {trace_ids[j]}: {str(error)}")
+                        counts["failed"] += len(positions[j])
+                        for index in positions[j]:
+                            yield {"type": "ERROR", "sender": "CoordinatorAgent", "receiver": "UI",
+                                   "trace_id": trace_ids[j],
+                                   "payload": {"index": index, "query": queries[index], "detail": str(error)}}
+                        continue
+
+                    answer_text = llm_msg["payload"]["answer"]
+                    sources = retrieval["payload"]["sources"]
+                    citations = retrieval["payload"]["citations"]
+                    if self.answer_cache is not None:
+                        self.answer_cache.put(unique[j], answer_text, sources, scope=scope, generation=generation,
+                                              query_embedding=vectors[j], citations=citations)
+                    response = self._final_response(trace_ids[j], answer_text, sources,
+                                                    llm_msg["payload"].get("context"), citations)
+                    for message in self._batch_results(queries, positions[j], response):
+                        yield message
+            finally:
+                # Stop outstanding calls if the consumer goes away (e.g., the client disconnected)
+                for task in tasks:
+                    task.cancel()
+
+            yield {"type": "DONE", "sender": "CoordinatorAgent", "receiver": "UI", "trace_id": None, "payload": counts}
+            logging.info(f"Coordinator finished a batch: {counts}")
+
+        except Exception as e:
+            logging.error(f"Error in coordinator batch: {str(e)}")
+            raise CustomException(e, sys)
+
+    async def _generate_with_backoff(self, query: str, top_docs: list, trace_id: str) -> dict:
+        # One LLM call on the I/O pool, retried with exponential backoff (plus jitter, or the provider's
+        # Retry-After) while it is throttled. The caller's concurrency slot is held while waiting, so a
+        # throttled batch also sends fewer requests.
+        for attempt in range(self.batch_retries + 1):
+            try:
+                return await registry.get_executor().run_io(
+                    self.llm_agent.generate_response, query=query, retrieved_docs=top_docs, trace_id=trace_id
+                )
+            except Exception as e:
+                retryable = isinstance(e, ExecutorBusyError) or is_rate_limit_error(e)
+                if not retryable or attempt == self.batch_retries:
+                    raise
+                delay = retry_after_seconds(e)
+                if delay is None:
+                    delay = min(self.batch_backoff_max, self.batch_backoff * 2 ** attempt) * random.uniform(0.5, 1.0)
+                logging.warning(f"LLM call throttled for trace_id {trace_id}; retry {attempt + 1} in {delay:.1f}s")
+                await asyncio.sleep(delay)
+
+    @staticmethod
+    def _batch_results(queries: list, indexes: list, response: dict, cached: str = None):
+        # One RESULT message per position of a (deduplicated) question in the batch
+        for index in indexes:
+            yield {**response, "type": "RESULT",
+                   "payload": {"index": index, "query": queries[index], **response["payload"], "cached": cached}}
+
+    @staticmethod
+    def _stream_messages(trace_id: str, sources: list, tokens: list, citations: list = None):
+        # SOURCES, TOKEN... and DONE messages for an already known answer
+        yield {"type": "SOURCES", "sender": "CoordinatorAgent", "receiver": "UI",
+               "trace_id": trace_id, "payload": {"sources": sources, "citations": citations or sources}}
+        for token in tokens:
+            yield {"type": "TOKEN", "sender": "CoordinatorAgent", "receiver": "UI",
+                   "trace_id": trace_id, "payload": {"token": token}}
+        yield {"type": "DONE", "sender": "CoordinatorAgent", "receiver": "UI",
+               "trace_id": trace_id, "payload": {}}
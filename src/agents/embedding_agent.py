@@ -1,45 +1,72 @@
 # This Agent is responsible for embedding documents and storing them in a vector database.
 
+import os
 import sys
-from langchain_huggingface import HuggingFaceEmbeddings
 from src.vector_store.chroma_db import ChromaDBHandler
+from src.cache.embedding_cache import CachedEmbeddings
+from src.embeddings.backends import build_backend
+from src.embeddings.micro_batcher import MicroBatchingEmbeddings
 from src.exception import CustomException
 from src.logger import logging
 
 class EmbeddingAgent:
-    def __init__(self, model_name: str = "sentence-transformers/all-MiniLM-L6-v2"):
+    def __init__(self, model_name: str = "sentence-transformers/all-MiniLM-L6-v2", backend: str = None):
         """
-        Initializes the embedding agent using a HuggingFace sentence transformer model.
+        Initializes the embedding agent using a sentence transformer model on the configured
+        backend (EMBEDDING_BACKEND: PyTorch "huggingface" or quantized "onnx").
 
         Args:
             model_name (str): Name of the embedding model to load from HuggingFace.
+            backend (str, optional): Runtime to use instead of EMBEDDING_BACKEND.
         """
         try:
-            logging.info(f"Loading HuggingFace embedding model: {model_name}")
-            
-            # Load the embedding model (e.g., MiniLM) from HuggingFace
-            self.embedding_model = HuggingFaceEmbeddings(model_name=model_name)
+            # Load the embedding model (e.g., MiniLM) on the selected runtime
+            self.base_model = build_backend(model_name, kind=backend)
+
+            # Concurrent queries share forward passes (EMBEDDING_BATCH_WAIT_MS=0 disables batching)
+            wait_ms = float(os.getenv("EMBEDDING_BATCH_WAIT_MS", "3"))
+            self.batcher = None
+            if wait_ms > 0:
+                self.batcher = MicroBatchingEmbeddings(
+                    self.base_model,
+                    max_batch=int(os.getenv("EMBEDDING_MAX_BATCH", "32")),
+                    max_wait_ms=wait_ms,
+                )
+
+            # Wrap it with an LRU (and optional on-disk) cache so repeated queries and
+            # re-ingested identical chunks skip the transformer. Keyed by the backend name,
+            # since quantized vectors differ slightly from full-precision ones.
+            self.embedding_model = CachedEmbeddings(
+                self.batcher or self.base_model,
+                model_name=self.base_model.name,
+                max_entries=int(os.getenv("EMBEDDING_CACHE_SIZE", "50000")),
+                cache_dir=os.getenv("EMBEDDING_CACHE_DIR") or None
+            )
         
         except Exception as e:
             # Raise a CustomException if model loading fails
             raise CustomException(e, sys)
 
-    def embed_and_store(self, documents, persist_directory: str):
+    def embed_and_store(self, documents, persist_directory: str = None):
         """
         Embeds the provided documents and stores them in a Chroma vector database.
 
         Args:
             documents (List[Document]): List of LangChain Document objects to embed.
-            persist_directory (str): Directory path where ChromaDB should persist the vectors.
+            persist_directory (str, optional): Directory path where ChromaDB should persist the vectors.
+                                               Defaults to the shared store from the component registry.
         """
         try:
             logging.info("Embedding documents and storing to Chroma DB...")
 
-            # Initialize or load an existing Chroma vector store
-            vector_store = ChromaDBHandler(persist_directory)
-
-            # Create ChromaDB collection (if not exists) using the loaded embedding model
-            vector_store.create_or_load(self.embedding_model)
+            if persist_directory is None:
+                # Imported here to avoid a circular import (the registry builds this agent)
+                from src.registry import registry
+                vector_store = registry.get_vector_store()
+            else:
+                # Initialize or load a separate Chroma vector store using this agent's model
+                vector_store = ChromaDBHandler(persist_directory)
+                vector_store.create_or_load(self.embedding_model)
 
             # Add embedded documents to the vector store for future retrieval
             vector_store.add_documents(documents)
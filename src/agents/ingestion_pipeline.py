@@ -0,0 +1,293 @@
+# This file defines the streaming ingestion pipeline: extract -> chunk -> embed -> store,
+# with bounded queues between stages so memory stays flat for large uploads.
+
+import os
+import sys
+import time
+import queue
+import threading
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from src.agents.ingestion_agent import extract_and_chunk_file
+from src.agents.textextraction import TextExtractor
+from src.agents.processing import TextProcessing
+from src.vector_store.manifest import chunk_id, hash_file
+from src.vector_store.filters import file_metadata
+from src.executor import ExecutorBusyError
+from src.exception import CustomException
+from src.logger import logging
+
+# Marks the end of a stream on a queue
+_DONE = object()
+
+
+class IngestionPipeline:
+    """
+    Streams files through extraction, chunking and storage without materializing a whole upload.
+
+    Stage 1 (extract + chunk): `extract_workers` threads take files from a queue and turn each
+        one into a lazy stream of page records (TextExtractor.extract_records) chunked incrementally
+        (TextProcessing.process_records), so chunks keep their page numbers. Chunks are put on a bounded queue.
+    Stage 2 (embed + store): the chunk queue is fed to ChromaDBHandler.add_documents_bulk, which
+        embeds and writes in batches of `batch_size`, so documents become searchable batch by batch.
+
+    With an executor (INGEST_MODE=parallel), stage 1 parses each file in a worker process instead;
+    the file's chunks come back at once and are then queued the same way.
+
+    When the store falls behind, the bounded queue blocks the extractors (back-pressure).
+    At most `queue_size` chunks plus one batch are therefore in memory at any time.
+
+    Files whose content hash matches the manifest are skipped before extraction. For changed
+    files, only new chunks are embedded and chunks that disappeared are deleted afterwards.
+    Chunks already stored for a file that fails mid-extraction, or for every file of a run that
+    fails or is cancelled (cancel(), e.g., after a request timeout), are deleted again.
+    """
+
+    def __init__(
+        self,
+        vector_store,
+        text_processor: TextProcessing = None,
+        extractor: TextExtractor = None,
+        batch_size: int = None,
+        queue_size: int = None,
+        extract_workers: int = None,
+        preview_chars: int = None,
+        executor=None,
+    ):
+        """
+        Args:
+            vector_store: ChromaDBHandler (or compatible) receiving the chunks.
+            text_processor (TextProcessing, optional): Chunker (defaults to 500/50 characters).
+            extractor (TextExtractor, optional): Text extractor.
+            batch_size (int, optional): Chunks per store batch (PIPELINE_BATCH_SIZE env).
+            queue_size (int, optional): Max chunks buffered between stages (PIPELINE_QUEUE_SIZE env).
+            extract_workers (int, optional): Files extracted concurrently (PIPELINE_EXTRACT_WORKERS env).
+            preview_chars (int, optional): Characters of extracted text kept per file for display.
+            executor (ExecutionLayer, optional): When given, each file is parsed and chunked in its
+                                                 process pool (INGEST_MODE=parallel) instead of on the
+                                                 extract thread; the extract threads then only feed
+                                                 the chunks to the store stage.
+        """
+        self.vector_store = vector_store
+        self.text_processor = text_processor or TextProcessing(chunk_size=500, chunk_overlap=50)
+        self.extractor = extractor or TextExtractor()
+        self.batch_size = batch_size or int(os.getenv("PIPELINE_BATCH_SIZE", "64"))
+        self.queue_size = queue_size or int(os.getenv("PIPELINE_QUEUE_SIZE", "512"))
+        self.extract_workers = extract_workers or int(os.getenv("PIPELINE_EXTRACT_WORKERS", "2"))
+        self.preview_chars = preview_chars if preview_chars is not None else int(os.getenv("PIPELINE_PREVIEW_CHARS", "5000"))
+        self.executor = executor
+        self.file_timeout = float(os.getenv("INGEST_FILE_TIMEOUT", "300"))
+        if executor is not None and extract_workers is None:
+            # One feeding thread per worker process keeps the pool busy
+            self.extract_workers = max(self.extract_workers, executor.cpu.workers)
+        self._stop = threading.Event()
+
+    def cancel(self):
+        """
+        Stops a running run() from another thread: extraction and storing end at the next chunk,
+        the chunks stored so far are discarded and run() raises.
+        """
+        self._stop.set()
+
+    def _preview_records(self, records, report: dict):
+        # Pass records through while keeping a short preview and a page count for the response
+        pages = set()
+        for record in records:
+            # Element loaders emit several records per page; count distinct pages when known
+            pages.add(record.get("page", len(pages) + 1))
+            report["pages"] = len(pages)
+            if len(report["preview"]) < self.preview_chars:
+                report["preview"] += record["text"][: self.preview_chars - len(report["preview"])] + "\n"
+            yield record
+
+    def _extract_in_process(self, file_path: str, report: dict, stop: threading.Event) -> list:
+        # Parses and chunks the whole file in the process pool, waiting while the pool is full
+        while True:
+            try:
+                _, text, docs = self.executor.call_cpu(
+                    extract_and_chunk_file, file_path, self.text_processor.chunk_size,
+                    self.text_processor.chunk_overlap, timeout=self.file_timeout
+                )
+                break
+            except ExecutorBusyError:
+                if stop.is_set():
+                    return []
+                time.sleep(0.2)
+            except FutureTimeoutError:
+                raise TimeoutError(f"Timed out after {self.file_timeout:.0f}s.")
+        report["pages"] = len({doc.metadata["page"] for doc in docs if "page" in doc.metadata})
+        report["preview"] = text[: self.preview_chars]
+        return docs
+
+    @staticmethod
+    def _set_stage(report: dict, stage: str, on_progress=None):
+        report["stage"] = stage
+        if on_progress:
+            on_progress(report)
+
+    def _extract_worker(self, file_queue: queue.Queue, chunk_queue: queue.Queue, reports: dict, stop: threading.Event,
+                        on_progress=None, file_hashes: dict = None):
+        while not stop.is_set():
+            try:
+                file_path = file_queue.get_nowait()
+            except queue.Empty:
+                return
+
+            report = reports[file_path]
+            started = time.monotonic()
+            try:
+                self._set_stage(report, "extracting", on_progress)
+                # Unchanged re-uploads are a no-op (the hash is reused when the upload store computed it)
+                report["file_hash"] = (file_hashes or {}).get(file_path) or hash_file(file_path)
+                if self.vector_store.file_unchanged(report["filename"], report["file_hash"]):
+                    logging.info(f"Skipping unchanged file: {report['filename']}")
+                    report["skipped"] = True
+                    report["seconds"] = round(time.monotonic() - started, 3)
+                    self._set_stage(report, "skipped", on_progress)
+                    continue
+
+                if self.executor is not None:
+                    docs = self._extract_in_process(file_path, report, stop)
+                else:
+                    records = self._preview_records(self.extractor.extract_records(file_path, file_hash=report["file_hash"]), report)
+                    docs = self.text_processor.process_records(records, metadata=file_metadata(report["filename"]))
+                for doc in docs:
+                    report["chunk_ids"][chunk_id(report["filename"], doc.page_content)] = None
+                    # Blocks while the store stage is behind (back-pressure)
+                    while not stop.is_set():
+                        try:
+                            chunk_queue.put(doc, timeout=0.5)
+                            break
+                        except queue.Full:
+                            continue
+                    if stop.is_set():
+                        return
+                    report["chunks"] += 1
+                logging.info(f"Extracted and chunked {report['filename']}: {report['chunks']} chunks")
+                report["seconds"] = round(time.monotonic() - started, 3)
+                self._set_stage(report, "extracted", on_progress)
+            except Exception as e:
+                # One bad file is reported without stopping the others
+                logging.error(f"Error processing {file_path}: {str(e)}")
+                report["error"] = str(e)
+                report["seconds"] = round(time.monotonic() - started, 3)
+                self._set_stage(report, "failed", on_progress)
+
+    def _drain(self, chunk_queue: queue.Queue, stop: threading.Event):
+        # Turns the chunk queue back into an iterator that ends at the _DONE marker
+        while True:
+            if stop.is_set():
+                raise RuntimeError("Ingestion was cancelled.")
+            try:
+                item = chunk_queue.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            if item is _DONE:
+                return
+            yield item
+
+    def _discard_partial(self, report: dict):
+        # Best effort: a file that was not committed must not leave chunks behind
+        if report["skipped"] or not report["chunk_ids"]:
+            return
+        try:
+            self.vector_store.discard_chunks(report["filename"], list(report["chunk_ids"]))
+        except Exception as e:
+            logging.error(f"Could not discard the partial chunks of {report['filename']}: {str(e)}")
+
+    def _store_batches(self, chunk_queue: queue.Queue, stop: threading.Event, stats: dict, on_batch=None):
+        def committed(size: int):
+            stats["batches"] += 1
+            stats["chunks"] += size
+            if on_batch:
+                on_batch(size)
+
+        # Bulk insert overlaps embedding with writing and commits every `batch_size` chunks
+        self.vector_store.add_documents_bulk(
+            self._drain(chunk_queue, stop), write_batch_size=self.batch_size, on_batch=committed
+        )
+
+    def run(self, file_paths: list, on_batch=None, on_progress=None, file_hashes: dict = None) -> dict:
+        """
+        Ingests the files and returns a summary once every chunk is stored.
+
+        Args:
+            file_paths (list): Paths of the files to ingest.
+            on_batch (callable, optional): Called with the batch size after each committed batch.
+            on_progress (callable, optional): Called with a file's report whenever its stage changes
+                                              (queued -> extracting -> extracted -> stored, or skipped / failed).
+                                              Called from worker threads.
+            file_hashes (dict, optional): path -> SHA-256 already known for some files (skips re-hashing them).
+
+        Output:
+            dict: {"files": [per-file report], "chunks": int, "batches": int, "seconds": float}
+                  where each file report has filename, stage, pages, chunks, preview, error, seconds,
+                  skipped (unchanged file) and file_hash.
+        """
+        try:
+            started = time.monotonic()
+            file_queue = queue.Queue()
+            chunk_queue = queue.Queue(maxsize=self.queue_size)
+            stop = self._stop
+            reports = {}
+            for path in file_paths:
+                file_queue.put(path)
+                reports[path] = {"filename": os.path.basename(path), "stage": "queued", "pages": 0, "chunks": 0,
+                                 "preview": "", "error": None, "seconds": 0.0, "skipped": False,
+                                 "file_hash": None, "chunk_ids": {}}
+            stats = {"chunks": 0, "batches": 0}
+
+            extractors = [
+                threading.Thread(target=self._extract_worker, args=(file_queue, chunk_queue, reports, stop, on_progress, file_hashes),
+                                 name=f"ingest-extract-{i}", daemon=True)
+                for i in range(max(1, min(self.extract_workers, len(file_paths))))
+            ]
+            for thread in extractors:
+                thread.start()
+
+            def close_when_extracted():
+                for thread in extractors:
+                    thread.join()
+                # Gives up once the store stage is gone (it failed or the run was cancelled)
+                while not stop.is_set():
+                    try:
+                        chunk_queue.put(_DONE, timeout=0.5)
+                        return
+                    except queue.Full:
+                        continue
+
+            closer = threading.Thread(target=close_when_extracted, name="ingest-closer", daemon=True)
+            closer.start()
+
+            # The store stage runs on the calling thread; a failure stops the extractors
+            try:
+                self._store_batches(chunk_queue, stop, stats, on_batch)
+                if stop.is_set():
+                    raise RuntimeError("Ingestion was cancelled.")
+            except Exception:
+                # Nothing is written after the store stage returns, so the partial chunks can go now
+                stop.set()
+                for report in reports.values():
+                    self._discard_partial(report)
+                raise
+            closer.join()
+
+            # Every chunk is stored now: drop chunks the previous versions had and record the new state
+            for path, report in reports.items():
+                if report["error"] is not None:
+                    self._discard_partial(report)
+                elif not report["skipped"]:
+                    report["removed"] = self.vector_store.commit_file(
+                        report["filename"], report["file_hash"], list(report["chunk_ids"]), os.path.getmtime(path)
+                    )
+                    self._set_stage(report, "stored", on_progress)
+                report.pop("chunk_ids")
+
+            return {
+                "files": list(reports.values()),
+                "chunks": stats["chunks"],
+                "batches": stats["batches"],
+                "seconds": round(time.monotonic() - started, 3),
+            }
+
+        except Exception as e:
+            raise CustomException(e, sys)
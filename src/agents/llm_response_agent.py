@@ -1,11 +1,13 @@
 # This Agent is responsible for generating responses using LLM based on user queries and retrieved document chunks.
 
 import os
+import re
 import sys
 from dotenv import load_dotenv
 from src.logger import logging
 from src.exception import CustomException
-from langchain_openai import ChatOpenAI
+from src.registry import registry
+from src.agents.context_packer import ContextPacker
 from langchain.schema import HumanMessage
 from typing import List
 from langchain_core.documents import Document
@@ -13,37 +15,94 @@ from langchain_core.documents import Document
 # Load environment variables from the .env file (API key, model name, etc.)
 load_dotenv()
 
+
+def _causes(e: Exception):
+    # The exception, the ones CustomException wraps (first argument) and its chained causes
+    seen = set()
+    while e is not None and id(e) not in seen:
+        seen.add(id(e))
+        yield e
+        if isinstance(e, CustomException) and e.args and isinstance(e.args[0], Exception):
+            e = e.args[0]
+        else:
+            e = e.__cause__ or e.__context__
+
+
+def is_rate_limit_error(e: Exception) -> bool:
+    """
+    True when an LLM call failed because the provider throttled it (HTTP 429, e.g. openai.RateLimitError),
+    i.e. when the same call is worth retrying after a pause.
+    """
+    for cause in _causes(e):
+        if getattr(cause, "status_code", None) == 429 or "RateLimit" in type(cause).__name__:
+            return True
+        # Wrappers' messages include file/line details, so only the original errors' texts are checked
+        if not isinstance(cause, CustomException):
+            text = str(cause).lower()
+            if re.search(r"\b429\b", text) or "rate limit" in text or "too many requests" in text:
+                return True
+    return False
+
+
+def retry_after_seconds(e: Exception):
+    """
+    Delay requested by the provider's Retry-After header on a throttled call, or None.
+    """
+    for cause in _causes(e):
+        headers = getattr(getattr(cause, "response", None), "headers", None) or {}
+        try:
+            return float(headers.get("retry-after"))
+        except (TypeError, ValueError):
+            continue
+    return None
+
+
 class LLMResponseAgent:
-    def __init__(self):
+    def __init__(self, llm=None):
         """
         Initializes the LLMResponseAgent with a language model (via OpenRouter - Mistral).
-        It uses credentials from the .env file to authenticate the LLM API.
+        The client is taken from the shared component registry unless one is passed in.
+
+        Args:
+            llm: Optional pre-built chat model (e.g., a fake LLM in tests).
         """
         try:
-            # Load model name and API key from environment
+            # Model name is only used for logging; the client itself is shared
             self.model_name = os.getenv("MISTRAL_MODEL_NAME")
-            self.api_key = os.getenv("OPENROUTER_API_KEY")
-
-            if not self.api_key:
-                raise ValueError(
-                    "OPENROUTER_API_KEY not found. "
-                    "Please make sure it is set in your .env file."
-                )
-
-            # Initialize the LLM (ChatOpenAI compatible with OpenRouter)
-            self.llm = ChatOpenAI(
-                model=self.model_name,
-                openai_api_key=self.api_key,
-                openai_api_base="https://openrouter.ai/api/v1",  # Base URL for OpenRouter
-                temperature=0.3,     # Lower temperature for more deterministic output
-                max_tokens=2000      # Limit token size to prevent overflow
-            )
+
+            # Reuse the process-wide LLM client instead of building a new one per agent
+            self.llm = llm if llm is not None else registry.get_llm()
+
+            # Retrieved chunks are packed into a fixed token budget before prompting
+            self.packer = ContextPacker(token_budget=int(os.getenv("CONTEXT_TOKEN_BUDGET", 3000)))
 
             logging.info(f"LLMResponseAgent initialized with model: {self.model_name}")
         
         except Exception as e:
             raise CustomException(e, sys)
 
+    # Returned when retrieval produced no context at all
+    NO_CONTEXT_ANSWER = "I could not find any relevant information in the uploaded documents to answer your question."
+
+    def build_context(self, retrieved_docs: List[Document]) -> tuple:
+        """
+        Packs the retrieved chunks into a single context block labelled by source.
+        Duplicates and splitter overlap are removed, adjacent chunks of a file are merged,
+        and the block is kept within the CONTEXT_TOKEN_BUDGET.
+
+        Args:
+            retrieved_docs (List[Document]): List of retrieved context chunks (from vector DB).
+
+        Output:
+            tuple: (context block to place in the prompt (empty if there are no chunks),
+                    dict with packed/dropped token and chunk counts)
+        """
+        sections, stats = self.packer.pack(retrieved_docs)
+
+        # Add the source (and page) label to each packed passage and join them into a single context block
+        context_parts = [f"--- Context from: {label} ---\n{text}" for label, text in sections]
+        return "\n\n".join(context_parts), stats
+
     def generate_response(self, query: str, retrieved_docs: List[Document], trace_id: str) -> dict:
         """
         Generates a structured response by prompting the LLM with relevant context and the user query.
@@ -58,19 +117,12 @@ class LLMResponseAgent:
         """
         try:
             # --- Build prompt context from retrieved documents ---
-            context_parts = []
-            for doc in retrieved_docs:
-                source = doc.metadata.get('source', 'Unknown Document')
-                # Add source label to each context chunk
-                context_parts.append(f"--- Context from: {source} ---\n{doc.page_content}")
-            
-            # Join all chunks into a single context block
-            context = "\n\n".join(context_parts)
-            
+            context, stats = self.build_context(retrieved_docs)
+
             if not context:
                 # If no context is available, return a fallback answer
                 logging.warning("No context provided to LLM, generating response based on query alone.")
-                answer = "I could not find any relevant information in the uploaded documents to answer your question."
+                answer = self.NO_CONTEXT_ANSWER
             else:
                 # Call the method to generate a detailed LLM answer
                 answer = self.generate_answer(context, query)
@@ -83,29 +135,73 @@ class LLMResponseAgent:
                 "trace_id": trace_id,
                 "payload": {
                     "answer": answer,
-                    "query": query
+                    "query": query,
+                    "context": stats
                 }
             }
         except Exception as e:
             raise CustomException(e, sys)
 
-    def generate_answer(self, context: str, query: str) -> str:
+    async def stream_response(self, query: str, retrieved_docs: List[Document], trace_id: str):
         """
-        Constructs a detailed prompt combining context and question,
-        then invokes the LLM to generate a precise and source-referenced answer.
+        Streaming counterpart of generate_response: yields one LLM_CONTEXT message with the
+        packing stats, then the answer token by token.
+
+        Args:
+            query (str): The user's input question.
+            retrieved_docs (List[Document]): List of retrieved context chunks (from vector DB).
+            trace_id (str): Unique identifier for tracking the flow across agents.
+
+        Output:
+            AsyncIterator[dict]: An LLM_CONTEXT message, then LLM_TOKEN messages, one per streamed chunk of text.
+        """
+        context, stats = self.build_context(retrieved_docs)
+        yield {
+            "sender": "LLMResponseAgent",
+            "receiver": "CoordinatorAgent",
+            "type": "LLM_CONTEXT",
+            "trace_id": trace_id,
+            "payload": {
+                "context": stats
+            }
+        }
+
+        if not context:
+            logging.warning("No context provided to LLM, streaming fallback answer.")
+            tokens = self._single_token(self.NO_CONTEXT_ANSWER)
+        else:
+            tokens = self.stream_answer(context, query)
+
+        async for token in tokens:
+            yield {
+                "sender": "LLMResponseAgent",
+                "receiver": "CoordinatorAgent",
+                "type": "LLM_TOKEN",
+                "trace_id": trace_id,
+                "payload": {
+                    "token": token
+                }
+            }
+
+    @staticmethod
+    async def _single_token(text: str):
+        # Wraps a fixed answer as a one-element async stream
+        yield text
+
+    def build_prompt(self, context: str, query: str) -> str:
+        """
+        Builds the instruction prompt combining the retrieved context and the question.
 
         Args:
             context (str): Text extracted from the documents.
             query (str): The user's input question.
 
         Output:
-            str: The final response generated by the LLM.
+            str: The full prompt sent to the LLM.
         """
-        try:
-            # Build a highly instructive prompt for the LLM
-            prompt = f"""You are a helpful and precise assistant. Use the following context, which is composed of sections from different documents, to answer the question. 
+        return f"""You are a helpful and precise assistant. Use the following context, which is composed of sections from different documents, to answer the question. 
 Your answer should be comprehensive and synthesize information from all relevant sources provided. 
-Explicitly mention the source document (e.g., 'According to Jinil_Patel_Resume.pdf...') when the information is specific to one file.
+Explicitly mention the source document (e.g., 'According to Jinil_Patel_Resume.pdf...') when the information is specific to one file, and cite the page when the context label gives one (e.g., 'Jinil_Patel_Resume.pdf, p. 2').
 
 CONTEXT:
 {context}
@@ -121,8 +217,21 @@ INSTRUCTIONS:
 
 ANSWER:"""
 
+    def generate_answer(self, context: str, query: str) -> str:
+        """
+        Constructs a detailed prompt combining context and question,
+        then invokes the LLM to generate a precise and source-referenced answer.
+
+        Args:
+            context (str): Text extracted from the documents.
+            query (str): The user's input question.
+
+        Output:
+            str: The final response generated by the LLM.
+        """
+        try:
             # Wrap the prompt as a message for the LLM
-            messages = [HumanMessage(content=prompt)]
+            messages = [HumanMessage(content=self.build_prompt(context, query))]
 
             # Generate the response from the LLM
             response = self.llm.invoke(messages)
@@ -132,3 +241,26 @@ ANSWER:"""
         except Exception as e:
             logging.error(f"Error generating answer: {str(e)}")
             raise CustomException(e, sys)
+
+    async def stream_answer(self, context: str, query: str):
+        """
+        Same prompt as generate_answer, but yields text chunks as the LLM produces them.
+
+        Args:
+            context (str): Text extracted from the documents.
+            query (str): The user's input question.
+
+        Output:
+            AsyncIterator[str]: Pieces of the answer in generation order.
+        """
+        try:
+            messages = [HumanMessage(content=self.build_prompt(context, query))]
+
+            # astream yields message chunks as soon as the provider sends them
+            async for chunk in self.llm.astream(messages):
+                if chunk.content:
+                    yield chunk.content
+
+        except Exception as e:
+            logging.error(f"Error streaming answer: {str(e)}")
+            raise CustomException(e, sys)
@@ -1,6 +1,7 @@
 # This Agent is responsible for chunking text into smaller pieces.
 import sys
-from typing import List
+from bisect import bisect_right
+from typing import List, Iterable, Iterator
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain_core.documents import Document
 
@@ -43,12 +44,13 @@ class TextProcessing:
             chunks = self.splitter.split_text(text)
 
             # Wrap each chunk in a LangChain Document, attaching metadata if provided
+            # (chunk_index records the chunk's position so neighbours can be merged later)
             docs = [
                 Document(
                     page_content=chunk,
-                    metadata=metadata if metadata else {}
+                    metadata={**(metadata or {}), "chunk_index": i}
                 )
-                for chunk in chunks
+                for i, chunk in enumerate(chunks)
             ]
 
             logging.info(f"Text split into {len(docs)} chunks.")
@@ -57,3 +59,108 @@ class TextProcessing:
         except Exception as e:
             logging.error("Failed to process text into chunks.")
             raise CustomException(e, sys)
+
+    def process_stream(self, pages: Iterable[str], metadata: dict = None) -> Iterator[Document]:
+        """
+        Incremental version of process() for plain text pieces (see process_records()).
+
+        Args:
+            pages (Iterable[str]): Text pieces in document order (e.g., from TextExtractor.extract_pages).
+            metadata (dict, optional): Metadata to attach to each chunk.
+
+        Output:
+            Iterator[Document]: Chunked LangChain Document objects.
+        """
+        return self.process_records(({"text": page} for page in pages), metadata=metadata)
+
+    def process_records(self, records: Iterable[dict], metadata: dict = None) -> Iterator[Document]:
+        """
+        Consumes extraction records page by page and yields chunks as soon as they are complete.
+        Only a small tail of text is carried between records, so chunks can still span page
+        boundaries without holding the whole file in memory.
+
+        Each chunk is tagged with the location of its text: "page" where it starts and
+        "page_end" when it continues onto a later page, "row" for CSV rows and "section".
+
+        Args:
+            records (Iterable[dict]): Records in document order (from TextExtractor.extract_records).
+            metadata (dict, optional): Metadata to attach to each chunk.
+
+        Output:
+            Iterator[Document]: Chunked LangChain Document objects.
+        """
+        try:
+            buffer = ""
+            marks = []          # (offset in buffer, location) where each record's text starts
+            count = 0
+            # Split once the buffer holds a few chunks' worth of text
+            flush_at = self.chunk_size * 4
+
+            for record in records:
+                text = record.get("text") or ""
+                if not text:
+                    continue
+                if buffer:
+                    buffer += "\n"
+                marks.append((len(buffer), {k: record[k] for k in _LOCATION_KEYS if record.get(k) is not None}))
+                buffer += text
+                if len(buffer) < flush_at:
+                    continue
+
+                chunks = self.splitter.split_text(buffer)
+                # Keep the last (possibly incomplete) chunk to join with the next record
+                tail = chunks.pop() if chunks else ""
+                for chunk, location in zip(chunks, _locate(buffer, chunks, marks)):
+                    yield Document(page_content=chunk, metadata={**(metadata or {}), **location, "chunk_index": count})
+                    count += 1
+                buffer, marks = _carry_tail(buffer, tail, marks)
+
+            chunks = self.splitter.split_text(buffer) if buffer else []
+            for chunk, location in zip(chunks, _locate(buffer, chunks, marks)):
+                yield Document(page_content=chunk, metadata={**(metadata or {}), **location, "chunk_index": count})
+                count += 1
+
+            logging.info(f"Streamed text into {count} chunks.")
+
+        except Exception as e:
+            logging.error("Failed to process text stream into chunks.")
+            raise CustomException(e, sys)
+
+
+# Record fields copied onto the chunks cut from them
+_LOCATION_KEYS = ("page", "row", "section")
+
+
+def _mark_at(marks: list, offset: int) -> int:
+    # Index of the record covering `offset`
+    return max(bisect_right([m[0] for m in marks], offset) - 1, 0)
+
+
+def _locate(buffer: str, chunks: list, marks: list) -> Iterator[dict]:
+    # Location metadata of each chunk, found by its offset in the buffer
+    cursor = 0
+    for chunk in chunks:
+        start = buffer.find(chunk, cursor)
+        if start < 0:
+            start = cursor
+        cursor = start + 1
+        if not marks:
+            yield {}
+            continue
+        first = _mark_at(marks, start)
+        last = _mark_at(marks, start + max(len(chunk) - 1, 0))
+        location = dict(marks[first][1])
+        end_page = marks[last][1].get("page")
+        if end_page is not None and end_page != location.get("page"):
+            location["page_end"] = end_page
+        yield location
+
+
+def _carry_tail(buffer: str, tail: str, marks: list) -> tuple:
+    # Keeps the tail as the new buffer, with the record marks rebased onto it
+    if not tail:
+        return "", []
+    start = max(buffer.rfind(tail), 0)
+    first = _mark_at(marks, start) if marks else 0
+    rebased = [(max(offset - start, 0), location) for offset, location in marks[first:]]
+    return tail, rebased
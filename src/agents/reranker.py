@@ -0,0 +1,156 @@
+# This Agent is responsible for reranking retrieved chunks with a local cross-encoder model.
+
+import re
+import sys
+import time
+import threading
+from collections import OrderedDict
+from typing import List
+from langchain_core.documents import Document
+from src.exception import CustomException
+from src.logger import logging
+
+
+class CrossEncoderReranker:
+    """
+    Scores (query, chunk) pairs with a CPU cross-encoder and keeps the best `top_n`.
+
+    - Pairs are scored in batches of `batch_size`.
+    - Scores are cached per (normalized query, chunk ID), so repeated questions only score new chunks.
+    - A latency budget is enforced with a running estimate of the per-pair cost. Only as many
+      candidates as fit in the budget are reranked, and reranking is skipped entirely when
+      not even `top_n` pairs fit.
+    - The first forward pass (model warm-up) is not part of the estimate, and after `probe_every`
+      skipped queries one batch is scored anyway, so a single slow call cannot disable reranking
+      for good.
+    - Returned chunks are copies carrying "rerank_score"; the caller's documents are not modified.
+    """
+
+    def __init__(self, model_name: str = "cross-encoder/ms-marco-MiniLM-L-6-v2", batch_size: int = 16,
+                 budget_ms: float = 300, cache_size: int = 20000, probe_every: int = 20, model=None):
+        """
+        Args:
+            model_name (str): HuggingFace cross-encoder model to load.
+            batch_size (int): Pairs scored per forward pass.
+            budget_ms (float): Maximum time to spend reranking one query.
+            cache_size (int): Number of (query, chunk) scores kept.
+            probe_every (int): Skipped queries after which one batch is scored to re-measure the cost.
+            model: Optional pre-built model exposing predict(pairs, batch_size=...) (e.g., in tests).
+        """
+        try:
+            if model is None:
+                # Imported here so sentence-transformers is only needed when reranking is enabled
+                from sentence_transformers import CrossEncoder
+                logging.info(f"Loading cross-encoder reranker: {model_name}")
+                model = CrossEncoder(model_name, device="cpu")
+            self.model = model
+            self.batch_size = batch_size
+            self.budget_ms = budget_ms
+            self.cache_size = cache_size
+            self.probe_every = max(1, probe_every)
+
+            self._cache = OrderedDict()     # (query, chunk id) -> score
+            self._lock = threading.Lock()
+            self._ms_per_pair = None        # Exponential moving average of the observed cost
+            self._warmed_up = False         # The first forward pass is not timed
+            self._since_probe = 0           # Queries skipped since the last scored batch
+            self.skipped = 0
+        except Exception as e:
+            raise CustomException(e, sys)
+
+    @staticmethod
+    def _chunk_key(doc: Document) -> str:
+        return doc.metadata.get("doc_id") or doc.id or doc.page_content
+
+    def _affordable_pairs(self) -> int:
+        # No estimate yet: allow a first batch to calibrate
+        if not self._ms_per_pair:
+            return self.batch_size
+        return int(self.budget_ms / self._ms_per_pair)
+
+    def _record_cost(self, per_pair: float, probe: bool):
+        # Folds one timed batch into the estimate (the warm-up batch only marks the model as warm).
+        # A probe replaces the estimate: it is the only measurement taken since going over budget.
+        with self._lock:
+            self._since_probe = 0
+            if not self._warmed_up:
+                self._warmed_up = True
+                return
+            if self._ms_per_pair is None or probe:
+                self._ms_per_pair = per_pair
+            else:
+                self._ms_per_pair = 0.8 * self._ms_per_pair + 0.2 * per_pair
+
+    def rerank(self, query: str, candidates: List[Document], top_n: int) -> List[Document]:
+        """
+        Reorders candidates by cross-encoder relevance and returns the best `top_n`.
+
+        Args:
+            query (str): The user's question.
+            candidates (List[Document]): Candidate chunks, best-first by the first-stage retriever.
+            top_n (int): Number of chunks to keep.
+
+        Output:
+            List[Document]: The top_n chunks; the first-stage order is kept if the budget does not allow reranking.
+        """
+        try:
+            if len(candidates) <= 1:
+                return candidates[:top_n]
+
+            query_key = re.sub(r"\s+", " ", query.strip().lower())
+            scores = {}
+            with self._lock:
+                for doc in candidates:
+                    key = (query_key, self._chunk_key(doc))
+                    if key in self._cache:
+                        self._cache.move_to_end(key)
+                        scores[key[1]] = self._cache[key]
+
+            uncached = [doc for doc in candidates if self._chunk_key(doc) not in scores]
+            affordable = self._affordable_pairs()
+            probe = False
+            if len(scores) + min(len(uncached), affordable) < min(top_n, len(candidates)):
+                with self._lock:
+                    probe = self._since_probe >= self.probe_every
+                    self._since_probe += 1
+                if probe:
+                    # Over budget for a while: score one batch to find out whether that is still true
+                    affordable = max(affordable, self.batch_size)
+                else:
+                    # Reranking would blow the latency budget: keep the first-stage order
+                    self.skipped += 1
+                    logging.warning(f"Skipping rerank: {len(uncached)} pairs exceed the {self.budget_ms}ms budget.")
+                    return candidates[:top_n]
+
+            # Rerank only the head of the candidate list that fits in the budget
+            to_score = uncached[:affordable]
+            if to_score:
+                started = time.perf_counter()
+                predicted = self.model.predict(
+                    [(query, doc.page_content) for doc in to_score], batch_size=self.batch_size
+                )
+                elapsed_ms = (time.perf_counter() - started) * 1000
+                self._record_cost(elapsed_ms / len(to_score), probe)
+
+                with self._lock:
+                    for doc, score in zip(to_score, predicted):
+                        key = (query_key, self._chunk_key(doc))
+                        scores[key[1]] = float(score)
+                        self._cache[key] = float(score)
+                    while len(self._cache) > self.cache_size:
+                        self._cache.popitem(last=False)
+                logging.info(f"Reranked {len(to_score)} pairs in {elapsed_ms:.0f}ms")
+
+            scored = [doc for doc in candidates if self._chunk_key(doc) in scores]
+            scored.sort(key=lambda doc: scores[self._chunk_key(doc)], reverse=True)
+            scored = [
+                Document(page_content=doc.page_content, id=doc.id,
+                         metadata={**doc.metadata, "rerank_score": scores[self._chunk_key(doc)]})
+                for doc in scored
+            ]
+            # Candidates outside the budget keep their first-stage order after the reranked head
+            unscored = [doc for doc in candidates if self._chunk_key(doc) not in scores]
+            return (scored + unscored)[:top_n]
+
+        except Exception as e:
+            raise CustomException(e, sys)
@@ -1,42 +1,101 @@
 # This Agent is responsible for retrieving relevant document chunks from a vector database based on user queries.
 
+import os
 import sys
 import uuid
 from typing import List, Dict
 from src.exception import CustomException
 from src.logger import logging
-from src.vector_store.chroma_db import ChromaDBHandler
+from src.registry import registry
 from src.mcp.mcp_like_msg import MCPMessage
+from src.vector_store.base import VectorStore
+from src.vector_store.mmr import cap_per_source
+from src.agents.context_packer import chunk_pages, cite
 from langchain_core.documents import Document
 
 
+def _doc_key(doc: Document) -> str:
+    # Chunk ID used to match the same chunk across result lists
+    return doc.metadata.get("doc_id") or doc.id or doc.page_content
+
+
+def reciprocal_rank_fusion(result_lists: List[List[Document]], k: int = 60) -> List[Document]:
+    """
+    Merges several ranked result lists with reciprocal-rank fusion:
+    score(doc) = sum over lists of 1 / (k + rank). Only ranks are used, so BM25 and
+    cosine scores never need to be put on the same scale.
+
+    Args:
+        result_lists (List[List[Document]]): Ranked lists (best first).
+        k (int): RRF damping constant (60 is the usual default).
+
+    Output:
+        List[Document]: Documents ordered by fused score.
+    """
+    scores, docs = {}, {}
+    for results in result_lists:
+        for rank, doc in enumerate(results):
+            key = _doc_key(doc)
+            scores[key] = scores.get(key, 0.0) + 1.0 / (k + rank + 1)
+            docs.setdefault(key, doc)
+    return [docs[key] for key in sorted(scores, key=scores.get, reverse=True)]
+
+
 class RetrievalAgent:
-    def __init__(self, vector_db=None, persist_directory: str = "vectorstore"):
+    def __init__(self, vector_db: VectorStore = None, top_k: int = 7, hybrid: bool = None, reranker=None):
         """
         Initializes the RetrievalAgent with a vector database.
 
         Args:
-            vector_db: Optional pre-initialized vector store instance.
-            persist_directory (str): Directory where ChromaDB persists data
+            vector_db (VectorStore, optional): Pre-initialized vector store (Chroma or the local engine).
+                       Defaults to the shared store from the component registry.
+            top_k (int): Number of chunks passed on to the LLM.
+            hybrid (bool, optional): Fuse BM25 keyword hits with vector hits (HYBRID_SEARCH env, default on).
+            reranker (optional): Cross-encoder reranker. Defaults to the shared one from the
+                                 registry, which is only built when RERANK_ENABLED is set.
         """
         try:
             if vector_db:
                 self.vector_db = vector_db  # Use provided vector store
             else:
-                self.vector_db = ChromaDBHandler(persist_directory)  # Load or create ChromaDB
+                self.vector_db = registry.get_vector_store()  # Shared, already loaded vector store
+
+            self.top_k = top_k
+            if hybrid is None:
+                hybrid = os.getenv("HYBRID_SEARCH", "true").lower() in ("1", "true", "yes")
+            self.hybrid = hybrid
+            # Each retriever contributes this many candidates to the fusion
+            self.fusion_candidates = int(os.getenv("HYBRID_CANDIDATES", "20"))
+            self.rrf_k = int(os.getenv("RRF_K", "60"))
+
+            # Optional rerank stage: wider candidate pool in, fewer but better chunks out
+            self.reranker = reranker if reranker is not None else registry.get_reranker()
+            self.rerank_candidates = int(os.getenv("RERANK_CANDIDATES", "50"))
+            self.rerank_top_n = int(os.getenv("RERANK_TOP_N", "5"))
+
+            # Result diversity defaults; both can be overridden per request
+            self.mmr = os.getenv("SEARCH_MMR", "false").lower() in ("1", "true", "yes")
+            self.max_per_source = int(os.getenv("MAX_CHUNKS_PER_SOURCE", "0")) or None
 
             logging.info("RetrievalAgent initialized successfully")
         except Exception as e:
             raise CustomException(e, sys)
 
-    def retrieve_context(self, query: str, documents: list, trace_id: str) -> dict:
+    def retrieve_context(self, query: str, documents: list, trace_id: str,
+                         mmr: bool = None, max_per_source: int = None, filters: dict = None) -> dict:
         """
         Retrieves the top relevant document chunks from the vector store based on the input query.
 
         Args:
             query (str): The user's input or question.
-            documents (list): (Unused in current logic) Placeholder for future use.
+            documents (list): Source file names to search in (empty = whole corpus).
             trace_id (str): A unique ID to trace this request across agents.
+            mmr (bool, optional): Diversify the dense results with maximal marginal relevance
+                                  (SEARCH_MMR env by default).
+            max_per_source (int, optional): At most this many chunks per source file
+                                            (MAX_CHUNKS_PER_SOURCE env by default, 0 = no cap).
+            filters (dict, optional): Extra metadata filters ("file_types", "ingested_after",
+                                      "ingested_before"), pushed down into the vector and BM25 searches.
 
         Output:
             dict: A structured MCP-like dictionary containing the top documents and their sources.
@@ -44,40 +103,136 @@ class RetrievalAgent:
         try:
             logging.info(f"Starting document retrieval for query: {query}")
 
-            # Search the vector store for top-K most relevant document chunks
-            top_docs: List[Document] = self.vector_db.similarity_search(query, k=7)
-
-            if not top_docs:
-                logging.warning("No relevant documents found for the query.")
-                return {
-                    "sender": "RetrievalAgent",
-                    "receiver": "LLMResponseAgent",
-                    "type": "RETRIEVAL_RESULT",
-                    "trace_id": trace_id,
-                    "payload": {
-                        "top_docs": [],
-                        "sources": []
-                    }
-                }
+            filters, mmr, max_per_source = self._search_options(documents, mmr, max_per_source, filters)
+            # With a reranker, fetch a wider pool and let the cross-encoder pick the best few
+            pool = self.rerank_candidates if self.reranker else self.top_k
 
-            # Extract the actual content and the sources (e.g., file names)
-            top_chunks = [doc.page_content for doc in top_docs]
-            sources_used = list(set(doc.metadata.get("source", "Unknown") for doc in top_docs))
+            if self.hybrid:
+                # Dense + BM25 candidates merged by reciprocal-rank fusion
+                per_retriever = max(self.fusion_candidates, pool)
+                dense = self.vector_db.similarity_search(
+                    query, k=per_retriever, mmr=mmr, max_per_source=max_per_source, filters=filters
+                )
+            else:
+                # Search the vector store for top-K most relevant document chunks
+                dense = self.vector_db.similarity_search(
+                    query, k=pool, mmr=mmr, max_per_source=max_per_source, filters=filters
+                )
+            return self._retrieval_message(query, dense, trace_id, max_per_source, filters)
+        except Exception as e:
+            raise CustomException(e, sys)
+
+    def embed_queries(self, queries: List[str]) -> list:
+        """
+        Query embeddings of several questions in one batched pass (see dense_search_batch).
+        """
+        return self.vector_db.embed_queries(queries)
+
+    def dense_search_batch(self, queries: List[str], documents: list, mmr: bool = None, max_per_source: int = None,
+                           filters: dict = None, query_embeddings: list = None) -> list:
+        """
+        First half of retrieve_context for a batch of questions sharing the same options: the dense
+        search of all questions runs as one multi-query vector search. Each question is then finished
+        on its own with complete_retrieval, so BM25 and reranking of one question do not hold up the others.
 
-            logging.info(f"Retrieved {len(top_docs)} chunks from sources: {sources_used}")
+        Args:
+            queries (List[str]): The questions.
+            documents (list): Source file names to search in (empty = whole corpus).
+            mmr, max_per_source, filters: As in retrieve_context.
+            query_embeddings (list, optional): Precomputed embeddings of `queries` (see embed_queries).
+
+        Output:
+            list: The dense hits of each question, in order.
+        """
+        try:
+            logging.info(f"Starting batched dense retrieval for {len(queries)} queries")
 
+            filters, mmr, max_per_source = self._search_options(documents, mmr, max_per_source, filters)
+            pool = self.rerank_candidates if self.reranker else self.top_k
+            k = max(self.fusion_candidates, pool) if self.hybrid else pool
+
+            return self.vector_db.similarity_search_batch(
+                list(queries), k=k, mmr=mmr, max_per_source=max_per_source, filters=filters,
+                query_embeddings=query_embeddings
+            )
+        except Exception as e:
+            raise CustomException(e, sys)
+
+    def complete_retrieval(self, query: str, dense: List[Document], documents: list, trace_id: str,
+                           mmr: bool = None, max_per_source: int = None, filters: dict = None) -> dict:
+        """
+        Second half of retrieve_context for one question of a dense_search_batch: BM25 fusion,
+        reranking and the RETRIEVAL_RESULT message (same arguments as retrieve_context).
+        """
+        try:
+            filters, mmr, max_per_source = self._search_options(documents, mmr, max_per_source, filters)
+            return self._retrieval_message(query, dense, trace_id, max_per_source, filters)
+        except Exception as e:
+            raise CustomException(e, sys)
+
+    def _search_options(self, documents: list, mmr: bool, max_per_source: int, filters: dict) -> tuple:
+        # Scope the search to the selected documents, inside the stores rather than afterwards
+        filters = dict(filters or {})
+        if documents:
+            filters["sources"] = list(documents)
+
+        mmr = self.mmr if mmr is None else mmr
+        max_per_source = self.max_per_source if max_per_source is None else (max_per_source or None)
+        return filters, mmr, max_per_source
+
+    def _retrieval_message(self, query: str, dense: List[Document], trace_id: str, max_per_source: int,
+                           filters: dict) -> dict:
+        # Fuses the dense hits with BM25 (hybrid mode), reranks, and builds the RETRIEVAL_RESULT message
+        pool = self.rerank_candidates if self.reranker else self.top_k
+
+        if self.hybrid:
+            lexical = self.vector_db.keyword_search(query, k=max(self.fusion_candidates, pool), filters=filters)
+            # BM25 hits are not diversified, so the source cap is applied again after fusion
+            fused = reciprocal_rank_fusion([dense, lexical], k=self.rrf_k)
+            top_docs: List[Document] = cap_per_source(fused, max_per_source)[:pool]
+        else:
+            top_docs: List[Document] = dense
+
+        if self.reranker:
+            top_docs = self.reranker.rerank(query, top_docs, top_n=self.rerank_top_n)
+
+        if not top_docs:
+            logging.warning("No relevant documents found for the query.")
             return {
                 "sender": "RetrievalAgent",
                 "receiver": "LLMResponseAgent",
                 "type": "RETRIEVAL_RESULT",
                 "trace_id": trace_id,
                 "payload": {
-                    "top_docs": top_docs,     # Pass full Document objects with metadata
-                    "sources": sources_used   # Source files used in retrieval
+                    "top_docs": [],
+                    "sources": [],
+                    "citations": []
                 }
             }
-        except Exception as e:
-            raise CustomException(e, sys)
+
+        # Extract the actual content and the sources (e.g., file names)
+        top_chunks = [doc.page_content for doc in top_docs]
+        # Sources in rank order of their best chunk
+        sources_used = list(dict.fromkeys(doc.metadata.get("source", "Unknown") for doc in top_docs))
+        # Same order, with the pages each source's chunks came from (e.g., "report.pdf (pp. 3-4)")
+        pages = {source: [] for source in sources_used}
+        for doc in top_docs:
+            pages[doc.metadata.get("source", "Unknown")].extend(chunk_pages(doc.metadata))
+        citations = [cite(source, source_pages) for source, source_pages in pages.items()]
+
+        logging.info(f"Retrieved {len(top_docs)} chunks from sources: {sources_used}")
+
+        return {
+            "sender": "RetrievalAgent",
+            "receiver": "LLMResponseAgent",
+            "type": "RETRIEVAL_RESULT",
+            "trace_id": trace_id,
+            "payload": {
+                "top_docs": top_docs,     # Pass full Document objects with metadata
+                "sources": sources_used,  # Source files used in retrieval
+                "citations": citations    # Source files with page numbers
+            }
+        }
 
     def retrieve(self, query: str) -> MCPMessage:
         """
@@ -10,16 +10,28 @@ from langchain_community.document_loaders import (
     TextLoader
 )
 
+from src.cache.extraction_cache import ExtractionCache
 from src.exception import CustomException
 from src.logger import logging
+from src.vector_store.manifest import hash_file
 
 from dataclasses import dataclass
 @dataclass
 class TextExtractor:
-    def __init__(self):
+    def __init__(self, cache: ExtractionCache = None):
+        """
+        Args:
+            cache (ExtractionCache, optional): Persistent extraction cache. Defaults to the shared
+                                               registry cache (None when EXTRACTION_CACHE_ENABLED is false).
+        """
         # Initialize and log supported file types
         logging.info("Initializing TextExtractor with supported file types...")
 
+        if cache is None:
+            from src.registry import registry
+            cache = registry.get_extraction_cache()
+        self.cache = cache
+
         # Mapping of file extensions to corresponding LangChain loaders
         self.supported_loaders = {
             ".pdf": PyPDFLoader,
@@ -30,37 +42,120 @@ class TextExtractor:
             ".markdown": UnstructuredMarkdownLoader,
             ".txt": TextLoader
         }
+        self._element_loaders = {UnstructuredWordDocumentLoader, UnstructuredPowerPointLoader, UnstructuredMarkdownLoader}
 
-    def extract(self, file_path: str) -> str:
+    def _get_loader_cls(self, file_path: str):
+        # Select the correct loader class for the file type
+        ext = os.path.splitext(file_path)[1].lower()
+        loader_cls = self.supported_loaders.get(ext)
+
+        if not loader_cls:
+            # Raise an error if the file type is not supported
+            raise ValueError(f"Unsupported file type: {ext}")
+
+        return loader_cls
+
+    def _get_loader(self, file_path: str):
+        # Instantiate the correct loader for the file type
+        loader_cls = self._get_loader_cls(file_path)
+        # Unstructured loaders return one element per paragraph/title in "elements" mode, with
+        # page (slide) numbers; the default mode would merge the whole file into one document
+        kwargs = {"mode": "elements"} if loader_cls in self._element_loaders else {}
+        return loader_cls(file_path, **kwargs)
+
+    @staticmethod
+    def _to_record(doc, section: str = None) -> dict:
+        # Keep the text plus the location metadata the loader produced (1-based page / row)
+        record = {"text": doc.page_content}
+        metadata = doc.metadata or {}
+        if metadata.get("page_number") is not None:
+            record["page"] = int(metadata["page_number"])       # Unstructured pages / slides
+        elif isinstance(metadata.get("page"), int):
+            record["page"] = metadata["page"] + 1               # PyPDF pages are 0-based
+        if isinstance(metadata.get("row"), int):
+            record["row"] = metadata["row"] + 1                 # CSV rows are 0-based
+        if section:
+            record["section"] = section
+        return record
+
+    def _load_records(self, file_path: str):
+        # lazy_load yields documents as the loader parses them
+        section = None
+        for doc in self._get_loader(file_path).lazy_load():
+            if doc.metadata.get("category") == "Title":
+                # Titles are kept as text and name the section of the elements that follow
+                section = doc.page_content.strip()[:200] or section
+            if doc.page_content:
+                yield self._to_record(doc, section)
+
+    def extract_records(self, file_path: str, file_hash: str = None):
         """
-        Extracts text from a given file using the appropriate loader based on file extension.
+        Lazily extracts a file as a stream of page/slide/row records, so large files never have
+        to be held in memory as one string and chunking can start before parsing finishes.
+
+        With a cache, unchanged content (same hash, loader and loader version) is read back
+        from disk instead of being parsed again; otherwise the parsed records are written to the
+        cache as they stream past.
 
         Args:
             file_path (str): The path to the file to be extracted.
+            file_hash (str, optional): SHA-256 of the file when already known (computed otherwise).
 
         Output:
-            The combined text content extracted from the file.
+            Iterator[dict]: {"text"} plus, when the loader provides them, "page" (PDF page,
+                            DOCX page or PPTX slide, 1-based), "row" (CSV, 1-based) and
+                            "section" (the nearest preceding title).
 
         Raises:
             CustomException: If the file type is unsupported or extraction fails.
         """
         try:
-            # Get the file extension in lowercase
-            ext = os.path.splitext(file_path)[1].lower()
+            if self.cache is None:
+                records = self._load_records(file_path)
+            else:
+                key = ExtractionCache.key(file_hash or hash_file(file_path), self._get_loader_cls(file_path))
+                records = self.cache.read(key)
+                if records is not None:
+                    logging.info(f"Extraction cache hit: {os.path.basename(file_path)}")
+                else:
+                    records = self.cache.write_through(key, self._load_records(file_path))
+
+            yield from records
+
+        except Exception as e:
+            logging.error(f"Failed to extract text from {file_path}")
+            raise CustomException(e, sys)
 
-            # Select the correct loader class for the file type
-            loader_cls = self.supported_loaders.get(ext)
+    def extract_pages(self, file_path: str, file_hash: str = None):
+        """
+        Text-only view of extract_records().
 
-            if not loader_cls:
-                # Raise an error if the file type is not supported
-                raise ValueError(f"Unsupported file type: {ext}")
+        Args:
+            file_path (str): The path to the file to be extracted.
+            file_hash (str, optional): SHA-256 of the file when already known.
+
+        Output:
+            Iterator[str]: The text of each page/element produced by the loader.
+        """
+        for record in self.extract_records(file_path, file_hash=file_hash):
+            yield record["text"]
 
-            # Instantiate the loader and load the file content
-            loader = loader_cls(file_path)
-            docs = loader.load()
+    def extract(self, file_path: str) -> str:
+        """
+        Extracts text from a given file using the appropriate loader based on file extension.
 
-            # Join content from all pages/documents into one string
-            return "\n".join([doc.page_content for doc in docs])
+        Args:
+            file_path (str): The path to the file to be extracted.
+
+        Output:
+            The combined text content extracted from the file.
+
+        Raises:
+            CustomException: If the file type is unsupported or extraction fails.
+        """
+        try:
+            # Join content from all pages/documents into one string (cached like extract_pages)
+            return "\n".join(self.extract_pages(file_path))
 
         except Exception as e:
             # Log and raise a custom exception if anything fails
@@ -0,0 +1,241 @@
+# This file defines a two-tier (exact + semantic) cache for final answers produced by the CoordinatorAgent.
+
+import re
+import sys
+import time
+import threading
+from collections import OrderedDict
+import numpy as np
+from src.exception import CustomException
+from src.logger import logging
+
+
+def normalize_query(query: str) -> str:
+    """
+    Normalizes a query for exact matching: collapsed whitespace and trailing punctuation
+    removed ("What is X?" == "What is  X"). Case is kept, since it can change the meaning
+    ("US" vs "us"); queries differing only in case can still match in the semantic tier.
+    """
+    query = re.sub(r"\s+", " ", query.strip())
+    return query.rstrip(" ?!.")
+
+
+class _CacheEntry:
+    __slots__ = ("answer", "sources", "citations", "embedding", "created_at", "size")
+
+    def __init__(self, answer: str, sources: list, embedding, size: int, citations: list = None):
+        self.answer = answer
+        self.sources = sources
+        self.citations = citations if citations is not None else sources
+        self.embedding = embedding
+        self.created_at = time.monotonic()
+        self.size = size
+
+
+class AnswerCache:
+    """
+    Caches final answers in front of retrieval + LLM generation.
+
+    Lookup order:
+    1. Exact match on the normalized query (no embedding needed).
+    2. Semantic match: cosine similarity between the query embedding and cached query
+       embeddings, accepted above `similarity_threshold`.
+
+    Entries are evicted LRU-first when `max_entries` or `max_bytes` is exceeded, and expire
+    after `ttl_seconds`. `invalidate()` must be called whenever the corpus changes; answers
+    computed before an invalidation are never stored afterwards (generation check).
+    """
+
+    def __init__(
+        self,
+        embed_fn=None,
+        similarity_threshold: float = 0.95,
+        max_entries: int = 1024,
+        max_bytes: int = 32 * 1024 * 1024,
+        ttl_seconds: float = 3600,
+    ):
+        """
+        Args:
+            embed_fn: Callable mapping a query string to its embedding (None disables the semantic tier).
+            similarity_threshold (float): Minimum cosine similarity for a semantic hit.
+            max_entries (int): Maximum number of cached answers.
+            max_bytes (int): Approximate memory budget for cached answers and embeddings.
+            ttl_seconds (float): Time after which an entry is considered stale.
+        """
+        self.embed_fn = embed_fn
+        self.similarity_threshold = similarity_threshold
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+
+        self._entries = OrderedDict()   # (scope, normalized query) -> _CacheEntry, LRU order
+        self._bytes = 0
+        self._generation = 0
+        self._lock = threading.Lock()
+
+        # Counters exposed through stats()
+        self._exact_hits = 0
+        self._semantic_hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._invalidations = 0
+
+    @property
+    def generation(self) -> int:
+        """Current corpus generation; pass it back to put() to avoid storing stale answers."""
+        return self._generation
+
+    def _embed(self, query: str):
+        if self.embed_fn is None:
+            return None
+        vector = np.asarray(self.embed_fn(query), dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _is_expired(self, entry: _CacheEntry) -> bool:
+        return self.ttl_seconds is not None and time.monotonic() - entry.created_at > self.ttl_seconds
+
+    def _remove(self, key):
+        entry = self._entries.pop(key)
+        self._bytes -= entry.size
+
+    def get(self, query: str, scope=(), query_embedding=None):
+        """
+        Looks up a cached answer for the query.
+
+        Args:
+            query (str): The user's question.
+            scope (tuple): Hashable description of any retrieval filters; only entries
+                           with the same scope can match.
+            query_embedding: Optional precomputed embedding for the semantic tier.
+
+        Output:
+            dict or None: {"answer", "sources", "citations", "cache": "exact"|"semantic"} on a hit, else None.
+        """
+        try:
+            key = (scope, normalize_query(query))
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is not None and self._is_expired(entry):
+                    self._remove(key)
+                    entry = None
+                if entry is not None:
+                    self._entries.move_to_end(key)
+                    self._exact_hits += 1
+                    return {"answer": entry.answer, "sources": entry.sources, "citations": entry.citations, "cache": "exact"}
+
+                has_candidates = any(k[0] == scope for k in self._entries)
+
+            # Semantic tier (embedding is computed outside the lock)
+            if has_candidates and (self.embed_fn is not None or query_embedding is not None):
+                if query_embedding is None:
+                    vector = self._embed(query)
+                else:
+                    vector = np.asarray(query_embedding, dtype=np.float32)
+                    vector = vector / (np.linalg.norm(vector) or 1.0)
+
+                with self._lock:
+                    keys = [k for k, e in self._entries.items()
+                            if k[0] == scope and e.embedding is not None and not self._is_expired(e)]
+                    if keys:
+                        matrix = np.stack([self._entries[k].embedding for k in keys])
+                        scores = matrix @ vector
+                        best = int(np.argmax(scores))
+                        if scores[best] >= self.similarity_threshold:
+                            entry = self._entries[keys[best]]
+                            self._entries.move_to_end(keys[best])
+                            self._semantic_hits += 1
+                            return {"answer": entry.answer, "sources": entry.sources, "citations": entry.citations,
+                                    "cache": "semantic"}
+
+            with self._lock:
+                self._misses += 1
+            return None
+
+        except Exception as e:
+            raise CustomException(e, sys)
+
+    def put(self, query: str, answer: str, sources: list, scope=(), generation: int = None, query_embedding=None,
+            citations: list = None):
+        """
+        Stores an answer for the query.
+
+        Args:
+            query (str): The user's question.
+            answer (str): The generated answer.
+            sources (list): Source file names used for the answer.
+            scope (tuple): Same scope value that was passed to get().
+            generation (int, optional): Value of `generation` read before the answer was computed.
+                                        The answer is dropped if the corpus changed since then.
+            query_embedding: Optional precomputed embedding for the semantic tier.
+            citations (list, optional): Sources with page numbers (defaults to `sources`).
+        """
+        try:
+            if generation is not None and generation != self._generation:
+                logging.info("Corpus changed while answering; not caching stale answer.")
+                return
+
+            if query_embedding is None:
+                vector = self._embed(query)
+            else:
+                vector = np.asarray(query_embedding, dtype=np.float32)
+                vector = vector / (np.linalg.norm(vector) or 1.0)
+
+            key = (scope, normalize_query(query))
+            size = (
+                len(answer.encode("utf-8"))
+                + sum(len(str(s)) for s in sources)
+                + sum(len(str(c)) for c in citations or [])
+                + len(key[1])
+                + (vector.nbytes if vector is not None else 0)
+                + 200  # Rough per-entry object overhead
+            )
+            if size > self.max_bytes:
+                return
+
+            with self._lock:
+                if generation is not None and generation != self._generation:
+                    return
+                if key in self._entries:
+                    self._remove(key)
+                self._entries[key] = _CacheEntry(answer, list(sources), vector, size, list(citations) if citations else None)
+                self._bytes += size
+
+                # Evict least recently used entries until both budgets are respected
+                while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                    self._remove(next(iter(self._entries)))
+                    self._evictions += 1
+
+        except Exception as e:
+            raise CustomException(e, sys)
+
+    def invalidate(self):
+        """
+        Drops every cached answer. Called whenever documents are added or the collection is cleared.
+        """
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+            self._generation += 1
+            self._invalidations += 1
+        logging.info("Answer cache invalidated after corpus change.")
+
+    def stats(self) -> dict:
+        """
+        Output:
+            dict: Hit/miss counters and current size, for sizing the cache.
+        """
+        with self._lock:
+            lookups = self._exact_hits + self._semantic_hits + self._misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+                "exact_hits": self._exact_hits,
+                "semantic_hits": self._semantic_hits,
+                "misses": self._misses,
+                "hit_rate": (self._exact_hits + self._semantic_hits) / lookups if lookups else 0.0,
+                "evictions": self._evictions,
+                "invalidations": self._invalidations,
+            }
@@ -0,0 +1,234 @@
+# This file defines a caching wrapper around an embedding model so repeated texts skip the transformer.
+
+import os
+import re
+import sys
+import time
+import atexit
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import List
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from src.exception import CustomException
+from src.logger import logging
+
+# Rows allocated for the in-memory tier on first store; the matrix doubles up to max_entries as it fills
+_INITIAL_ROWS = 1024
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    LangChain-compatible Embeddings wrapper with an in-memory LRU and an optional on-disk tier.
+
+    - Keys are SHA-1 digests of (model name, kind, normalized text), so different models never share
+      vectors, and query and document embeddings of the same text (which differ for models with
+      instruction prefixes or asymmetric encoders) are cached separately.
+    - Vectors are kept in one float32 matrix (one row per entry) instead of Python lists of
+      floats, which is several times smaller. The matrix grows by doubling up to `max_entries`
+      rows, so a lightly used cache does not hold the full allocation.
+    - The optional SQLite tier stores the same float32 bytes and survives restarts. New vectors
+      are committed in batches (every `commit_every` rows or `commit_interval` seconds, and at exit)
+      rather than one transaction per cache miss.
+
+    Both embed_query (query path) and embed_documents (ingestion path) go through the cache,
+    and only the texts that miss are sent to the underlying model, in one batch.
+    """
+
+    def __init__(self, base_embeddings: Embeddings, model_name: str, max_entries: int = 50000, cache_dir: str = None,
+                 commit_every: int = 256, commit_interval: float = 2.0):
+        """
+        Args:
+            base_embeddings (Embeddings): The real embedding model (e.g., HuggingFaceEmbeddings).
+            model_name (str): Name of the model, used as part of the cache key.
+            max_entries (int): Number of vectors kept in memory.
+            cache_dir (str, optional): Directory for the persistent on-disk tier (disabled if None).
+            commit_every (int): Uncommitted on-disk rows that trigger a commit.
+            commit_interval (float): Maximum seconds new on-disk rows stay uncommitted while the cache is used.
+        """
+        try:
+            self.base_embeddings = base_embeddings
+            self.model_name = model_name
+            self.max_entries = max_entries
+            self.commit_every = commit_every
+            self.commit_interval = commit_interval
+
+            self._matrix = None             # float32 [rows, dim]; rows double up to max_entries as the cache fills
+            self._rows = OrderedDict()      # key -> row index, in LRU order
+            self._lock = threading.Lock()
+
+            self.hits = 0
+            self.misses = 0
+
+            self._db = None
+            self._uncommitted = 0
+            self._last_commit = time.monotonic()
+            if cache_dir:
+                os.makedirs(cache_dir, exist_ok=True)
+                self._db = sqlite3.connect(os.path.join(cache_dir, "embeddings.sqlite3"), check_same_thread=False)
+                # WAL lets other processes read the cache while this one holds an open write batch
+                self._db.execute("PRAGMA journal_mode=WAL")
+                self._db.execute("CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB)")
+                self._db.commit()
+                # Rows written since the last batch commit are committed when the process exits
+                atexit.register(self.flush)
+                logging.info(f"Embedding cache on-disk tier at: {cache_dir}")
+        except Exception as e:
+            raise CustomException(e, sys)
+
+    @staticmethod
+    def normalize(text: str) -> str:
+        # Collapse whitespace so formatting-only differences map to the same vector
+        return re.sub(r"\s+", " ", text).strip()
+
+    def _key(self, text: str, kind: str) -> str:
+        # `kind` is "query" or "document": the two paths may embed the same text differently
+        return hashlib.sha1(f"{self.model_name}\x00{kind}\x00{self.normalize(text)}".encode("utf-8")).hexdigest()
+
+    def _lookup_memory(self, key: str):
+        row = self._rows.get(key)
+        if row is None:
+            return None
+        self._rows.move_to_end(key)
+        return self._matrix[row].copy()
+
+    def _store_memory(self, key: str, vector: np.ndarray):
+        if self._matrix is None:
+            self._matrix = np.zeros((min(self.max_entries, _INITIAL_ROWS), vector.shape[0]), dtype=np.float32)
+        if key in self._rows:
+            self._rows.move_to_end(key)
+            return
+        # Rows are filled in order and only reused after an eviction, so rows [0, len(_rows)) are in use
+        if len(self._rows) == len(self._matrix) and len(self._matrix) < self.max_entries:
+            grown = np.zeros((min(2 * len(self._matrix), self.max_entries), self._matrix.shape[1]), dtype=np.float32)
+            grown[:len(self._matrix)] = self._matrix
+            self._matrix = grown
+        if len(self._rows) < len(self._matrix):
+            row = len(self._rows)
+        else:
+            # Full: evict the least recently used vector and reuse its row
+            _, row = self._rows.popitem(last=False)
+        self._matrix[row] = vector
+        self._rows[key] = row
+
+    def _lookup_disk(self, keys: List[str]) -> dict:
+        if self._db is None or not keys:
+            return {}
+        found = {}
+        # Query in slices to stay under SQLite's bound-parameter limit
+        for start in range(0, len(keys), 500):
+            part = keys[start:start + 500]
+            rows = self._db.execute(
+                f"SELECT key, vector FROM embeddings WHERE key IN ({','.join('?' * len(part))})", part
+            ).fetchall()
+            for key, blob in rows:
+                found[key] = np.frombuffer(blob, dtype=np.float32).copy()
+        return found
+
+    def _store_disk(self, items: List[tuple]):
+        if self._db is None or not items:
+            return
+        # Rows join the open transaction (visible to this connection's lookups right away) and
+        # are committed together once enough rows or time have accumulated
+        self._db.executemany(
+            "INSERT OR REPLACE INTO embeddings (key, vector) VALUES (?, ?)",
+            [(key, vector.astype(np.float32).tobytes()) for key, vector in items],
+        )
+        self._uncommitted += len(items)
+        if self._uncommitted >= self.commit_every or time.monotonic() - self._last_commit >= self.commit_interval:
+            self._commit()
+
+    def _commit(self):
+        self._db.commit()
+        self._uncommitted = 0
+        self._last_commit = time.monotonic()
+
+    def flush(self):
+        """
+        Commits on-disk rows written since the last batch commit.
+        """
+        try:
+            with self._lock:
+                if self._db is not None and self._uncommitted:
+                    self._commit()
+        except Exception as e:
+            raise CustomException(e, sys)
+
+    def _embed_cached(self, texts: List[str], kind: str, embed_missing) -> List[List[float]]:
+        keys = [self._key(t, kind) for t in texts]
+        vectors = [None] * len(texts)
+
+        with self._lock:
+            for i, key in enumerate(keys):
+                vectors[i] = self._lookup_memory(key)
+
+            missing = [i for i, v in enumerate(vectors) if v is None]
+            if missing:
+                from_disk = self._lookup_disk(list({keys[i] for i in missing}))
+                for i in missing:
+                    if keys[i] in from_disk:
+                        vectors[i] = from_disk[keys[i]]
+                        self._store_memory(keys[i], vectors[i])
+
+        # Embed each distinct missing text once, outside the lock
+        pending = {}
+        for i, v in enumerate(vectors):
+            if v is None:
+                pending.setdefault(keys[i], texts[i])
+
+        with self._lock:
+            self.hits += len(texts) - len(pending)
+            self.misses += len(pending)
+
+        if pending:
+            new_vectors = embed_missing(list(pending.values()))
+            computed = {key: np.asarray(vec, dtype=np.float32) for key, vec in zip(pending.keys(), new_vectors)}
+            with self._lock:
+                for key, vector in computed.items():
+                    self._store_memory(key, vector)
+                self._store_disk(list(computed.items()))
+            for i, v in enumerate(vectors):
+                if v is None:
+                    vectors[i] = computed[keys[i]]
+
+        return [v.tolist() for v in vectors]
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """
+        Embeds document chunks, only sending cache misses to the underlying model.
+        """
+        try:
+            return self._embed_cached(texts, "document", self.base_embeddings.embed_documents)
+        except Exception as e:
+            raise CustomException(e, sys)
+
+    def embed_query(self, text: str) -> List[float]:
+        """
+        Embeds a single query, served from the cache when the same question was seen before.
+        """
+        try:
+            return self._embed_cached([text], "query", lambda missing: [self.base_embeddings.embed_query(missing[0])])[0]
+        except Exception as e:
+            raise CustomException(e, sys)
+
+    def embed_queries(self, texts: List[str]) -> List[List[float]]:
+        """
+        Embeds several queries at once (e.g., a batch of questions): cache misses go to the model
+        in one forward pass instead of one embed_query call each.
+        """
+        try:
+            embed = getattr(self.base_embeddings, "embed_queries", None) or (
+                lambda missing: [self.base_embeddings.embed_query(text) for text in missing]
+            )
+            return self._embed_cached(texts, "query", embed)
+        except Exception as e:
+            raise CustomException(e, sys)
+
+    def stats(self) -> dict:
+        """
+        Output:
+            dict: Hit/miss counters and the number of vectors held in memory.
+        """
+        return {"entries": len(self._rows), "max_entries": self.max_entries, "hits": self.hits, "misses": self.misses}
@@ -0,0 +1,187 @@
+# This file defines a persistent cache of extracted document text, so unchanged files are never parsed twice.
+
+import os
+import sys
+import json
+import zlib
+import hashlib
+import tempfile
+import threading
+from importlib import metadata
+from src.exception import CustomException
+from src.logger import logging
+
+# Bump when the cached record format changes, so old entries are ignored
+CACHE_FORMAT_VERSION = 2
+
+# Parser package behind each loader family; its version is part of the cache key
+_PARSER_PACKAGES = {
+    "PyPDFLoader": "pypdf",
+    "UnstructuredWordDocumentLoader": "unstructured",
+    "UnstructuredPowerPointLoader": "unstructured",
+    "UnstructuredMarkdownLoader": "unstructured",
+}
+
+
+def _package_version(name: str) -> str:
+    try:
+        return metadata.version(name)
+    except metadata.PackageNotFoundError:
+        return "none"
+
+
+def loader_version(loader_cls) -> str:
+    """
+    Version string of a loader: its LangChain package plus the parser library it wraps.
+    Upgrading either one produces new cache keys, so stale extractions are never reused.
+    """
+    top_package = loader_cls.__module__.split(".")[0].replace("_", "-")
+    parser = _PARSER_PACKAGES.get(loader_cls.__name__)
+    version = f"{top_package}={_package_version(top_package)}"
+    if parser:
+        version += f";{parser}={_package_version(parser)}"
+    return version
+
+
+class ExtractionCache:
+    """
+    On-disk cache of extraction results keyed by (file content hash, loader class, loader version).
+
+    - Each entry is one file of zlib-compressed JSON lines, one line per page/element, so page
+      boundaries are kept and entries are written and read as streams (no whole-file strings).
+    - An entry only becomes visible once the extraction finished without errors.
+    - When the total size exceeds `max_bytes`, the least recently used entries are deleted
+      (hits refresh an entry's modification time).
+    """
+
+    def __init__(self, cache_dir: str, max_bytes: int = 1024 * 1024 * 1024, compression_level: int = 6):
+        """
+        Args:
+            cache_dir (str): Directory holding the cache entries.
+            max_bytes (int): Size budget of the directory.
+            compression_level (int): zlib level (1 = fastest, 9 = smallest).
+        """
+        try:
+            self.cache_dir = cache_dir
+            self.max_bytes = max_bytes
+            self.compression_level = compression_level
+            os.makedirs(cache_dir, exist_ok=True)
+            self._lock = threading.Lock()
+            self._total_bytes = None     # Computed on first write
+            self.hits = 0
+            self.misses = 0
+        except Exception as e:
+            raise CustomException(e, sys)
+
+    @staticmethod
+    def key(file_hash: str, loader_cls) -> str:
+        """
+        Cache key of one file as extracted by one loader version.
+        """
+        raw = f"{CACHE_FORMAT_VERSION}\x00{file_hash}\x00{loader_cls.__module__}.{loader_cls.__name__}\x00{loader_version(loader_cls)}"
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.jsonl.z")
+
+    def read(self, key: str):
+        """
+        Output:
+            Iterator[dict] or None: The cached page records ({"text", "page", ...}), or None on a miss.
+        """
+        path = self._path(key)
+        if not os.path.exists(path):
+            self.misses += 1
+            return None
+        self.hits += 1
+        try:
+            os.utime(path)      # Mark as recently used for eviction
+        except OSError:
+            pass
+        return self._iter_records(path)
+
+    def _iter_records(self, path: str, block_size: int = 256 * 1024):
+        # Decompresses incrementally and yields one record per line
+        decompressor = zlib.decompressobj()
+        pending = b""
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(block_size), b""):
+                pending += decompressor.decompress(block)
+                *lines, pending = pending.split(b"\n")
+                for line in lines:
+                    yield json.loads(line)
+        pending += decompressor.flush()
+        for line in pending.split(b"\n"):
+            if line:
+                yield json.loads(line)
+
+    def write_through(self, key: str, records):
+        """
+        Passes records through unchanged while writing them to a new entry. The entry is only
+        committed when the stream is fully consumed; errors or early stops discard it.
+
+        Args:
+            key (str): Cache key (see key()).
+            records (Iterable[dict]): Page records from the loader.
+
+        Output:
+            Iterator[dict]: The same records.
+        """
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".part")
+        committed = False
+        try:
+            compressor = zlib.compressobj(self.compression_level)
+            with os.fdopen(fd, "wb") as out:
+                for record in records:
+                    out.write(compressor.compress(json.dumps(record).encode("utf-8") + b"\n"))
+                    yield record
+                out.write(compressor.flush())
+            os.replace(tmp_path, self._path(key))
+            committed = True
+            self._account(os.path.getsize(self._path(key)))
+        finally:
+            if not committed and os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def _account(self, added: int):
+        # Track the directory size and evict least recently used entries beyond the budget
+        with self._lock:
+            if self._total_bytes is None:
+                self._total_bytes = sum(e.stat().st_size for e in os.scandir(self.cache_dir) if e.name.endswith(".z"))
+            else:
+                self._total_bytes += added
+            if self._total_bytes <= self.max_bytes:
+                return
+
+            entries = sorted(
+                (e for e in os.scandir(self.cache_dir) if e.name.endswith(".z")),
+                key=lambda e: e.stat().st_mtime,
+            )
+            # Re-sync with the disk (other processes may share the directory)
+            self._total_bytes = sum(e.stat().st_size for e in entries)
+            removed = 0
+            for entry in entries:
+                if self._total_bytes <= self.max_bytes:
+                    break
+                try:
+                    size = entry.stat().st_size
+                    os.remove(entry.path)
+                    self._total_bytes -= size
+                    removed += 1
+                except OSError:
+                    continue
+            logging.info(f"Extraction cache evicted {removed} entries ({self._total_bytes} bytes kept)")
+
+    def stats(self) -> dict:
+        """
+        Output:
+            dict: {"hits", "misses", "entries", "bytes", "max_bytes"}
+        """
+        entries = [e for e in os.scandir(self.cache_dir) if e.name.endswith(".z")]
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "entries": len(entries),
+            "bytes": sum(e.stat().st_size for e in entries),
+            "max_bytes": self.max_bytes,
+        }
@@ -0,0 +1,244 @@
+# This file defines the embedding backends: the PyTorch sentence-transformers model and a quantized
+# ONNX Runtime model for faster CPU inference, behind one interface.
+
+import os
+import sys
+from typing import List
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from src.exception import CustomException
+from src.logger import logging
+
+
+class EmbeddingBackend(Embeddings):
+    """
+    Interface of an embedding backend (a LangChain Embeddings with a few extras).
+
+    - `name` identifies the model *and* the runtime/precision, so vectors of different
+      backends are never mixed in caches.
+    - `embed_queries` embeds several queries in one forward pass (used by the micro-batcher).
+    """
+
+    name: str = ""
+
+    def embed_queries(self, texts: List[str]) -> List[List[float]]:
+        # Query and document encoding are identical for symmetric models such as MiniLM
+        return self.embed_documents(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_queries([text])[0]
+
+
+class HuggingFaceBackend(EmbeddingBackend):
+    """
+    Full-precision PyTorch sentence-transformers model (the original behaviour).
+    """
+
+    def __init__(self, model_name: str, threads: int = 0):
+        """
+        Args:
+            model_name (str): HuggingFace model to load.
+            threads (int): PyTorch intra-op threads (0 = library default).
+        """
+        try:
+            from langchain_huggingface import HuggingFaceEmbeddings
+
+            if threads:
+                import torch
+                torch.set_num_threads(threads)
+            logging.info(f"Loading HuggingFace embedding model: {model_name}")
+            self.model = HuggingFaceEmbeddings(model_name=model_name)
+            self.name = model_name
+        except Exception as e:
+            raise CustomException(e, sys)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.model.embed_documents(texts)
+
+    def embed_queries(self, texts: List[str]) -> List[List[float]]:
+        return self.model.embed_documents(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.model.embed_query(text)
+
+
+class OnnxBackend(EmbeddingBackend):
+    """
+    Sentence-transformers model exported to ONNX (optionally int8-quantized) and run with
+    ONNX Runtime on CPU. Mean pooling + L2 normalization reproduce the sentence-transformers
+    pipeline of MiniLM-style models.
+
+    The model directory holds the ONNX file(s) and `tokenizer.json`; create it with
+    `python -m src.embeddings.backends <model_name> <model_dir>`.
+    """
+
+    def __init__(self, model_dir: str, model_file: str = "model_int8.onnx", model_name: str = None,
+                 threads: int = 0, batch_size: int = 32, max_length: int = 256, normalize: bool = True):
+        """
+        Args:
+            model_dir (str): Directory with the exported model and tokenizer.
+            model_file (str): ONNX file to run ("model_int8.onnx" quantized, "model.onnx" full precision).
+            model_name (str, optional): Name of the source model (part of `name`).
+            threads (int): ONNX Runtime intra-op threads (0 = one per physical core).
+            batch_size (int): Texts per forward pass; texts are sorted by length to limit padding.
+            max_length (int): Token limit per text (longer texts are truncated).
+            normalize (bool): L2-normalize the vectors.
+        """
+        try:
+            import onnxruntime
+            from tokenizers import Tokenizer
+
+            model_path = os.path.join(model_dir, model_file)
+            if not os.path.exists(model_path):
+                raise FileNotFoundError(
+                    f"ONNX embedding model not found at {model_path}. "
+                    f"Export it with: python -m src.embeddings.backends {model_name or '<model_name>'} {model_dir}"
+                )
+
+            options = onnxruntime.SessionOptions()
+            options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+            options.intra_op_num_threads = threads
+            options.inter_op_num_threads = 1
+            self.session = onnxruntime.InferenceSession(model_path, options, providers=["CPUExecutionProvider"])
+            self.input_names = {i.name for i in self.session.get_inputs()}
+
+            self.tokenizer = Tokenizer.from_file(os.path.join(model_dir, "tokenizer.json"))
+            self.tokenizer.enable_truncation(max_length=max_length)
+            self.tokenizer.enable_padding(pad_id=self.tokenizer.token_to_id("[PAD]") or 0)
+
+            self.batch_size = batch_size
+            self.normalize = normalize
+            self.name = f"{model_name or os.path.basename(os.path.normpath(model_dir))}@onnx:{model_file}"
+            logging.info(f"Loaded ONNX embedding model: {model_path} (threads={threads or 'auto'})")
+        except Exception as e:
+            raise CustomException(e, sys)
+
+    def _forward(self, texts: List[str]) -> np.ndarray:
+        encodings = self.tokenizer.encode_batch(texts)
+        input_ids = np.array([e.ids for e in encodings], dtype=np.int64)
+        attention_mask = np.array([e.attention_mask for e in encodings], dtype=np.int64)
+        feeds = {"input_ids": input_ids, "attention_mask": attention_mask}
+        if "token_type_ids" in self.input_names:
+            feeds["token_type_ids"] = np.array([e.type_ids for e in encodings], dtype=np.int64)
+
+        hidden = self.session.run(None, feeds)[0]       # [batch, tokens, dim]
+        # Mean over the real (non-padding) tokens
+        mask = attention_mask[:, :, None].astype(np.float32)
+        vectors = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+        if self.normalize:
+            vectors /= np.clip(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12, None)
+        return vectors.astype(np.float32)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        try:
+            if not texts:
+                return []
+            # Similar lengths in one batch pad to similar sizes
+            order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+            vectors = [None] * len(texts)
+            for start in range(0, len(order), self.batch_size):
+                part = order[start:start + self.batch_size]
+                for i, vector in zip(part, self._forward([texts[i] for i in part])):
+                    vectors[i] = vector.tolist()
+            return vectors
+        except Exception as e:
+            raise CustomException(e, sys)
+
+
+def default_onnx_dir(model_name: str) -> str:
+    """
+    Export directory of a model: EMBEDDING_ONNX_DIR for the configured MODEL_NAME, otherwise
+    ./vectorstore/onnx/<model name> (e.g., for the target of an embedding migration).
+    """
+    configured = os.getenv("MODEL_NAME", "sentence-transformers/all-MiniLM-L6-v2")
+    if model_name == configured and os.getenv("EMBEDDING_ONNX_DIR"):
+        return os.getenv("EMBEDDING_ONNX_DIR")
+    return os.path.join("./vectorstore/onnx", model_name.replace("/", "__"))
+
+
+def parse_backend_name(name: str) -> tuple:
+    """
+    Inverse of EmbeddingBackend.name, e.g., for the model recorded in a collection's fingerprint.
+
+    Output:
+        tuple: (HuggingFace model name, backend kind)
+    """
+    if "@onnx:" in name:
+        return name.split("@onnx:", 1)[0], "onnx"
+    return name, "huggingface"
+
+
+def build_backend(model_name: str, kind: str = None) -> EmbeddingBackend:
+    """
+    Builds the backend selected by EMBEDDING_BACKEND ("huggingface" (default) or "onnx").
+
+    Args:
+        model_name (str): HuggingFace model name (for ONNX: the model the export was made from).
+        kind (str, optional): Backend to build instead of EMBEDDING_BACKEND.
+
+    Output:
+        EmbeddingBackend: The configured backend.
+    """
+    kind = (kind or os.getenv("EMBEDDING_BACKEND", "huggingface")).lower()
+    threads = int(os.getenv("EMBEDDING_THREADS", "0"))
+    if kind == "onnx":
+        return OnnxBackend(
+            model_dir=default_onnx_dir(model_name),
+            model_file=os.getenv("EMBEDDING_ONNX_FILE", "model_int8.onnx"),
+            model_name=model_name,
+            threads=threads,
+            batch_size=int(os.getenv("EMBED_BATCH_SIZE", "64")),
+        )
+    if kind != "huggingface":
+        raise ValueError(f"Unknown EMBEDDING_BACKEND: {kind} (use 'huggingface' or 'onnx')")
+    return HuggingFaceBackend(model_name, threads=threads)
+
+
+def export_onnx(model_name: str, model_dir: str, quantize: bool = True):
+    """
+    Exports a HuggingFace encoder to ONNX (model.onnx) and, optionally, an int8 dynamically
+    quantized copy (model_int8.onnx), plus its tokenizer.json. Needs torch, transformers and onnx.
+
+    Args:
+        model_name (str): HuggingFace model to export.
+        model_dir (str): Output directory.
+        quantize (bool): Also write the int8 model.
+    """
+    try:
+        import torch
+        from transformers import AutoModel, AutoTokenizer
+
+        os.makedirs(model_dir, exist_ok=True)
+        tokenizer = AutoTokenizer.from_pretrained(model_name)
+        model = AutoModel.from_pretrained(model_name).eval()
+        tokenizer.save_pretrained(model_dir)
+
+        sample = tokenizer(["export sample"], return_tensors="pt")
+        input_names = [name for name in ("input_ids", "attention_mask", "token_type_ids") if name in sample]
+        dynamic = {name: {0: "batch", 1: "tokens"} for name in input_names}
+        dynamic["last_hidden_state"] = {0: "batch", 1: "tokens"}
+        model_path = os.path.join(model_dir, "model.onnx")
+        with torch.no_grad():
+            torch.onnx.export(
+                model, tuple(sample[name] for name in input_names), model_path,
+                input_names=input_names, output_names=["last_hidden_state"],
+                dynamic_axes=dynamic, opset_version=14,
+            )
+        logging.info(f"Exported {model_name} to {model_path}")
+
+        if quantize:
+            from onnxruntime.quantization import QuantType, quantize_dynamic
+
+            quantize_dynamic(model_path, os.path.join(model_dir, "model_int8.onnx"), weight_type=QuantType.QInt8)
+            logging.info(f"Wrote int8 model to {os.path.join(model_dir, 'model_int8.onnx')}")
+    except Exception as e:
+        raise CustomException(e, sys)
+
+
+# Example usage:
+#   python -m src.embeddings.backends sentence-transformers/all-MiniLM-L6-v2 ./vectorstore/onnx/sentence-transformers__all-MiniLM-L6-v2
+if __name__ == "__main__":
+    if len(sys.argv) != 3:
+        print("Usage: python -m src.embeddings.backends <model_name> <model_dir>")
+        sys.exit(2)
+    export_onnx(sys.argv[1], sys.argv[2])
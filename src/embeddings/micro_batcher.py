@@ -0,0 +1,108 @@
+# This file defines a micro-batcher that coalesces concurrent single-query embedding calls into one forward pass.
+
+import sys
+import time
+import queue
+import threading
+from concurrent.futures import Future
+from typing import List
+from langchain_core.embeddings import Embeddings
+from src.exception import CustomException
+from src.logger import logging
+
+
+class MicroBatchingEmbeddings(Embeddings):
+    """
+    Wraps an embedding backend so concurrent embed_query calls share forward passes.
+
+    A single worker thread takes the first waiting query, then keeps collecting queries for up
+    to `max_wait_ms` (or until `max_batch` are waiting) and embeds them together. While a batch
+    runs, new queries queue up and form the next batch, so batches grow with load and an idle
+    server only adds `max_wait_ms` to a lone query.
+
+    embed_documents and embed_queries are already batched by the caller and go straight to the backend.
+    """
+
+    def __init__(self, backend, max_batch: int = 32, max_wait_ms: float = 3.0):
+        """
+        Args:
+            backend (EmbeddingBackend): Backend providing embed_queries / embed_documents.
+            max_batch (int): Most queries embedded in one forward pass.
+            max_wait_ms (float): How long the first query of a batch waits for company.
+        """
+        self.backend = backend
+        self.name = getattr(backend, "name", "")
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000.0
+        self._queue = queue.Queue()
+        self._worker = None
+        self._lock = threading.Lock()
+        self.batches = 0
+        self.queries = 0
+        self.largest_batch = 0
+
+    def _ensure_worker(self):
+        if self._worker is None:
+            with self._lock:
+                if self._worker is None:
+                    self._worker = threading.Thread(target=self._loop, name="embed-batcher", daemon=True)
+                    self._worker.start()
+
+    def _loop(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                try:
+                    batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            # Counted before any caller is released, so stats read after a call include its batch
+            self.batches += 1
+            self.queries += len(batch)
+            self.largest_batch = max(self.largest_batch, len(batch))
+
+            texts = [text for text, _ in batch]
+            try:
+                embed = getattr(self.backend, "embed_queries", None) or self.backend.embed_documents
+                vectors = embed(texts)
+                for (_, future), vector in zip(batch, vectors):
+                    future.set_result(vector)
+            except Exception as e:
+                logging.error(f"Batched query embedding failed: {str(e)}")
+                for _, future in batch:
+                    future.set_exception(e)
+
+    def embed_query(self, text: str) -> List[float]:
+        """
+        Embeds one query, sharing the forward pass with other queries waiting at the same time.
+        """
+        try:
+            self._ensure_worker()
+            future = Future()
+            self._queue.put((text, future))
+            return future.result()
+        except Exception as e:
+            raise CustomException(e, sys)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.backend.embed_documents(texts)
+
+    def embed_queries(self, texts: List[str]) -> List[List[float]]:
+        # A batch of queries already fills a forward pass; it bypasses the queue
+        embed = getattr(self.backend, "embed_queries", None) or self.backend.embed_documents
+        return embed(texts)
+
+    def stats(self) -> dict:
+        """
+        Output:
+            dict: {"queries", "batches", "avg_batch", "largest_batch"}
+        """
+        return {
+            "queries": self.queries,
+            "batches": self.batches,
+            "avg_batch": round(self.queries / self.batches, 2) if self.batches else 0.0,
+            "largest_batch": self.largest_batch,
+        }
@@ -0,0 +1,86 @@
+# This file defines the parity check between two embedding backends (e.g., PyTorch vs. quantized ONNX).
+
+import sys
+import numpy as np
+from src.exception import CustomException
+from src.logger import logging
+
+# Used when no text file is given: short questions and passages of different lengths
+SAMPLE_TEXTS = [
+    "What is the candidate's experience with Python?",
+    "Summarize the key findings of the quarterly report.",
+    "Which skills are listed in the resume?",
+    "Docker containers package an application with its dependencies so it runs the same everywhere.",
+    "The revenue grew by 12% compared to the previous quarter, driven mainly by subscription sales.",
+    "Retrieval-augmented generation combines a search step over private documents with a language model.",
+    "Kubernetes schedules containers across a cluster and restarts them when they fail.",
+    "The meeting was moved to Thursday afternoon because the client could not attend on Monday.",
+    "Install the dependencies with pip install -r requirements.txt and start the API with uvicorn.",
+    "Gradient descent updates the model parameters in the direction that reduces the loss.",
+]
+
+
+def check_parity(reference, candidate, texts: list, threshold: float = 0.99) -> dict:
+    """
+    Compares two backends on the same texts.
+
+    Args:
+        reference: Backend whose vectors are the baseline (the current PyTorch model).
+        candidate: Backend to switch to.
+        texts (list): Texts to embed with both.
+        threshold (float): Minimum cosine similarity required for every text.
+
+    Output:
+        dict: {"texts", "mean_cosine", "min_cosine", "neighbour_agreement", "passed"}, where
+              neighbour_agreement is the share of texts whose nearest other text is the same
+              under both backends (i.e., whether retrieval rankings survive the switch).
+    """
+    try:
+        a = np.asarray(reference.embed_documents(texts), dtype=np.float32)
+        b = np.asarray(candidate.embed_documents(texts), dtype=np.float32)
+        a /= np.clip(np.linalg.norm(a, axis=1, keepdims=True), 1e-12, None)
+        b /= np.clip(np.linalg.norm(b, axis=1, keepdims=True), 1e-12, None)
+        cosines = (a * b).sum(axis=1)
+
+        agreement = 1.0
+        if len(texts) > 1:
+            sim_a, sim_b = a @ a.T, b @ b.T
+            np.fill_diagonal(sim_a, -np.inf)
+            np.fill_diagonal(sim_b, -np.inf)
+            agreement = float((sim_a.argmax(axis=1) == sim_b.argmax(axis=1)).mean())
+
+        result = {
+            "texts": len(texts),
+            "mean_cosine": round(float(cosines.mean()), 5),
+            "min_cosine": round(float(cosines.min()), 5),
+            "neighbour_agreement": round(agreement, 4),
+            "passed": bool(cosines.min() >= threshold),
+        }
+        logging.info(f"Embedding parity: {result}")
+        return result
+    except Exception as e:
+        raise CustomException(e, sys)
+
+
+# Example usage: python -m src.embeddings.parity [texts.txt] (compares MODEL_NAME on PyTorch vs. ONNX)
+if __name__ == "__main__":
+    import os
+    from dotenv import load_dotenv
+    from src.embeddings.backends import HuggingFaceBackend, OnnxBackend, default_onnx_dir
+
+    load_dotenv()
+    model_name = os.getenv("MODEL_NAME", "sentence-transformers/all-MiniLM-L6-v2")
+    texts = SAMPLE_TEXTS
+    if len(sys.argv) > 1:
+        with open(sys.argv[1], "r", encoding="utf-8") as f:
+            texts = [line.strip() for line in f if line.strip()]
+
+    reference = HuggingFaceBackend(model_name)
+    candidate = OnnxBackend(
+        model_dir=default_onnx_dir(model_name),
+        model_file=os.getenv("EMBEDDING_ONNX_FILE", "model_int8.onnx"),
+        model_name=model_name,
+    )
+    result = check_parity(reference, candidate, texts, threshold=float(os.getenv("EMBEDDING_PARITY_THRESHOLD", "0.99")))
+    print(result)
+    sys.exit(0 if result["passed"] else 1)
@@ -10,9 +10,17 @@ def error_message_detailed(error, error_detail: sys):
 
 # Custom exception class that formats and logs the error clearly
 class CustomException(Exception):
-    def __init__(self, error_message, error_detail: sys):
+    def __init__(self, error_message, error_detail: sys = None):
         super().__init__(error_message)
-        self.error_message = error_message_detailed(error_message, error_detail)
+        if error_detail is None:
+            # Already formatted (e.g., rebuilt after crossing a process boundary)
+            self.error_message = str(error_message)
+        else:
+            self.error_message = error_message_detailed(error_message, error_detail)
+
+    def __reduce__(self):
+        # Keep the formatted message when the exception is pickled by a worker process
+        return (self.__class__, (self.error_message,))
 
     def __str__(self):
         return self.error_message
@@ -0,0 +1,251 @@
+# This file defines the execution layer that keeps blocking work off the FastAPI event loop.
+
+import os
+import asyncio
+import functools
+import threading
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from src.logger import logging
+
+
+class ExecutorBusyError(Exception):
+    """
+    Raised when a pool already has as many queued/running tasks as its queue limit allows.
+    The API turns this into a 503 so clients can back off instead of piling up.
+    """
+
+
+class _BoundedPool:
+    """
+    Wraps a concurrent.futures executor with a queue limit and a default timeout.
+
+    With `recycle_on_timeout` (process pools), a call that times out while still running gets its
+    worker killed: new calls go to a fresh executor at once, and the old one is terminated as soon
+    as its other calls have finished. A hung parser therefore frees its worker and its queue slot.
+    """
+
+    def __init__(self, name: str, factory, workers: int, queue_limit: int, timeout: float,
+                 recycle_on_timeout: bool = False):
+        self.name = name
+        self.workers = workers
+        self._factory = factory
+        self._executor = None
+        self.queue_limit = queue_limit
+        self.timeout = timeout
+        self.recycle_on_timeout = recycle_on_timeout
+        self._pending = 0
+        self._lock = threading.Lock()
+        self._owners = {}       # unfinished future -> executor running it
+        self._retired = {}      # executor being recycled -> its timed-out futures
+
+    @property
+    def executor(self):
+        # Pools are created lazily so importing the API does not spawn workers
+        with self._lock:
+            if self._executor is None:
+                self._executor = self._factory()
+                logging.info(f"Started {self.name} pool")
+            return self._executor
+
+    @property
+    def pending(self) -> int:
+        return self._pending
+
+    def _acquire(self):
+        with self._lock:
+            if self._pending >= self.queue_limit:
+                raise ExecutorBusyError(
+                    f"{self.name} pool is full ({self._pending}/{self.queue_limit} tasks pending)."
+                )
+            self._pending += 1
+
+    def _release(self, future=None):
+        with self._lock:
+            self._pending -= 1
+            executor = self._owners.pop(future, None)
+        if executor is not None and executor in self._retired:
+            self._terminate_if_idle(executor)
+
+    def _retire(self, future):
+        # Called when `future` timed out while running: stop routing work to its executor
+        with self._lock:
+            executor = self._owners.get(future)
+            if executor is None:
+                return
+            if self._executor is executor:
+                self._executor = None
+            self._retired.setdefault(executor, set()).add(future)
+        logging.warning(f"Recycling {self.name} pool workers after a timed-out task")
+        self._terminate_if_idle(executor)
+
+    def _terminate_if_idle(self, executor):
+        # Kills a retired executor once only its timed-out calls are left running
+        with self._lock:
+            hung = self._retired.get(executor)
+            if hung is None:
+                return
+            busy = [f for f, owner in self._owners.items() if owner is executor and f not in hung]
+            if busy:
+                return
+            del self._retired[executor]
+        processes = list((getattr(executor, "_processes", None) or {}).values())
+        for process in processes:
+            process.terminate()
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    def submit(self, fn, *args, **kwargs):
+        """
+        Submits a call to the pool, enforcing the queue limit.
+
+        Output:
+            concurrent.futures.Future: Future for the submitted call.
+        """
+        self._acquire()
+        try:
+            executor = self.executor
+            future = executor.submit(fn, *args, **kwargs)
+        except Exception:
+            self._release()
+            raise
+        with self._lock:
+            self._owners[future] = executor
+        future.add_done_callback(self._release)
+        return future
+
+    async def run(self, fn, *args, timeout: float = None, **kwargs):
+        """
+        Runs a blocking call in the pool and awaits its result without blocking the event loop.
+
+        Args:
+            fn: The blocking callable (must be picklable for the process pool).
+            timeout (float, optional): Seconds to wait before giving up; defaults to the pool timeout.
+
+        Output:
+            The callable's return value.
+
+        Raises:
+            ExecutorBusyError: If the queue limit is reached.
+            asyncio.TimeoutError: If the call takes longer than the timeout.
+        """
+        future = self.submit(fn, *args, **kwargs)
+        wait_for = self.timeout if timeout is None else timeout
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(future), timeout=wait_for)
+        except asyncio.TimeoutError:
+            # A running call cannot be cancelled; without recycling it would hold its worker forever
+            if self.recycle_on_timeout and not future.done():
+                self._retire(future)
+            raise
+
+    def call(self, fn, *args, timeout: float = None, **kwargs):
+        """
+        Blocking counterpart of run() for worker threads (same queue limit, timeout and recycling).
+
+        Raises:
+            ExecutorBusyError: If the queue limit is reached.
+            concurrent.futures.TimeoutError: If the call takes longer than the timeout.
+        """
+        future = self.submit(fn, *args, **kwargs)
+        try:
+            return future.result(timeout=self.timeout if timeout is None else timeout)
+        except FutureTimeoutError:
+            if self.recycle_on_timeout and not future.done():
+                self._retire(future)
+            raise
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
+                logging.info(f"Stopped {self.name} pool")
+
+
+class ExecutionLayer:
+    """
+    Bounded pools for the three kinds of blocking work the API performs:
+
+    - io:     thread pool for short calls: LLM calls, Chroma reads/writes and embedding inference
+              (network waits and torch kernels both release the GIL).
+    - cpu:    process pool for pure-Python, CPU-heavy work such as file parsing and chunking.
+              Workers running a call that timed out are killed and replaced.
+    - ingest: small thread pool for whole-upload pipelines (?wait=true uploads), which can run
+              for up to INGEST_TIMEOUT; they never hold the threads short calls need.
+
+    Sizes, queue limits and timeouts are read from the environment:
+    IO_WORKERS, IO_QUEUE_LIMIT, IO_TIMEOUT, CPU_WORKERS, CPU_QUEUE_LIMIT, CPU_TIMEOUT,
+    INGEST_WORKERS, INGEST_QUEUE_LIMIT, INGEST_TIMEOUT.
+    """
+
+    def __init__(
+        self,
+        io_workers: int = None,
+        cpu_workers: int = None,
+        io_queue_limit: int = None,
+        cpu_queue_limit: int = None,
+        io_timeout: float = None,
+        cpu_timeout: float = None,
+        ingest_workers: int = None,
+        ingest_queue_limit: int = None,
+        ingest_timeout: float = None,
+    ):
+        io_workers = io_workers or int(os.getenv("IO_WORKERS", "8"))
+        cpu_workers = cpu_workers or int(os.getenv("CPU_WORKERS", str(max(1, (os.cpu_count() or 2) - 1))))
+        io_queue_limit = io_queue_limit or int(os.getenv("IO_QUEUE_LIMIT", str(io_workers * 8)))
+        cpu_queue_limit = cpu_queue_limit or int(os.getenv("CPU_QUEUE_LIMIT", str(cpu_workers * 4)))
+        io_timeout = io_timeout or float(os.getenv("IO_TIMEOUT", "120"))
+        cpu_timeout = cpu_timeout or float(os.getenv("CPU_TIMEOUT", "600"))
+        ingest_workers = ingest_workers or int(os.getenv("INGEST_WORKERS", "2"))
+        ingest_queue_limit = ingest_queue_limit or int(os.getenv("INGEST_QUEUE_LIMIT", str(ingest_workers * 2)))
+        ingest_timeout = ingest_timeout or float(os.getenv("INGEST_TIMEOUT", "3600"))
+
+        self.io = _BoundedPool(
+            "io",
+            functools.partial(ThreadPoolExecutor, max_workers=io_workers, thread_name_prefix="rag-io"),
+            io_workers,
+            io_queue_limit,
+            io_timeout,
+        )
+        # "spawn" avoids forking a parent that already holds torch/Chroma threads
+        self.cpu = _BoundedPool(
+            "cpu",
+            functools.partial(
+                ProcessPoolExecutor,
+                max_workers=cpu_workers,
+                mp_context=multiprocessing.get_context(os.getenv("CPU_START_METHOD", "spawn")),
+            ),
+            cpu_workers,
+            cpu_queue_limit,
+            cpu_timeout,
+            recycle_on_timeout=True,
+        )
+        self.ingest = _BoundedPool(
+            "ingest",
+            functools.partial(ThreadPoolExecutor, max_workers=ingest_workers, thread_name_prefix="rag-ingest"),
+            ingest_workers,
+            ingest_queue_limit,
+            ingest_timeout,
+        )
+
+    async def run_io(self, fn, *args, timeout: float = None, **kwargs):
+        """Runs an I/O-bound blocking call in the thread pool."""
+        return await self.io.run(fn, *args, timeout=timeout, **kwargs)
+
+    async def run_cpu(self, fn, *args, timeout: float = None, **kwargs):
+        """Runs a CPU-bound, picklable call in the process pool."""
+        return await self.cpu.run(fn, *args, timeout=timeout, **kwargs)
+
+    async def run_ingest(self, fn, *args, timeout: float = None, **kwargs):
+        """Runs a whole-upload ingestion call in the dedicated ingest thread pool."""
+        return await self.ingest.run(fn, *args, timeout=timeout, **kwargs)
+
+    def call_cpu(self, fn, *args, timeout: float = None, **kwargs):
+        """Runs a CPU-bound, picklable call in the process pool from a worker thread (blocking)."""
+        return self.cpu.call(fn, *args, timeout=timeout, **kwargs)
+
+    def shutdown(self):
+        """Stops all pools (called on application shutdown)."""
+        self.io.shutdown()
+        self.cpu.shutdown()
+        self.ingest.shutdown()
@@ -0,0 +1,231 @@
+# This file defines the background workers that drain the ingestion job queue.
+
+import os
+import sys
+import time
+import threading
+from src.jobs.job_queue import JobQueue, RUNNING
+from src.exception import CustomException
+from src.logger import logging
+
+# Report fields copied into a job's per-file progress
+_PROGRESS_FIELDS = ("filename", "stage", "pages", "chunks", "seconds", "error", "skipped", "preview")
+
+
+class IngestionWorkers:
+    """
+    A fixed number of threads that claim queued jobs and run them through the IngestionPipeline
+    of the job's tenant. Progress is written back to the job queue at most every
+    `progress_interval` seconds (and on every file stage change), so polling clients see
+    per-file stages, chunk counts and timings while a job runs.
+
+    A heartbeat thread keeps the claimed jobs alive in the queue and periodically requeues jobs
+    whose owner (another process, or a previous run of this one) stopped heartbeating. It also
+    stops the pipeline of a running job that was cancelled in the queue, e.g., by another process.
+    """
+
+    def __init__(self, job_queue: JobQueue, tenants, workers: int = 2, poll_interval: float = 1.0,
+                 progress_interval: float = 0.5, executor=None):
+        """
+        Args:
+            job_queue (JobQueue): The persistent queue to drain.
+            tenants (TenantManager): Provides each job's vector store.
+            workers (int): Jobs processed concurrently.
+            poll_interval (float): Seconds an idle worker waits before checking the queue again.
+            progress_interval (float): Minimum seconds between progress writes for batch updates.
+            executor (ExecutionLayer, optional): Parses files in its process pool (INGEST_MODE=parallel);
+                                                 without it, files are parsed on the pipeline's threads.
+        """
+        self.job_queue = job_queue
+        self.tenants = tenants
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self.progress_interval = progress_interval
+        self.executor = executor
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._threads = []
+        self._running = {}      # job ID -> {"tenant", "pipeline", "cancelled", "done"} of jobs running here
+        self._running_lock = threading.Lock()
+
+    def start(self):
+        """
+        Requeues abandoned jobs and starts the worker and heartbeat threads.
+        """
+        try:
+            self.job_queue.recover()
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._loop, name=f"ingest-job-{i}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+            thread = threading.Thread(target=self._heartbeat_loop, name="ingest-job-heartbeat", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+            logging.info(f"Started {self.workers} ingestion job worker(s)")
+        except Exception as e:
+            raise CustomException(e, sys)
+
+    def notify(self):
+        """
+        Wakes idle workers after a job was enqueued.
+        """
+        self._wake.set()
+
+    def stop(self, timeout: float = 5.0):
+        """
+        Stops claiming new jobs. Jobs still running stop heartbeating and are requeued once stale.
+        """
+        self._stop.set()
+        self._wake.set()
+        for thread in self._threads:
+            thread.join(timeout)
+
+    def _loop(self):
+        while not self._stop.is_set():
+            try:
+                job = self.job_queue.claim()
+            except Exception as e:
+                logging.error(f"Could not claim an ingestion job: {str(e)}")
+                job = None
+            if job is None:
+                self._wake.wait(self.poll_interval)
+                self._wake.clear()
+                continue
+            self._run(job)
+
+    def _heartbeat_loop(self):
+        # Beat several times per timeout so a slow write never lets a live job look abandoned
+        interval = max(self.job_queue.heartbeat_timeout / 4, 0.05)
+        while not self._stop.wait(interval):
+            try:
+                self.job_queue.heartbeat()
+                if self.job_queue.recover():
+                    self._wake.set()
+                # Jobs cancelled in the queue (by another process) stop here too
+                with self._running_lock:
+                    running = list(self._running)
+                for job_id in running:
+                    job = self.job_queue.get(job_id)
+                    if job is not None and job["status"] != RUNNING:
+                        self._cancel(job_id)
+            except Exception as e:
+                logging.error(f"Could not refresh ingestion job heartbeats: {str(e)}")
+
+    def _cancel(self, job_id: str):
+        # Stops a job running here: its pipeline discards the chunks stored so far and raises
+        with self._running_lock:
+            entry = self._running.get(job_id)
+            if entry is None:
+                return None
+            entry["cancelled"] = True
+            pipeline = entry["pipeline"]
+        if pipeline is not None:
+            pipeline.cancel()
+        return entry["done"]
+
+    def cancel_tenant(self, tenant: str, timeout: float = 60.0) -> int:
+        """
+        Fails the tenant's queued and running jobs and stops the ones running in this process,
+        waiting until their pipelines have discarded what they stored (e.g., before a clear).
+
+        Args:
+            tenant (str): Tenant whose jobs are cancelled.
+            timeout (float): Seconds to wait for each running job to stop.
+
+        Output:
+            int: Number of jobs cancelled.
+        """
+        try:
+            cancelled = self.job_queue.cancel_tenant(tenant)
+            with self._running_lock:
+                local = [job_id for job_id, entry in self._running.items() if entry["tenant"] == tenant]
+            for job_id in local:
+                done = self._cancel(job_id)
+                if done is not None and not done.wait(timeout):
+                    logging.warning(f"Ingestion job {job_id} did not stop within {timeout}s")
+            return len(cancelled)
+        except Exception as e:
+            raise CustomException(e, sys)
+
+    def _run(self, job: dict):
+        # Imported here to avoid loading the pipeline (and its loaders) at import time
+        from src.agents.ingestion_pipeline import IngestionPipeline
+
+        job_id = job["id"]
+        logging.info(f"Running ingestion job {job_id} (attempt {job['attempts']})")
+        started = time.monotonic()
+        # Hashes computed by the upload store at save time travel with the job
+        file_hashes = {
+            path: entry.get("sha256") for path, entry in zip(job["files"], job["progress"]["files"]) if entry.get("sha256")
+        }
+        progress = {
+            "files": [{"filename": os.path.basename(p), "stage": "queued", "sha256": file_hashes.get(p)}
+                      for p in job["files"]],
+            "chunks": 0,
+            "batches": 0,
+        }
+        by_name = {entry["filename"]: entry for entry in progress["files"]}
+        entry = {"tenant": job["tenant"], "pipeline": None, "cancelled": False, "done": threading.Event()}
+        with self._running_lock:
+            self._running[job_id] = entry
+        lock = threading.Lock()
+        last_write = [0.0]
+
+        def save(force: bool = False):
+            # Throttled write of the current progress snapshot
+            now = time.monotonic()
+            if force or now - last_write[0] >= self.progress_interval:
+                last_write[0] = now
+                with lock:
+                    progress["seconds"] = round(now - started, 3)
+                    snapshot = {**progress, "files": [dict(entry) for entry in progress["files"]]}
+                self.job_queue.update_progress(job_id, snapshot)
+
+        def on_progress(report: dict):
+            with lock:
+                by_name[report["filename"]].update({k: report[k] for k in _PROGRESS_FIELDS if k in report})
+            save(force=True)
+
+        def on_batch(size: int):
+            with lock:
+                progress["chunks"] += size
+                progress["batches"] += 1
+            save()
+
+        try:
+            missing = [p for p in job["files"] if not os.path.exists(p)]
+            for path in missing:
+                by_name[os.path.basename(path)].update({"stage": "failed", "error": "Uploaded file no longer exists."})
+            present = [p for p in job["files"] if p not in missing]
+
+            with self.tenants.lease(job["tenant"]) as workspace:
+                # A snapshot whose name was re-uploaded or deleted since is stale: the newer job
+                # (or the deletion) owns that document now
+                stale = [p for p in present if workspace.uploads.current(p) != file_hashes.get(p)]
+                for path in stale:
+                    by_name[os.path.basename(path)].update({"stage": "skipped", "skipped": True,
+                                                            "error": "Replaced or deleted after upload."})
+                present = [p for p in present if p not in stale]
+
+                try:
+                    pipeline = IngestionPipeline(workspace.vector_store, executor=self.executor)
+                    with self._running_lock:
+                        entry["pipeline"] = pipeline
+                        if entry["cancelled"]:
+                            pipeline.cancel()
+                    pipeline.run(present, on_batch=on_batch, on_progress=on_progress, file_hashes=file_hashes)
+                finally:
+                    for path in job["files"]:
+                        workspace.uploads.release_snapshot(path)
+
+            progress["seconds"] = round(time.monotonic() - started, 3)
+            self.job_queue.finish(job_id, progress)
+            logging.info(f"Ingestion job {job_id} finished in {progress['seconds']}s ({progress['chunks']} chunks)")
+        except Exception as e:
+            logging.error(f"Ingestion job {job_id} failed: {str(e)}")
+            progress["seconds"] = round(time.monotonic() - started, 3)
+            self.job_queue.finish(job_id, progress, error=str(e))
+        finally:
+            with self._running_lock:
+                del self._running[job_id]
+            entry["done"].set()
@@ -0,0 +1,283 @@
+# This file defines the persistent, SQLite-backed queue of background ingestion jobs.
+
+import os
+import sys
+import json
+import time
+import uuid
+import sqlite3
+import threading
+from src.exception import CustomException
+from src.logger import logging
+
+# Job states: queued -> running -> done | failed (running jobs whose owner stopped heartbeating go back to queued;
+# queued and running jobs of a cleared tenant are failed)
+QUEUED, RUNNING, DONE, FAILED = "queued", "running", "done", "failed"
+
+
+class JobQueue:
+    """
+    Stores ingestion jobs in SQLite so they survive restarts.
+
+    Each job is one upload: a tenant, the saved file paths, per-file progress and timings.
+    Workers claim the oldest queued job atomically; at most one job per tenant runs at a time,
+    so one tenant's large upload does not delay the others' jobs.
+
+    Several API processes may share the file. A claimed job records its owner (this queue
+    instance) and a heartbeat that the owner refreshes while it runs; only jobs whose heartbeat
+    went stale are treated as interrupted, so a restart never steals a live sibling's jobs.
+    """
+
+    def __init__(self, db_path: str, max_attempts: int = 3, heartbeat_timeout: float = 60.0):
+        """
+        Args:
+            db_path (str): SQLite file holding the jobs (created if missing).
+            max_attempts (int): A job interrupted this many times is marked failed instead of retried.
+            heartbeat_timeout (float): Seconds without a heartbeat after which a running job is
+                considered abandoned by its owner.
+        """
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+            self.db_path = db_path
+            self.max_attempts = max_attempts
+            self.heartbeat_timeout = heartbeat_timeout
+            # Identifies the jobs claimed through this instance (one per process)
+            self.owner = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+            self._lock = threading.Lock()
+            # Autocommit mode; multi-statement updates use explicit transactions
+            self._db = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+            self._db.row_factory = sqlite3.Row
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                """CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    tenant TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    files TEXT NOT NULL,
+                    progress TEXT NOT NULL,
+                    error TEXT,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    created_at REAL NOT NULL,
+                    started_at REAL,
+                    finished_at REAL,
+                    owner TEXT,
+                    heartbeat REAL
+                )"""
+            )
+            # Queues created before heartbeats existed lack the ownership columns
+            columns = {row["name"] for row in self._db.execute("PRAGMA table_info(jobs)")}
+            for column, kind in (("owner", "TEXT"), ("heartbeat", "REAL")):
+                if column not in columns:
+                    self._db.execute(f"ALTER TABLE jobs ADD COLUMN {column} {kind}")
+            self._db.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created_at)")
+            logging.info(f"Job queue opened at: {db_path}")
+        except Exception as e:
+            raise CustomException(e, sys)
+
+    @staticmethod
+    def _row_to_job(row) -> dict:
+        job = dict(row)
+        job["files"] = json.loads(job["files"])
+        job["progress"] = json.loads(job["progress"])
+        return job
+
+    def enqueue(self, tenant: str, file_paths: list, file_hashes: dict = None) -> str:
+        """
+        Adds a job for already saved files.
+
+        Args:
+            tenant (str): Workspace receiving the documents.
+            file_paths (list): Saved upload paths.
+            file_hashes (dict, optional): path -> SHA-256 computed while saving (not recomputed by the job).
+
+        Output:
+            str: The job ID.
+        """
+        try:
+            job_id = uuid.uuid4().hex
+            progress = {
+                "files": [{"filename": os.path.basename(p), "stage": "queued", "sha256": (file_hashes or {}).get(p)}
+                          for p in file_paths],
+                "chunks": 0,
+                "batches": 0,
+            }
+            with self._lock:
+                self._db.execute(
+                    "INSERT INTO jobs (id, tenant, status, files, progress, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+                    (job_id, tenant, QUEUED, json.dumps(file_paths), json.dumps(progress), time.time()),
+                )
+            logging.info(f"Queued ingestion job {job_id} for tenant '{tenant}' ({len(file_paths)} files)")
+            return job_id
+        except Exception as e:
+            raise CustomException(e, sys)
+
+    def claim(self) -> dict:
+        """
+        Marks the oldest runnable queued job as running and returns it.
+
+        Output:
+            dict or None: The claimed job, or None when nothing can run now.
+        """
+        try:
+            with self._lock:
+                # IMMEDIATE takes the write lock up front, so two API processes never claim the same job
+                self._db.execute("BEGIN IMMEDIATE")
+                try:
+                    row = self._db.execute(
+                        f"""SELECT * FROM jobs WHERE status = '{QUEUED}'
+                            AND tenant NOT IN (SELECT tenant FROM jobs WHERE status = '{RUNNING}')
+                            ORDER BY created_at LIMIT 1"""
+                    ).fetchone()
+                    if row is not None:
+                        now = time.time()
+                        self._db.execute(
+                            """UPDATE jobs SET status = ?, started_at = ?, attempts = attempts + 1,
+                                   owner = ?, heartbeat = ? WHERE id = ?""",
+                            (RUNNING, now, self.owner, now, row["id"]),
+                        )
+                    self._db.execute("COMMIT")
+                except Exception:
+                    self._db.execute("ROLLBACK")
+                    raise
+            if row is None:
+                return None
+            job = self._row_to_job(row)
+            job["status"] = RUNNING
+            job["attempts"] += 1
+            job["owner"] = self.owner
+            return job
+        except Exception as e:
+            raise CustomException(e, sys)
+
+    def heartbeat(self) -> int:
+        """
+        Refreshes the heartbeat of every running job claimed through this instance.
+
+        Output:
+            int: Number of jobs refreshed.
+        """
+        try:
+            with self._lock:
+                return self._db.execute(
+                    "UPDATE jobs SET heartbeat = ? WHERE status = ? AND owner = ?", (time.time(), RUNNING, self.owner)
+                ).rowcount
+        except Exception as e:
+            raise CustomException(e, sys)
+
+    def update_progress(self, job_id: str, progress: dict):
+        """
+        Persists a job's progress (per-file stages, chunk and batch counts).
+        """
+        try:
+            with self._lock:
+                self._db.execute("UPDATE jobs SET progress = ? WHERE id = ?", (json.dumps(progress), job_id))
+        except Exception as e:
+            raise CustomException(e, sys)
+
+    def finish(self, job_id: str, progress: dict, error: str = None):
+        """
+        Marks a job done (or failed when `error` is given) with its final progress. A job that was
+        failed meanwhile (cancelled, see cancel_tenant) keeps its status and error.
+        """
+        try:
+            with self._lock:
+                self._db.execute(
+                    f"""UPDATE jobs SET status = CASE WHEN status = '{FAILED}' THEN status ELSE ? END, progress = ?,
+                           error = CASE WHEN status = '{FAILED}' THEN error ELSE ? END, finished_at = ? WHERE id = ?""",
+                    (FAILED if error else DONE, json.dumps(progress), error, time.time(), job_id),
+                )
+        except Exception as e:
+            raise CustomException(e, sys)
+
+    def cancel_tenant(self, tenant: str, error: str = "Cancelled: the workspace was cleared.") -> list:
+        """
+        Fails every queued and running job of a tenant. Queued jobs are never claimed; the
+        owners of running jobs see the new status and stop them (see IngestionWorkers).
+
+        Output:
+            list: IDs of the jobs cancelled.
+        """
+        try:
+            with self._lock:
+                self._db.execute("BEGIN IMMEDIATE")
+                try:
+                    ids = [row["id"] for row in self._db.execute(
+                        "SELECT id FROM jobs WHERE tenant = ? AND status IN (?, ?)", (tenant, QUEUED, RUNNING)
+                    )]
+                    self._db.execute(
+                        "UPDATE jobs SET status = ?, error = ?, finished_at = ? WHERE tenant = ? AND status IN (?, ?)",
+                        (FAILED, error, time.time(), tenant, QUEUED, RUNNING),
+                    )
+                    self._db.execute("COMMIT")
+                except Exception:
+                    self._db.execute("ROLLBACK")
+                    raise
+            if ids:
+                logging.info(f"Cancelled {len(ids)} ingestion job(s) of tenant '{tenant}'")
+            return ids
+        except Exception as e:
+            raise CustomException(e, sys)
+
+    def recover(self) -> int:
+        """
+        Requeues running jobs whose owner stopped heartbeating (a crashed or stopped process).
+        Jobs of live owners, in this or another process, are left alone. Jobs that were already
+        interrupted `max_attempts` times are failed instead.
+
+        Output:
+            int: Number of jobs requeued.
+        """
+        try:
+            now = time.time()
+            # Jobs from queues without heartbeats have none and count as stale
+            stale = "status = ? AND (heartbeat IS NULL OR heartbeat < ?)"
+            with self._lock:
+                self._db.execute("BEGIN IMMEDIATE")
+                try:
+                    self._db.execute(
+                        f"UPDATE jobs SET status = ?, error = ?, finished_at = ? WHERE {stale} AND attempts >= ?",
+                        (FAILED, "Interrupted too many times.", now, RUNNING, now - self.heartbeat_timeout,
+                         self.max_attempts),
+                    )
+                    requeued = self._db.execute(
+                        f"UPDATE jobs SET status = ?, started_at = NULL, owner = NULL, heartbeat = NULL WHERE {stale}",
+                        (QUEUED, RUNNING, now - self.heartbeat_timeout),
+                    ).rowcount
+                    self._db.execute("COMMIT")
+                except Exception:
+                    self._db.execute("ROLLBACK")
+                    raise
+            if requeued:
+                logging.info(f"Requeued {requeued} interrupted ingestion job(s)")
+            return requeued
+        except Exception as e:
+            raise CustomException(e, sys)
+
+    def get(self, job_id: str) -> dict:
+        """
+        Output:
+            dict or None: The job with its status, files, progress and timestamps.
+        """
+        try:
+            with self._lock:
+                row = self._db.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            return self._row_to_job(row) if row is not None else None
+        except Exception as e:
+            raise CustomException(e, sys)
+
+    def list(self, tenant: str, limit: int = 20) -> list:
+        """
+        Most recent jobs of a tenant, newest first.
+        """
+        try:
+            with self._lock:
+                rows = self._db.execute(
+                    "SELECT * FROM jobs WHERE tenant = ? ORDER BY created_at DESC LIMIT ?", (tenant, limit)
+                ).fetchall()
+            return [self._row_to_job(row) for row in rows]
+        except Exception as e:
+            raise CustomException(e, sys)
+
+    def close(self):
+        with self._lock:
+            self._db.close()
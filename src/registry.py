@@ -0,0 +1,323 @@
+# This file defines a process-wide registry that builds and shares the heavy components
+# (embedding model, vector store, LLM client) between all agents and the API.
+
+import os
+import sys
+import threading
+from dotenv import load_dotenv
+from src.exception import CustomException
+from src.logger import logging
+
+# Load environment variables from the .env file (model names, directories, API key, etc.)
+load_dotenv()
+
+
+class ComponentRegistry:
+    """
+    Lazily constructs and caches a single shared instance of each heavy component.
+
+    Every agent asks the registry for its embedding model, vector store and LLM client
+    instead of building its own, so one worker process only holds one copy of the
+    embedding model and one Chroma client on CHROMA_DIR. Ingestion writes and query
+    reads therefore go through the same collection handle. Vector stores and answer
+    caches are per tenant (see src/tenants.py); the other components are shared.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._embedding_agent = None
+        self._migration_models = {}     # (model name, backend) -> embedding model loaded for migrations
+        self._tenants = None
+        self._job_queue = None
+        self._job_workers = None
+        self._llm = None
+        self._executor = None
+        self._reranker = None
+        self._extraction_cache = None
+
+    def get_embedding_agent(self):
+        """
+        Returns the shared EmbeddingAgent, loading the model on first use.
+
+        Output:
+            EmbeddingAgent: The process-wide embedding agent.
+        """
+        if self._embedding_agent is None:
+            with self._lock:
+                if self._embedding_agent is None:
+                    # Imported here to avoid a circular import (agents use the registry too)
+                    from src.agents.embedding_agent import EmbeddingAgent
+
+                    model_name = os.getenv("MODEL_NAME", "sentence-transformers/all-MiniLM-L6-v2")
+                    self._embedding_agent = EmbeddingAgent(model_name=model_name)
+        return self._embedding_agent
+
+    def get_embedding_model(self):
+        """
+        Returns the shared embedding model used for both documents and queries.
+        """
+        return self.get_embedding_agent().embedding_model
+
+    def get_migration_model(self, model_name: str, backend: str = None):
+        """
+        Returns an embedding model other than the configured one (the target of an embedding
+        migration), loaded once per process.
+
+        Args:
+            model_name (str): HuggingFace model name.
+            backend (str, optional): "huggingface" or "onnx" (EMBEDDING_BACKEND when omitted).
+
+        Output:
+            CachedEmbeddings: The model, wrapped like the configured one.
+        """
+        key = (model_name, backend)
+        with self._lock:
+            if key not in self._migration_models:
+                from src.agents.embedding_agent import EmbeddingAgent
+
+                self._migration_models[key] = EmbeddingAgent(model_name=model_name, backend=backend).embedding_model
+            return self._migration_models[key]
+
+    def get_fingerprinted_model(self, name: str):
+        """
+        Returns the embedding model whose name (model + runtime) is `name`, as recorded in a
+        collection's fingerprint: an already loaded one, or else one loaded with get_migration_model.
+        Lets a migrated workspace keep using the model its collection was migrated to, also after
+        a restart.
+
+        Output:
+            CachedEmbeddings or None: The model, or None when it cannot be built with that name here.
+        """
+        from src.embeddings.backends import parse_backend_name
+
+        with self._lock:
+            loaded = [self._embedding_agent.embedding_model] if self._embedding_agent is not None else []
+            loaded += list(self._migration_models.values())
+        model = next((model for model in loaded if model.model_name == name), None)
+        if model is not None:
+            return model
+        try:
+            model = self.get_migration_model(*parse_backend_name(name))
+        except Exception as e:
+            logging.error(f"Could not load embedding model '{name}': {str(e)}")
+            return None
+        # E.g., an ONNX export file other than EMBEDDING_ONNX_FILE
+        return model if model.model_name == name else None
+
+    def get_tenants(self):
+        """
+        Returns the shared TenantManager, which opens one collection per tenant on demand.
+
+        Output:
+            TenantManager: The process-wide tenant manager.
+        """
+        if self._tenants is None:
+            with self._lock:
+                if self._tenants is None:
+                    from src.tenants import TenantManager
+
+                    self._tenants = TenantManager(
+                        registry=self,
+                        chroma_dir=os.getenv("CHROMA_DIR", "./vectorstore/chroma_db"),
+                        upload_dir=os.getenv("UPLOAD_DIR", "./data"),
+                        max_open=int(os.getenv("MAX_OPEN_TENANTS", "16")),
+                    )
+        return self._tenants
+
+    def get_vector_store(self, tenant: str = None):
+        """
+        Returns a tenant's vector store (ChromaDBHandler, or LocalVectorStore with VECTOR_ENGINE=local),
+        creating or loading the collection on first use.
+
+        Args:
+            tenant (str, optional): Tenant name; the default tenant uses "rag_collection" in CHROMA_DIR.
+
+        Output:
+            VectorStore: The shared vector store handler of that tenant.
+        """
+        return self.get_tenants().get(tenant).vector_store
+
+    def get_llm(self):
+        """
+        Returns the shared chat model client (OpenRouter via the OpenAI-compatible API).
+
+        Output:
+            ChatOpenAI: The process-wide LLM client.
+        """
+        if self._llm is None:
+            with self._lock:
+                if self._llm is None:
+                    try:
+                        from langchain_openai import ChatOpenAI
+
+                        model_name = os.getenv("MISTRAL_MODEL_NAME")
+                        api_key = os.getenv("OPENROUTER_API_KEY")
+
+                        if not api_key:
+                            raise ValueError(
+                                "OPENROUTER_API_KEY not found. "
+                                "Please make sure it is set in your .env file."
+                            )
+
+                        self._llm = ChatOpenAI(
+                            model=model_name,
+                            openai_api_key=api_key,
+                            openai_api_base="https://openrouter.ai/api/v1",  # Base URL for OpenRouter
+                            temperature=0.3,     # Lower temperature for more deterministic output
+                            max_tokens=2000      # Limit token size to prevent overflow
+                        )
+                        logging.info(f"Shared LLM client initialized with model: {model_name}")
+                    except Exception as e:
+                        raise CustomException(e, sys)
+        return self._llm
+
+    def get_executor(self):
+        """
+        Returns the shared ExecutionLayer (bounded thread and process pools).
+
+        Output:
+            ExecutionLayer: The process-wide execution layer.
+        """
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    from src.executor import ExecutionLayer
+                    self._executor = ExecutionLayer()
+        return self._executor
+
+    def get_job_queue(self):
+        """
+        Returns the shared persistent queue of background ingestion jobs.
+
+        Output:
+            JobQueue: The process-wide job queue (SQLite file at JOBS_DB).
+        """
+        if self._job_queue is None:
+            with self._lock:
+                if self._job_queue is None:
+                    from src.jobs.job_queue import JobQueue
+
+                    self._job_queue = JobQueue(
+                        db_path=os.getenv("JOBS_DB", "./vectorstore/jobs.sqlite3"),
+                        max_attempts=int(os.getenv("JOB_MAX_ATTEMPTS", "3")),
+                        heartbeat_timeout=float(os.getenv("JOB_HEARTBEAT_TIMEOUT", "60")),
+                    )
+        return self._job_queue
+
+    def get_job_workers(self):
+        """
+        Returns the shared background ingestion workers (not started; the API starts them).
+
+        Output:
+            IngestionWorkers: The process-wide workers draining the job queue.
+        """
+        if self._job_workers is None:
+            with self._lock:
+                if self._job_workers is None:
+                    from src.jobs.ingestion_worker import IngestionWorkers
+
+                    parallel = os.getenv("INGEST_MODE", "stream") == "parallel"
+                    self._job_workers = IngestionWorkers(
+                        self.get_job_queue(), self.get_tenants(), workers=int(os.getenv("JOB_WORKERS", "2")),
+                        executor=self.get_executor() if parallel else None,
+                    )
+        return self._job_workers
+
+    def get_answer_cache(self, tenant: str = None):
+        """
+        Returns a tenant's AnswerCache, or None when ANSWER_CACHE_ENABLED is false.
+
+        Output:
+            AnswerCache or None: The answer cache of that tenant.
+        """
+        return self.get_tenants().get(tenant).answer_cache
+
+    def new_answer_cache(self, vector_store):
+        """
+        Builds an AnswerCache for one vector store, or returns None when ANSWER_CACHE_ENABLED is false.
+        The cache is registered with the store so any change to its corpus invalidates it.
+        """
+        if os.getenv("ANSWER_CACHE_ENABLED", "true").lower() not in ("1", "true", "yes"):
+            return None
+        from src.cache.answer_cache import AnswerCache
+
+        answer_cache = AnswerCache(
+            # The store's current model (it changes when a migration swaps the collection), so cached
+            # vectors and the vectors batch queries get from the store always come from the same model
+            embed_fn=lambda query: vector_store.embeddings.embed_query(query),
+            similarity_threshold=float(os.getenv("ANSWER_CACHE_SIMILARITY", "0.95")),
+            max_entries=int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "1024")),
+            max_bytes=int(os.getenv("ANSWER_CACHE_MAX_BYTES", str(32 * 1024 * 1024))),
+            ttl_seconds=float(os.getenv("ANSWER_CACHE_TTL", "3600")),
+        )
+        vector_store.add_change_listener(answer_cache.invalidate)
+        return answer_cache
+
+    def get_extraction_cache(self):
+        """
+        Returns the shared on-disk extraction cache, or None when EXTRACTION_CACHE_ENABLED is false.
+
+        Output:
+            ExtractionCache or None: The process-wide extraction cache.
+        """
+        if os.getenv("EXTRACTION_CACHE_ENABLED", "true").lower() not in ("1", "true", "yes"):
+            return None
+        if self._extraction_cache is None:
+            with self._lock:
+                if self._extraction_cache is None:
+                    from src.cache.extraction_cache import ExtractionCache
+
+                    self._extraction_cache = ExtractionCache(
+                        cache_dir=os.getenv("EXTRACTION_CACHE_DIR", "./vectorstore/extraction_cache"),
+                        max_bytes=int(os.getenv("EXTRACTION_CACHE_MAX_BYTES", str(1024 * 1024 * 1024))),
+                    )
+        return self._extraction_cache
+
+    def get_reranker(self):
+        """
+        Returns the shared cross-encoder reranker, or None when RERANK_ENABLED is false (default).
+
+        Output:
+            CrossEncoderReranker or None: The process-wide reranker.
+        """
+        if os.getenv("RERANK_ENABLED", "false").lower() not in ("1", "true", "yes"):
+            return None
+        if self._reranker is None:
+            with self._lock:
+                if self._reranker is None:
+                    from src.agents.reranker import CrossEncoderReranker
+
+                    self._reranker = CrossEncoderReranker(
+                        model_name=os.getenv("RERANK_MODEL", "cross-encoder/ms-marco-MiniLM-L-6-v2"),
+                        batch_size=int(os.getenv("RERANK_BATCH_SIZE", "16")),
+                        budget_ms=float(os.getenv("RERANK_BUDGET_MS", "300")),
+                        cache_size=int(os.getenv("RERANK_CACHE_SIZE", "20000")),
+                        probe_every=int(os.getenv("RERANK_PROBE_EVERY", "20")),
+                    )
+        return self._reranker
+
+    def reset(self):
+        """
+        Drops all cached components so they are rebuilt on next access (useful for tests).
+        """
+        with self._lock:
+            if self._job_workers is not None:
+                self._job_workers.stop()
+            self._job_workers = None
+            if self._executor is not None:
+                self._executor.shutdown()
+            self._executor = None
+            if self._tenants is not None:
+                self._tenants.close_all()
+            self._tenants = None
+            if self._job_queue is not None:
+                self._job_queue.close()
+            self._job_queue = None
+            self._reranker = None
+            self._embedding_agent = None
+            self._migration_models = {}
+            self._llm = None
+
+
+# Single registry instance shared by the whole process
+registry = ComponentRegistry()
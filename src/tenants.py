@@ -0,0 +1,441 @@
+# This file defines per-tenant workspaces: an isolated collection, upload directory and answer cache
+# for each tenant, opened lazily and kept in a bounded LRU of open handles.
+
+import os
+import re
+import sys
+import shutil
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+from contextlib import contextmanager
+from src.exception import CustomException
+from src.logger import logging
+
+# Tenant used when a request does not name one; it keeps the original collection and directories
+DEFAULT_TENANT = "default"
+
+# Tenant names end up in collection and directory names, so only a safe subset is accepted
+_TENANT_PATTERN = re.compile(r"^[A-Za-z0-9](?:[A-Za-z0-9_-]{0,62}[A-Za-z0-9])?$")
+
+
+class InvalidTenantError(ValueError):
+    """Raised when a tenant name is not usable as a collection / directory name."""
+
+
+class MigrationRunningError(RuntimeError):
+    """Raised when an embedding migration is requested while another one runs for the same tenant."""
+
+
+def normalize_tenant(tenant: str = None) -> str:
+    """
+    Validates a tenant name, mapping an empty one to DEFAULT_TENANT.
+    """
+    tenant = (tenant or DEFAULT_TENANT).strip()
+    if not _TENANT_PATTERN.match(tenant):
+        raise InvalidTenantError(
+            f"Invalid tenant '{tenant}': use 1-64 letters, digits, '-' or '_' (starting and ending with a letter or digit)."
+        )
+    return tenant
+
+
+class TenantWorkspace:
+    """
+    Everything that belongs to one tenant: its vector store handle, upload directory and
+    content-addressed upload store, answer cache and coordinator. Built by TenantManager; `leases` counts requests using it.
+    """
+
+    def __init__(self, name: str, upload_dir: str, vector_store, answer_cache, coordinator_factory):
+        from src.upload_store import UploadStore
+
+        self.name = name
+        self.upload_dir = upload_dir
+        self.uploads = UploadStore(upload_dir, chunk_bytes=int(os.getenv("UPLOAD_CHUNK_BYTES", str(1024 * 1024))))
+        self.vector_store = vector_store
+        self.answer_cache = answer_cache
+        self.leases = 0
+        self._coordinator_factory = coordinator_factory
+        self._coordinator = None
+        self._lock = threading.Lock()
+
+    @property
+    def coordinator(self):
+        # Built on first query, so ingestion-only use never needs the LLM client
+        if self._coordinator is None:
+            with self._lock:
+                if self._coordinator is None:
+                    self._coordinator = self._coordinator_factory(self)
+        return self._coordinator
+
+
+class TenantManager:
+    """
+    Opens tenant workspaces on first use and keeps at most `max_open` of them open.
+
+    - The default tenant uses the original "rag_collection", CHROMA_DIR and UPLOAD_DIR, so
+      existing single-tenant data keeps working.
+    - Tenant "x" uses collection "tenant_x", state under CHROMA_DIR/tenants/x and uploads
+      under UPLOAD_DIR/tenants/x.
+    - When more than `max_open` workspaces are open, the least recently used ones that no
+      request currently holds are closed. Memory therefore follows the active tenants.
+      The embedding model, LLM client, reranker and thread pools are shared by all tenants.
+    - Opening and closing stores happens outside the manager lock, so a slow open only delays
+      requests for that tenant: concurrent callers wait on the tenant's pending open, and a
+      tenant being closed is reopened only once its close has finished.
+    - VECTOR_ENGINE selects the vector store of every workspace: "chroma" (ChromaDBHandler) or
+      "local" (LocalVectorStore: in-process flat / HNSW indexes under CHROMA_DIR/local).
+    """
+
+    def __init__(self, registry, chroma_dir: str, upload_dir: str, max_open: int = 16):
+        """
+        Args:
+            registry: The ComponentRegistry providing the shared embedding model, LLM and reranker.
+            chroma_dir (str): Chroma persist directory shared by all tenants.
+            upload_dir (str): Root upload directory.
+            max_open (int): Open workspace limit (workspaces in use are never closed).
+        """
+        self.registry = registry
+        self.chroma_dir = chroma_dir
+        self.upload_dir = upload_dir
+        self.max_open = max_open
+        self._open = OrderedDict()      # tenant name -> TenantWorkspace, LRU order
+        self._opening = {}              # tenant name -> Future of the workspace being opened
+        self._closing = {}              # tenant name -> Event set once its evicted store is closed
+        self._lock = threading.RLock()
+        self._migrations = {}           # tenant name -> EmbeddingMigration (latest one)
+        self._starting = set()          # tenants whose migration is being set up (target model loading)
+        self.vector_engine = os.getenv("VECTOR_ENGINE", "chroma").lower()
+        if self.vector_engine not in ("chroma", "local"):
+            raise ValueError(f"Unknown VECTOR_ENGINE: {self.vector_engine} (use 'chroma' or 'local')")
+
+    def _paths(self, tenant: str) -> tuple:
+        # (collection name, state directory, upload directory) of a tenant
+        if tenant == DEFAULT_TENANT:
+            return "rag_collection", self.chroma_dir, self.upload_dir
+        return (
+            f"tenant_{tenant}",
+            os.path.join(self.chroma_dir, "tenants", tenant),
+            os.path.join(self.upload_dir, "tenants", tenant),
+        )
+
+    def _open_workspace(self, tenant: str) -> TenantWorkspace:
+        # Imported here to avoid circular imports (agents use the registry too)
+        from src.vector_store.chroma_db import ChromaDBHandler
+        from src.vector_store.local_store import LocalVectorStore
+
+        collection_name, state_dir, upload_dir = self._paths(tenant)
+        os.makedirs(upload_dir, exist_ok=True)
+
+        store_class = LocalVectorStore if self.vector_engine == "local" else ChromaDBHandler
+        vector_store = store_class(
+            persist_directory=self.chroma_dir, collection_name=collection_name, state_directory=state_dir
+        )
+        vector_store.create_or_load(embeddings=self.registry.get_embedding_model())
+        migrated = vector_store.migrated_fingerprint
+        stored = vector_store.fingerprint
+        if vector_store.fingerprint_mismatch and migrated and migrated["embedding_model"] == stored["embedding_model"]:
+            # Migrated to another model (in this process or before a restart): keep using that model.
+            # A mismatch without a migration (the configured model was changed) still refuses the collection.
+            migrated_model = self.registry.get_fingerprinted_model(migrated["embedding_model"])
+            if migrated_model is not None:
+                vector_store.create_or_load(embeddings=migrated_model)
+
+        # Each tenant gets its own answer cache, invalidated only by its own corpus changes
+        answer_cache = self.registry.new_answer_cache(vector_store)
+        logging.info(f"Opened workspace for tenant '{tenant}' ({len(self._open) + 1} open)")
+        return TenantWorkspace(tenant, upload_dir, vector_store, answer_cache, self._build_coordinator)
+
+    def _build_coordinator(self, workspace: TenantWorkspace):
+        from src.agents.retrieval_agent import RetrievalAgent
+        from src.agents.llm_response_agent import LLMResponseAgent
+        from src.agents.coordinator_agent import CoordinatorAgent
+
+        return CoordinatorAgent(
+            retrieval_agent=RetrievalAgent(vector_db=workspace.vector_store),
+            llm_agent=LLMResponseAgent(llm=self.registry.get_llm()),
+            answer_cache=workspace.answer_cache,
+        )
+
+    def _evict(self, keep: str = None) -> list:
+        # Picks least recently used workspaces that no request is holding (called under the lock;
+        # the caller closes them with _close after releasing it). The default workspace stays
+        # open: single-tenant code paths keep long-lived references to its handles.
+        evicted = []
+        for name in list(self._open):
+            if len(self._open) <= self.max_open:
+                break
+            workspace = self._open[name]
+            if workspace.leases == 0 and name not in (keep, DEFAULT_TENANT):
+                del self._open[name]
+                self._closing[name] = threading.Event()
+                evicted.append(workspace)
+        return evicted
+
+    def _close(self, evicted: list):
+        for workspace in evicted:
+            try:
+                workspace.vector_store.close()
+                logging.info(f"Closed idle workspace for tenant '{workspace.name}'")
+            except Exception as e:
+                logging.error(f"Could not close workspace for tenant '{workspace.name}': {str(e)}")
+            finally:
+                with self._lock:
+                    self._closing.pop(workspace.name).set()
+
+    def _get(self, tenant: str, lease: bool) -> TenantWorkspace:
+        # Returns the open workspace (pinned when `lease`), opening it outside the manager lock
+        tenant = normalize_tenant(tenant)
+        while True:
+            with self._lock:
+                workspace = self._open.get(tenant)
+                if workspace is not None:
+                    self._open.move_to_end(tenant)
+                    if lease:
+                        workspace.leases += 1
+                    evicted = self._evict(keep=tenant)
+                    break
+                pending = self._opening.get(tenant)
+                opener = pending is None
+                if opener:
+                    pending = self._opening[tenant] = Future()
+                closing = self._closing.get(tenant)
+
+            if not opener:
+                pending.result()    # Opened (or failed) by a concurrent caller: look again
+                continue
+            try:
+                if closing is not None:
+                    closing.wait()  # Never open a store while its previous handle is being closed
+                workspace = self._open_workspace(tenant)
+            except Exception as e:
+                with self._lock:
+                    del self._opening[tenant]
+                pending.set_exception(e)
+                raise
+            with self._lock:
+                del self._opening[tenant]
+                self._open[tenant] = workspace
+                pending.set_result(workspace)
+
+        self._close(evicted)
+        return workspace
+
+    def get(self, tenant: str = None) -> TenantWorkspace:
+        """
+        Returns the tenant's workspace, opening it if needed (marks it most recently used).
+
+        Args:
+            tenant (str, optional): Tenant name (DEFAULT_TENANT when empty).
+
+        Output:
+            TenantWorkspace: The open workspace.
+        """
+        try:
+            return self._get(tenant, lease=False)
+        except InvalidTenantError:
+            raise
+        except Exception as e:
+            raise CustomException(e, sys)
+
+    def acquire(self, tenant: str = None) -> TenantWorkspace:
+        """
+        Same as get(), but also pins the workspace until release() so it is not closed mid-request.
+        """
+        try:
+            return self._get(tenant, lease=True)
+        except InvalidTenantError:
+            raise
+        except Exception as e:
+            raise CustomException(e, sys)
+
+    def release(self, workspace: TenantWorkspace):
+        """
+        Unpins a workspace returned by acquire().
+        """
+        with self._lock:
+            workspace.leases -= 1
+            evicted = self._evict()
+        self._close(evicted)
+
+    @contextmanager
+    def lease(self, tenant: str = None):
+        """
+        Context manager around acquire() / release().
+        """
+        workspace = self.acquire(tenant)
+        try:
+            yield workspace
+        finally:
+            self.release(workspace)
+
+    def known_tenants(self) -> list:
+        """
+        Tenants with data on disk or currently open (the default tenant is always listed).
+        """
+        names = {DEFAULT_TENANT, *self._open}
+        tenants_dir = os.path.join(self.chroma_dir, "tenants")
+        if os.path.isdir(tenants_dir):
+            names.update(name for name in os.listdir(tenants_dir) if _TENANT_PATTERN.match(name))
+        return sorted(names)
+
+    def is_open(self, tenant: str) -> bool:
+        with self._lock:
+            return normalize_tenant(tenant) in self._open
+
+    def _closed_store(self, tenant: str):
+        # A handler on the tenant's state directory whose collection is not opened (see disk_stats)
+        from src.vector_store.chroma_db import ChromaDBHandler
+        from src.vector_store.local_store import LocalVectorStore
+
+        collection_name, state_dir, _ = self._paths(tenant)
+        store_class = LocalVectorStore if self.vector_engine == "local" else ChromaDBHandler
+        return store_class(persist_directory=self.chroma_dir, collection_name=collection_name, state_directory=state_dir)
+
+    def stats(self, tenant: str = None) -> dict:
+        """
+        Chunk / file counts and upload size of one tenant. A tenant that is not open is not
+        opened for this: its counts are read from disk.
+
+        Output:
+            dict: {"tenant", "open", "collection", "chunks", "files", "keyword_docs", "upload_files", "upload_bytes"}
+        """
+        tenant = normalize_tenant(tenant)
+        try:
+            with self._lock:
+                workspace = self._open.get(tenant)
+                if workspace is not None:
+                    workspace.leases += 1
+            try:
+                if workspace is not None:
+                    store_stats = workspace.vector_store.stats()
+                else:
+                    store = self._closed_store(tenant)
+                    try:
+                        store_stats = store.disk_stats()
+                    finally:
+                        store.close()
+            finally:
+                if workspace is not None:
+                    self.release(workspace)
+
+            upload_files = upload_bytes = 0
+            upload_dir = self._paths(tenant)[2]
+            if os.path.isdir(upload_dir):
+                for entry in os.scandir(upload_dir):
+                    if entry.is_file():
+                        upload_files += 1
+                        upload_bytes += entry.stat().st_size
+            return {
+                "tenant": tenant,
+                "open": len(self._open),
+                **store_stats,
+                "upload_files": upload_files,
+                "upload_bytes": upload_bytes,
+            }
+        except Exception as e:
+            raise CustomException(e, sys)
+
+    def clear(self, tenant: str = None) -> int:
+        """
+        Removes one tenant's vectors and uploaded files; other tenants are untouched. The tenant's
+        queued and running ingestion jobs are failed first, so none writes into the cleared collection.
+
+        Output:
+            int: Number of vectors removed.
+        """
+        try:
+            with self.lease(tenant) as workspace:
+                # Running pipelines stop and discard their chunks before the reset
+                self.registry.get_job_workers().cancel_tenant(workspace.name)
+                removed = workspace.vector_store.clear_collection()
+                # Only plain files: the default tenant's directory also holds the other tenants' folders
+                for entry in os.scandir(workspace.upload_dir):
+                    if entry.is_file() or entry.is_symlink():
+                        os.unlink(entry.path)
+                    elif entry.is_dir() and not (workspace.name == DEFAULT_TENANT and entry.name == "tenants"):
+                        shutil.rmtree(entry.path)
+                workspace.uploads.clear()
+                logging.info(f"Cleared tenant '{workspace.name}': {removed} vectors removed")
+                return removed
+        except Exception as e:
+            raise CustomException(e, sys)
+
+    def migrate_embeddings(self, tenant: str, model_name: str, backend: str = None,
+                           batch_size: int = None, duty_cycle: float = None) -> dict:
+        """
+        Starts re-embedding a tenant's collection with another model in the background
+        (see EmbeddingMigration). The workspace stays open until the migration ends.
+
+        Args:
+            tenant (str): Tenant to migrate.
+            model_name (str): Target HuggingFace model.
+            backend (str, optional): Target runtime ("huggingface" / "onnx").
+            batch_size (int, optional): Chunks per step (MIGRATION_BATCH_SIZE env).
+            duty_cycle (float, optional): Share of time spent working (MIGRATION_DUTY_CYCLE env).
+
+        Output:
+            dict: The migration status.
+        """
+        from src.vector_store.migration import EmbeddingMigration, RUNNING
+
+        tenant = normalize_tenant(tenant)
+        try:
+            workspace = self.acquire(tenant)
+            # Reserve the tenant in the same lock section as the check: loading the target model is
+            # slow, and a second request arriving meanwhile must not start another migration
+            with self._lock:
+                current = self._migrations.get(tenant)
+                running = tenant in self._starting or (current is not None and current.status["state"] == RUNNING)
+                if not running:
+                    self._starting.add(tenant)
+            if running:
+                self.release(workspace)
+                raise MigrationRunningError(f"An embedding migration is already running for tenant '{tenant}'.")
+
+            try:
+                target = self.registry.get_migration_model(model_name, backend)
+                migration = EmbeddingMigration(
+                    workspace.vector_store,
+                    target,
+                    batch_size=batch_size or int(os.getenv("MIGRATION_BATCH_SIZE", "256")),
+                    duty_cycle=duty_cycle or float(os.getenv("MIGRATION_DUTY_CYCLE", "0.5")),
+                )
+            except Exception:
+                with self._lock:
+                    self._starting.discard(tenant)
+                self.release(workspace)
+                raise
+            with self._lock:
+                self._migrations[tenant] = migration
+                self._starting.discard(tenant)
+
+            def run():
+                try:
+                    migration.run()
+                except Exception:
+                    pass    # Recorded in the migration status
+                finally:
+                    self.release(workspace)
+
+            threading.Thread(target=run, name=f"embedding-migration-{tenant}", daemon=True).start()
+            return migration.status
+        except MigrationRunningError:
+            raise
+        except Exception as e:
+            raise CustomException(e, sys)
+
+    def migration_status(self, tenant: str) -> dict:
+        """
+        Status of the tenant's latest embedding migration in this process, or None.
+        """
+        migration = self._migrations.get(normalize_tenant(tenant))
+        return dict(migration.status) if migration is not None else None
+
+    def close_all(self):
+        """
+        Closes every open workspace (on shutdown).
+        """
+        with self._lock:
+            for workspace in self._open.values():
+                workspace.vector_store.close()
+            self._open.clear()
@@ -0,0 +1,209 @@
+# This file defines the content-addressed store for uploaded files: streamed writes hashed on the fly,
+# one blob per distinct content, and named links that point uploads at their blob.
+
+import os
+import sys
+import json
+import shutil
+import hashlib
+import tempfile
+import threading
+from src.exception import CustomException
+from src.logger import logging
+
+
+class UploadTooLargeError(ValueError):
+    """Raised when an uploaded file exceeds the configured size limit."""
+
+
+class UploadStore:
+    """
+    Saves uploads under `root` without ever holding a whole file in memory.
+
+    - Each upload is copied in `chunk_bytes` blocks to a temp file while its SHA-256 is computed,
+      so saving costs exactly one pass over the data.
+    - The content lives once in root/.blobs/<hash>; identical uploads (under any name) reuse it.
+    - root/<filename> is a hard link to the blob (a copy where links are unsupported), so the
+      ingestion code keeps working with plain file paths and file names as document sources.
+    - Uploading a different file under an existing name re-points the name (a new version of
+      that document); the old blob is removed once nothing links to it.
+    - Ingestion jobs read a snapshot instead of root/<filename>: a link to the blob under
+      root/.blobs/snapshots/<token>/<filename>, made when the file is saved. A later upload under
+      the same name cannot change the bytes a queued job reads (the snapshot keeps the old
+      content alive until the job releases it), so the hash recorded at upload time stays true.
+    """
+
+    def __init__(self, root: str, chunk_bytes: int = 1024 * 1024):
+        """
+        Args:
+            root (str): Upload directory of one workspace.
+            chunk_bytes (int): Block size of streamed writes.
+        """
+        try:
+            self.root = root
+            self.chunk_bytes = chunk_bytes
+            self.blob_dir = os.path.join(root, ".blobs")
+            self.snapshot_dir = os.path.join(self.blob_dir, "snapshots")
+            os.makedirs(self.snapshot_dir, exist_ok=True)
+            self._index_path = os.path.join(self.blob_dir, "names.json")
+            self._lock = threading.Lock()
+            self._names = {}    # file name -> content hash
+            if os.path.exists(self._index_path):
+                with open(self._index_path, "r", encoding="utf-8") as f:
+                    self._names = json.load(f)
+        except Exception as e:
+            raise CustomException(e, sys)
+
+    def _save_index(self):
+        # Same atomic write as the manifest: temp file, then swap
+        tmp_path = f"{self._index_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self._names, f)
+        os.replace(tmp_path, self._index_path)
+
+    def _blob_path(self, digest: str) -> str:
+        return os.path.join(self.blob_dir, digest)
+
+    def _drop_blob_if_unused(self, digest: str):
+        # A blob is unused when no name refers to it any more
+        if digest and digest not in self._names.values():
+            path = self._blob_path(digest)
+            if os.path.exists(path):
+                os.remove(path)
+
+    def _link(self, digest: str, path: str):
+        # Point `path` at the blob: hard link when possible, otherwise a copy (both leave the
+        # bytes at `path` unchanged when the blob itself is removed later)
+        tmp_path = f"{path}.linking"
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        try:
+            os.link(self._blob_path(digest), tmp_path)
+        except OSError:
+            shutil.copyfile(self._blob_path(digest), tmp_path)
+        os.replace(tmp_path, path)
+
+    def save(self, fileobj, filename: str, max_bytes: int = None, snapshot: str = None) -> dict:
+        """
+        Streams one upload into the store.
+
+        Args:
+            fileobj: Readable binary file object (e.g., UploadFile.file).
+            filename (str): Name the upload is stored (and indexed) under.
+            max_bytes (int, optional): Size limit; larger uploads raise UploadTooLargeError.
+            snapshot (str, optional): Token of the ingestion run (e.g., one per upload request);
+                                      an immutable snapshot of the content is linked for it.
+
+        Output:
+            dict: {"filename", "path", "sha256", "bytes", "duplicate" (content already stored),
+                   "replaced" (the name previously held different content),
+                   "snapshot" (path of the snapshot to ingest, or None)}
+        """
+        filename = os.path.basename(filename)
+        digest = hashlib.sha256()
+        size = 0
+        fd, tmp_path = tempfile.mkstemp(dir=self.blob_dir, suffix=".part")
+        try:
+            with os.fdopen(fd, "wb") as out:
+                for block in iter(lambda: fileobj.read(self.chunk_bytes), b""):
+                    size += len(block)
+                    if max_bytes and size > max_bytes:
+                        raise UploadTooLargeError(f"{filename} exceeds the upload limit of {max_bytes} bytes.")
+                    digest.update(block)
+                    out.write(block)
+            sha256 = digest.hexdigest()
+
+            with self._lock:
+                duplicate = os.path.exists(self._blob_path(sha256))
+                if duplicate:
+                    os.remove(tmp_path)      # Same bytes already stored: keep the existing blob
+                else:
+                    os.replace(tmp_path, self._blob_path(sha256))
+
+                previous = self._names.get(filename)
+                path = os.path.join(self.root, filename)
+                if previous != sha256 or not os.path.exists(path):
+                    self._link(sha256, path)
+                    self._names[filename] = sha256
+                    self._save_index()
+                    self._drop_blob_if_unused(previous)
+
+                # Linked under the same lock, before another upload can re-point the name
+                snapshot_path = None
+                if snapshot:
+                    os.makedirs(os.path.join(self.snapshot_dir, snapshot), exist_ok=True)
+                    snapshot_path = os.path.join(self.snapshot_dir, snapshot, filename)
+                    self._link(sha256, snapshot_path)
+
+            logging.info(f"Stored upload {filename} ({size} bytes, duplicate={duplicate})")
+            return {
+                "filename": filename,
+                "path": path,
+                "sha256": sha256,
+                "bytes": size,
+                "duplicate": duplicate,
+                "replaced": previous is not None and previous != sha256,
+                "snapshot": snapshot_path,
+            }
+        except UploadTooLargeError:
+            raise
+        except Exception as e:
+            raise CustomException(e, sys)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def current(self, filename: str) -> str:
+        """
+        Content hash the name currently points at (None once the upload was removed).
+        """
+        with self._lock:
+            return self._names.get(os.path.basename(filename))
+
+    def release_snapshot(self, path: str):
+        """
+        Deletes a snapshot once its ingestion run is over (its directory too, when empty).
+        """
+        try:
+            path = os.path.abspath(path)
+            if os.path.dirname(os.path.dirname(path)) != os.path.abspath(self.snapshot_dir):
+                return
+            with self._lock:
+                if os.path.isfile(path):
+                    os.remove(path)
+                directory = os.path.dirname(path)
+                if os.path.isdir(directory) and not os.listdir(directory):
+                    os.rmdir(directory)
+        except Exception as e:
+            raise CustomException(e, sys)
+
+    def remove(self, filename: str) -> bool:
+        """
+        Deletes a named upload (and its blob when no other name uses it).
+
+        Output:
+            bool: True if the name existed.
+        """
+        try:
+            filename = os.path.basename(filename)
+            with self._lock:
+                digest = self._names.pop(filename, None)
+                path = os.path.join(self.root, filename)
+                existed = digest is not None or os.path.isfile(path)
+                if os.path.isfile(path):
+                    os.unlink(path)
+                if digest is not None:
+                    self._save_index()
+                    self._drop_blob_if_unused(digest)
+                return existed
+        except Exception as e:
+            raise CustomException(e, sys)
+
+    def clear(self):
+        """
+        Forgets every upload (the files themselves are deleted by the caller with the directory).
+        """
+        with self._lock:
+            self._names = {}
+            shutil.rmtree(self.blob_dir, ignore_errors=True)
+            os.makedirs(self.snapshot_dir, exist_ok=True)
@@ -0,0 +1,112 @@
+# This file defines the VectorStore interface that the retrieval and ingestion code depend on,
+# implemented by the Chroma handler and by the local engine.
+
+from typing import List, Iterable
+from langchain_core.documents import Document
+
+
+class VectorStore:
+    """
+    Interface of a vector store: a collection of embedded chunks with dense, keyword and ID lookups,
+    incremental ingestion bookkeeping and change notifications.
+
+    Implementations:
+    - ChromaDBHandler (src/vector_store/chroma_db.py): collections in Chroma.
+    - LocalVectorStore (src/vector_store/local_store.py): in-process flat / HNSW indexes over
+      memory-mapped vectors (VECTOR_ENGINE=local).
+    """
+
+    # --- Lifecycle ---
+
+    def create_or_load(self, embeddings):
+        """
+        Opens the collection with the given embedding model (creating it on first use).
+        """
+        raise NotImplementedError
+
+    def close(self):
+        """
+        Releases in-memory state; data on disk is kept.
+        """
+        raise NotImplementedError
+
+    def stats(self) -> dict:
+        """
+        Size of the collection and its companion indexes.
+        """
+        raise NotImplementedError
+
+    def add_change_listener(self, callback):
+        """
+        Registers a zero-argument callback run after the corpus changes.
+        """
+        raise NotImplementedError
+
+    # --- Search (used by RetrievalAgent) ---
+
+    def similarity_search(self, query: str, k: int = 5, mmr: bool = False, max_per_source: int = None,
+                          fetch_k: int = None, lambda_mult: float = None, filters: dict = None) -> List[Document]:
+        """
+        Dense top-k search, optionally diversified (MMR / per-source cap) and filtered (see build_where).
+        """
+        raise NotImplementedError
+
+    def embed_queries(self, queries: List[str]) -> list:
+        """
+        Query embeddings of several questions, computed in one batched pass.
+        """
+        raise NotImplementedError
+
+    def similarity_search_batch(self, queries: List[str], k: int = 5, mmr: bool = False, max_per_source: int = None,
+                                fetch_k: int = None, lambda_mult: float = None, filters: dict = None,
+                                query_embeddings: list = None) -> List[List[Document]]:
+        """
+        similarity_search for several queries with one embedding pass and one multi-vector search;
+        one result list per query, in order.
+        """
+        raise NotImplementedError
+
+    def keyword_search(self, query: str, k: int = 5, sources: list = None, filters: dict = None) -> List[Document]:
+        """
+        BM25 top-k search with the same filters as similarity_search.
+        """
+        raise NotImplementedError
+
+    def get_by_ids(self, ids: list, where: dict = None) -> List[Document]:
+        """
+        Stored chunks by ID, in the order of `ids`.
+        """
+        raise NotImplementedError
+
+    # --- Ingestion ---
+
+    def add_documents(self, documents: List[Document]):
+        raise NotImplementedError
+
+    def add_documents_bulk(self, documents: Iterable[Document], write_batch_size: int = None,
+                           embed_batch_size: int = None, on_batch=None) -> int:
+        """
+        Embeds and stores documents in batches, skipping chunks already stored; returns the number of new chunks.
+        """
+        raise NotImplementedError
+
+    def file_unchanged(self, source: str, file_hash: str) -> bool:
+        raise NotImplementedError
+
+    def commit_file(self, source: str, file_hash: str, chunk_ids: list, mtime: float = None) -> int:
+        """
+        Removes chunks the previous version of a file had but the new one does not, and records the file.
+        """
+        raise NotImplementedError
+
+    def discard_chunks(self, source: str, chunk_ids: list) -> int:
+        """
+        Deletes chunks stored for a file whose ingestion did not complete (keeps those its recorded version uses).
+        """
+        raise NotImplementedError
+
+    def delete_by_source(self, source: str, page_size: int = 1000) -> int:
+        raise NotImplementedError
+
+    def clear_collection(self, mode: str = "reset", page_size: int = 1000) -> int:
+        raise NotImplementedError
@@ -0,0 +1,203 @@
+# This file defines the vector search benchmark: recall@k, query latency and index memory of Chroma
+# and the local engine (flat / HNSW, optionally int8- or PQ-quantized) on the same corpus, against
+# exact nearest neighbours (the results of the unquantized flat search).
+
+import os
+import sys
+import time
+import shutil
+import tempfile
+import numpy as np
+from src.vector_store.local_index import normalize
+from src.vector_store.local_store import LocalCollection
+from src.exception import CustomException
+from src.logger import logging
+
+
+def synthetic_corpus(n: int, dim: int, queries: int, clusters: int = 200, seed: int = 0) -> tuple:
+    """
+    Clustered random vectors (embeddings of real text cluster by topic; uniform noise would make
+    every index look worse than it is) and queries drawn from the same clusters.
+
+    Output:
+        tuple: (vectors [n, dim], queries [queries, dim]), float32.
+    """
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(clusters, dim))
+    vectors = centers[rng.integers(0, clusters, n)] + rng.normal(scale=0.6, size=(n, dim))
+    probes = centers[rng.integers(0, clusters, queries)] + rng.normal(scale=0.6, size=(queries, dim))
+    return vectors.astype(np.float32), probes.astype(np.float32)
+
+
+def exact_neighbours(vectors: np.ndarray, queries: np.ndarray, k: int) -> list:
+    """
+    Ground truth: the k most cosine-similar vectors of each query, by brute force.
+    """
+    similarities = normalize(queries) @ normalize(vectors).T
+    return [set(np.argsort(-row)[:k].tolist()) for row in similarities]
+
+
+def _measure(search, queries: np.ndarray, truth: list, k: int) -> dict:
+    # Runs every query once (after a short warm-up) and scores the returned positions
+    for query in queries[:10]:
+        search(query)
+    latencies, hits, results = [], 0, []
+    for query, expected in zip(queries, truth):
+        started = time.perf_counter()
+        found = search(query)
+        latencies.append((time.perf_counter() - started) * 1000)
+        hits += len(expected & set(found[:k]))
+        results.append(set(found[:k]))
+    return {
+        "recall_at_k": round(hits / (k * len(queries)), 4),
+        "p50_ms": round(float(np.percentile(latencies, 50)), 3),
+        "p99_ms": round(float(np.percentile(latencies, 99)), 3),
+        "results": results,
+    }
+
+
+def _bench_chroma(vectors, queries, truth, k, workdir, M, ef_construction, ef_search) -> dict:
+    import chromadb
+
+    client = chromadb.PersistentClient(path=os.path.join(workdir, "chroma"))
+    collection = client.create_collection("bench", metadata={
+        "hnsw:space": "cosine", "hnsw:M": M, "hnsw:construction_ef": ef_construction, "hnsw:search_ef": ef_search,
+    })
+    started = time.perf_counter()
+    batch = client.get_max_batch_size()
+    for start in range(0, len(vectors), batch):
+        part = vectors[start:start + batch]
+        collection.add(ids=[str(i) for i in range(start, start + len(part))], embeddings=part)
+    build = time.perf_counter() - started
+
+    def search(query):
+        found = collection.query(query_embeddings=[query], n_results=k, include=[])
+        return [int(i) for i in found["ids"][0]]
+
+    measured = _measure(search, queries, truth, k)
+    # Chroma loads its HNSW segment files (vectors + graph) into memory; the SQLite file holds the rest
+    segments = 0
+    for root, _, files in os.walk(os.path.join(workdir, "chroma")):
+        segments += sum(os.path.getsize(os.path.join(root, f)) for f in files if not f.startswith("chroma.sqlite3"))
+    return {"engine": "chroma", "build_s": round(build, 2), "memory_mb": round(segments / 2 ** 20, 2), **measured}
+
+
+def _bench_local(engine, vectors, queries, truth, k, workdir, M, ef_construction, ef_search,
+                 rescore_factor, pq_subspaces) -> dict:
+    # Engine names are "<flat|hnsw>[-<int8|pq>]"
+    index, _, quantization = engine.partition("-")
+    collection = LocalCollection(os.path.join(workdir, engine), "bench", index=index, M=M,
+                                 ef_construction=ef_construction, ef_search=ef_search,
+                                 quantization=quantization or "none", train_size=min(5000, len(vectors)),
+                                 rescore_factor=rescore_factor, pq_subspaces=pq_subspaces)
+    started = time.perf_counter()
+    for start in range(0, len(vectors), 5000):
+        part = vectors[start:start + 5000]
+        collection.upsert(ids=[str(i) for i in range(start, start + len(part))], embeddings=part)
+    collection.wait_indexed()
+    build = time.perf_counter() - started
+
+    def search(query):
+        found = collection.query(query_embeddings=[query], n_results=k, include=[])
+        return [int(i) for i in found["ids"][0]]
+
+    try:
+        measured = _measure(search, queries, truth, k)
+        # What a search keeps hot: the codes (quantized) or the float32 vectors, plus the graph
+        memory = collection.flat.resident_bytes + (collection.graph.nbytes if collection.graph is not None else 0)
+        return {"engine": f"local-{engine}", "build_s": round(build, 2), "memory_mb": round(memory / 2 ** 20, 2), **measured}
+    finally:
+        collection.close()
+
+
+def run_benchmark(vectors: np.ndarray, queries: np.ndarray, k: int = 10, engines: tuple = ("chroma", "flat", "hnsw"),
+                  M: int = 16, ef_construction: int = 100, ef_search: int = 64, rescore_factor: int = 8,
+                  pq_subspaces: int = 48, workdir: str = None) -> list:
+    """
+    Loads the same vectors into each engine and runs the same queries against them.
+
+    Args:
+        vectors (np.ndarray): Corpus vectors.
+        queries (np.ndarray): Query vectors.
+        k (int): Results per query (recall@k is measured against the exact top-k, i.e., what the
+                 unquantized similarity search returns).
+        engines (tuple): Any of "chroma", "flat", "hnsw", "flat-int8", "flat-pq", "hnsw-int8", "hnsw-pq".
+        M, ef_construction, ef_search (int): HNSW settings, used for Chroma's and the local graph alike.
+        rescore_factor (int): Candidates re-scored at full precision per result (quantized engines).
+        pq_subspaces (int): Code bytes per vector of the "-pq" engines.
+        workdir (str, optional): Scratch directory (a temporary one is created and removed otherwise).
+
+    Output:
+        list: One dict per engine: {"engine", "build_s", "memory_mb", "recall_at_k", "p50_ms", "p99_ms"},
+              plus "overlap_chroma" (share of Chroma's top-k also returned) when "chroma" is benchmarked.
+    """
+    scratch = workdir or tempfile.mkdtemp(prefix="vector-bench-")
+    try:
+        truth = exact_neighbours(vectors, queries, k)
+        results = []
+        for engine in engines:
+            logging.info(f"Benchmarking {engine} on {len(vectors)} vectors, {len(queries)} queries")
+            if engine == "chroma":
+                results.append(_bench_chroma(vectors, queries, truth, k, scratch, M, ef_construction, ef_search))
+            else:
+                results.append(_bench_local(engine, vectors, queries, truth, k, scratch, M, ef_construction, ef_search,
+                                            rescore_factor, pq_subspaces))
+            logging.info(f"Benchmark result: { {key: value for key, value in results[-1].items() if key != 'results'} }")
+
+        # Overlap with what the existing Chroma similarity_search returns for the same queries
+        baseline = next((row["results"] for row in results if row["engine"] == "chroma"), None)
+        for row in results:
+            found = row.pop("results")
+            if baseline is not None:
+                row["overlap_chroma"] = round(sum(len(a & b) for a, b in zip(found, baseline)) / (k * len(queries)), 4)
+        return results
+    except Exception as e:
+        raise CustomException(e, sys)
+    finally:
+        if workdir is None:
+            shutil.rmtree(scratch, ignore_errors=True)
+
+
+# Example usage:
+#   python -m src.vector_store.benchmark --n 20000 --k 10
+#   python -m src.vector_store.benchmark --vectors corpus.npy --queries queries.npy --engines chroma hnsw --ef-search 32
+#   python -m src.vector_store.benchmark --engines flat flat-int8 flat-pq --rescore-factor 4
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Compare Chroma with the local flat / HNSW (optionally quantized) indexes.")
+    parser.add_argument("--n", type=int, default=20000, help="Synthetic corpus size")
+    parser.add_argument("--dim", type=int, default=384, help="Synthetic vector dimension")
+    parser.add_argument("--num-queries", type=int, default=200)
+    parser.add_argument("--vectors", help=".npy file with corpus vectors (instead of the synthetic corpus)")
+    parser.add_argument("--queries", help=".npy file with query vectors (default: perturbed corpus vectors)")
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--engines", nargs="+", default=["chroma", "flat", "flat-int8", "flat-pq", "hnsw"])
+    parser.add_argument("--M", type=int, default=int(os.getenv("HNSW_M", "16")))
+    parser.add_argument("--ef-construction", type=int, default=int(os.getenv("HNSW_EF_CONSTRUCTION", "100")))
+    parser.add_argument("--ef-search", type=int, default=int(os.getenv("HNSW_EF_SEARCH", "64")))
+    parser.add_argument("--rescore-factor", type=int, default=int(os.getenv("QUANTIZATION_RESCORE_FACTOR", "8")))
+    parser.add_argument("--pq-subspaces", type=int, default=int(os.getenv("PQ_SUBSPACES", "48")))
+    args = parser.parse_args()
+
+    if args.vectors:
+        corpus = np.load(args.vectors).astype(np.float32)
+        if args.queries:
+            probes = np.load(args.queries).astype(np.float32)
+        else:
+            rng = np.random.default_rng(0)
+            picked = corpus[rng.choice(len(corpus), min(args.num_queries, len(corpus)), replace=False)]
+            probes = picked + rng.normal(scale=0.05 * float(np.abs(corpus).mean()), size=picked.shape).astype(np.float32)
+    else:
+        corpus, probes = synthetic_corpus(args.n, args.dim, args.num_queries)
+
+    rows = run_benchmark(corpus, probes, k=args.k, engines=tuple(args.engines), M=args.M,
+                         ef_construction=args.ef_construction, ef_search=args.ef_search,
+                         rescore_factor=args.rescore_factor, pq_subspaces=args.pq_subspaces)
+    print(f"{len(corpus)} vectors x {corpus.shape[1]} dims, {len(probes)} queries, k={args.k}, "
+          f"M={args.M}, ef_construction={args.ef_construction}, ef_search={args.ef_search}, "
+          f"rescore_factor={args.rescore_factor}, pq_subspaces={args.pq_subspaces}")
+    print(f"{'engine':<16} {'build_s':>8} {'memory_mb':>10} {'recall@k':>9} {'vs_chroma':>10} {'p50_ms':>8} {'p99_ms':>8}")
+    for row in rows:
+        print(f"{row['engine']:<16} {row['build_s']:>8} {row['memory_mb']:>10} {row['recall_at_k']:>9} "
+              f"{row.get('overlap_chroma', '-'):>10} {row['p50_ms']:>8} {row['p99_ms']:>8}")
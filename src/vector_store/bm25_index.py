@@ -0,0 +1,509 @@
+# This file defines a compact, array-backed BM25 inverted index stored next to the Chroma directory.
+
+import os
+import re
+import sys
+import json
+import math
+import shutil
+import threading
+import unicodedata
+import numpy as np
+from src.exception import CustomException
+from src.logger import logging
+
+# Keeps identifiers such as "SKU-1042", "v2.3" or "user_id" as single tokens; letters and digits
+# of any script count as word characters, so non-ASCII text is indexed too
+_TOKEN_RE = re.compile(r"[^\W_][\w\-\.]*[^\W_]|[^\W_]")
+_MAX_TERM_LEN = 40
+
+# The base segment is rebuilt once the delta (documents added since the last compaction) or the
+# tombstones reach COMPACT_RATIO of its size (at least COMPACT_MIN_DOCS), or after MAX_SEGMENTS saves
+COMPACT_MIN_DOCS = 20000
+COMPACT_RATIO = 0.1
+MAX_SEGMENTS = 64
+
+
+def tokenize(text: str) -> list:
+    """
+    Normalizes (NFKC, case-folded) the text and splits it into word/identifier tokens.
+    """
+    return [t[:_MAX_TERM_LEN] for t in _TOKEN_RE.findall(unicodedata.normalize("NFKC", text).casefold())]
+
+
+class BM25Index:
+    """
+    BM25 keyword index kept in sync with the vector store.
+
+    On disk the index is a compact base segment (sorted vocabulary, posting offsets, posting
+    doc numbers, term frequencies, doc lengths, doc IDs, doc source numbers), opened with mmap,
+    plus small delta segments and a tombstone list:
+
+    - add() puts new documents in an in-memory delta; save() appends only the documents added
+      since the previous save as a new delta segment file, and rewrites meta.json (sources,
+      tombstones, segment list). A save therefore costs O(new documents), not O(corpus).
+    - Deletions are tombstones (doc numbers in meta.json) until the next compaction.
+    - Once the delta or the tombstones grow past a threshold, save() compacts: base and delta
+      postings are merged as integer (term number, doc number) pairs into a new base segment.
+    """
+
+    _ARRAYS = ("terms", "offsets", "postings", "tfs", "doc_lens", "doc_ids", "doc_sources")
+
+    def __init__(self, directory: str, k1: float = 1.5, b: float = 0.75):
+        """
+        Args:
+            directory (str): Where the index arrays are stored (created if missing).
+            k1 (float): BM25 term-frequency saturation.
+            b (float): BM25 length normalization.
+        """
+        self.directory = directory
+        self.k1 = k1
+        self.b = b
+        self._lock = threading.RLock()
+        self._loaded = False
+
+    # --- Loading and persistence ---
+
+    def exists(self) -> bool:
+        return os.path.exists(os.path.join(self.directory, "meta.json"))
+
+    def _empty(self):
+        self._seg = {
+            "terms": np.array([], dtype=f"<U{_MAX_TERM_LEN}"),
+            "offsets": np.zeros(1, dtype=np.int64),
+            "postings": np.array([], dtype=np.int32),
+            "tfs": np.array([], dtype=np.uint16),
+            "doc_lens": np.array([], dtype=np.int32),
+            "doc_ids": np.array([], dtype="<U32"),
+            "doc_sources": np.array([], dtype=np.int32),
+        }
+        self._base = None               # Directory of the base segment (None = no base yet)
+        self._segments = []             # Delta segment files, oldest first
+        self._seq = 0                   # Number used for the next segment / base directory
+        self._sources = []              # source number -> source name
+        self._deleted = set()           # tombstoned doc numbers
+        self._deleted_array = None      # sorted tombstones, rebuilt lazily for searches
+        self._delta_postings = {}       # term -> {doc number: tf}
+        self._delta_lens = []
+        self._delta_ids = []
+        self._delta_sources = []
+        self._delta_arrays = None       # NumPy copies of the delta doc lists, rebuilt lazily
+        self._pending = []              # (doc number, {term: tf}) added since the last save
+        self._dirty = False             # tombstones / sources changed since the last save
+        self._base_len = 0              # total token count of the base segment
+        self._delta_len = 0
+        self._deleted_len = 0           # ... and of the tombstoned documents
+        self._id_to_doc = None          # built lazily for deletes by chunk ID
+
+    def _open_base(self, base_dir: str):
+        for name in self._ARRAYS:
+            self._seg[name] = np.load(os.path.join(base_dir, f"{name}.npy"), mmap_mode="r")
+        self._base_len = int(np.asarray(self._seg["doc_lens"]).sum(dtype=np.int64))
+
+    def _ensure_loaded(self):
+        if self._loaded:
+            return
+        with self._lock:
+            if self._loaded:
+                return
+            self._empty()
+            if self.exists():
+                with open(os.path.join(self.directory, "meta.json"), "r", encoding="utf-8") as f:
+                    meta = json.load(f)
+                # Indexes written before delta segments existed keep their arrays in the directory itself
+                self._base = meta.get("base", "" if os.path.exists(os.path.join(self.directory, "terms.npy")) else None)
+                if self._base is not None:
+                    self._open_base(os.path.join(self.directory, self._base))
+                self._sources = meta["sources"]
+                self._deleted = set(meta.get("deleted", []))
+                self._seq = meta.get("seq", 0)
+                for segment in meta.get("segments", []):
+                    self._replay(segment)
+                self._segments = list(meta.get("segments", []))
+                if self._deleted:
+                    deleted = np.fromiter(self._deleted, dtype=np.int64)
+                    self._deleted_len = int(self._doc_column(deleted, "doc_lens").sum())
+                logging.info(f"Loaded BM25 index ({self._seg_docs} docs + {len(self._delta_ids)} in "
+                             f"{len(self._segments)} delta segments) from: {self.directory}")
+            self._loaded = True
+
+    def _replay(self, segment: str):
+        # Loads a delta segment file back into the in-memory delta
+        with np.load(os.path.join(self.directory, segment)) as data:
+            for term, doc, tf in zip(data["terms"].tolist(), data["docs"].tolist(), data["tfs"].tolist()):
+                self._delta_postings.setdefault(term, {})[doc] = tf
+            self._delta_lens.extend(data["doc_lens"].tolist())
+            self._delta_ids.extend(data["doc_ids"].tolist())
+            self._delta_sources.extend(data["doc_sources"].tolist())
+            self._delta_len += int(data["doc_lens"].sum())
+
+    @property
+    def _seg_docs(self) -> int:
+        return len(self._seg["doc_lens"])
+
+    @property
+    def num_docs(self) -> int:
+        self._ensure_loaded()
+        return self._seg_docs + len(self._delta_ids) - len(self._deleted)
+
+    def stored_num_docs(self) -> int:
+        """
+        Live document count as of the last save, read from meta.json without loading the index.
+        """
+        try:
+            if self._loaded or not self.exists():
+                return self.num_docs if self.exists() else 0
+            with open(os.path.join(self.directory, "meta.json"), "r", encoding="utf-8") as f:
+                docs = json.load(f).get("docs")
+            if docs is not None:
+                return docs
+            # Written before the count was recorded: load once to count
+            count = self.num_docs
+            self.unload()
+            return count
+        except Exception as e:
+            raise CustomException(e, sys)
+
+    def _source_number(self, source: str) -> int:
+        try:
+            return self._sources.index(source)
+        except ValueError:
+            self._sources.append(source)
+            self._dirty = True
+            return len(self._sources) - 1
+
+    def _write_meta(self):
+        tmp_meta = os.path.join(self.directory, "meta.json.tmp")
+        with open(tmp_meta, "w", encoding="utf-8") as f:
+            json.dump({"base": self._base, "segments": self._segments, "seq": self._seq,
+                       "sources": self._sources, "deleted": sorted(self._deleted),
+                       "docs": self._seg_docs + len(self._delta_ids) - len(self._deleted)}, f)
+        os.replace(tmp_meta, os.path.join(self.directory, "meta.json"))
+
+    def _needs_compaction(self) -> bool:
+        threshold = max(COMPACT_MIN_DOCS, COMPACT_RATIO * self._seg_docs)
+        return (len(self._delta_ids) >= threshold or len(self._deleted) >= threshold
+                or len(self._segments) >= MAX_SEGMENTS)
+
+    def save(self):
+        """
+        Persists the changes since the last save: the new documents as a delta segment, and the
+        tombstones. Compacts into a new base segment when the delta or the tombstones are large.
+        """
+        try:
+            self._ensure_loaded()
+            with self._lock:
+                if not self._pending and not self._dirty and self.exists():
+                    return
+                os.makedirs(self.directory, exist_ok=True)
+                if self._base is None or self._needs_compaction():
+                    self._compact()
+                    return
+
+                if self._pending:
+                    terms, docs, tfs = [], [], []
+                    for doc, counts in self._pending:
+                        terms.extend(counts.keys())
+                        docs.extend([doc] * len(counts))
+                        tfs.extend(counts.values())
+                    first = self._pending[0][0] - self._seg_docs
+                    segment = f"delta-{self._seq:06d}.npz"
+                    tmp_path = os.path.join(self.directory, f"{segment}.tmp")
+                    with open(tmp_path, "wb") as f:
+                        np.savez(
+                            f,
+                            terms=np.array(terms, dtype=f"<U{_MAX_TERM_LEN}"),
+                            docs=np.array(docs, dtype=np.int32),
+                            tfs=np.array(tfs, dtype=np.uint16),
+                            doc_lens=np.array(self._delta_lens[first:], dtype=np.int32),
+                            doc_ids=np.array(self._delta_ids[first:], dtype="<U32"),
+                            doc_sources=np.array(self._delta_sources[first:], dtype=np.int32),
+                        )
+                    os.replace(tmp_path, os.path.join(self.directory, segment))
+                    self._segments.append(segment)
+                    self._seq += 1
+
+                # meta.json names the segment only once it is complete on disk
+                self._write_meta()
+                logging.info(f"Saved BM25 delta ({len(self._pending)} new docs, {len(self._deleted)} tombstones).")
+                self._pending = []
+                self._dirty = False
+        except Exception as e:
+            raise CustomException(e, sys)
+
+    def _compact(self):
+        # Merges the base segment, the delta and the tombstones into a new base segment. Terms are
+        # handled as integer numbers: only the vocabularies (not the postings) are string arrays.
+        seg = self._seg
+        base_terms = np.asarray(seg["terms"])
+        base_term_ids = np.repeat(np.arange(len(base_terms), dtype=np.int64), np.diff(np.asarray(seg["offsets"])))
+
+        # Vocabulary: delta terms not in the base are inserted at their sorted positions
+        delta_terms = np.array(sorted(self._delta_postings), dtype=f"<U{_MAX_TERM_LEN}")
+        found = np.searchsorted(base_terms, delta_terms)
+        known = found < len(base_terms)
+        known[known] = base_terms[found[known]] == delta_terms[known]
+        new_terms = delta_terms[~known]
+        inserted = np.searchsorted(base_terms, new_terms)
+        vocab = np.insert(base_terms, inserted, new_terms)
+        base_remap = np.arange(len(base_terms), dtype=np.int64) + np.searchsorted(
+            inserted, np.arange(len(base_terms)), side="right")
+        delta_ids = np.empty(len(delta_terms), dtype=np.int64)
+        delta_ids[known] = base_remap[found[known]]
+        delta_ids[~known] = inserted + np.arange(len(new_terms))
+
+        # Delta postings as (term number, doc, tf) arrays
+        sizes = np.fromiter((len(self._delta_postings[t]) for t in delta_terms.tolist()), dtype=np.int64,
+                            count=len(delta_terms))
+        delta_docs = np.fromiter((d for t in delta_terms.tolist() for d in self._delta_postings[t].keys()),
+                                 dtype=np.int64, count=int(sizes.sum()))
+        delta_tfs = np.fromiter((tf for t in delta_terms.tolist() for tf in self._delta_postings[t].values()),
+                                dtype=np.int64, count=int(sizes.sum()))
+
+        term_ids = np.concatenate([base_remap[base_term_ids], np.repeat(delta_ids, sizes)])
+        docs = np.concatenate([np.asarray(seg["postings"], dtype=np.int64), delta_docs])
+        tfs = np.concatenate([np.asarray(seg["tfs"]), delta_tfs.astype(np.uint16)])
+
+        doc_lens = np.concatenate([np.asarray(seg["doc_lens"]), np.array(self._delta_lens, dtype=np.int32)])
+        doc_ids = np.concatenate([np.asarray(seg["doc_ids"]), np.array(self._delta_ids, dtype="<U32")])
+        doc_sources = np.concatenate([np.asarray(seg["doc_sources"]), np.array(self._delta_sources, dtype=np.int32)])
+
+        # Drop tombstoned documents and renumber the survivors densely
+        alive = np.ones(len(doc_lens), dtype=bool)
+        if self._deleted:
+            alive[np.fromiter(self._deleted, dtype=np.int64)] = False
+        new_number = np.cumsum(alive) - 1
+        keep = alive[docs]
+        term_ids, docs, tfs = term_ids[keep], new_number[docs[keep]], tfs[keep]
+
+        # Drop terms left without postings, then sort postings by term and doc
+        counts = np.bincount(term_ids, minlength=len(vocab))
+        used = counts > 0
+        term_ids = (np.cumsum(used) - 1)[term_ids]
+        order = np.lexsort((docs, term_ids))
+        arrays = {
+            "terms": vocab[used].astype(f"<U{_MAX_TERM_LEN}"),
+            "offsets": np.concatenate([[0], np.cumsum(counts[used])]).astype(np.int64),
+            "postings": docs[order].astype(np.int32),
+            "tfs": tfs[order],
+            "doc_lens": doc_lens[alive],
+            "doc_ids": doc_ids[alive],
+            "doc_sources": doc_sources[alive],
+        }
+
+        # The new base gets its own directory; meta.json switches to it in one atomic replace
+        base = f"base-{self._seq:06d}"
+        base_dir = os.path.join(self.directory, base)
+        os.makedirs(base_dir, exist_ok=True)
+        for name, array in arrays.items():
+            np.save(os.path.join(base_dir, f"{name}.npy"), array)
+        old_base, old_segments, sources = self._base, self._segments, self._sources
+        self._empty()
+        self._base, self._seq, self._sources = base, int(base.split("-")[1]) + 1, sources
+        self._write_meta()
+        self._open_base(base_dir)
+
+        # Files of the previous base and the merged segments are no longer referenced
+        for segment in old_segments:
+            os.remove(os.path.join(self.directory, segment))
+        if old_base:
+            shutil.rmtree(os.path.join(self.directory, old_base), ignore_errors=True)
+        elif old_base == "":
+            for name in self._ARRAYS:
+                os.remove(os.path.join(self.directory, f"{name}.npy"))
+        logging.info(f"Compacted BM25 index to {len(arrays['doc_ids'])} docs and {len(arrays['terms'])} terms.")
+
+    # --- Updates ---
+
+    def add(self, ids: list, texts: list, sources: list):
+        """
+        Indexes new chunks in the in-memory delta (persisted on the next save()).
+
+        Args:
+            ids (list): Chunk IDs (same IDs as in the vector store).
+            texts (list): Chunk texts.
+            sources (list): Source file name of each chunk.
+        """
+        self._ensure_loaded()
+        with self._lock:
+            for chunk, text, source in zip(ids, texts, sources):
+                doc = self._seg_docs + len(self._delta_ids)
+                tokens = tokenize(text)
+                counts = {}
+                for token in tokens:
+                    counts[token] = counts.get(token, 0) + 1
+                for token, tf in counts.items():
+                    counts[token] = min(tf, 65535)
+                    self._delta_postings.setdefault(token, {})[doc] = counts[token]
+                self._pending.append((doc, counts))
+                self._delta_lens.append(len(tokens))
+                self._delta_len += len(tokens)
+                self._delta_ids.append(chunk)
+                self._delta_sources.append(self._source_number(source))
+                if self._id_to_doc is not None:
+                    self._id_to_doc[chunk] = doc
+            self._delta_arrays = None
+
+    def _tombstone(self, docs):
+        docs = np.array([doc for doc in docs if doc not in self._deleted], dtype=np.int64)
+        if not len(docs):
+            return
+        self._deleted_len += int(self._doc_column(docs, "doc_lens").sum())
+        self._deleted.update(docs.tolist())
+        self._deleted_array = None
+        self._dirty = True
+
+    def delete_ids(self, ids: list):
+        """
+        Tombstones chunks by ID.
+        """
+        self._ensure_loaded()
+        with self._lock:
+            if self._id_to_doc is None:
+                self._id_to_doc = {str(c): i for i, c in enumerate(self._seg["doc_ids"])}
+                self._id_to_doc.update({c: self._seg_docs + i for i, c in enumerate(self._delta_ids)})
+            self._tombstone([doc for doc in (self._id_to_doc.pop(chunk, None) for chunk in ids) if doc is not None])
+
+    def delete_source(self, source: str):
+        """
+        Tombstones every chunk of one source file.
+        """
+        self._ensure_loaded()
+        with self._lock:
+            if source not in self._sources:
+                return
+            number = self._sources.index(source)
+            self._tombstone(np.nonzero(np.asarray(self._seg["doc_sources"]) == number)[0].tolist())
+            self._tombstone(self._seg_docs + i for i, s in enumerate(self._delta_sources) if s == number)
+            self._id_to_doc = None
+
+    def unload(self):
+        """
+        Persists pending changes and releases the in-memory delta and mmap'd arrays.
+        The index is loaded again on next use.
+        """
+        try:
+            with self._lock:
+                if not self._loaded:
+                    return
+                if self._pending or self._dirty:
+                    self.save()
+                self._seg = None
+                self._delta_postings = {}
+                self._id_to_doc = None
+                self._loaded = False
+        except Exception as e:
+            raise CustomException(e, sys)
+
+    def clear(self):
+        """
+        Removes the whole index from memory and disk.
+        """
+        with self._lock:
+            self._empty()
+            self._loaded = True
+            if os.path.isdir(self.directory):
+                for name in os.listdir(self.directory):
+                    path = os.path.join(self.directory, name)
+                    if name.startswith("base-") and os.path.isdir(path):
+                        shutil.rmtree(path, ignore_errors=True)
+                    elif name == "meta.json" or name.startswith("delta-") or name[:-4] in self._ARRAYS:
+                        os.remove(path)
+
+    # --- Search ---
+
+    def _delta_columns(self) -> tuple:
+        # NumPy copies of the delta's doc lengths and sources (bounded by the compaction threshold)
+        if self._delta_arrays is None:
+            self._delta_arrays = (np.array(self._delta_lens, dtype=np.int32),
+                                  np.array(self._delta_sources, dtype=np.int32))
+        return self._delta_arrays
+
+    def _doc_column(self, docs: np.ndarray, name: str) -> np.ndarray:
+        # doc_lens / doc_sources values of the given doc numbers (base segment or delta)
+        delta = self._delta_columns()[0 if name == "doc_lens" else 1]
+        in_base = docs < self._seg_docs
+        values = np.empty(len(docs), dtype=np.int64)
+        values[in_base] = np.asarray(self._seg[name][docs[in_base]])
+        values[~in_base] = delta[docs[~in_base] - self._seg_docs]
+        return values
+
+    def _is_deleted(self, docs: np.ndarray) -> np.ndarray:
+        if not self._deleted:
+            return np.zeros(len(docs), dtype=bool)
+        if self._deleted_array is None:
+            self._deleted_array = np.array(sorted(self._deleted), dtype=np.int64)
+        return np.isin(docs, self._deleted_array)
+
+    def search(self, query: str, k: int = 10, sources: list = None) -> list:
+        """
+        Scores documents with BM25 and returns the best matches. Only the postings of the
+        query terms are read (no per-query arrays over the whole corpus).
+
+        Args:
+            query (str): The user query.
+            k (int): Number of results.
+            sources (list, optional): Only return chunks from these source files.
+
+        Output:
+            list: [(chunk ID, score)] sorted by descending score.
+        """
+        try:
+            self._ensure_loaded()
+            with self._lock:
+                seg = self._seg
+                total = self._seg_docs + len(self._delta_ids)
+                alive_docs = total - len(self._deleted)
+                if alive_docs <= 0:
+                    return []
+                # Collection statistics only count documents that are not tombstoned
+                avg_len = max(float(self._base_len + self._delta_len - self._deleted_len) / alive_docs, 1.0)
+
+                all_docs, all_scores = [], []
+                for term in set(tokenize(query)):
+                    # Segment postings: binary search in the sorted vocabulary
+                    docs = np.zeros(0, dtype=np.int64)
+                    tfs = np.zeros(0, dtype=np.float32)
+                    pos = int(np.searchsorted(seg["terms"], term))
+                    if pos < len(seg["terms"]) and seg["terms"][pos] == term:
+                        start, end = int(seg["offsets"][pos]), int(seg["offsets"][pos + 1])
+                        docs = np.asarray(seg["postings"][start:end], dtype=np.int64)
+                        tfs = np.asarray(seg["tfs"][start:end], dtype=np.float32)
+                    delta = self._delta_postings.get(term)
+                    if delta:
+                        docs = np.concatenate([docs, np.fromiter(delta.keys(), dtype=np.int64)])
+                        tfs = np.concatenate([tfs, np.fromiter(delta.values(), dtype=np.float32)])
+                    if not len(docs):
+                        continue
+
+                    # Document frequency only counts documents that are not tombstoned
+                    alive = ~self._is_deleted(docs)
+                    docs, tfs = docs[alive], tfs[alive]
+                    if not len(docs):
+                        continue
+                    idf = math.log(1 + (alive_docs - len(docs) + 0.5) / (len(docs) + 0.5))
+                    norm = self.k1 * (1 - self.b + self.b * self._doc_column(docs, "doc_lens") / avg_len)
+                    all_docs.append(docs)
+                    all_scores.append(idf * tfs * (self.k1 + 1) / (tfs + norm))
+
+                if not all_docs:
+                    return []
+                candidates, positions = np.unique(np.concatenate(all_docs), return_inverse=True)
+                scores = np.bincount(positions, weights=np.concatenate(all_scores))
+                if sources is not None:
+                    allowed = [self._sources.index(s) for s in sources if s in self._sources]
+                    keep = np.isin(self._doc_column(candidates, "doc_sources"), allowed)
+                    candidates, scores = candidates[keep], scores[keep]
+
+                if not len(candidates):
+                    return []
+                best = np.argsort(-scores, kind="stable")[:k] if len(candidates) <= k else \
+                    np.argpartition(-scores, k - 1)[:k]
+                best = best[np.argsort(-scores[best], kind="stable")]
+
+                def doc_id(doc):
+                    return str(seg["doc_ids"][doc]) if doc < self._seg_docs else self._delta_ids[doc - self._seg_docs]
+
+                return [(doc_id(int(candidates[i])), float(scores[i])) for i in best]
+        except Exception as e:
+            raise CustomException(e, sys)
@@ -2,51 +2,268 @@
 
 import sys
 import os
-from typing import List
+import json
+import time
+import uuid
+import queue
+import threading
+from typing import List, Iterable
 from langchain_chroma import Chroma
 from langchain_core.documents import Document
+from src.vector_store.base import VectorStore
+from src.vector_store.manifest import FileManifest, chunk_id
+from src.vector_store.bm25_index import BM25Index
+from src.vector_store.mmr import maximal_marginal_relevance
+from src.vector_store.filters import build_where
+from src.vector_store.fingerprint import (
+    EmbeddingMismatchError, embedding_fingerprint, mismatch_message, stored_fingerprint, MODEL_KEY, DIM_KEY
+)
 from src.exception import CustomException
 from src.logger import logging
 
 
-class ChromaDBHandler:
+class ChromaDBHandler(VectorStore):
     """
-    Handler class to manage interaction with the Chroma vector database.
+    Handler class to manage interaction with the Chroma vector database (the Chroma implementation of VectorStore).
     This includes creating/loading the DB, adding documents, performing similarity searches, and clearing the DB.
     """
 
-    def __init__(self, persist_directory: str):
+    def __init__(self, persist_directory: str, collection_name: str = "rag_collection", state_directory: str = None):
         """
         Initializes the handler and sets up the directory to persist the Chroma DB.
 
         Args:
             persist_directory (str): Path to save and reload vectorstore data.
+            collection_name (str): Chroma collection holding this handler's vectors (one per tenant).
+            state_directory (str, optional): Where the manifest and BM25 index of this collection
+                                             are kept. Defaults to persist_directory.
         """
         try:
             self.persist_directory = persist_directory
+            self.collection_name = collection_name
+            self.state_directory = state_directory or persist_directory
             self.db = None
+            self.embeddings = None
+            self.fingerprint = None             # {"embedding_model", "embedding_dim"} of the live collection
+            self.fingerprint_mismatch = None    # Set when the configured model does not match the stored vectors
+            self._model_fingerprint = None      # Fingerprint of the configured model
+            # Chunks per Chroma write and per embedding call (they can differ; see add_documents_bulk)
+            self.write_batch_size = int(os.getenv("CHROMA_WRITE_BATCH_SIZE", "1000"))
+            self.embed_batch_size = int(os.getenv("EMBED_BATCH_SIZE", "64"))
+            self._change_listeners = []  # Callbacks run after the corpus changes (e.g., cache invalidation)
+            self._write_lock = threading.RLock()  # Serializes resets and deletes against each other
             os.makedirs(persist_directory, exist_ok=True)  # Ensure directory exists
-            logging.info(f"Initializing Chroma vectorstore at: {persist_directory}")
+            os.makedirs(self.state_directory, exist_ok=True)
+
+            # Per-file record of content hash and chunk IDs, for incremental re-ingestion
+            self.manifest = FileManifest(os.path.join(self.state_directory, "manifest.sqlite3"))
+
+            # BM25 keyword index kept in sync with the collection (mmap-loaded on first use)
+            self.keyword_index = BM25Index(os.path.join(self.state_directory, "bm25"))
+            self._keyword_checked = False       # Set once the index is known to match the collection
+
+            # Name of the Chroma collection currently serving this handler. It only differs from
+            # `collection_name` after an embedding migration or a reset swapped in another collection.
+            self._pointer_path = os.path.join(self.state_directory, f"{collection_name}.active.json")
+            self.active_collection = collection_name
+            self.migrated_fingerprint = None    # Fingerprint of the model a migration switched to
+            if os.path.exists(self._pointer_path):
+                with open(self._pointer_path, "r", encoding="utf-8") as f:
+                    pointer = json.load(f)
+                self.active_collection = pointer["collection"]
+                if MODEL_KEY in pointer:
+                    self.migrated_fingerprint = {MODEL_KEY: pointer[MODEL_KEY], DIM_KEY: pointer.get(DIM_KEY)}
+            logging.info(f"Initializing {type(self).__name__} vectorstore at: {persist_directory}")
         except Exception as e:
             raise CustomException(e, sys)
 
     def create_or_load(self, embeddings):
         """
-        Creates a new or loads an existing Chroma vectorstore using the given embedding model.
+        Creates a new or loads an existing Chroma vectorstore using the given embedding model,
+        and checks the model against the fingerprint stored with the collection.
 
         Args:
             embeddings: The embedding function/model used for storing and retrieving vectors.
         """
         try:
-            self.db = Chroma(
-                persist_directory=self.persist_directory,
-                embedding_function=embeddings,
-                collection_name="rag_collection"  # Use a consistent collection name
-            )
-            logging.info("Chroma vectorstore initialized successfully.")
+            self.embeddings = embeddings
+            self.db = self.open_collection(self.active_collection, embeddings)
+            self._check_fingerprint()
+            logging.info(f"Chroma vectorstore initialized successfully (collection: {self.active_collection}).")
+        except Exception as e:
+            raise CustomException(e, sys)
+
+    def open_collection(self, name: str, embeddings) -> Chroma:
+        """
+        Opens (or creates) another collection on the same Chroma client, e.g., a migration's shadow collection.
+        """
+        return Chroma(
+            persist_directory=self.persist_directory,
+            embedding_function=embeddings,
+            collection_name=name,
+            client_settings=self._client_settings()
+        )
+
+    @staticmethod
+    def _write_fingerprint(db: Chroma, fingerprint: dict):
+        # modify() replaces the whole metadata; index settings ("hnsw:*") cannot be passed again
+        metadata = {k: v for k, v in (db._collection.metadata or {}).items() if not k.startswith("hnsw:")}
+        db._collection.modify(metadata={**metadata, **fingerprint})
+
+    def _check_fingerprint(self):
+        # Record the model on new collections; flag a mismatch on existing ones
+        current = self._model_fingerprint = embedding_fingerprint(self.embeddings)
+        stored = stored_fingerprint(self.db._collection.metadata)
+        self.fingerprint, self.fingerprint_mismatch = current, None
+
+        if stored is None:
+            if self.db._collection.count():
+                # Created before fingerprints existed: the dimension of a stored vector is all we can check
+                sample = self.db._collection.get(limit=1, include=["embeddings"])["embeddings"]
+                stored_dim = len(sample[0]) if sample is not None and len(sample) else current[DIM_KEY]
+                if stored_dim != current[DIM_KEY]:
+                    self.fingerprint = {"embedding_model": "unknown", "embedding_dim": stored_dim}
+                    self.fingerprint_mismatch = mismatch_message(self.fingerprint, current)
+                    logging.error(self.fingerprint_mismatch)
+                    return
+                logging.warning(f"Collection {self.active_collection} has no model fingerprint; assuming {current}")
+            self._write_fingerprint(self.db, current)
+        elif stored != current:
+            self.fingerprint = stored
+            self.fingerprint_mismatch = mismatch_message(stored, current)
+            logging.error(self.fingerprint_mismatch)
+
+    def _require_compatible(self):
+        # Vectors of different models are not comparable, so searches and writes are refused
+        if self.fingerprint_mismatch:
+            raise EmbeddingMismatchError(self.fingerprint_mismatch)
+
+    def swap_collection(self, db: Chroma, embeddings, fingerprint: dict):
+        """
+        Atomically replaces the live collection with a re-embedded one (end of a migration):
+        the pointer file is swapped with os.replace, then the handler switches to the new
+        collection and model, and the old collection is dropped.
+
+        Args:
+            db (Chroma): The fully populated replacement collection.
+            embeddings: Model that produced its vectors (used for queries from now on).
+            fingerprint (dict): Fingerprint of that model.
+        """
+        try:
+            with self._write_lock:
+                self._write_fingerprint(db, fingerprint)
+                old_name, new_name = self._point_to(db, fingerprint)
+                self.embeddings = embeddings
+                self.migrated_fingerprint = dict(fingerprint)
+                self.fingerprint, self.fingerprint_mismatch = fingerprint, None
+                self._model_fingerprint = fingerprint
+            logging.info(f"Swapped collection {old_name} -> {new_name} ({fingerprint})")
+            self._notify_change()
+        except Exception as e:
+            raise CustomException(e, sys)
+
+    def _point_to(self, db, pointer: dict) -> tuple:
+        # Called under the write lock: switch the pointer file with os.replace (readers of the file see
+        # the old or the new collection, never neither), then the live handle, then drop the old collection
+        new_name = db._collection.name
+        tmp_path = f"{self._pointer_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"collection": new_name, **pointer}, f)
+        os.replace(tmp_path, self._pointer_path)
+
+        old_name = self.active_collection
+        self.db = db
+        self.active_collection = new_name
+        if old_name != new_name:
+            db._client.delete_collection(old_name)
+        return old_name, new_name
+
+    def _client_settings(self):
+        # All collections share one Chroma client per directory. With CHROMA_MEMORY_LIMIT_BYTES set,
+        # Chroma keeps loaded collection indexes in an LRU cache bounded to that many bytes, so
+        # memory follows the active collections rather than all of them.
+        memory_limit = int(os.getenv("CHROMA_MEMORY_LIMIT_BYTES", "0"))
+        if not memory_limit:
+            return None
+        from chromadb.config import Settings
+        return Settings(
+            is_persistent=True,
+            persist_directory=self.persist_directory,
+            chroma_segment_cache_policy="LRU",
+            chroma_memory_limit_bytes=memory_limit,
+        )
+
+    def close(self):
+        """
+        Releases this handler's in-memory state (BM25 arrays, listeners, collection handle).
+        Data on disk is kept; a new handler can reopen the collection later.
+        """
+        try:
+            with self._write_lock:
+                self.keyword_index.unload()
+                self.manifest.close()
+                self._change_listeners = []
+                self.db = None
+            logging.info(f"Closed collection: {self.collection_name}")
         except Exception as e:
             raise CustomException(e, sys)
 
+    def stats(self) -> dict:
+        """
+        Size of the collection and its companion indexes.
+
+        Output:
+            dict: {"collection", "chunks", "files", "keyword_docs", "embedding_model", "embedding_dim",
+                   "fingerprint_mismatch"}
+        """
+        try:
+            return {
+                "collection": self.active_collection,
+                "chunks": self.db._collection.count() if self.db else 0,
+                "files": self.manifest.count(),
+                "keyword_docs": self.keyword_index.num_docs if self.keyword_index.exists() else 0,
+                **(self.fingerprint or {}),
+                "fingerprint_mismatch": self.fingerprint_mismatch,
+            }
+        except Exception as e:
+            raise CustomException(e, sys)
+
+    def disk_stats(self) -> dict:
+        """
+        Counts of a collection that is not open, read from the manifest and the BM25 index on disk
+        (the BM25 index holds one entry per stored chunk), so no client or model is needed.
+
+        Output:
+            dict: {"collection", "chunks", "files", "keyword_docs"}
+        """
+        try:
+            keyword_docs = self.keyword_index.stored_num_docs()
+            return {
+                "collection": self.active_collection,
+                "chunks": keyword_docs,
+                "files": self.manifest.count(),
+                "keyword_docs": keyword_docs,
+            }
+        except Exception as e:
+            raise CustomException(e, sys)
+
+    def add_change_listener(self, callback):
+        """
+        Registers a callback that is called with no arguments after documents are added
+        or the collection is cleared (used to invalidate answer caches).
+
+        Args:
+            callback: Zero-argument callable.
+        """
+        self._change_listeners.append(callback)
+
+    def _notify_change(self):
+        for callback in self._change_listeners:
+            try:
+                callback()
+            except Exception as e:
+                logging.error(f"Change listener failed: {str(e)}")
+
     def add_documents(self, documents: List[Document]):
         """
         Adds a list of LangChain Document chunks to the Chroma DB.
@@ -54,27 +271,258 @@ class ChromaDBHandler:
         Args:
             documents (List[Document]): The documents (with metadata) to be stored.
         """
+        try:
+            self.add_documents_bulk(documents)
+        except Exception as e:
+            raise CustomException(e, sys)
+
+    def _max_write_batch(self) -> int:
+        # Chroma rejects writes larger than the client's max batch size
+        client = self.db._client
+        try:
+            limit = client.get_max_batch_size()
+        except AttributeError:
+            limit = getattr(client, "max_batch_size", None)
+        return min(self.write_batch_size, limit) if limit else self.write_batch_size
+
+    def add_documents_bulk(self, documents: Iterable[Document], write_batch_size: int = None,
+                           embed_batch_size: int = None, on_batch=None) -> int:
+        """
+        Bulk insert: embeds documents in batches of `embed_batch_size` on a background thread
+        while the calling thread writes finished embeddings to Chroma in batches of
+        `write_batch_size`, so embedding and writing overlap and no single call has to hold
+        the whole upload. Throughput is logged per write batch.
+
+        Every chunk gets a content-addressed ID (hash of source + text, also stored as the
+        "doc_id" metadata). Chunks whose ID is already in the collection are not embedded again,
+        so re-ingesting identical content does not duplicate vectors; only their metadata is
+        rewritten (an edited file moves unchanged chunks to other pages / chunk positions).
+
+        Args:
+            documents (Iterable[Document]): The documents (with metadata) to be stored; may be a generator.
+            write_batch_size (int, optional): Chunks per Chroma write (capped at Chroma's max batch size).
+            embed_batch_size (int, optional): Chunks per embedding model call.
+            on_batch (callable, optional): Called with the number of chunks after each committed write.
+
+        Output:
+            int: Number of new chunks stored.
+        """
         try:
             if not self.db:
                 raise Exception("Chroma DB not initialized. Call create_or_load first.")
-            
-            # Assign unique doc_id using source and index to help prevent duplicates
-            for i, doc in enumerate(documents):
-                doc.metadata["doc_id"] = f"{doc.metadata.get('source', 'unknown')}_{i}"
-            
-            logging.info(f"Adding {len(documents)} document chunks to Chroma...")
-            self.db.add_documents(documents)
-            logging.info("Documents added to Chroma DB successfully.")
+            self._require_compatible()
+
+            write_batch_size = min(write_batch_size or self.write_batch_size, self._max_write_batch())
+            embed_batch_size = embed_batch_size or self.embed_batch_size
+            embedded = queue.Queue(maxsize=max(2, write_batch_size // embed_batch_size * 2))
+            errors = []
+            stop = threading.Event()    # Set when the writer gives up, so the producer never blocks on a full queue
+
+            skipped = [0]
+            refreshed = [0]
+
+            def hand_over(item) -> bool:
+                # Bounded put that gives up once the writer has stopped consuming
+                while not stop.is_set():
+                    try:
+                        embedded.put(item, timeout=0.1)
+                        return True
+                    except queue.Full:
+                        continue
+                return False
+
+            def embed_batch(batch) -> bool:
+                # Only embed chunks the collection does not already hold. The ID lookup takes the write
+                # lock, so it never reads a collection that a reset, swap or delete is replacing
+                with self._write_lock:
+                    found = self.db._collection.get(ids=[d.metadata["doc_id"] for d in batch], include=["metadatas"])
+                    existing = {cid: meta or {} for cid, meta in zip(found["ids"], found["metadatas"])}
+                    # Known chunks keep their vectors but take the new version's metadata (page, chunk
+                    # index, ingestion time); update() merges keys, so dropped keys are set to None
+                    stale = [d for d in batch if d.metadata["doc_id"] in existing and existing[d.metadata["doc_id"]] != d.metadata]
+                    if stale:
+                        self.db._collection.update(
+                            ids=[d.metadata["doc_id"] for d in stale],
+                            metadatas=[{**{key: None for key in existing[d.metadata["doc_id"]] if key not in d.metadata},
+                                        **d.metadata} for d in stale],
+                        )
+                        refreshed[0] += len(stale)
+                skipped[0] += len(existing)
+                batch = [d for d in batch if d.metadata["doc_id"] not in existing]
+                if batch:
+                    return hand_over((batch, self.embeddings.embed_documents([d.page_content for d in batch])))
+                return not stop.is_set()
+
+            def embed_stage():
+                # Producer: embed fixed-size batches and hand them to the writer
+                try:
+                    batch = []
+                    seen = set()
+                    for doc in documents:
+                        doc_id = chunk_id(doc.metadata.get("source", "unknown"), doc.page_content)
+                        if doc_id in seen:
+                            # Same text repeated within this call (e.g., boilerplate on every page)
+                            skipped[0] += 1
+                            continue
+                        seen.add(doc_id)
+                        doc.metadata = {**doc.metadata, "doc_id": doc_id}
+                        batch.append(doc)
+                        if len(batch) >= embed_batch_size:
+                            if not embed_batch(batch):
+                                return
+                            batch = []
+                    if batch:
+                        embed_batch(batch)
+                except Exception as e:
+                    errors.append(e)
+                finally:
+                    hand_over(None)
+
+            embedder = threading.Thread(target=embed_stage, name="chroma-embed", daemon=True)
+            embedder.start()
+
+            total = 0
+            started = time.monotonic()
+            pending_docs, pending_vectors = [], []
+            finished = False
+            try:
+                while not finished:
+                    item = embedded.get()
+                    if item is None:
+                        finished = True
+                    else:
+                        pending_docs.extend(item[0])
+                        pending_vectors.extend(item[1])
+
+                    # Write full batches, plus whatever is left once embedding is done
+                    while len(pending_docs) >= write_batch_size or (finished and pending_docs):
+                        docs, pending_docs = pending_docs[:write_batch_size], pending_docs[write_batch_size:]
+                        vectors, pending_vectors = pending_vectors[:write_batch_size], pending_vectors[write_batch_size:]
+
+                        batch_started = time.monotonic()
+                        # Under the write lock, so a migration's final sync sees every committed batch
+                        with self._write_lock:
+                            self._require_compatible()
+                            self.db._collection.upsert(
+                                ids=[d.metadata["doc_id"] for d in docs],
+                                embeddings=vectors,
+                                documents=[d.page_content for d in docs],
+                                metadatas=[d.metadata for d in docs]
+                            )
+                            self.keyword_index.add(
+                                [d.metadata["doc_id"] for d in docs],
+                                [d.page_content for d in docs],
+                                [d.metadata.get("source", "unknown") for d in docs]
+                            )
+                            # Each committed batch reaches the BM25 index on disk too: after a crash,
+                            # the re-run skips these chunks as existing and would never index them
+                            self.keyword_index.save()
+                        total += len(docs)
+                        elapsed = time.monotonic() - batch_started
+                        logging.info(
+                            f"Wrote {len(docs)} chunks in {elapsed:.2f}s "
+                            f"({len(docs) / max(elapsed, 1e-6):.0f} chunks/s); "
+                            f"{total} total at {total / max(time.monotonic() - started, 1e-6):.0f} chunks/s"
+                        )
+                        if on_batch:
+                            on_batch(len(docs))
+            finally:
+                # A failed write must not leave the producer blocked on the full queue
+                stop.set()
+                embedder.join()
+
+            if errors:
+                raise errors[0]
+
+            logging.info(f"Added {total} document chunks to Chroma DB successfully "
+                         f"({skipped[0]} unchanged chunks skipped, {refreshed[0]} of them with updated metadata).")
+            if total or refreshed[0]:
+                self._notify_change()
+            return total
+
+        except Exception as e:
+            raise CustomException(e, sys)
+
+    def file_unchanged(self, source: str, file_hash: str) -> bool:
+        """
+        True when this exact file content was already ingested under the same source name,
+        in which case re-ingesting it can be skipped entirely.
+        """
+        return self.manifest.is_unchanged(source, file_hash)
+
+    def commit_file(self, source: str, file_hash: str, chunk_ids: list, mtime: float = None) -> int:
+        """
+        Finalizes the (re-)ingestion of one file: deletes chunks that the previous version of
+        the file had but the new one does not, then records the new state in the manifest.
+
+        Args:
+            source (str): Source file name (the "source" metadata of its chunks).
+            file_hash (str): Content hash of the ingested file.
+            chunk_ids (list): IDs of all chunks of the new version.
+            mtime (float, optional): Modification time of the file.
+
+        Output:
+            int: Number of stale chunks removed.
+        """
+        try:
+            current = set(chunk_ids)
+            stale = [cid for cid in self.manifest.chunk_ids(source) if cid not in current]
+            if stale:
+                self._delete_ids(stale)
+                logging.info(f"Removed {len(stale)} stale chunks of {source}")
+
+            self.manifest.update(source, file_hash, chunk_ids, mtime)
+            return len(stale)
         except Exception as e:
             raise CustomException(e, sys)
 
-    def similarity_search(self, query: str, k: int = 5):
+    def discard_chunks(self, source: str, chunk_ids: list) -> int:
+        """
+        Deletes the chunks written for a file whose ingestion did not complete (it failed
+        mid-extraction or the run was stopped), so no untracked chunks stay searchable.
+        Chunks the file's recorded version still uses are kept.
+
+        Args:
+            source (str): Source file name.
+            chunk_ids (list): IDs of the chunks produced for the incomplete version.
+
+        Output:
+            int: Number of chunk IDs deleted.
+        """
+        try:
+            keep = set(self.manifest.chunk_ids(source))
+            partial = [cid for cid in chunk_ids if cid not in keep]
+            if partial:
+                self._delete_ids(partial)
+                logging.info(f"Discarded {len(partial)} chunks of the incomplete ingestion of {source}")
+            return len(partial)
+        except Exception as e:
+            raise CustomException(e, sys)
+
+    def _delete_ids(self, ids: list):
+        # Deletes chunks from the collection and the BM25 index (missing IDs are ignored)
+        with self._write_lock:
+            for start in range(0, len(ids), self._max_write_batch()):
+                self.db._collection.delete(ids=ids[start:start + self._max_write_batch()])
+        self.keyword_index.delete_ids(ids)
+        self.keyword_index.save()
+        self._notify_change()
+
+    def similarity_search(self, query: str, k: int = 5, mmr: bool = False, max_per_source: int = None,
+                          fetch_k: int = None, lambda_mult: float = None, filters: dict = None):
         """
         Performs a vector-based similarity search in the Chroma DB.
 
         Args:
             query (str): The user query to search for relevant documents.
             k (int): Number of top results to return.
+            mmr (bool): Re-select the results with maximal marginal relevance, so near-duplicate
+                        chunks (e.g., from one large PDF) do not crowd out everything else.
+            max_per_source (int, optional): Return at most this many chunks per source file.
+            fetch_k (int, optional): Candidates fetched before diversifying (MMR_FETCH_K env, default 4*k).
+            lambda_mult (float, optional): MMR relevance/diversity trade-off (MMR_LAMBDA env, default 0.5).
+            filters (dict, optional): Sources / file types / ingestion dates to search in (see build_where).
+                                      Applied inside Chroma, so only matching vectors are searched.
 
         Output:
             List[Document]: List of top-k documents relevant to the query.
@@ -82,9 +530,14 @@ class ChromaDBHandler:
         try:
             if not self.db:
                 raise Exception("Chroma DB not initialized. Call create_or_load first.")
-            
-            logging.info(f"Searching for: {query}")
-            results = self.db.similarity_search(query, k=k)
+            self._require_compatible()
+
+            where = build_where(filters)
+            logging.info(f"Searching for: {query}" + (f" (where={where})" if where else ""))
+            if mmr or max_per_source:
+                results = self._diverse_search(query, k, mmr, max_per_source, fetch_k, lambda_mult, where)
+            else:
+                results = self.db.similarity_search(query, k=k, filter=where)
 
             # Log where results came from
             sources = set([doc.metadata.get("source", "unknown") for doc in results])
@@ -94,18 +547,281 @@ class ChromaDBHandler:
         except Exception as e:
             raise CustomException(e, sys)
 
-    def clear_collection(self):
+    @staticmethod
+    def _fetch_k(fetch_k: int, k: int) -> int:
+        # Candidates fetched before diversifying (MMR_FETCH_K env, default 4*k)
+        return max(fetch_k or int(os.getenv("MMR_FETCH_K", "0")) or 4 * k, k)
+
+    def _diverse_search(self, query: str, k: int, mmr: bool, max_per_source: int,
+                        fetch_k: int = None, lambda_mult: float = None, where: dict = None) -> List[Document]:
+        # Fetch a wider candidate pool with its stored vectors, then select k of them in NumPy
+        query_embedding = self.embeddings.embed_query(query)
+        found = self.db._collection.query(
+            query_embeddings=[query_embedding],
+            n_results=self._fetch_k(fetch_k, k),
+            where=where,
+            include=["documents", "metadatas", "embeddings"],
+        )
+        return self._diversify(query_embedding, found["ids"][0], found["documents"][0], found["metadatas"][0],
+                               found["embeddings"][0], k, mmr, max_per_source, lambda_mult)
+
+    @staticmethod
+    def _diversify(query_embedding, ids: list, texts: list, metas: list, vectors, k: int, mmr: bool,
+                   max_per_source: int, lambda_mult: float = None) -> List[Document]:
+        # Selects k of the fetched candidates by MMR and/or the per-source cap
+        if not ids:
+            return []
+        if lambda_mult is None:
+            lambda_mult = float(os.getenv("MMR_LAMBDA", "0.5"))
+
+        selected = maximal_marginal_relevance(
+            query_embedding,
+            vectors,
+            k=k,
+            lambda_mult=lambda_mult if mmr else 1.0,  # Cap only: keep plain relevance order
+            sources=[(m or {}).get("source", "unknown") for m in metas],
+            max_per_source=max_per_source,
+        )
+        logging.info(f"Diversified {len(ids)} candidates to {len(selected)} (mmr={mmr}, max_per_source={max_per_source})")
+        return [Document(id=ids[i], page_content=texts[i], metadata=metas[i] or {}) for i in selected]
+
+    def embed_queries(self, queries: List[str]) -> list:
+        """
+        Embeds several queries in one forward pass of the collection's embedding model
+        (through the embedding cache, so repeated questions are not re-embedded).
+
+        Args:
+            queries (List[str]): The questions.
+
+        Output:
+            list: One query embedding per question, in order.
+        """
+        try:
+            embed = getattr(self.embeddings, "embed_queries", None)
+            if embed is None:
+                return [self.embeddings.embed_query(query) for query in queries]
+            return embed(list(queries))
+        except Exception as e:
+            raise CustomException(e, sys)
+
+    def similarity_search_batch(self, queries: List[str], k: int = 5, mmr: bool = False, max_per_source: int = None,
+                                fetch_k: int = None, lambda_mult: float = None, filters: dict = None,
+                                query_embeddings: list = None) -> List[List[Document]]:
+        """
+        Same search as similarity_search for several queries at once: the queries are embedded
+        in one batched pass and sent to the collection as a single multi-vector query.
+
+        Args:
+            queries (List[str]): The questions.
+            k, mmr, max_per_source, fetch_k, lambda_mult, filters: As in similarity_search (shared by all queries).
+            query_embeddings (list, optional): Precomputed embeddings of `queries` (see embed_queries).
+
+        Output:
+            List[List[Document]]: Top-k documents of each query, in the order of `queries`.
+        """
+        try:
+            if not self.db:
+                raise Exception("Chroma DB not initialized. Call create_or_load first.")
+            self._require_compatible()
+            if not queries:
+                return []
+
+            where = build_where(filters)
+            if query_embeddings is None:
+                query_embeddings = self.embed_queries(queries)
+            logging.info(f"Searching for {len(queries)} queries in one batch" + (f" (where={where})" if where else ""))
+
+            diverse = bool(mmr or max_per_source)
+            found = self.db._collection.query(
+                query_embeddings=list(query_embeddings),
+                n_results=self._fetch_k(fetch_k, k) if diverse else k,
+                where=where,
+                include=["documents", "metadatas"] + (["embeddings"] if diverse else []),
+            )
+
+            results = []
+            for i, query_embedding in enumerate(query_embeddings):
+                ids, texts, metas = found["ids"][i], found["documents"][i], found["metadatas"][i]
+                if diverse:
+                    results.append(self._diversify(query_embedding, ids, texts, metas, found["embeddings"][i],
+                                                   k, mmr, max_per_source, lambda_mult))
+                else:
+                    results.append([Document(id=cid, page_content=text, metadata=meta or {})
+                                    for cid, text, meta in zip(ids, texts, metas)])
+            return results
+        except Exception as e:
+            raise CustomException(e, sys)
+
+    def _ensure_keyword_index(self):
+        # Collections created before the keyword index existed are indexed once, page by page. An
+        # index missing chunks (e.g., left behind by a crash before its save) is rebuilt the same way.
+        if self._keyword_checked:
+            return
+        with self._write_lock:
+            if self._keyword_checked:
+                return
+            count = self.db._collection.count()
+            if self.keyword_index.exists() and self.keyword_index.stored_num_docs() == count:
+                self._keyword_checked = True
+                return
+            if self.keyword_index.exists():
+                logging.warning(f"BM25 index holds {self.keyword_index.stored_num_docs()} chunks, "
+                                f"the collection {count}: rebuilding it.")
+                self.keyword_index.clear()
+            self._keyword_checked = True
+            if not count:
+                return
+            logging.info("Building BM25 index from existing collection...")
+            offset, page_size = 0, self._max_write_batch()
+            while True:
+                page = self.db._collection.get(include=["documents", "metadatas"], limit=page_size, offset=offset)
+                if not page["ids"]:
+                    break
+                self.keyword_index.add(
+                    page["ids"], page["documents"], [(m or {}).get("source", "unknown") for m in page["metadatas"]]
+                )
+                offset += len(page["ids"])
+            self.keyword_index.save()
+
+    def get_by_ids(self, ids: list, where: dict = None) -> List[Document]:
+        """
+        Fetches stored chunks by ID, returned in the same order as `ids` (missing IDs, and
+        chunks not matching the optional `where` clause, are skipped).
+        """
+        try:
+            if not ids:
+                return []
+            found = self.db._collection.get(ids=list(ids), where=where, include=["documents", "metadatas"])
+            by_id = {
+                cid: Document(id=cid, page_content=text, metadata=meta or {})
+                for cid, text, meta in zip(found["ids"], found["documents"], found["metadatas"])
+            }
+            return [by_id[cid] for cid in ids if cid in by_id]
+        except Exception as e:
+            raise CustomException(e, sys)
+
+    def keyword_search(self, query: str, k: int = 5, sources: list = None, filters: dict = None) -> List[Document]:
+        """
+        Performs a BM25 keyword search, which catches exact identifiers, codes and names
+        that dense embeddings tend to miss.
+
+        Args:
+            query (str): The user query.
+            k (int): Number of top results to return.
+            sources (list, optional): Restrict the search to these source files.
+            filters (dict, optional): Same filters as similarity_search. Sources are applied inside
+                                      the BM25 index; type/date conditions are checked against the
+                                      stored metadata of a growing hit list until k chunks match.
+
+        Output:
+            List[Document]: Top-k chunks by BM25 score.
+        """
+        try:
+            if not self.db:
+                raise Exception("Chroma DB not initialized. Call create_or_load first.")
+
+            filters = dict(filters or {})
+            sources = sources or filters.pop("sources", None)
+            filters.pop("sources", None)
+            where = build_where(filters)
+
+            self._ensure_keyword_index()
+            if not where:
+                hits = self.keyword_index.search(query, k=k, sources=sources)
+                return self.get_by_ids([cid for cid, _ in hits])
+
+            # Metadata the index does not store is filtered afterwards: widen the hit list until
+            # k chunks pass the filter or the index has no more matches, so selective filters
+            # still fill the result
+            results, checked, fetch = [], set(), k * 4
+            while True:
+                hits = self.keyword_index.search(query, k=fetch, sources=sources)
+                fresh = [cid for cid, _ in hits if cid not in checked]
+                checked.update(fresh)
+                results.extend(self.get_by_ids(fresh, where=where))
+                if len(results) >= k or len(hits) < fetch:
+                    return results[:k]
+                fetch *= 4
+        except Exception as e:
+            raise CustomException(e, sys)
+
+    def clear_collection(self, mode: str = "reset", page_size: int = 1000) -> int:
         """
         Clears all documents from the Chroma collection.
         Useful for testing or re-ingesting new data.
+
+        Args:
+            mode (str): "reset" swaps in a new empty collection and drops the old one (fast, constant
+                        memory; searches see the old or the new collection, never a missing one);
+                        "paged" deletes IDs page by page and keeps the collection itself.
+            page_size (int): IDs fetched per delete in "paged" mode.
+
+        Output:
+            int: Number of vectors removed.
         """
         try:
-            if self.db:
-                # Access the low-level collection object
-                collection = self.db._collection
-                all_ids = collection.get()["ids"]
-                if all_ids:
-                    collection.delete(ids=all_ids)
-                    logging.info(f"Cleared {len(all_ids)} documents from collection")
+            if not self.db:
+                return 0
+
+            with self._write_lock:
+                if mode == "reset":
+                    removed = self.db._collection.count()
+                    # Create the empty collection first and swap to it, instead of listing every ID or
+                    # dropping the live collection before its replacement exists
+                    fresh = self.open_collection(f"{self.collection_name}-{uuid.uuid4().hex[:12]}", self.embeddings)
+                    # An empty collection takes the fingerprint of the model in use (this also resolves a
+                    # mismatch). A migrated collection keeps its model in the pointer, so a restart loads it again.
+                    self._write_fingerprint(fresh, self._model_fingerprint)
+                    self._point_to(fresh, self.migrated_fingerprint or {})
+                else:
+                    removed = self._delete_where(None, page_size)
+                    self._write_fingerprint(self.db, self._model_fingerprint)
+                self.keyword_index.clear()
+                self.fingerprint, self.fingerprint_mismatch = self._model_fingerprint, None
+
+                logging.info(f"Cleared {removed} documents from collection")
+                self.manifest.clear()
+            self._notify_change()
+            return removed
         except Exception as e:
             logging.error(f"Error clearing collection: {str(e)}")
+            raise CustomException(e, sys)
+
+    def _delete_where(self, where: dict, page_size: int) -> int:
+        # Fetch only IDs (no documents/embeddings) one page at a time and delete them
+        collection = self.db._collection
+        removed = 0
+        while True:
+            ids = collection.get(where=where, limit=page_size, include=[])["ids"]
+            if not ids:
+                return removed
+            collection.delete(ids=ids)
+            removed += len(ids)
+
+    def delete_by_source(self, source: str, page_size: int = 1000) -> int:
+        """
+        Removes every chunk of one document without touching the rest of the collection.
+
+        Args:
+            source (str): Source file name (the "source" metadata of its chunks).
+            page_size (int): IDs fetched per delete.
+
+        Output:
+            int: Number of vectors removed.
+        """
+        try:
+            if not self.db:
+                raise Exception("Chroma DB not initialized. Call create_or_load first.")
+
+            with self._write_lock:
+                removed = self._delete_where({"source": source}, min(page_size, self._max_write_batch()))
+                self.manifest.remove(source)
+                self.keyword_index.delete_source(source)
+                self.keyword_index.save()
+
+            logging.info(f"Removed {removed} chunks of {source}")
+            if removed:
+                self._notify_change()
+            return removed
+        except Exception as e:
+            raise CustomException(e, sys)
@@ -0,0 +1,61 @@
+# This file defines the chunk metadata used for filtering and the translation of query filters into Chroma `where` clauses.
+
+import os
+import time
+
+
+def file_metadata(filename: str) -> dict:
+    """
+    Metadata attached to every chunk of a file at ingestion time, so queries can be scoped
+    by source file, file type and ingestion date.
+    """
+    return {
+        "source": filename,
+        "file_type": os.path.splitext(filename)[1].lstrip(".").lower(),
+        "ingested_at": int(time.time()),
+    }
+
+
+def build_where(filters: dict = None) -> dict:
+    """
+    Builds a Chroma `where` clause from query filters.
+
+    Args:
+        filters (dict, optional): Any of
+            - "sources" (list): source file names to search in,
+            - "file_types" (list): extensions such as "pdf" or "docx",
+            - "ingested_after" / "ingested_before" (int): Unix timestamps (inclusive).
+
+    Output:
+        dict or None: The where clause, or None when nothing is filtered.
+    """
+    if not filters:
+        return None
+
+    conditions = []
+    if filters.get("sources"):
+        conditions.append({"source": {"$in": list(filters["sources"])}})
+    if filters.get("file_types"):
+        types = [t.lstrip(".").lower() for t in filters["file_types"]]
+        conditions.append({"file_type": {"$in": types}})
+    if filters.get("ingested_after") is not None:
+        conditions.append({"ingested_at": {"$gte": int(filters["ingested_after"])}})
+    if filters.get("ingested_before") is not None:
+        conditions.append({"ingested_at": {"$lte": int(filters["ingested_before"])}})
+
+    if not conditions:
+        return None
+    # Chroma requires $and for more than one condition
+    return conditions[0] if len(conditions) == 1 else {"$and": conditions}
+
+
+def filters_scope(filters: dict = None) -> tuple:
+    """
+    Hashable, order-independent form of the filters (used as part of the answer-cache scope).
+    """
+    if not filters:
+        return ()
+    return tuple(sorted(
+        (key, tuple(sorted(value)) if isinstance(value, (list, tuple, set)) else value)
+        for key, value in filters.items() if value not in (None, [], ())
+    ))
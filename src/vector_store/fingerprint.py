@@ -0,0 +1,48 @@
+# This file defines the embedding fingerprint stored with each collection, so vectors from different models are never mixed.
+
+# Collection metadata keys holding the fingerprint
+MODEL_KEY = "embedding_model"
+DIM_KEY = "embedding_dim"
+
+
+class EmbeddingMismatchError(RuntimeError):
+    """Raised when a collection's vectors were made by a different embedding model than the configured one."""
+
+
+def embedding_name(embeddings) -> str:
+    """
+    Name of the model (and runtime) behind an embeddings object.
+    """
+    return (
+        getattr(embeddings, "model_name", None)
+        or getattr(embeddings, "name", None)
+        or type(embeddings).__name__
+    )
+
+
+def embedding_fingerprint(embeddings) -> dict:
+    """
+    Model name and vector dimension of an embeddings object (the dimension is measured with one probe query).
+
+    Output:
+        dict: {"embedding_model": str, "embedding_dim": int}
+    """
+    return {MODEL_KEY: embedding_name(embeddings), DIM_KEY: len(embeddings.embed_query("embedding fingerprint"))}
+
+
+def stored_fingerprint(collection_metadata: dict) -> dict:
+    """
+    Fingerprint recorded in a collection's metadata, or None for collections created before fingerprints existed.
+    """
+    metadata = collection_metadata or {}
+    if MODEL_KEY not in metadata:
+        return None
+    return {MODEL_KEY: metadata[MODEL_KEY], DIM_KEY: int(metadata.get(DIM_KEY, 0))}
+
+
+def mismatch_message(stored: dict, current: dict) -> str:
+    return (
+        f"The collection was embedded with '{stored[MODEL_KEY]}' ({stored[DIM_KEY]} dimensions) but the configured "
+        f"model is '{current[MODEL_KEY]}' ({current[DIM_KEY]} dimensions). Set MODEL_NAME / EMBEDDING_BACKEND back "
+        f"to the stored model, or migrate the collection (POST /tenants/<tenant>/migrate-embeddings)."
+    )
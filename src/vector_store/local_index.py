@@ -0,0 +1,664 @@
+# This file defines the vector indexes of the local engine: an exact flat index over normalized float32
+# vectors in a memory-mapped file, and an HNSW graph over the same vectors for large corpora.
+
+import os
+import json
+import math
+import time
+import heapq
+import pickle
+import threading
+import numpy as np
+from src.vector_store.quantization import BLOCK_ROWS, TRAIN_SAMPLE, build_quantizer
+from src.logger import logging
+
+
+def normalize(vectors) -> np.ndarray:
+    """
+    L2-normalizes vectors (rows), so a dot product is the cosine similarity.
+    """
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if vectors.ndim == 1:
+        return vectors / max(float(np.linalg.norm(vectors)), 1e-12)
+    return vectors / np.clip(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12, None)
+
+
+def _atomic_write(path: str, write):
+    # Writes through a temp file and os.replace, so readers never see a half-written file
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        write(f)
+    os.replace(tmp_path, path)
+
+
+def top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    """
+    Positions of the k highest scores, best first (argpartition, then a sort of only those k).
+    """
+    k = min(k, len(scores))
+    if k <= 0:
+        return np.empty(0, dtype=np.int64)
+    best = np.argpartition(-scores, k - 1)[:k]
+    return best[np.argsort(-scores[best], kind="stable")]
+
+
+class MappedRows:
+    """
+    Append-only 2-D array of fixed-width rows in a file, memory-mapped and grown by doubling.
+    The capacity follows from the file size, so only the number of used rows needs saving.
+    """
+
+    def __init__(self, path: str, dtype, width: int = None, initial_capacity: int = 1024):
+        self.path = path
+        self.dtype = np.dtype(dtype)
+        self.width = width
+        self.initial_capacity = initial_capacity
+        self.capacity = 0
+        self.rows = None        # Plain ndarray view of the mapping (cheaper to index than np.memmap)
+        self._map = None
+        if width and os.path.exists(path):
+            self._open()
+
+    def _open(self):
+        self.capacity = os.path.getsize(self.path) // (self.width * self.dtype.itemsize)
+        if self.capacity:
+            self._map = np.memmap(self.path, dtype=self.dtype, mode="r+", shape=(self.capacity, self.width))
+            self.rows = self._map.view(np.ndarray)
+
+    def reserve(self, needed: int):
+        # Extends the file to at least `needed` rows and re-maps it
+        if needed <= self.capacity:
+            return
+        capacity = max(needed, self.capacity * 2, self.initial_capacity)
+        self.flush()
+        with open(self.path, "ab") as f:
+            f.truncate(capacity * self.width * self.dtype.itemsize)
+        self._open()
+
+    def write(self, start: int, rows: np.ndarray):
+        self.reserve(start + len(rows))
+        self.rows[start:start + len(rows)] = rows
+
+    def flush(self):
+        if self._map is not None:
+            self._map.flush()
+
+
+class FlatIndex:
+    """
+    Exact index: vectors live in one float32 file (`vectors.f32`, one row per slot), memory-mapped
+    so the OS page cache holds them and every process shares the same pages. A search is one
+    matrix-vector product over all rows plus a top-k selection.
+
+    With a quantizer ("int8" or "pq"), a compact code per vector is kept as well (`codes.u8`) and
+    searches scan the codes instead: the best `rescore_factor * k` candidates are then re-scored on
+    their full-precision rows, read from the vector file. Only the codes are read on every query,
+    so the float32 file can stay on disk and memory drops by the compression ratio. The quantizer
+    is trained once the index holds `train_size` vectors, by a background thread calling
+    train_quantizer (never on the write path); until its codes cover every vector, searches are exact.
+
+    Slots are append-only: a deleted vector is only marked dead in the `alive` mask (a tombstone),
+    and an updated vector gets a new slot.
+    """
+
+    def __init__(self, path: str, initial_capacity: int = 1024, quantization: str = "none",
+                 train_size: int = 5000, rescore_factor: int = 8, pq_subspaces: int = 48):
+        """
+        Args:
+            path (str): Directory holding the vector / code files, alive.npy, quantizer.npz and flat.json.
+            initial_capacity (int): Rows allocated by the first write.
+            quantization (str): "none", "int8" (scalar) or "pq" (product quantization).
+            train_size (int): Vectors needed before the quantizer is trained.
+            rescore_factor (int): Candidates re-scored at full precision per requested result.
+            pq_subspaces (int): Code bytes per vector with "pq".
+        """
+        self.path = path
+        self.initial_capacity = initial_capacity
+        self.quantization = (quantization or "none").lower()
+        self.train_size = train_size
+        self.rescore_factor = rescore_factor
+        self.pq_subspaces = pq_subspaces
+        self._alive_path = os.path.join(path, "alive.npy")
+        self._state_path = os.path.join(path, "flat.json")
+        self._quantizer_path = os.path.join(path, "quantizer.npz")
+        self.dim = None
+        self.count = 0          # Slots used
+        self.store = MappedRows(os.path.join(path, "vectors.f32"), np.float32, initial_capacity=initial_capacity)
+        self.alive = np.zeros(0, dtype=bool)
+        self.quantizer = None   # Trained quantizer (None = exact search)
+        self.codes = None       # MappedRows of quantized codes, one row per slot
+        os.makedirs(path, exist_ok=True)
+        build_quantizer(self.quantization)  # Fails early on an unknown setting
+        if os.path.exists(self._state_path):
+            self._load()
+
+    def _load(self):
+        with open(self._state_path, "r", encoding="utf-8") as f:
+            state = json.load(f)
+        self.dim, self.count = state["dim"], state["count"]
+        if self.dim:
+            self.store = MappedRows(self.store.path, np.float32, self.dim, self.initial_capacity)
+        alive = np.load(self._alive_path) if os.path.exists(self._alive_path) else np.ones(self.count, dtype=bool)
+        # Slots written after the last saved state are not referenced by any chunk
+        self.alive = np.zeros(max(self.store.capacity, self.count), dtype=bool)
+        self.alive[:min(len(alive), self.count)] = alive[:self.count]
+
+        if self.quantization != "none" and os.path.exists(self._quantizer_path):
+            saved = np.load(self._quantizer_path)
+            if str(saved["kind"]) == self.quantization and state.get("encoded") == self.count:
+                self.quantizer = build_quantizer(self.quantization, self.pq_subspaces)
+                self.quantizer.load_state({key: saved[key] for key in saved.files if key != "kind"})
+                self.codes = self._open_codes(self.quantizer)
+
+    def _open_codes(self, quantizer) -> MappedRows:
+        width = quantizer.code_width(self.dim)
+        return MappedRows(os.path.join(self.path, f"codes.{quantizer.kind}.u8"), np.uint8, width, self.initial_capacity)
+
+    @property
+    def needs_training(self) -> bool:
+        # Quantization is configured and enough vectors exist, but no codes are published yet
+        return self.quantization != "none" and self.quantizer is None and self.count >= self.train_size
+
+    def train_quantizer(self, lock, should_stop=None) -> bool:
+        """
+        Trains the quantizer and encodes every stored vector, then publishes both so searches
+        switch from exact scans to the codes. Meant for a background thread: `lock` (the lock
+        the owner holds around add / delete / save) is only taken to snapshot the index and to
+        publish, so writes and searches continue while the codes are built.
+
+        Args:
+            lock: Lock serializing writes to this index.
+            should_stop (callable, optional): Checked between blocks; returning True abandons the codes.
+
+        Output:
+            bool: True when the codes were published.
+        """
+        with lock:
+            if not self.needs_training:
+                return False
+            # Slots are append-only, so rows below `count` never change while they are encoded
+            count, rows = self.count, self.store.rows
+            live = np.flatnonzero(self.alive[:count])
+        started = time.monotonic()
+        quantizer = build_quantizer(self.quantization, self.pq_subspaces)
+        live = live if len(live) else np.arange(count)
+        sample = np.random.default_rng(0).choice(live, min(len(live), TRAIN_SAMPLE), replace=False)
+        quantizer.train(rows[np.sort(sample)])
+        codes = self._open_codes(quantizer)
+        for start in range(0, count, BLOCK_ROWS):
+            if should_stop and should_stop():
+                return False
+            codes.write(start, quantizer.encode(rows[start:min(start + BLOCK_ROWS, count)]))
+
+        with lock:
+            # Catch up with the vectors written while encoding, then publish (codes before the quantizer,
+            # since searches check the quantizer first)
+            if self.count > count:
+                codes.write(count, quantizer.encode(self.store.rows[count:self.count]))
+            codes.flush()
+            _atomic_write(self._quantizer_path, lambda f: np.savez(f, kind=quantizer.kind, **quantizer.state()))
+            self.codes = codes
+            self.quantizer = quantizer
+            self.save()
+            logging.info(f"Quantized {self.count} vectors with {quantizer.kind} in {time.monotonic() - started:.2f}s "
+                         f"({self.store.width * 4} -> {codes.width} bytes per vector)")
+        return True
+
+    @property
+    def capacity(self) -> int:
+        return self.store.capacity
+
+    @property
+    def live_count(self) -> int:
+        return int(self.alive[:self.count].sum())
+
+    def add(self, vectors) -> np.ndarray:
+        """
+        Appends vectors (normalized here) and returns their slots.
+        """
+        vectors = normalize(vectors)
+        if vectors.ndim != 2 or not len(vectors):
+            return np.empty(0, dtype=np.int64)
+        if self.dim is None:
+            self.dim = int(vectors.shape[1])
+            self.store = MappedRows(self.store.path, np.float32, self.dim, self.initial_capacity)
+        elif vectors.shape[1] != self.dim:
+            raise ValueError(f"Vector dimension {vectors.shape[1]} does not match the index dimension {self.dim}.")
+
+        start = self.count
+        self.store.write(start, vectors)
+        if self.quantizer is not None:
+            self.codes.write(start, self.quantizer.encode(vectors))
+        if len(self.alive) < self.store.capacity:
+            alive = np.zeros(self.store.capacity, dtype=bool)
+            alive[:self.count] = self.alive[:self.count]
+            self.alive = alive
+        self.alive[start:start + len(vectors)] = True
+        self.count = start + len(vectors)
+        return np.arange(start, self.count)
+
+    def delete(self, slots):
+        """
+        Marks slots dead; their rows stay in the file but are never returned again.
+        """
+        slots = np.asarray(list(slots), dtype=np.int64)
+        if len(slots):
+            self.alive[slots[slots < self.count]] = False
+
+    def get(self, slots) -> np.ndarray:
+        if not len(slots):
+            return np.empty((0, self.dim or 0), dtype=np.float32)
+        return self.store.rows[np.asarray(slots, dtype=np.int64)]
+
+    def score(self, query: np.ndarray, slots: np.ndarray) -> np.ndarray:
+        """
+        Cosine similarity of a (normalized) query with the full-precision vectors in `slots`.
+        """
+        return self.store.rows[slots] @ query
+
+    def scorer(self, query: np.ndarray):
+        """
+        Function slots -> similarities on the quantized codes (approximate), or None without a quantizer.
+        """
+        quantizer, codes = self.quantizer, self.codes
+        if quantizer is None:
+            return None
+        prepared = quantizer.prepare(query)
+        return lambda slots: quantizer.score(prepared, codes.rows[slots])
+
+    def mask(self, allowed=None) -> np.ndarray:
+        """
+        Searchable slots: alive ones, restricted to `allowed` (an array of slots) when given.
+        """
+        mask = self.alive[:self.count].copy()
+        if allowed is not None:
+            restrict = np.zeros(self.count, dtype=bool)
+            allowed = np.asarray(allowed, dtype=np.int64)
+            restrict[allowed[allowed < self.count]] = True
+            mask &= restrict
+        return mask
+
+    def rescore(self, query: np.ndarray, slots: np.ndarray, k: int):
+        """
+        Exact top-k among candidate slots (reads only their full-precision rows).
+        """
+        slots = np.sort(slots)  # Ascending offsets read the file front to back
+        scores = self.score(query, slots)
+        best = top_k(scores, k)
+        return slots[best], scores[best]
+
+    def search(self, query, k: int, mask: np.ndarray = None, start: int = 0):
+        """
+        Top-k by cosine similarity: exact, or quantized scan + exact re-score of the best candidates.
+
+        Args:
+            query: Query vector (normalized here).
+            k (int): Number of results.
+            mask (np.ndarray, optional): Searchable slots (see `mask`); defaults to all alive slots.
+            start (int): Only search slots from here on (used for the part an HNSW graph does not cover yet).
+
+        Output:
+            tuple: (slots, similarities), best first.
+        """
+        mask = self.mask() if mask is None else mask
+        # A mask taken before a concurrent write may be shorter than the index; it bounds the search
+        end = min(len(mask), self.count)
+        if start >= end:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        query = normalize(query)
+        mask = mask[start:end]
+        live = int(mask.sum())
+        if not live:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        if live < len(mask) // 4:
+            # Few searchable rows (e.g., a narrow filter): only read those
+            return self.rescore(query, np.flatnonzero(mask) + start, k)
+
+        scorer = self.scorer(query)
+        if scorer is None:
+            scores = self.store.rows[start:end] @ query
+            scores[~mask] = -np.inf
+            best = top_k(scores, min(k, live))
+            return best + start, scores[best]
+
+        # Quantized scan block by block, keeping the best candidates of each block
+        wanted = min(k * self.rescore_factor, live)
+        prepared = self.quantizer.prepare(query)
+        candidates, candidate_scores = [], []
+        for block in range(start, end, BLOCK_ROWS):
+            block_end = min(block + BLOCK_ROWS, end)
+            scores = self.quantizer.score(prepared, self.codes.rows[block:block_end])
+            scores[~mask[block - start:block_end - start]] = -np.inf
+            best = top_k(scores, wanted)
+            candidates.append(best + block)
+            candidate_scores.append(scores[best])
+        candidates, candidate_scores = np.concatenate(candidates), np.concatenate(candidate_scores)
+        best = top_k(candidate_scores, wanted)
+        return self.rescore(query, candidates[best][np.isfinite(candidate_scores[best])], k)
+
+    def search_many(self, queries, k: int, mask: np.ndarray = None) -> list:
+        """
+        `search` for several queries. Exact searches over most of the index are one matrix-matrix
+        product per block of rows, so the vectors are read once per batch instead of once per query;
+        quantized and narrowly filtered searches run query by query.
+
+        Args:
+            queries: Query vectors [n, dim] (normalized here).
+            k (int): Number of results per query.
+            mask (np.ndarray, optional): Searchable slots (see `mask`); defaults to all alive slots.
+
+        Output:
+            list: One (slots, similarities) tuple per query, best first.
+        """
+        if not len(queries):
+            return []
+        mask = self.mask() if mask is None else mask
+        queries = normalize(np.atleast_2d(np.asarray(queries, dtype=np.float32)))
+        end = min(len(mask), self.count)
+        live = int(mask[:end].sum())
+        if self.quantizer is not None or not live or live < end // 4:
+            return [self.search(query, k, mask) for query in queries]
+
+        # Best `wanted` rows of every block for every query, then the best k of those
+        wanted = min(k, live)
+        candidates, candidate_scores = [], []
+        for block in range(0, end, BLOCK_ROWS):
+            block_end = min(block + BLOCK_ROWS, end)
+            scores = queries @ self.store.rows[block:block_end].T
+            scores[:, ~mask[block:block_end]] = -np.inf
+            width = min(wanted, block_end - block)
+            best = np.argpartition(-scores, width - 1, axis=1)[:, :width]
+            candidates.append(best + block)
+            candidate_scores.append(np.take_along_axis(scores, best, axis=1))
+        candidates, candidate_scores = np.hstack(candidates), np.hstack(candidate_scores)
+
+        results = []
+        for slots, scores in zip(candidates, candidate_scores):
+            best = top_k(scores, wanted)
+            best = best[np.isfinite(scores[best])]
+            results.append((slots[best], scores[best]))
+        return results
+
+    def save(self):
+        """
+        Flushes the vectors and codes, then the mask, then the state (so a crash never leaves a state pointing past the data).
+        """
+        self.store.flush()
+        if self.codes is not None:
+            self.codes.flush()
+        alive = self.alive[:self.count]
+        _atomic_write(self._alive_path, lambda f: np.save(f, alive))
+        state = {"dim": self.dim, "count": self.count,
+                 "encoded": self.count if self.quantizer is not None else 0}
+        _atomic_write(self._state_path, lambda f: f.write(json.dumps(state).encode("utf-8")))
+
+    @property
+    def nbytes(self) -> int:
+        # Size of the full-precision vectors
+        return self.count * (self.dim or 0) * 4
+
+    @property
+    def code_bytes(self) -> int:
+        # Size of the codes and codebooks scanned by every quantized search
+        if self.quantizer is None:
+            return 0
+        return self.count * self.codes.width + self.quantizer.nbytes
+
+    @property
+    def resident_bytes(self) -> int:
+        # Bytes a full search reads: the codes when quantized, the vectors otherwise
+        return self.code_bytes if self.quantizer is not None else self.nbytes
+
+
+class HNSWGraph:
+    """
+    Hierarchical navigable small world graph over the vectors of a FlatIndex (the graph stores
+    only links; distances are computed on the memory-mapped vectors).
+
+    - `M`: links per node on the upper layers (2*M on the bottom layer). More links give better
+      recall and slower inserts; it is fixed when the graph is created.
+    - `ef_construction`: candidate list size while inserting (build quality vs. build time).
+    - `ef_search`: candidate list size while searching (recall vs. latency; can change at any time).
+
+    The bottom layer is a fixed-width int32 array (one row of neighbour slots per node), the sparse
+    upper layers are dicts. Deleted slots stay in the graph as waypoints but are never returned.
+    The entry point and top layer are published together as one `top` tuple, which searches read
+    once, so a concurrent insert never pairs a new entry with an old level (or vice versa).
+    The graph covers slots [0, size); FlatIndex slots beyond that are searched exactly until inserted.
+    """
+
+    def __init__(self, flat: FlatIndex, path: str, M: int = 16, ef_construction: int = 200,
+                 ef_search: int = 64, seed: int = 42):
+        """
+        Args:
+            flat (FlatIndex): Index holding the vectors.
+            path (str): File the graph is persisted to.
+            M (int): Links per node (upper layers).
+            ef_construction (int): Build-time candidate list size.
+            ef_search (int): Default query-time candidate list size.
+            seed (int): Seed of the random layer assignment.
+        """
+        self.flat = flat
+        self.path = path
+        self.M = M
+        self.ef_construction = ef_construction
+        self.ef_search = ef_search
+        self.size = 0
+        self.top = (-1, -1)     # (entry slot, its level); replaced as a whole, never updated in place
+        self.links0 = np.full((0, 2 * M), -1, dtype=np.int32)
+        self.degree0 = np.zeros(0, dtype=np.int32)
+        self.upper = {}   # slot -> [neighbours on layer 1, layer 2, ...]
+        self._rng = np.random.default_rng(seed)
+        self._lock = threading.Lock()  # One inserter at a time; searches do not lock
+        if os.path.exists(path):
+            self._load()
+
+    def _load(self):
+        with open(self.path, "rb") as f:
+            state = pickle.load(f)
+        if state["M"] != self.M:
+            logging.warning(f"HNSW graph {self.path} was built with M={state['M']}; keeping it (HNSW_M={self.M} applies to new graphs)")
+        self.M, self.ef_construction = state["M"], state["ef_construction"]
+        self.size, self.top = state["size"], (state["entry"], state["max_level"])
+        self.links0, self.degree0, self.upper = state["links0"], state["degree0"], state["upper"]
+
+    def save(self):
+        """
+        Persists the graph in one file (written atomically).
+        """
+        with self._lock:
+            state = {
+                "M": self.M, "ef_construction": self.ef_construction, "size": self.size,
+                "entry": self.top[0], "max_level": self.top[1],
+                "links0": self.links0[:self.size], "degree0": self.degree0[:self.size], "upper": self.upper,
+            }
+            _atomic_write(self.path, lambda f: pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL))
+
+    @property
+    def pending(self) -> int:
+        # Vectors in the flat index not yet inserted into the graph
+        return self.flat.count - self.size
+
+    def _neighbours(self, slot: int, level: int):
+        if level == 0:
+            return self.links0[slot, :self.degree0[slot]].tolist()
+        return self.upper[slot][level - 1]
+
+    def _set_neighbours(self, slot: int, level: int, neighbours):
+        if level == 0:
+            # Row first, then the degree, so a concurrent search never reads unwritten entries
+            self.links0[slot, :len(neighbours)] = neighbours
+            self.degree0[slot] = len(neighbours)
+        else:
+            self.upper[slot][level - 1] = list(neighbours)
+
+    def _search_layer(self, score, entries: list, ef: int, level: int, accept: np.ndarray = None) -> list:
+        """
+        Best-first search of one layer.
+
+        Args:
+            score (callable): Slots -> similarities to the query (exact, or on quantized codes).
+            entries (list): (similarity, slot) pairs to start from.
+            ef (int): Size of the result list.
+            level (int): Layer to search.
+            accept (np.ndarray, optional): Bool mask of slots allowed in the results; others are
+                                           traversed but not returned (deleted / filtered out).
+
+        Output:
+            list: Up to `ef` (similarity, slot) pairs (unordered).
+        """
+        visited = {slot for _, slot in entries}
+        candidates = [(-sim, slot) for sim, slot in entries]
+        heapq.heapify(candidates)
+        results = [(sim, slot) for sim, slot in entries if accept is None or (slot < len(accept) and accept[slot])]
+        heapq.heapify(results)
+        while candidates:
+            neg_sim, slot = heapq.heappop(candidates)
+            if len(results) >= ef and -neg_sim < results[0][0]:
+                break
+            neighbours = [n for n in self._neighbours(slot, level) if n not in visited]
+            if not neighbours:
+                continue
+            visited.update(neighbours)
+            sims = score(np.asarray(neighbours, dtype=np.int64)).tolist()
+            for sim, n in zip(sims, neighbours):
+                # Only neighbours better than the current worst result can change anything
+                if len(results) >= ef and sim <= results[0][0]:
+                    continue
+                heapq.heappush(candidates, (-sim, n))
+                # Slots written after the mask was taken are not returned
+                if accept is None or (n < len(accept) and accept[n]):
+                    heapq.heappush(results, (sim, n))
+                    if len(results) > ef:
+                        heapq.heappop(results)
+        return results
+
+    def _select(self, candidates: list, width: int) -> list:
+        # Neighbour selection heuristic for (similarity to the new node, slot) pairs: keep a candidate
+        # only if it is closer to the new node than to every neighbour kept so far (spreads links in
+        # all directions instead of into one cluster), then top up with the closest of the rest
+        candidates = sorted(candidates, reverse=True)
+        if len(candidates) <= width:
+            return [slot for _, slot in candidates]
+        slots = np.asarray([slot for _, slot in candidates], dtype=np.int64)
+        vectors = self.flat.get(slots)
+        gram = vectors @ vectors.T
+        kept, pruned = [], []
+        for i, (sim, _) in enumerate(candidates):
+            if len(kept) >= width:
+                break
+            if not kept or sim > gram[i, kept].max():
+                kept.append(i)
+            else:
+                pruned.append(i)
+        kept += pruned[:width - len(kept)]
+        return slots[kept].tolist()
+
+    def _shrink(self, slot: int, links: list, width: int) -> list:
+        # Keeps the `width` links closest to `slot` when a back-link overflows its list
+        links = np.asarray(links, dtype=np.int64)
+        sims = self.flat.score(self.flat.get([slot])[0], links)
+        return links[top_k(sims, width)].tolist()
+
+    def _grow(self, needed: int):
+        if needed <= len(self.links0):
+            return
+        capacity = max(needed, len(self.links0) * 2, 1024)
+        links0 = np.full((capacity, 2 * self.M), -1, dtype=np.int32)
+        links0[:self.size] = self.links0[:self.size]
+        degree0 = np.zeros(capacity, dtype=np.int32)
+        degree0[:self.size] = self.degree0[:self.size]
+        self.links0, self.degree0 = links0, degree0
+
+    def _insert(self, slot: int):
+        vector = self.flat.get([slot])[0]
+        score = lambda slots: self.flat.score(vector, slots)
+        level = int(-math.log(1.0 - self._rng.random()) / math.log(self.M))
+        if level:
+            self.upper[slot] = [[] for _ in range(level)]
+        top_slot, max_level = self.top
+        if top_slot < 0:
+            self.top = (slot, level)
+            return
+
+        entry = [(float(score(np.asarray([top_slot]))[0]), top_slot)]
+        for layer in range(max_level, level, -1):
+            entry = [max(self._search_layer(score, entry, 1, layer))]
+        for layer in range(min(level, max_level), -1, -1):
+            found = self._search_layer(score, entry, self.ef_construction, layer)
+            width = 2 * self.M if layer == 0 else self.M
+            neighbours = self._select(found, self.M)
+            self._set_neighbours(slot, layer, neighbours)
+            # Link back, pruning neighbours that now have too many links
+            for n in neighbours:
+                links = self._neighbours(n, layer)
+                if len(links) < width:
+                    self._set_neighbours(n, layer, links + [slot])
+                else:
+                    self._set_neighbours(n, layer, self._shrink(n, links + [slot], width))
+            entry = found
+        if level > max_level:
+            # Published after every layer of the new node is linked
+            self.top = (slot, level)
+
+    def insert_pending(self, limit: int = None, should_stop=None) -> int:
+        """
+        Inserts flat-index slots the graph does not cover yet, in slot order (dead slots get no links).
+
+        Args:
+            limit (int, optional): Most slots inserted in this call.
+            should_stop (callable, optional): Checked between inserts; returning True stops early.
+
+        Output:
+            int: Number of slots inserted.
+        """
+        inserted = 0
+        with self._lock:
+            end = self.flat.count if limit is None else min(self.flat.count, self.size + limit)
+            self._grow(end)
+            while self.size < end:
+                if should_stop and should_stop():
+                    break
+                slot = self.size
+                if self.flat.alive[slot]:
+                    self._insert(slot)
+                self.size += 1
+                inserted += 1
+        return inserted
+
+    def search(self, query, k: int, ef: int = None, accept: np.ndarray = None):
+        """
+        Approximate top-k among the slots covered by the graph. With a quantized flat index the
+        walk scores the codes, and the `ef` nodes it ends with are re-scored at full precision.
+
+        Args:
+            query: Query vector (normalized here).
+            k (int): Number of results.
+            ef (int, optional): Candidate list size (defaults to ef_search, at least k).
+            accept (np.ndarray, optional): Bool mask of returnable slots (alive and matching filters).
+
+        Output:
+            tuple: (slots, similarities), best first.
+        """
+        # One read of the entry point and its level (an insert may replace both meanwhile)
+        top_slot, max_level = self.top
+        if top_slot < 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        query = normalize(query)
+        approximate = self.flat.scorer(query)
+        score = approximate or (lambda slots: self.flat.score(query, slots))
+        ef = max(ef or self.ef_search, k)
+        entry = [(float(score(np.asarray([top_slot]))[0]), top_slot)]
+        for layer in range(max_level, 0, -1):
+            entry = [max(self._search_layer(score, entry, 1, layer))]
+        if approximate is not None:
+            found = self._search_layer(score, entry, max(ef, k * self.flat.rescore_factor), 0, accept)
+            return self.flat.rescore(query, np.asarray([slot for _, slot in found], dtype=np.int64), k)
+        found = sorted(self._search_layer(score, entry, ef, 0, accept), reverse=True)[:k]
+        return (np.asarray([slot for _, slot in found], dtype=np.int64),
+                np.asarray([sim for sim, _ in found], dtype=np.float32))
+
+    @property
+    def nbytes(self) -> int:
+        return int(self.links0[:self.size].nbytes + self.degree0[:self.size].nbytes
+                   + sum(len(layer) for layers in self.upper.values() for layer in layers) * 8)
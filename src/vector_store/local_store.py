@@ -0,0 +1,562 @@
+# This file defines the local vector engine: collections kept in SQLite (texts, metadata) plus a
+# memory-mapped flat index and an optional HNSW graph (vectors), behind the same handler as Chroma.
+
+import os
+import sys
+import json
+import time
+import shutil
+import sqlite3
+import threading
+import numpy as np
+from langchain_core.documents import Document
+from src.vector_store.chroma_db import ChromaDBHandler
+from src.vector_store.local_index import FlatIndex, HNSWGraph, normalize, top_k
+from src.exception import CustomException
+from src.logger import logging
+
+# Filtered searches matching at most this many chunks are answered exactly (a scan of only those
+# rows is cheaper than a graph walk that skips most of the nodes it visits)
+EXACT_FILTER_ROWS = 20000
+
+_OPERATORS = {"$eq": "=", "$ne": "!=", "$gt": ">", "$gte": ">=", "$lt": "<", "$lte": "<="}
+
+
+def where_sql(where: dict) -> tuple:
+    """
+    Translates a Chroma `where` clause (see build_where) into an SQL condition on the JSON metadata column.
+
+    Supports field equality, $eq, $ne, $gt, $gte, $lt, $lte, $in, $nin, $and and $or.
+
+    Output:
+        tuple: (sql, params)
+    """
+    if not where:
+        return "1", []
+    clauses, params = [], []
+    for key, value in where.items():
+        if key in ("$and", "$or"):
+            parts = [where_sql(condition) for condition in value]
+            joiner = " AND " if key == "$and" else " OR "
+            clauses.append("(" + joiner.join(sql for sql, _ in parts) + ")")
+            params += [p for _, part_params in parts for p in part_params]
+            continue
+        field = "json_extract(metadata, ?)"
+        path = f'$."{key}"'
+        conditions = value if isinstance(value, dict) else {"$eq": value}
+        for op, operand in conditions.items():
+            if op in ("$in", "$nin"):
+                operand = list(operand)
+                if not operand:
+                    clauses.append("0" if op == "$in" else "1")
+                    continue
+                marks = ", ".join("?" * len(operand))
+                clauses.append(f"{field} {'IN' if op == '$in' else 'NOT IN'} ({marks})")
+                params += [path, *operand]
+            elif op in _OPERATORS:
+                clauses.append(f"{field} {_OPERATORS[op]} ?")
+                params += [path, operand]
+            else:
+                raise ValueError(f"Unsupported where operator: {op}")
+    return " AND ".join(clauses) or "1", params
+
+
+class LocalCollection:
+    """
+    One collection of the local engine, with the subset of the chromadb Collection API that
+    ChromaDBHandler and EmbeddingMigration use (get / upsert / update / delete / query / count / metadata / modify).
+
+    - Texts and metadata live in SQLite (`chunks.sqlite3`); each row points at a slot of the flat index.
+    - Vectors are normalized float32 rows in a memory-mapped file (FlatIndex); searches are exact,
+      or scan int8 / PQ codes and re-score the best candidates on the float32 rows.
+    - A background indexer thread does the slow index work: it trains the quantizer and encodes
+      the stored vectors once `train_size` exist (searches stay exact until then), and with an
+      HNSW index it inserts new slots into the graph after each write. Searches walk the graph
+      for the slots it covers and scan the (small) rest exactly, so writes and opens never wait
+      for the index and results never miss a freshly written chunk.
+
+    SQLite is the source of truth: on open, only slots referenced by a row are alive, so a crash
+    between the vector write and the row commit leaves no dangling vectors.
+    """
+
+    def __init__(self, path: str, name: str, index: str = "auto", hnsw_threshold: int = 50000,
+                 M: int = 16, ef_construction: int = 100, ef_search: int = 64, save_interval: float = 30.0,
+                 quantization: str = "none", train_size: int = 5000, rescore_factor: int = 8, pq_subspaces: int = 48):
+        """
+        Args:
+            path (str): Directory of this collection.
+            name (str): Collection name.
+            index (str): "flat" (exact only), "hnsw" (graph from the first vector) or
+                         "auto" (graph once the collection holds `hnsw_threshold` vectors).
+            hnsw_threshold (int): Vectors needed before "auto" builds the graph.
+            M (int): HNSW links per node.
+            ef_construction (int): HNSW build-time candidate list size.
+            ef_search (int): HNSW query-time candidate list size.
+            save_interval (float): Least seconds between two saves of the graph (it is also saved on close).
+            quantization (str): "none", "int8" or "pq": compressed codes scanned before an exact re-score (see FlatIndex).
+            train_size (int): Vectors needed before the quantizer is trained.
+            rescore_factor (int): Candidates re-scored at full precision per requested result.
+            pq_subspaces (int): Code bytes per vector with "pq".
+        """
+        if index not in ("flat", "hnsw", "auto"):
+            raise ValueError(f"Unknown LOCAL_INDEX: {index} (use 'flat', 'hnsw' or 'auto')")
+        self.path = path
+        self.name = name
+        self.index = index
+        self.hnsw_threshold = 0 if index == "hnsw" else hnsw_threshold
+        self.hnsw_params = {"M": M, "ef_construction": ef_construction, "ef_search": ef_search}
+        self.save_interval = save_interval
+        self._lock = threading.RLock()
+        os.makedirs(path, exist_ok=True)
+
+        self._conn = sqlite3.connect(os.path.join(path, "chunks.sqlite3"), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS chunks (id TEXT PRIMARY KEY, slot INTEGER UNIQUE NOT NULL, "
+            "document TEXT, metadata TEXT)"
+        )
+        self._conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+        self._conn.commit()
+        row = self._conn.execute("SELECT value FROM meta WHERE key = 'metadata'").fetchone()
+        self._metadata = json.loads(row[0]) if row else {}
+
+        self.flat = FlatIndex(os.path.join(path, "flat"), quantization=quantization, train_size=train_size,
+                              rescore_factor=rescore_factor, pq_subspaces=pq_subspaces)
+        alive = np.zeros(self.flat.count, dtype=bool)
+        slots = np.fromiter((slot for (slot,) in self._conn.execute("SELECT slot FROM chunks")), dtype=np.int64)
+        alive[slots[slots < self.flat.count]] = True
+        self.flat.alive[:self.flat.count] = alive
+
+        self.graph = None
+        self._graph_path = os.path.join(path, "hnsw.pkl")
+        self._indexer = None
+        self._wake = threading.Event()
+        self._closed = False
+        self._last_save = time.monotonic()
+        if index != "flat" and (os.path.exists(self._graph_path) or self.flat.count >= self.hnsw_threshold):
+            self._start_graph()
+        if self.flat.needs_training:
+            self._start_indexer()
+
+    # --- Chroma Collection API subset -------------------------------------------------------
+
+    @property
+    def metadata(self) -> dict:
+        return dict(self._metadata)
+
+    def modify(self, metadata: dict = None, name: str = None):
+        # Like Chroma, the metadata is replaced as a whole
+        with self._lock:
+            if metadata is not None:
+                self._metadata = dict(metadata)
+                self._conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('metadata', ?)",
+                                   (json.dumps(self._metadata),))
+                self._conn.commit()
+
+    def count(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM chunks").fetchone()[0]
+
+    def _rows(self, condition: str, params: list, limit: int = None, offset: int = None) -> list:
+        sql = f"SELECT id, slot, document, metadata FROM chunks WHERE {condition} ORDER BY slot"
+        if limit is not None or offset:
+            sql += " LIMIT ? OFFSET ?"
+            params = [*params, -1 if limit is None else limit, offset or 0]
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    def _rows_by(self, column: str, values: list, where: dict = None) -> list:
+        # Looks rows up by id or slot, in pieces below SQLite's parameter limit
+        condition, params = where_sql(where)
+        rows = []
+        for start in range(0, len(values), 900):
+            part = list(values[start:start + 900])
+            rows += self._rows(f"{column} IN ({', '.join('?' * len(part))}) AND {condition}", part + params)
+        return rows
+
+    def _result(self, rows: list, include: list) -> dict:
+        return {
+            "ids": [row[0] for row in rows],
+            "documents": [row[2] for row in rows] if "documents" in include else None,
+            "metadatas": [json.loads(row[3]) if row[3] else None for row in rows] if "metadatas" in include else None,
+            "embeddings": self.flat.get([row[1] for row in rows]) if "embeddings" in include else None,
+        }
+
+    def get(self, ids: list = None, where: dict = None, limit: int = None, offset: int = None,
+            include: list = ("metadatas", "documents")) -> dict:
+        """
+        Chunks by ID and/or metadata condition, in insertion order (Chroma's `Collection.get`).
+        """
+        if ids is not None:
+            rows = self._rows_by("id", list(ids), where)
+            rows = rows[offset or 0:None if limit is None else (offset or 0) + limit]
+        else:
+            condition, params = where_sql(where)
+            rows = self._rows(condition, params, limit, offset)
+        return self._result(rows, include)
+
+    def upsert(self, ids: list, embeddings, documents: list = None, metadatas: list = None):
+        """
+        Inserts or replaces chunks. Replaced chunks get a new slot; the old one becomes a tombstone.
+        """
+        if not len(ids):
+            return
+        documents = documents if documents is not None else [None] * len(ids)
+        metadatas = metadatas if metadatas is not None else [None] * len(ids)
+        with self._lock:
+            old_slots = [row[1] for row in self._rows_by("id", list(ids))]
+            slots = self.flat.add(embeddings)
+            # Vectors reach the disk before the rows that point at them are committed
+            self.flat.save()
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO chunks (id, slot, document, metadata) VALUES (?, ?, ?, ?)",
+                [(cid, int(slot), text, json.dumps(meta) if meta is not None else None)
+                 for cid, slot, text, meta in zip(ids, slots, documents, metadatas)],
+            )
+            self._conn.commit()
+            self.flat.delete(old_slots)
+            if self.graph is None and self.index != "flat" and self.flat.count >= self.hnsw_threshold:
+                self._start_graph()
+            if self.flat.needs_training:
+                self._start_indexer()
+        self._wake.set()
+
+    def update(self, ids: list, metadatas: list = None, documents: list = None):
+        """
+        Changes the metadata and/or text of stored chunks in place, keeping their vectors (Chroma's
+        `Collection.update`): metadata keys are merged and a None value removes the key. Unknown IDs are ignored.
+        """
+        if not len(ids):
+            return
+        with self._lock:
+            rows = {row[0]: row for row in self._rows_by("id", list(ids))}
+            changes = []
+            for i, cid in enumerate(ids):
+                row = rows.get(cid)
+                if row is None:
+                    continue
+                metadata = json.loads(row[3]) if row[3] else {}
+                if metadatas is not None and metadatas[i] is not None:
+                    metadata.update(metadatas[i])
+                    metadata = {key: value for key, value in metadata.items() if value is not None}
+                text = documents[i] if documents is not None else row[2]
+                changes.append((text, json.dumps(metadata), cid))
+            self._conn.executemany("UPDATE chunks SET document = ?, metadata = ? WHERE id = ?", changes)
+            self._conn.commit()
+
+    def delete(self, ids: list = None, where: dict = None):
+        """
+        Deletes chunks by ID and/or metadata condition (their vectors become tombstones).
+        """
+        with self._lock:
+            if ids is not None:
+                rows = self._rows_by("id", list(ids), where)
+            else:
+                condition, params = where_sql(where)
+                rows = self._rows(condition, params)
+            if not rows:
+                return
+            ids = [row[0] for row in rows]
+            for start in range(0, len(ids), 900):
+                part = ids[start:start + 900]
+                self._conn.execute(f"DELETE FROM chunks WHERE id IN ({', '.join('?' * len(part))})", part)
+            self._conn.commit()
+            self.flat.delete([row[1] for row in rows])
+            self.flat.save()
+
+    def query(self, query_embeddings: list, n_results: int = 10, where: dict = None,
+              include: list = ("metadatas", "documents", "distances")) -> dict:
+        """
+        Top-n chunks per query vector (Chroma's `Collection.query`); distances are cosine distances.
+        """
+        allowed = None
+        if where:
+            condition, params = where_sql(where)
+            with self._lock:
+                allowed = np.fromiter(
+                    (slot for (slot,) in self._conn.execute(f"SELECT slot FROM chunks WHERE {condition}", params)),
+                    dtype=np.int64,
+                )
+
+        result = {"ids": [], "documents": [], "metadatas": [], "distances": [], "embeddings": []}
+        for slots, sims in self.search_many(query_embeddings, n_results, allowed):
+            rows = {row[1]: row for row in self._rows_by("slot", slots.tolist())}
+            order = [i for i, slot in enumerate(slots.tolist()) if slot in rows]
+            found = self._result([rows[int(slots[i])] for i in order], include)
+            for key in ("ids", "documents", "metadatas", "embeddings"):
+                result[key].append(found[key])
+            result["distances"].append([1.0 - float(sims[i]) for i in order])
+        return {key: (value if key == "ids" or key in include else None) for key, value in result.items()}
+
+    # --- Search ------------------------------------------------------------------------------
+
+    def search(self, query, k: int, allowed: np.ndarray = None, ef: int = None):
+        """
+        Top-k slots for one query vector: exact on the flat index, or through the HNSW graph
+        (plus an exact scan of slots the graph does not cover yet).
+
+        Args:
+            query: Query vector.
+            k (int): Number of results.
+            allowed (np.ndarray, optional): Slots matching a filter (None = all).
+            ef (int, optional): HNSW candidate list size for this search.
+
+        Output:
+            tuple: (slots, similarities), best first.
+        """
+        query = normalize(query)
+        # Unfiltered searches read the live mask in place (no per-query copy)
+        mask = self.flat.alive if allowed is None else self.flat.mask(allowed)
+        graph = self.graph
+        if graph is None or not graph.size or (allowed is not None and len(allowed) <= EXACT_FILTER_ROWS):
+            return self.flat.search(query, k, mask)
+
+        covered = min(graph.size, len(mask))
+        slots, sims = graph.search(query, k, ef=ef, accept=mask)
+        tail_slots, tail_sims = self.flat.search(query, k, mask, start=covered)
+        if not len(tail_slots):
+            return slots, sims
+        slots, sims = np.concatenate([slots, tail_slots]), np.concatenate([sims, tail_sims])
+        best = top_k(sims, k)
+        return slots[best], sims[best]
+
+    def search_many(self, queries, k: int, allowed: np.ndarray = None) -> list:
+        """
+        `search` for several query vectors (a multi-query `query` call). Exact searches are
+        vectorized across the queries; graph searches walk the graph once per query.
+
+        Output:
+            list: One (slots, similarities) tuple per query, best first.
+        """
+        if not len(queries):
+            return []
+        queries = np.atleast_2d(np.asarray(queries, dtype=np.float32))
+        graph = self.graph
+        if graph is None or not graph.size or (allowed is not None and len(allowed) <= EXACT_FILTER_ROWS):
+            mask = self.flat.alive if allowed is None else self.flat.mask(allowed)
+            return self.flat.search_many(queries, k, mask)
+        return [self.search(query, k, allowed) for query in queries]
+
+    # --- Background index maintenance (quantizer, HNSW) --------------------------------------
+
+    def _start_graph(self):
+        self.graph = HNSWGraph(self.flat, self._graph_path, **self.hnsw_params)
+        logging.info(f"HNSW index enabled for collection {self.name} ({self.graph.pending} vectors to insert)")
+        self._start_indexer()
+
+    def _start_indexer(self):
+        # One indexer thread per collection, started by the first piece of work it has
+        if self._indexer is None:
+            self._indexer = threading.Thread(target=self._index_loop, name=f"index-{self.name}", daemon=True)
+            self._indexer.start()
+        self._wake.set()
+
+    def _index_loop(self):
+        # Trains the quantizer when due, and inserts new slots into the graph in small steps,
+        # saving it now and then
+        while not self._closed:
+            self._wake.wait(timeout=self.save_interval)
+            self._wake.clear()
+            try:
+                if self.flat.needs_training:
+                    self.flat.train_quantizer(self._lock, should_stop=lambda: self._closed)
+                if self.graph is None:
+                    continue
+                while not self._closed and self.graph.pending:
+                    started = time.monotonic()
+                    inserted = self.graph.insert_pending(limit=1000, should_stop=lambda: self._closed)
+                    logging.info(f"HNSW {self.name}: inserted {inserted} vectors in {time.monotonic() - started:.2f}s "
+                                 f"({self.graph.pending} pending)")
+                if not self._closed and time.monotonic() - self._last_save >= self.save_interval:
+                    self.save_graph()
+            except Exception as e:
+                logging.error(f"HNSW indexing of {self.name} failed: {str(e)}")
+
+    def wait_indexed(self, timeout: float = None) -> bool:
+        """
+        Blocks until the quantized codes (when due) and the graph cover every vector (returns at
+        once when there is nothing to build). Used by benchmarks and tests.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self.flat.needs_training or (self.graph is not None and self.graph.pending):
+            if deadline is not None and time.monotonic() > deadline:
+                return False
+            self._wake.set()
+            time.sleep(0.05)
+        return True
+
+    def save_graph(self):
+        if self.graph is not None:
+            self.graph.save()
+            self._last_save = time.monotonic()
+
+    def close(self, save: bool = True):
+        """
+        Stops the indexer, saves the graph (unless the collection is being deleted) and closes SQLite.
+        """
+        self._closed = True
+        self._wake.set()
+        if self._indexer is not None:
+            self._indexer.join()
+        with self._lock:
+            if save:
+                self.flat.save()
+                self.save_graph()
+            self._conn.close()
+
+    def stats(self) -> dict:
+        """
+        Output:
+            dict: {"index", "quantization", "vectors", "tombstones", "vector_bytes", "code_bytes",
+                   "graph_size", "graph_pending", "graph_bytes"}
+        """
+        graph = self.graph
+        return {
+            "index": "hnsw" if graph is not None else "flat",
+            "quantization": self.flat.quantizer.kind if self.flat.quantizer is not None else "none",
+            "vectors": self.flat.live_count,
+            "tombstones": self.flat.count - self.flat.live_count,
+            "vector_bytes": self.flat.nbytes,
+            "code_bytes": self.flat.code_bytes,
+            "graph_size": graph.size if graph is not None else 0,
+            "graph_pending": graph.pending if graph is not None else 0,
+            "graph_bytes": graph.nbytes if graph is not None else 0,
+        }
+
+
+class LocalClient:
+    """
+    Opens the collections under one directory (the counterpart of a Chroma client). Collections are
+    shared by everyone using the client, so a migration's shadow collection and the live one coexist.
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+        self._collections = {}
+        self._lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+
+    @staticmethod
+    def _settings() -> dict:
+        return {
+            "index": os.getenv("LOCAL_INDEX", "auto").lower(),
+            "hnsw_threshold": int(os.getenv("LOCAL_HNSW_THRESHOLD", "50000")),
+            "M": int(os.getenv("HNSW_M", "16")),
+            "ef_construction": int(os.getenv("HNSW_EF_CONSTRUCTION", "100")),
+            "ef_search": int(os.getenv("HNSW_EF_SEARCH", "64")),
+            "quantization": os.getenv("LOCAL_QUANTIZATION", "none").lower(),
+            "train_size": int(os.getenv("QUANTIZATION_TRAIN_SIZE", "5000")),
+            "rescore_factor": int(os.getenv("QUANTIZATION_RESCORE_FACTOR", "8")),
+            "pq_subspaces": int(os.getenv("PQ_SUBSPACES", "48")),
+        }
+
+    def get_or_create_collection(self, name: str) -> LocalCollection:
+        with self._lock:
+            if name not in self._collections:
+                self._collections[name] = LocalCollection(os.path.join(self.root, name), name, **self._settings())
+            return self._collections[name]
+
+    def release(self, name: str):
+        """
+        Saves and closes a collection; the next get_or_create_collection loads it again from disk.
+        """
+        with self._lock:
+            collection = self._collections.pop(name, None)
+        if collection is not None:
+            collection.close()
+
+    def delete_collection(self, name: str):
+        with self._lock:
+            collection = self._collections.pop(name, None)
+        if collection is not None:
+            collection.close(save=False)
+        shutil.rmtree(os.path.join(self.root, name), ignore_errors=True)
+
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_client(root: str) -> LocalClient:
+    """
+    The shared LocalClient of a directory (one per process, like Chroma's shared system per path).
+    """
+    root = os.path.abspath(root)
+    with _clients_lock:
+        if root not in _clients:
+            _clients[root] = LocalClient(root)
+        return _clients[root]
+
+
+class LocalChroma:
+    """
+    Stand-in for langchain_chroma.Chroma over a LocalCollection: exposes `_collection`, `_client`,
+    and `similarity_search`, which is what ChromaDBHandler calls.
+    """
+
+    def __init__(self, client: LocalClient, collection_name: str, embedding_function):
+        self._client = client
+        self._collection_name = collection_name
+        self._embedding_function = embedding_function
+        self._collection = client.get_or_create_collection(collection_name)
+
+    def similarity_search(self, query: str, k: int = 4, filter: dict = None):
+        found = self._collection.query(
+            query_embeddings=[self._embedding_function.embed_query(query)], n_results=k, where=filter,
+            include=["documents", "metadatas"],
+        )
+        return [
+            Document(id=cid, page_content=text, metadata=meta or {})
+            for cid, text, meta in zip(found["ids"][0], found["documents"][0], found["metadatas"][0])
+        ]
+
+
+class LocalVectorStore(ChromaDBHandler):
+    """
+    Vector store on the local engine. Ingestion, manifest, BM25, fingerprints, migrations and
+    search options are ChromaDBHandler's; only the collections differ (LocalCollection instead of
+    a Chroma collection), so vector search runs in-process on NumPy without the Chroma client stack.
+
+    The manifest and BM25 index are kept in a "local" subdirectory of the state directory, apart
+    from Chroma's, so switching VECTOR_ENGINE re-ingests files instead of skipping them as unchanged.
+    """
+
+    def __init__(self, persist_directory: str, collection_name: str = "rag_collection", state_directory: str = None):
+        """
+        Args:
+            persist_directory (str): Base directory; collections are kept under <persist_directory>/local.
+            collection_name (str): Collection holding this handler's vectors (one per tenant).
+            state_directory (str, optional): Base directory of the manifest and BM25 index (defaults to persist_directory).
+        """
+        super().__init__(persist_directory, collection_name, os.path.join(state_directory or persist_directory, "local"))
+        self.index_directory = os.path.join(persist_directory, "local")
+
+    def open_collection(self, name: str, embeddings) -> LocalChroma:
+        """
+        Opens (or creates) a local collection, e.g., a migration's shadow collection.
+        """
+        return LocalChroma(get_client(self.index_directory), name, embeddings)
+
+    def close(self):
+        """
+        Saves the collection's graph and releases it, then releases the handler's in-memory state.
+        """
+        try:
+            if self.db is not None:
+                self.db._client.release(self.active_collection)
+            super().close()
+        except Exception as e:
+            raise CustomException(e, sys)
+
+    def stats(self) -> dict:
+        """
+        ChromaDBHandler.stats plus the local index figures (see LocalCollection.stats).
+        """
+        try:
+            stats = super().stats()
+            if self.db is not None:
+                stats.update(self.db._collection.stats())
+            return stats
+        except Exception as e:
+            raise CustomException(e, sys)
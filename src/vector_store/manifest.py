@@ -0,0 +1,174 @@
+# This file defines content-addressed chunk IDs and the per-file manifest used for incremental re-ingestion.
+
+import os
+import sys
+import json
+import sqlite3
+import hashlib
+import threading
+from src.exception import CustomException
+from src.logger import logging
+
+
+def chunk_id(source: str, text: str) -> str:
+    """
+    Deterministic ID for a chunk: a hash of its source file name and content.
+    Re-ingesting the same chunk of the same file always yields the same ID.
+    """
+    return hashlib.sha256(f"{source}\x00{text}".encode("utf-8")).hexdigest()[:32]
+
+
+def hash_file(file_path: str, block_size: int = 1024 * 1024) -> str:
+    """
+    SHA-256 of a file's bytes, read in blocks so large files are never fully loaded.
+    """
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class FileManifest:
+    """
+    Records, per source file, the content hash, modification time and chunk IDs that are
+    currently stored in the vector database.
+
+    Stored in SQLite next to the Chroma directory: a row per file plus a row per chunk ID, so
+    committing one file writes only that file's rows (one transaction) instead of rewriting a
+    document that holds every chunk ID of the corpus. A manifest JSON written by older versions
+    (same path with a .json extension) is imported on first open.
+    """
+
+    def __init__(self, path: str):
+        """
+        Args:
+            path (str): Location of the manifest SQLite file.
+        """
+        try:
+            self.path = path
+            self._lock = threading.Lock()
+            # Autocommit mode; multi-statement updates use explicit transactions
+            self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                """CREATE TABLE IF NOT EXISTS files (
+                    source TEXT PRIMARY KEY,
+                    file_hash TEXT NOT NULL,
+                    mtime REAL,
+                    chunks INTEGER NOT NULL
+                )"""
+            )
+            self._db.execute(
+                """CREATE TABLE IF NOT EXISTS chunks (
+                    source TEXT NOT NULL,
+                    chunk_id TEXT NOT NULL,
+                    PRIMARY KEY (source, chunk_id)
+                ) WITHOUT ROWID"""
+            )
+            self._import_json(f"{os.path.splitext(path)[0]}.json")
+            logging.info(f"Opened manifest with {self.count()} file(s) at: {path}")
+        except Exception as e:
+            raise CustomException(e, sys)
+
+    def _import_json(self, json_path: str):
+        # One-time import of the JSON manifest; the file is renamed afterwards so it is not imported twice
+        if not os.path.exists(json_path):
+            return
+        with open(json_path, "r", encoding="utf-8") as f:
+            files = json.load(f)
+        with self._lock:
+            self._transaction(lambda: [self._write(source, entry["file_hash"], entry["chunk_ids"], entry.get("mtime"))
+                                       for source, entry in files.items()])
+        os.replace(json_path, f"{json_path}.imported")
+        logging.info(f"Imported {len(files)} file(s) from the JSON manifest: {json_path}")
+
+    def _transaction(self, work):
+        # Runs `work` atomically (callers hold self._lock)
+        self._db.execute("BEGIN IMMEDIATE")
+        try:
+            work()
+            self._db.execute("COMMIT")
+        except Exception:
+            self._db.execute("ROLLBACK")
+            raise
+
+    def _write(self, source: str, file_hash: str, chunk_ids: list, mtime: float = None):
+        self._db.execute("DELETE FROM chunks WHERE source = ?", (source,))
+        self._db.executemany("INSERT OR IGNORE INTO chunks (source, chunk_id) VALUES (?, ?)",
+                             ((source, cid) for cid in chunk_ids))
+        count = self._db.execute("SELECT COUNT(*) FROM chunks WHERE source = ?", (source,)).fetchone()[0]
+        self._db.execute("INSERT OR REPLACE INTO files (source, file_hash, mtime, chunks) VALUES (?, ?, ?, ?)",
+                         (source, file_hash, mtime, count))
+
+    def get(self, source: str) -> dict:
+        """
+        Output:
+            dict or None: {"file_hash", "mtime", "chunks"} for the source, if known ("chunks" is
+                          the number of chunk IDs; see chunk_ids for the IDs themselves).
+        """
+        with self._lock:
+            row = self._db.execute("SELECT file_hash, mtime, chunks FROM files WHERE source = ?", (source,)).fetchone()
+        return {"file_hash": row[0], "mtime": row[1], "chunks": row[2]} if row else None
+
+    def chunk_ids(self, source: str) -> list:
+        """
+        Output:
+            list: IDs of the chunks recorded for the source (empty if unknown).
+        """
+        with self._lock:
+            return [r[0] for r in self._db.execute("SELECT chunk_id FROM chunks WHERE source = ?", (source,))]
+
+    def is_unchanged(self, source: str, file_hash: str) -> bool:
+        """
+        True when the source was already ingested with exactly this content hash.
+        """
+        entry = self.get(source)
+        return entry is not None and entry["file_hash"] == file_hash
+
+    def update(self, source: str, file_hash: str, chunk_ids: list, mtime: float = None):
+        """
+        Records the current state of a source file and persists it (only this file's rows are written).
+        """
+        try:
+            with self._lock:
+                self._transaction(lambda: self._write(source, file_hash, chunk_ids, mtime))
+        except Exception as e:
+            raise CustomException(e, sys)
+
+    def remove(self, source: str):
+        """
+        Forgets a source file (after its vectors are deleted).
+        """
+        try:
+            with self._lock:
+                self._transaction(lambda: [self._db.execute(f"DELETE FROM {table} WHERE source = ?", (source,))
+                                           for table in ("chunks", "files")])
+        except Exception as e:
+            raise CustomException(e, sys)
+
+    def clear(self):
+        """
+        Forgets every file (after the collection is cleared).
+        """
+        try:
+            with self._lock:
+                self._transaction(lambda: [self._db.execute(f"DELETE FROM {table}") for table in ("chunks", "files")])
+        except Exception as e:
+            raise CustomException(e, sys)
+
+    def sources(self) -> list:
+        with self._lock:
+            return [r[0] for r in self._db.execute("SELECT source FROM files ORDER BY source")]
+
+    def count(self) -> int:
+        """
+        Output:
+            int: Number of files recorded.
+        """
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM files").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._db.close()
@@ -0,0 +1,147 @@
+# This file defines the online embedding migration: re-embed a collection into a shadow collection
+# in the background, then swap it in atomically while queries keep running on the old one.
+
+import sys
+import time
+import hashlib
+from src.vector_store.fingerprint import embedding_fingerprint, MODEL_KEY
+from src.exception import CustomException
+from src.logger import logging
+
+# Migration states: running -> done | failed
+RUNNING, DONE, FAILED = "running", "done", "failed"
+
+
+class EmbeddingMigration:
+    """
+    Re-embeds every chunk of a ChromaDBHandler's collection with a new model.
+
+    1. Copy: chunks are read page by page from the live collection, embedded with the target
+       model and upserted into a shadow collection under the same IDs. After each batch the
+       migration sleeps in proportion to the time it worked (`duty_cycle`), leaving CPU for
+       queries and ingestion. Queries keep using the live collection and the old model.
+    2. Sync: chunks added or deleted meanwhile are applied to the shadow collection, first
+       without locks, then once more under the handler's write lock (a short pause for writes only).
+    3. Swap: the handler switches to the shadow collection and the new model in one step
+       (see ChromaDBHandler.swap_collection) and drops the old collection.
+
+    A migration that was interrupted can be started again: chunks already in the shadow
+    collection are not embedded twice. The manifest and BM25 index are unaffected, because
+    chunk IDs and texts do not change.
+    """
+
+    def __init__(self, vector_store, target_embeddings, batch_size: int = 256, duty_cycle: float = 0.5):
+        """
+        Args:
+            vector_store (ChromaDBHandler): Handler whose collection is migrated.
+            target_embeddings: The new embedding model.
+            batch_size (int): Chunks read, embedded and written per step.
+            duty_cycle (float): Share of wall time spent working (0-1]; 0.5 = sleep as long as each batch took.
+        """
+        self.vector_store = vector_store
+        self.target_embeddings = target_embeddings
+        self.batch_size = batch_size
+        self.duty_cycle = min(max(duty_cycle, 0.05), 1.0)
+        self.status = {"state": RUNNING, "source": vector_store.fingerprint, "target": None, "collection": None,
+                       "total": 0, "migrated": 0, "skipped": 0, "seconds": 0.0, "error": None}
+        self._started = time.monotonic()
+
+    def _throttle(self, worked: float):
+        # Sleep so that work takes at most `duty_cycle` of the elapsed time
+        if self.duty_cycle < 1.0:
+            time.sleep(worked * (1.0 - self.duty_cycle) / self.duty_cycle)
+
+    def _ids(self, collection) -> set:
+        # All IDs of a collection, fetched page by page without documents or vectors
+        ids, offset = set(), 0
+        while True:
+            page = collection.get(limit=10000, offset=offset, include=[])["ids"]
+            if not page:
+                return ids
+            ids.update(page)
+            offset += len(page)
+
+    def _copy(self, ids: list, texts: list, metas: list, shadow):
+        vectors = self.target_embeddings.embed_documents(texts)
+        shadow.upsert(ids=ids, embeddings=vectors, documents=texts, metadatas=metas)
+        self.status["migrated"] += len(ids)
+
+    def _copy_ids(self, ids: list, live, shadow):
+        # Copies specific chunks (found by the sync step) from the live to the shadow collection
+        ids = list(ids)
+        for start in range(0, len(ids), self.batch_size):
+            found = live.get(ids=ids[start:start + self.batch_size], include=["documents", "metadatas"])
+            if found["ids"]:
+                self._copy(found["ids"], found["documents"], [m or {} for m in found["metadatas"]], shadow)
+
+    def _sync(self, live, shadow):
+        # Applies chunks added / removed in the live collection since they were copied
+        live_ids, shadow_ids = self._ids(live), self._ids(shadow)
+        missing, extra = live_ids - shadow_ids, list(shadow_ids - live_ids)
+        self._copy_ids(missing, live, shadow)
+        for start in range(0, len(extra), self.batch_size):
+            shadow.delete(ids=extra[start:start + self.batch_size])
+        return len(missing), len(extra)
+
+    def run(self) -> dict:
+        """
+        Runs the migration to completion (TenantManager.migrate_embeddings calls it on a background thread).
+
+        Output:
+            dict: The final status {"state", "source", "target", "collection", "total", "migrated",
+                  "skipped", "seconds", "error"}.
+        """
+        try:
+            store = self.vector_store
+            target = embedding_fingerprint(self.target_embeddings)
+            self.status["target"] = target
+            if store.fingerprint == target and not store.fingerprint_mismatch:
+                logging.info(f"Collection {store.active_collection} already uses {target}; nothing to migrate")
+                self.status["state"] = DONE
+                return self.status
+
+            # Shadow collection named after the target model, so a restarted migration resumes into it
+            digest = hashlib.sha1(f"{target[MODEL_KEY]}:{target['embedding_dim']}".encode("utf-8")).hexdigest()[:10]
+            shadow_name = f"{store.collection_name}-{digest}"
+            if shadow_name == store.active_collection:
+                raise ValueError(f"Collection {shadow_name} is already the live collection.")
+            self.status["collection"] = shadow_name
+            shadow = store.open_collection(shadow_name, self.target_embeddings)
+
+            live = store.db._collection
+            self.status["total"] = live.count()
+            logging.info(f"Migrating {self.status['total']} chunks of {store.active_collection} to {shadow_name} ({target})")
+
+            # 1. Copy page by page, throttled
+            offset = 0
+            while True:
+                batch_started = time.monotonic()
+                page = live.get(limit=self.batch_size, offset=offset, include=["documents", "metadatas"])
+                if not page["ids"]:
+                    break
+                offset += len(page["ids"])
+                existing = set(shadow._collection.get(ids=page["ids"], include=[])["ids"])
+                rows = [(cid, text, meta or {}) for cid, text, meta in zip(page["ids"], page["documents"], page["metadatas"])
+                        if cid not in existing]
+                self.status["skipped"] += len(page["ids"]) - len(rows)
+                if rows:
+                    self._copy([r[0] for r in rows], [r[1] for r in rows], [r[2] for r in rows], shadow._collection)
+                self.status["seconds"] = round(time.monotonic() - self._started, 3)
+                self._throttle(time.monotonic() - batch_started)
+
+            # 2. Catch up with concurrent ingestion, then repeat under the write lock and swap
+            added, removed = self._sync(live, shadow._collection)
+            logging.info(f"Migration catch-up: {added} chunks added, {removed} removed")
+            with store._write_lock:
+                added, removed = self._sync(store.db._collection, shadow._collection)
+                logging.info(f"Migration final sync: {added} chunks added, {removed} removed")
+                # 3. Swap
+                store.swap_collection(shadow, self.target_embeddings, target)
+
+            self.status.update(state=DONE, seconds=round(time.monotonic() - self._started, 3))
+            logging.info(f"Embedding migration finished: {self.status}")
+            return self.status
+        except Exception as e:
+            self.status.update(state=FAILED, error=str(e), seconds=round(time.monotonic() - self._started, 3))
+            logging.error(f"Embedding migration failed: {str(e)}")
+            raise CustomException(e, sys)
@@ -0,0 +1,79 @@
+# This file defines maximal-marginal-relevance (MMR) selection and the per-source cap used to diversify search results.
+
+from typing import List
+import numpy as np
+
+
+def maximal_marginal_relevance(query_embedding, candidate_embeddings, k: int, lambda_mult: float = 0.5,
+                               sources: list = None, max_per_source: int = None) -> List[int]:
+    """
+    Greedy MMR selection over candidate vectors.
+
+    Each step picks the candidate maximizing
+        lambda_mult * sim(query, c) - (1 - lambda_mult) * max sim(c, already selected)
+    so chunks that repeat an already chosen chunk are pushed down. With lambda_mult=1 this is
+    plain relevance order, which is how the per-source cap is applied on its own.
+
+    Args:
+        query_embedding: Query vector (d,).
+        candidate_embeddings: Candidate vectors (n, d), in any order.
+        k (int): Number of candidates to select.
+        lambda_mult (float): 1 = relevance only, 0 = diversity only.
+        sources (list, optional): Source file of each candidate (needed for max_per_source).
+        max_per_source (int, optional): At most this many selections per source.
+
+    Output:
+        List[int]: Indices of the selected candidates, in selection order.
+    """
+    candidates = np.asarray(candidate_embeddings, dtype=np.float32)
+    if candidates.ndim != 2 or not len(candidates) or k <= 0:
+        return []
+
+    # Cosine similarities via normalized dot products (one matrix-vector product for relevance)
+    candidates = candidates / np.maximum(np.linalg.norm(candidates, axis=1, keepdims=True), 1e-12)
+    query = np.asarray(query_embedding, dtype=np.float32)
+    query = query / max(float(np.linalg.norm(query)), 1e-12)
+    relevance = candidates @ query
+
+    n = len(candidates)
+    available = np.ones(n, dtype=bool)
+    # Highest similarity of each candidate to anything selected so far (updated incrementally,
+    # so each step costs one extra matrix-vector product instead of a full n x n matrix)
+    redundancy = np.full(n, -np.inf, dtype=np.float32)
+    per_source = {}
+    selected = []
+
+    while len(selected) < min(k, n) and available.any():
+        if selected:
+            scores = lambda_mult * relevance - (1 - lambda_mult) * redundancy
+        else:
+            scores = relevance.copy()
+        scores[~available] = -np.inf
+        best = int(np.argmax(scores))
+        available[best] = False
+
+        if max_per_source and sources is not None:
+            source = sources[best]
+            if per_source.get(source, 0) >= max_per_source:
+                continue  # Source is full: skip this candidate without selecting it
+            per_source[source] = per_source.get(source, 0) + 1
+
+        selected.append(best)
+        redundancy = np.maximum(redundancy, candidates @ candidates[best])
+
+    return selected
+
+
+def cap_per_source(docs: list, max_per_source: int = None) -> list:
+    """
+    Keeps at most `max_per_source` documents per source file, preserving order.
+    """
+    if not max_per_source:
+        return list(docs)
+    counts, kept = {}, []
+    for doc in docs:
+        source = doc.metadata.get("source", "unknown")
+        if counts.get(source, 0) < max_per_source:
+            counts[source] = counts.get(source, 0) + 1
+            kept.append(doc)
+    return kept
@@ -0,0 +1,171 @@
+# This file defines the vector quantizers of the local engine: int8 scalar quantization (4x smaller)
+# and product quantization (e.g., 32x smaller), used to score candidates before an exact re-score.
+
+import numpy as np
+
+# Rows scored / encoded per NumPy call, so temporaries stay a few MB however large the index is
+BLOCK_ROWS = 8192
+# Vectors sampled to train a quantizer
+TRAIN_SAMPLE = 20000
+
+
+class ScalarQuantizer:
+    """
+    int8 scalar quantization: every dimension is mapped linearly from its [min, max] range onto
+    256 levels (one uint8 per dimension, 4x less memory than float32).
+
+    With x ~ low + code * scale, the dot product with a query q is
+    q.low + code.(q * scale), so a query is scored against codes with one matrix-vector product.
+    """
+
+    kind = "int8"
+
+    def __init__(self):
+        self.low = None
+        self.scale = None
+
+    @property
+    def trained(self) -> bool:
+        return self.low is not None
+
+    def code_width(self, dim: int) -> int:
+        return dim
+
+    def train(self, vectors: np.ndarray):
+        self.low = vectors.min(axis=0).astype(np.float32)
+        self.scale = np.clip((vectors.max(axis=0) - self.low) / 255.0, 1e-8, None).astype(np.float32)
+
+    def encode(self, vectors: np.ndarray) -> np.ndarray:
+        return np.clip(np.rint((vectors - self.low) / self.scale), 0, 255).astype(np.uint8)
+
+    def prepare(self, query: np.ndarray):
+        # Per-query constants, computed once and reused for every block of codes
+        return (query * self.scale).astype(np.float32), float(self.low @ query)
+
+    def score(self, prepared, codes: np.ndarray) -> np.ndarray:
+        weights, offset = prepared
+        return codes.astype(np.float32) @ weights + offset
+
+    def state(self) -> dict:
+        return {"low": self.low, "scale": self.scale}
+
+    def load_state(self, state: dict):
+        self.low, self.scale = state["low"], state["scale"]
+
+    @property
+    def nbytes(self) -> int:
+        return int(self.low.nbytes + self.scale.nbytes) if self.trained else 0
+
+
+class ProductQuantizer:
+    """
+    Product quantization: the vector is split into `subspaces` slices and each slice is replaced by
+    the index of its nearest centroid in a 256-entry codebook learned with k-means (one uint8 per
+    slice; 384 dims in 48 slices take 48 bytes instead of 1536).
+
+    A query is scored by asymmetric distance computation: one table of query-slice x centroid dot
+    products per slice, then each code is scored by summing one table entry per slice.
+    """
+
+    kind = "pq"
+
+    def __init__(self, subspaces: int = 48, iterations: int = 15, seed: int = 0):
+        """
+        Args:
+            subspaces (int): Requested number of slices (the largest divisor of the dimension not above it is used).
+            iterations (int): k-means iterations per codebook.
+            seed (int): Seed of the k-means initialization.
+        """
+        self.subspaces = subspaces
+        self.iterations = iterations
+        self.seed = seed
+        self.codebooks = None   # [subspaces, 256, dim / subspaces]
+
+    @property
+    def trained(self) -> bool:
+        return self.codebooks is not None
+
+    def _slices(self, dim: int) -> int:
+        return max(m for m in range(1, min(self.subspaces, dim) + 1) if dim % m == 0)
+
+    def code_width(self, dim: int) -> int:
+        return self._slices(dim)
+
+    def _kmeans(self, points: np.ndarray, rng) -> np.ndarray:
+        centroids = points[rng.choice(len(points), min(256, len(points)), replace=False)].copy()
+        for _ in range(self.iterations):
+            assigned = self._nearest(points, centroids)
+            counts = np.bincount(assigned, minlength=len(centroids))
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assigned, points)
+            filled = counts > 0
+            centroids[filled] = sums[filled] / counts[filled, None]
+            # Empty clusters restart from random points
+            empty = np.flatnonzero(~filled)
+            if len(empty):
+                centroids[empty] = points[rng.choice(len(points), len(empty))]
+        if len(centroids) < 256:
+            centroids = np.vstack([centroids, np.repeat(centroids[:1], 256 - len(centroids), axis=0)])
+        return centroids
+
+    @staticmethod
+    def _nearest(points: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+        distances = (centroids ** 2).sum(axis=1)[None, :] - 2.0 * points @ centroids.T
+        return distances.argmin(axis=1)
+
+    def train(self, vectors: np.ndarray):
+        m = self._slices(vectors.shape[1])
+        width = vectors.shape[1] // m
+        rng = np.random.default_rng(self.seed)
+        self.codebooks = np.stack([
+            self._kmeans(np.ascontiguousarray(vectors[:, j * width:(j + 1) * width]), rng) for j in range(m)
+        ]).astype(np.float32)
+        self._offsets = np.arange(m) * 256
+
+    def encode(self, vectors: np.ndarray) -> np.ndarray:
+        m, _, width = self.codebooks.shape
+        codes = np.empty((len(vectors), m), dtype=np.uint8)
+        for j in range(m):
+            codes[:, j] = self._nearest(vectors[:, j * width:(j + 1) * width], self.codebooks[j])
+        return codes
+
+    def prepare(self, query: np.ndarray) -> np.ndarray:
+        m, _, width = self.codebooks.shape
+        # tables[j, c] = query slice j . centroid c of codebook j
+        return np.einsum("mcw,mw->mc", self.codebooks, query.reshape(m, width))
+
+    def score(self, tables: np.ndarray, codes: np.ndarray) -> np.ndarray:
+        if len(codes) < 1024:
+            # A few codes (graph neighbours): one gather over all slices
+            return tables.ravel()[codes.astype(np.int64) + self._offsets].sum(axis=1)
+        # A block of the scan: one small, cache-resident table per slice
+        scores = np.zeros(len(codes), dtype=np.float32)
+        for j in range(len(tables)):
+            scores += tables[j].take(codes[:, j])
+        return scores
+
+    def state(self) -> dict:
+        return {"codebooks": self.codebooks}
+
+    def load_state(self, state: dict):
+        self.codebooks = state["codebooks"]
+        self._offsets = np.arange(self.codebooks.shape[0]) * 256
+
+    @property
+    def nbytes(self) -> int:
+        return int(self.codebooks.nbytes) if self.trained else 0
+
+
+def build_quantizer(kind: str, pq_subspaces: int = 48):
+    """
+    Quantizer for LOCAL_QUANTIZATION: "int8", "pq", or "none" (returns None).
+    """
+    kind = (kind or "none").lower()
+    if kind == "none":
+        return None
+    if kind == "int8":
+        return ScalarQuantizer()
+    if kind == "pq":
+        return ProductQuantizer(subspaces=pq_subspaces)
+    raise ValueError(f"Unknown LOCAL_QUANTIZATION: {kind} (use 'none', 'int8' or 'pq')")
+
@@ -0,0 +1,55 @@
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+
+from src.cache.answer_cache import AnswerCache
+from src.registry import ComponentRegistry
+from src.vector_store.chroma_db import ChromaDBHandler
+
+
+class FakeEmbeddings(Embeddings):
+    model_name = "fake-embeddings"
+
+    def embed_documents(self, texts):
+        return [self.embed_query(text) for text in texts]
+
+    def embed_query(self, text):
+        return [1.0, float(len(text) % 7), 0.5]
+
+
+def test_exact_tier_ignores_spacing_and_punctuation_but_keeps_case():
+    cache = AnswerCache()
+    cache.put("Where is the US office?", "Boston", ["a.txt"])
+
+    assert cache.get("Where is  the US office")["cache"] == "exact"
+    # "us" is another question; without an embedding function there is no semantic tier
+    assert cache.get("where is the us office?") is None
+
+
+def test_answer_computed_before_an_invalidation_is_not_stored():
+    cache = AnswerCache()
+    generation = cache.generation
+    cache.put("What changed?", "old answer", ["a.txt"], generation=generation)
+    cache.invalidate()
+
+    assert cache.get("What changed?") is None
+    # Started before the invalidation, finished after it: dropped
+    cache.put("What changed?", "stale answer", ["a.txt"], generation=generation)
+    assert cache.get("What changed?") is None
+    cache.put("What changed?", "new answer", ["b.txt"], generation=cache.generation)
+    assert cache.get("What changed?")["answer"] == "new answer"
+    assert cache.stats()["invalidations"] == 1
+
+
+def test_corpus_changes_invalidate_the_stores_cache(tmp_path):
+    store = ChromaDBHandler(str(tmp_path / "chroma"))
+    store.create_or_load(FakeEmbeddings())
+    cache = ComponentRegistry().new_answer_cache(store)
+    cache.put("What is due?", "invoice 1", ["a.txt"], generation=cache.generation)
+
+    store.add_documents([Document(page_content="invoice 2", metadata={"source": "b.txt"})])
+    assert cache.get("What is due?") is None
+    generation = cache.generation
+
+    cache.put("What is due?", "invoice 1 and 2", ["a.txt", "b.txt"], generation=generation)
+    store.delete_by_source("b.txt")
+    assert cache.get("What is due?") is None and cache.generation == generation + 1
@@ -0,0 +1,45 @@
+import importlib
+
+from langchain_core.documents import Document
+
+from src.agents import context_packer
+from src.agents.context_packer import ContextPacker, count_tokens
+
+
+def _doc(text, source, **metadata):
+    return Document(page_content=text, metadata={"source": source, **metadata})
+
+
+def test_oversized_chunk_is_skipped_and_later_chunks_still_packed():
+    packer = ContextPacker(token_budget=60, min_fragment_tokens=20)
+    docs = [
+        _doc("Paris is the capital of France.", "a.txt"),
+        _doc(" ".join(["filler"] * 400), "b.txt"),
+        _doc("The Seine flows through Paris.", "c.txt"),
+    ]
+
+    sections, stats = packer.pack(docs)
+
+    assert [label for label, _ in sections] == ["a.txt", "c.txt"]
+    assert stats["packed_chunks"] == 2 and stats["dropped_chunks"] == 1
+    assert stats["packed_tokens"] <= 60
+
+
+def test_chunk_that_does_not_fit_is_cut_at_a_sentence():
+    sentence = "This sentence is about the quarterly revenue figures. "
+    packer = ContextPacker(token_budget=count_tokens(sentence * 3), min_fragment_tokens=5)
+
+    sections, stats = packer.pack([_doc(sentence * 2, "a.txt"), _doc(sentence * 4, "b.txt")])
+
+    assert stats["truncated_chunks"] == 1
+    assert sections[1][1] == sentence.strip()
+    assert stats["packed_tokens"] <= packer.token_budget
+
+
+def test_tokenizer_is_loaded_on_first_count():
+    module = importlib.reload(context_packer)
+    assert module._encoding == []
+
+    module.count_tokens("hello world")
+
+    assert len(module._encoding) == 1
@@ -0,0 +1,72 @@
+import sqlite3
+
+from langchain_core.embeddings import Embeddings
+
+from src.cache.embedding_cache import CachedEmbeddings
+
+
+class PrefixedEmbeddings(Embeddings):
+    """Asymmetric model stand-in: queries and documents of the same text get different vectors."""
+
+    def __init__(self):
+        self.calls = 0
+
+    def embed_documents(self, texts):
+        self.calls += 1
+        return [[0.0, float(len(text))] for text in texts]
+
+    def embed_query(self, text):
+        self.calls += 1
+        return [1.0, float(len(text))]
+
+
+def test_query_and_document_vectors_are_cached_separately():
+    base = PrefixedEmbeddings()
+    cache = CachedEmbeddings(base, model_name="fake")
+
+    document = cache.embed_documents(["same text"])[0]
+    query = cache.embed_query("same text")
+
+    assert document == [0.0, 9.0] and query == [1.0, 9.0]
+    assert cache.embed_query("same text") == query and cache.embed_documents(["same text"])[0] == document
+    assert base.calls == 2
+
+
+def test_memory_tier_grows_on_demand_and_evicts_at_capacity():
+    cache = CachedEmbeddings(PrefixedEmbeddings(), model_name="fake", max_entries=3000)
+
+    cache.embed_documents([f"text {i}" for i in range(10)])
+    assert cache._matrix.shape[0] == 1024
+
+    cache.embed_documents([f"more {i}" for i in range(2990)])
+    assert cache._matrix.shape[0] == 3000
+    cache.embed_documents([f"last {i}" for i in range(100)])
+
+    # Full: the oldest entries were evicted and their rows reused
+    assert cache.stats()["entries"] == 3000 and cache._matrix.shape[0] == 3000
+    assert cache._key("text 0", "document") not in cache._rows
+    assert cache._key("last 99", "document") in cache._rows
+
+def test_disk_tier_commits_in_batches(tmp_path):
+    cache = CachedEmbeddings(PrefixedEmbeddings(), model_name="fake", cache_dir=str(tmp_path),
+                             commit_every=5, commit_interval=3600)
+
+    def committed():
+        with sqlite3.connect(str(tmp_path / "embeddings.sqlite3")) as other:
+            return other.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    for i in range(4):
+        cache.embed_query(f"question {i}")
+    assert committed() == 0
+    cache.embed_query("question 4")
+    assert committed() == 5
+
+    cache.embed_query("question 5")
+    cache.flush()
+    assert committed() == 6
+
+    # A fresh cache serves the committed rows from disk without calling the model
+    base = PrefixedEmbeddings()
+    reopened = CachedEmbeddings(base, model_name="fake", cache_dir=str(tmp_path))
+    reopened.embed_query("question 5")
+    assert base.calls == 0
@@ -0,0 +1,158 @@
+import os
+import threading
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from src.embeddings.backends import HuggingFaceBackend, OnnxBackend, default_onnx_dir
+from src.embeddings.micro_batcher import MicroBatchingEmbeddings
+from src.embeddings.parity import SAMPLE_TEXTS, check_parity
+from src.exception import CustomException
+
+
+class HashEmbeddings:
+    """Deterministic backend: a pseudo-random unit vector per text, plus optional noise."""
+
+    def __init__(self, noise=0.0, dim=32):
+        self.noise = noise
+        self.dim = dim
+        self.calls = []
+
+    def embed_documents(self, texts):
+        self.calls.append(list(texts))
+        vectors = []
+        for text in texts:
+            rng = np.random.default_rng(sum(map(ord, text)))
+            vector = rng.normal(size=self.dim)
+            if self.noise:
+                vector += np.random.default_rng(len(text)).normal(size=self.dim) * self.noise
+            vectors.append(vector.tolist())
+        return vectors
+
+
+def test_parity_passes_for_matching_backends():
+    result = check_parity(HashEmbeddings(), HashEmbeddings(), SAMPLE_TEXTS)
+
+    assert result["passed"] and result["min_cosine"] == pytest.approx(1.0)
+    assert result["neighbour_agreement"] == 1.0 and result["texts"] == len(SAMPLE_TEXTS)
+
+
+def test_parity_fails_when_any_text_drifts_below_the_threshold():
+    result = check_parity(HashEmbeddings(), HashEmbeddings(noise=0.5), SAMPLE_TEXTS, threshold=0.99)
+
+    assert not result["passed"]
+    assert result["min_cosine"] < 0.99 <= 1.0
+    assert result["mean_cosine"] >= result["min_cosine"]
+
+
+def test_micro_batcher_coalesces_concurrent_queries():
+    backend = HashEmbeddings()
+    entered, release = threading.Event(), threading.Event()
+    embed = backend.embed_documents
+
+    def embed_queries(texts):
+        # The first forward pass blocks, so queries arriving meanwhile queue up for the next one
+        entered.set()
+        release.wait(5)
+        return embed(texts)
+
+    backend.embed_queries = embed_queries
+    batcher = MicroBatchingEmbeddings(backend, max_batch=32, max_wait_ms=1)
+    texts = [f"question {i}" for i in range(9)]
+    results = {}
+
+    def ask(text):
+        results[text] = batcher.embed_query(text)
+
+    threads = [threading.Thread(target=ask, args=(text,)) for text in texts]
+    threads[0].start()
+    assert entered.wait(5)
+    for thread in threads[1:]:
+        thread.start()
+    while batcher._queue.qsize() < len(texts) - 1:
+        release.wait(0.01)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert results == dict(zip(texts, HashEmbeddings().embed_documents(texts)))
+    assert batcher.stats() == {"queries": 9, "batches": 2, "avg_batch": 4.5, "largest_batch": 8}
+
+
+def test_micro_batcher_reports_backend_errors_to_every_caller():
+    class Broken:
+        def embed_queries(self, texts):
+            raise RuntimeError("backend down")
+
+    batcher = MicroBatchingEmbeddings(Broken(), max_wait_ms=1)
+
+    with pytest.raises(CustomException, match="backend down"):
+        batcher.embed_query("anything")
+
+
+class FakeTokenizer:
+    """Whitespace tokenizer that pads a batch to its longest text (like tokenizers' padding)."""
+
+    def encode_batch(self, texts):
+        width = max(len(text.split()) for text in texts)
+        encodings = []
+        for text in texts:
+            ids = [len(word) for word in text.split()]
+            pad = width - len(ids)
+            encodings.append(SimpleNamespace(ids=ids + [0] * pad, attention_mask=[1] * len(ids) + [0] * pad,
+                                             type_ids=[0] * width))
+        return encodings
+
+
+class FakeSession:
+    """Hidden state of a token = [its id, 1]; padding positions get large values that must be ignored."""
+
+    def run(self, outputs, feeds):
+        ids = feeds["input_ids"].astype(np.float32)
+        hidden = np.stack([ids, np.ones_like(ids)], axis=-1)
+        hidden[feeds["attention_mask"] == 0] = 1000.0
+        return [hidden]
+
+
+def _onnx_backend(normalize):
+    backend = object.__new__(OnnxBackend)
+    backend.session, backend.tokenizer = FakeSession(), FakeTokenizer()
+    backend.input_names = {"input_ids", "attention_mask", "token_type_ids"}
+    backend.batch_size, backend.normalize = 2, normalize
+    return backend
+
+
+def test_onnx_backend_mean_pools_real_tokens_in_input_order():
+    texts = ["aaaa bb", "c", "dddddd eeee ff"]
+
+    vectors = _onnx_backend(normalize=False).embed_documents(texts)
+
+    # Means over each text's own tokens (ids are word lengths); padding never leaks in
+    assert vectors == [[3.0, 1.0], [1.0, 1.0], [4.0, 1.0]]
+    normalized = np.asarray(_onnx_backend(normalize=True).embed_documents(texts))
+    assert np.allclose(np.linalg.norm(normalized, axis=1), 1.0)
+
+
+def test_onnx_export_matches_the_pytorch_model():
+    # Real backends: runs only where torch, ONNX Runtime, the model and its export are available
+    pytest.importorskip("torch")
+    pytest.importorskip("langchain_huggingface")
+    pytest.importorskip("onnxruntime")
+    pytest.importorskip("tokenizers")
+    model_name = os.getenv("MODEL_NAME", "sentence-transformers/all-MiniLM-L6-v2")
+    model_dir = default_onnx_dir(model_name)
+    model_file = os.getenv("EMBEDDING_ONNX_FILE", "model_int8.onnx")
+    if not os.path.exists(os.path.join(model_dir, model_file)):
+        pytest.skip(f"No ONNX export at {model_dir}/{model_file}")
+    try:
+        reference = HuggingFaceBackend(model_name)
+    except CustomException as e:
+        pytest.skip(f"Model {model_name} cannot be loaded here: {e}")
+
+    candidate = OnnxBackend(model_dir=model_dir, model_file=model_file, model_name=model_name)
+    result = check_parity(reference, candidate, SAMPLE_TEXTS,
+                          threshold=float(os.getenv("EMBEDDING_PARITY_THRESHOLD", "0.99")))
+
+    assert result["passed"], result
+    assert result["neighbour_agreement"] >= 0.9
@@ -0,0 +1,27 @@
+import asyncio
+import threading
+
+import pytest
+
+from src.executor import ExecutionLayer, ExecutorBusyError
+
+
+def test_long_uploads_do_not_hold_the_io_pool():
+    executor = ExecutionLayer(io_workers=1, cpu_workers=1, ingest_workers=1, ingest_queue_limit=1)
+    release = threading.Event()
+
+    async def scenario():
+        upload = asyncio.ensure_future(executor.run_ingest(release.wait, 5))
+        await asyncio.sleep(0.05)
+        # Short calls still get the only I/O thread; a second whole upload is refused at once
+        assert await executor.run_io(lambda: "answer", timeout=1) == "answer"
+        with pytest.raises(ExecutorBusyError):
+            await executor.run_ingest(release.wait, 5)
+        release.set()
+        return await upload
+
+    try:
+        assert asyncio.run(scenario()) is True
+    finally:
+        release.set()
+        executor.shutdown()
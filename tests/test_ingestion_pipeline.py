@@ -0,0 +1,39 @@
+from langchain_core.embeddings import Embeddings
+
+from src.agents.ingestion_pipeline import IngestionPipeline
+from src.executor import ExecutionLayer
+from src.vector_store.chroma_db import ChromaDBHandler
+
+
+class FakeEmbeddings(Embeddings):
+    model_name = "fake-embeddings"
+
+    def embed_documents(self, texts):
+        return [self.embed_query(text) for text in texts]
+
+    def embed_query(self, text):
+        return [1.0, float(len(text) % 7), 0.5]
+
+
+def test_parallel_mode_parses_files_in_the_process_pool(tmp_path, monkeypatch):
+    # Worker processes would otherwise share the default on-disk extraction cache
+    monkeypatch.setenv("EXTRACTION_CACHE_ENABLED", "false")
+    store = ChromaDBHandler(str(tmp_path / "chroma"))
+    store.create_or_load(FakeEmbeddings())
+    good = tmp_path / "notes.txt"
+    good.write_text(" ".join(f"invoice number {i}." for i in range(200)), encoding="utf-8")
+    bad = tmp_path / "broken.xyz"
+    bad.write_text("not a supported type", encoding="utf-8")
+    executor = ExecutionLayer(io_workers=1, cpu_workers=1)
+    try:
+        summary = IngestionPipeline(store, executor=executor).run([str(good), str(bad)])
+    finally:
+        executor.shutdown()
+
+    reports = {report["filename"]: report for report in summary["files"]}
+    assert reports["notes.txt"]["stage"] == "stored" and reports["notes.txt"]["chunks"] == summary["chunks"] > 1
+    assert reports["notes.txt"]["preview"].startswith("invoice number 0.")
+    # A file the worker cannot parse is reported without failing the others
+    assert reports["broken.xyz"]["stage"] == "failed" and reports["broken.xyz"]["error"]
+    assert store.stats()["chunks"] == summary["chunks"]
+    assert executor.cpu.pending == 0
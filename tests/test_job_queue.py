@@ -0,0 +1,65 @@
+import sqlite3
+
+from src.jobs import job_queue as job_queue_module
+from src.jobs.job_queue import JobQueue, QUEUED, RUNNING
+
+
+def test_recover_keeps_jobs_of_live_owners(tmp_path):
+    db_path = str(tmp_path / "jobs.sqlite3")
+    sibling = JobQueue(db_path, heartbeat_timeout=30)
+    job_id = sibling.enqueue("default", ["a.txt"])
+    assert sibling.claim()["id"] == job_id
+
+    # A second process starting up must not steal the sibling's running job
+    restarted = JobQueue(db_path, heartbeat_timeout=30)
+    assert restarted.recover() == 0
+    assert restarted.get(job_id)["status"] == RUNNING
+    assert restarted.get(job_id)["owner"] == sibling.owner
+
+
+def test_recover_requeues_jobs_with_stale_heartbeats(tmp_path, monkeypatch):
+    db_path = str(tmp_path / "jobs.sqlite3")
+    crashed = JobQueue(db_path, heartbeat_timeout=30)
+    job_id = crashed.enqueue("default", ["a.txt"])
+    crashed.claim()
+    claimed_at = crashed.get(job_id)["heartbeat"]
+
+    survivor = JobQueue(db_path, heartbeat_timeout=30)
+    monkeypatch.setattr(job_queue_module.time, "time", lambda: claimed_at + 31)
+
+    assert survivor.recover() == 1
+    job = survivor.get(job_id)
+    assert job["status"] == QUEUED and job["owner"] is None
+    assert survivor.claim()["owner"] == survivor.owner
+
+
+def test_heartbeat_keeps_a_long_job_alive(tmp_path, monkeypatch):
+    db_path = str(tmp_path / "jobs.sqlite3")
+    owner = JobQueue(db_path, heartbeat_timeout=30)
+    job_id = owner.enqueue("default", ["a.txt"])
+    owner.claim()
+    claimed_at = owner.get(job_id)["heartbeat"]
+
+    monkeypatch.setattr(job_queue_module.time, "time", lambda: claimed_at + 25)
+    assert owner.heartbeat() == 1
+    monkeypatch.setattr(job_queue_module.time, "time", lambda: claimed_at + 50)
+
+    assert JobQueue(db_path, heartbeat_timeout=30).recover() == 0
+    assert owner.get(job_id)["status"] == RUNNING
+
+
+def test_old_queue_files_gain_ownership_columns(tmp_path):
+    db_path = str(tmp_path / "jobs.sqlite3")
+    db = sqlite3.connect(db_path)
+    db.execute(
+        """CREATE TABLE jobs (id TEXT PRIMARY KEY, tenant TEXT NOT NULL, status TEXT NOT NULL,
+           files TEXT NOT NULL, progress TEXT NOT NULL, error TEXT, attempts INTEGER NOT NULL DEFAULT 0,
+           created_at REAL NOT NULL, started_at REAL, finished_at REAL)"""
+    )
+    db.execute("INSERT INTO jobs (id, tenant, status, files, progress, attempts, created_at) "
+               "VALUES ('old', 'default', 'running', '[]', '{\"files\": []}', 1, 0)")
+    db.commit()
+    db.close()
+
+    # Running jobs written without a heartbeat are treated as abandoned
+    assert JobQueue(db_path).recover() == 1
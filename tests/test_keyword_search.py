@@ -0,0 +1,86 @@
+import pytest
+
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+
+from src.vector_store.chroma_db import ChromaDBHandler
+
+
+class FakeEmbeddings(Embeddings):
+    model_name = "fake-embeddings"
+
+    def embed_documents(self, texts):
+        return [self.embed_query(text) for text in texts]
+
+    def embed_query(self, text):
+        return [1.0, float(len(text) % 7), 0.5]
+
+
+def test_selective_filter_still_returns_k_hits(tmp_path):
+    store = ChromaDBHandler(str(tmp_path / "chroma"))
+    store.create_or_load(FakeEmbeddings())
+    # The PDF chunks score lowest for the query, far below the first over-fetch window
+    docs = [Document(page_content=f"invoice invoice invoice number {i}",
+                     metadata={"source": f"notes{i}.txt", "file_type": "txt"}) for i in range(60)]
+    docs += [Document(page_content=f"invoice appendix with a long unrelated tail of words {i}",
+                      metadata={"source": f"report{i}.pdf", "file_type": "pdf"}) for i in range(3)]
+    store.add_documents(docs)
+
+    hits = store.keyword_search("invoice", k=3, filters={"file_types": ["pdf"]})
+
+    assert sorted(doc.metadata["source"] for doc in hits) == ["report0.pdf", "report1.pdf", "report2.pdf"]
+    assert len(store.keyword_search("invoice", k=5, filters={"file_types": ["docx"]})) == 0
+
+
+def test_reset_swaps_in_a_new_collection(tmp_path):
+    store = ChromaDBHandler(str(tmp_path / "chroma"))
+    store.create_or_load(FakeEmbeddings())
+    store.add_documents([Document(page_content=f"invoice {i}", metadata={"source": "a.txt"}) for i in range(5)])
+    old = store.db
+
+    assert store.clear_collection() == 5
+
+    # The replacement existed before the swap; the pointer survives a reopen
+    assert store.db is not old and store.active_collection != "rag_collection"
+    assert store.stats()["chunks"] == 0 and store.keyword_search("invoice") == []
+    store.close()
+    reopened = ChromaDBHandler(str(tmp_path / "chroma"))
+    reopened.create_or_load(FakeEmbeddings())
+    assert reopened.active_collection == store.active_collection
+    assert reopened.migrated_fingerprint is None
+
+
+def test_batches_committed_before_a_crash_stay_keyword_searchable(tmp_path):
+    store = ChromaDBHandler(str(tmp_path / "chroma"))
+    store.create_or_load(FakeEmbeddings())
+
+    def crashing_stream():
+        for i in range(4):
+            yield Document(page_content=f"invoice {i}", metadata={"source": "a.txt"})
+        raise RuntimeError("worker died")
+
+    with pytest.raises(Exception):
+        store.add_documents_bulk(crashing_stream(), write_batch_size=2, embed_batch_size=2)
+    store.close()
+
+    # The re-run skips the stored chunks as existing; BM25 already holds them
+    reopened = ChromaDBHandler(str(tmp_path / "chroma"))
+    reopened.create_or_load(FakeEmbeddings())
+    stored = reopened.stats()["chunks"]
+    assert stored >= 2
+    reopened.add_documents([Document(page_content=f"invoice {i}", metadata={"source": "a.txt"}) for i in range(4)])
+    assert len(reopened.keyword_search("invoice", k=10)) == 4
+
+
+def test_index_missing_chunks_is_rebuilt_on_open(tmp_path):
+    store = ChromaDBHandler(str(tmp_path / "chroma"))
+    store.create_or_load(FakeEmbeddings())
+    store.add_documents([Document(page_content=f"invoice {i}", metadata={"source": "a.txt"}) for i in range(3)])
+    # An index saved before the last chunks were written (e.g., by an older release that crashed)
+    store.keyword_index.delete_ids([store.keyword_search("invoice", k=1)[0].metadata["doc_id"]])
+    store.keyword_index.save()
+    store.close()
+
+    reopened = ChromaDBHandler(str(tmp_path / "chroma"))
+    reopened.create_or_load(FakeEmbeddings())
+    assert len(reopened.keyword_search("invoice", k=10)) == 3
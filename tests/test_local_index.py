@@ -0,0 +1,76 @@
+import threading
+
+import numpy as np
+
+from src.vector_store.local_index import FlatIndex, HNSWGraph
+from src.vector_store.local_store import LocalCollection
+
+
+def _vectors(n, dim=16, seed=0):
+    return np.random.default_rng(seed).normal(size=(n, dim)).astype(np.float32)
+
+
+def test_quantizer_trains_in_the_background_and_reloads(tmp_path):
+    collection = LocalCollection(str(tmp_path / "c"), "c", index="flat", quantization="int8", train_size=200)
+    vectors = _vectors(300)
+    collection.upsert(ids=[f"id{i}" for i in range(300)], embeddings=vectors)
+
+    assert collection.wait_indexed(timeout=30)
+    assert collection.flat.quantizer is not None and collection.stats()["quantization"] == "int8"
+    found = collection.query(query_embeddings=[vectors[42].tolist()], n_results=1)
+    assert found["ids"] == [["id42"]]
+    collection.close()
+
+    # Reopening loads the published codes instead of training again
+    reopened = LocalCollection(str(tmp_path / "c"), "c", index="flat", quantization="int8", train_size=200)
+    assert reopened.flat.quantizer is not None and not reopened.flat.needs_training
+    reopened.close()
+
+
+def test_vectors_written_while_encoding_are_caught_up(tmp_path):
+    flat = FlatIndex(str(tmp_path / "flat"), quantization="int8", train_size=100)
+    lock = threading.RLock()
+    flat.add(_vectors(150))
+    late = _vectors(20, seed=1)
+
+    def write_during_encoding():
+        # Runs between blocks, outside the lock, like an upsert racing the indexer
+        if flat.count == 150:
+            with lock:
+                flat.add(late)
+        return False
+
+    assert flat.scorer(late[0]) is None
+    assert flat.train_quantizer(lock, should_stop=write_during_encoding)
+
+    assert flat.count == 170 and not flat.needs_training
+    expected = flat.quantizer.encode(flat.store.rows[150:170])
+    assert np.array_equal(flat.codes.rows[150:170], expected)
+    slots, _ = flat.search(late[3], k=1)
+    assert slots.tolist() == [153]
+
+
+def test_graph_searches_run_safely_during_inserts(tmp_path):
+    flat = FlatIndex(str(tmp_path / "flat"))
+    vectors = _vectors(1500, seed=2)
+    flat.add(vectors)
+    graph = HNSWGraph(flat, str(tmp_path / "hnsw.pkl"), M=8, ef_construction=32)
+    errors = []
+
+    def insert():
+        while graph.pending:
+            graph.insert_pending(limit=5)
+
+    inserter = threading.Thread(target=insert)
+    inserter.start()
+    while inserter.is_alive():
+        try:
+            graph.search(vectors[0], k=5)
+        except Exception as e:
+            errors.append(e)
+    inserter.join()
+
+    assert errors == []
+    assert graph.search(vectors[10], k=1)[0].tolist() == [10]
+    graph.save()
+    assert HNSWGraph(flat, str(tmp_path / "hnsw.pkl"), M=8).top == graph.top
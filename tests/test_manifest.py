@@ -0,0 +1,34 @@
+import json
+import os
+
+from src.vector_store.manifest import FileManifest
+
+
+def test_update_replaces_only_that_files_chunks(tmp_path):
+    manifest = FileManifest(str(tmp_path / "manifest.sqlite3"))
+    manifest.update("a.txt", "h1", ["c1", "c2", "c2"], mtime=1.0)
+    manifest.update("b.txt", "h2", ["c3"])
+
+    manifest.update("a.txt", "h3", ["c2", "c4"])
+
+    assert manifest.get("a.txt") == {"file_hash": "h3", "mtime": None, "chunks": 2}
+    assert sorted(manifest.chunk_ids("a.txt")) == ["c2", "c4"]
+    assert manifest.chunk_ids("b.txt") == ["c3"]
+    assert manifest.is_unchanged("a.txt", "h3") and not manifest.is_unchanged("b.txt", "h1")
+
+    manifest.remove("a.txt")
+    assert manifest.get("a.txt") is None and manifest.chunk_ids("a.txt") == []
+    assert manifest.sources() == ["b.txt"] and manifest.count() == 1
+
+
+def test_json_manifest_is_imported_once(tmp_path):
+    legacy = {"a.txt": {"file_hash": "h1", "mtime": 2.0, "chunk_ids": ["c1", "c2"]}}
+    (tmp_path / "manifest.json").write_text(json.dumps(legacy), encoding="utf-8")
+
+    manifest = FileManifest(str(tmp_path / "manifest.sqlite3"))
+    assert manifest.get("a.txt") == {"file_hash": "h1", "mtime": 2.0, "chunks": 2}
+    assert not os.path.exists(tmp_path / "manifest.json")
+    manifest.close()
+
+    reopened = FileManifest(str(tmp_path / "manifest.sqlite3"))
+    assert sorted(reopened.chunk_ids("a.txt")) == ["c1", "c2"]
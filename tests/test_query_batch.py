@@ -0,0 +1,135 @@
+import asyncio
+from types import SimpleNamespace
+
+from langchain_core.documents import Document
+
+from src.agents import coordinator_agent
+from src.agents.coordinator_agent import CoordinatorAgent
+from src.agents.llm_response_agent import LLMResponseAgent
+from src.cache.answer_cache import AnswerCache
+
+
+class FakeBatchRetriever:
+    """Batch retrieval stand-in that records which questions were embedded and searched."""
+
+    def __init__(self):
+        self.embedded, self.searched = [], []
+
+    def embed_queries(self, queries):
+        self.embedded.extend(queries)
+        # One-hot on the length: questions of different lengths are never semantically similar
+        return [[1.0 if i == len(query) % 32 else 0.0 for i in range(32)] for query in queries]
+
+    def dense_search_batch(self, queries, documents, query_embeddings=None, **kwargs):
+        self.searched.extend(queries)
+        return [[Document(page_content="Paris is the capital of France.", metadata={"source": "france.txt"})]
+                for _ in queries]
+
+    def complete_retrieval(self, query, dense, documents, trace_id, **kwargs):
+        return {"payload": {"top_docs": dense, "sources": ["france.txt"], "citations": ["france.txt"]}}
+
+
+class RateLimitError(Exception):
+    """Looks like the provider's HTTP 429 error, optionally with a Retry-After header."""
+
+    status_code = 429
+
+    def __init__(self, retry_after=None):
+        super().__init__("Too many requests")
+        self.response = SimpleNamespace(headers={"retry-after": retry_after} if retry_after else {})
+
+
+class ThrottledLLM:
+    """Fails the first `throttled` calls with a 429, then answers."""
+
+    def __init__(self, throttled=0, retry_after=None):
+        self.throttled = throttled
+        self.retry_after = retry_after
+        self.calls = 0
+
+    def invoke(self, messages):
+        self.calls += 1
+        if self.calls <= self.throttled:
+            raise RateLimitError(self.retry_after)
+        return SimpleNamespace(content="Paris.")
+
+
+def _run_batch(coordinator, queries, **kwargs):
+    async def collect():
+        return [message async for message in coordinator.handle_queries(queries, **kwargs)]
+
+    return asyncio.run(collect())
+
+
+def _coordinator(llm, retriever=None, answer_cache=None):
+    return CoordinatorAgent(retrieval_agent=retriever or FakeBatchRetriever(), llm_agent=LLMResponseAgent(llm=llm),
+                            answer_cache=answer_cache)
+
+
+def test_identical_questions_are_answered_once():
+    llm, retriever = ThrottledLLM(), FakeBatchRetriever()
+    queries = ["What is the capital?", "What is  the capital", "What is the capital?", "Who wrote it?"]
+
+    messages = _run_batch(_coordinator(llm, retriever), queries)
+
+    results = [m for m in messages if m["type"] == "RESULT"]
+    assert sorted(m["payload"]["index"] for m in results) == [0, 1, 2, 3]
+    assert {m["payload"]["query"] for m in results} == set(queries)
+    assert retriever.embedded == ["What is the capital?", "Who wrote it?"] == retriever.searched
+    assert llm.calls == 2
+    assert messages[-1]["type"] == "DONE" and messages[-1]["payload"]["unique"] == 2
+
+
+def test_cached_questions_skip_search_and_llm():
+    llm, retriever = ThrottledLLM(), FakeBatchRetriever()
+    coordinator = _coordinator(llm, retriever, AnswerCache())
+    _run_batch(coordinator, ["What is the capital?"])
+
+    messages = _run_batch(coordinator, ["What is the capital?", "Who wrote it?"])
+
+    cached = [m for m in messages if m["type"] == "RESULT" and m["payload"]["cached"]]
+    assert [(m["payload"]["index"], m["payload"]["cached"]) for m in cached] == [(0, "exact")]
+    assert retriever.searched == ["What is the capital?", "Who wrote it?"] and llm.calls == 2
+    assert messages[-1]["payload"]["cached"] == 1
+
+
+def test_throttled_calls_back_off_exponentially(monkeypatch):
+    delays = []
+    sleep = asyncio.sleep
+
+    async def record(delay):
+        delays.append(delay)
+        await sleep(0)
+
+    monkeypatch.setattr(coordinator_agent.asyncio, "sleep", record)
+    monkeypatch.setattr(coordinator_agent.random, "uniform", lambda low, high: high)
+    llm = ThrottledLLM(throttled=3)
+    coordinator = _coordinator(llm)
+    coordinator.batch_backoff, coordinator.batch_backoff_max = 1.0, 3.0
+
+    messages = _run_batch(coordinator, ["What is the capital?"])
+
+    assert [m["type"] for m in messages] == ["RESULT", "DONE"] and llm.calls == 4
+    # 1s, 2s, then capped at BATCH_BACKOFF_MAX_SECONDS
+    assert delays == [1.0, 2.0, 3.0]
+
+
+def test_retry_after_is_honoured_and_retries_are_bounded(monkeypatch):
+    delays = []
+    sleep = asyncio.sleep
+
+    async def record(delay):
+        delays.append(delay)
+        await sleep(0)
+
+    monkeypatch.setattr(coordinator_agent.asyncio, "sleep", record)
+    llm = ThrottledLLM(throttled=10, retry_after="7")
+    coordinator = _coordinator(llm)
+    coordinator.batch_retries = 2
+
+    messages = _run_batch(coordinator, ["What is the capital?", "Who wrote it?"])
+
+    # Each question is tried 1 + 2 times, then reported as an error without failing the batch
+    assert [m["type"] for m in messages] == ["ERROR", "ERROR", "DONE"]
+    assert llm.calls == 6 and delays == [7.0] * 4
+    assert messages[-1]["payload"]["failed"] == 2
@@ -0,0 +1,132 @@
+import asyncio
+import json
+from types import SimpleNamespace
+
+import pytest
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+
+from src.agents.coordinator_agent import CoordinatorAgent
+from src.agents.llm_response_agent import LLMResponseAgent
+from src.vector_store.fingerprint import EmbeddingMismatchError
+
+ANSWER_TOKENS = ["Paris ", "is the ", "capital."]
+
+
+class FakeEmbeddings(Embeddings):
+    model_name = "fake-embeddings"
+
+    def embed_documents(self, texts):
+        return [self.embed_query(text) for text in texts]
+
+    def embed_query(self, text):
+        return [1.0, float(len(text) % 7), 0.5]
+
+
+class FakeStreamingLLM:
+    """Chat model stand-in: astream yields ANSWER_TOKENS as message chunks."""
+
+    def __init__(self):
+        self.calls = 0
+
+    async def astream(self, messages):
+        self.calls += 1
+        for token in ANSWER_TOKENS:
+            await asyncio.sleep(0)
+            yield SimpleNamespace(content=token)
+
+    def invoke(self, messages):
+        self.calls += 1
+        return SimpleNamespace(content="".join(ANSWER_TOKENS))
+
+
+class FakeRetriever:
+    def retrieve_context(self, query, documents, trace_id, **kwargs):
+        doc = Document(page_content="Paris is the capital of France.", metadata={"source": "france.txt", "page": 1})
+        return {"payload": {"top_docs": [doc], "sources": ["france.txt"], "citations": ["france.txt (p. 1)"]}}
+
+
+def _events(body: str) -> list:
+    return [json.loads(line[len("data: "):]) for line in body.splitlines() if line.startswith("data: ")]
+
+
+def test_stream_query_sends_sources_tokens_and_done():
+    llm = FakeStreamingLLM()
+    coordinator = CoordinatorAgent(retrieval_agent=FakeRetriever(), llm_agent=LLMResponseAgent(llm=llm))
+
+    async def collect():
+        return [message async for message in coordinator.stream_query("What is the capital of France?")]
+
+    messages = asyncio.run(collect())
+
+    assert [m["type"] for m in messages] == ["SOURCES"] + ["TOKEN"] * len(ANSWER_TOKENS) + ["DONE"]
+    assert messages[0]["payload"]["citations"] == ["france.txt (p. 1)"]
+    assert "".join(m["payload"]["token"] for m in messages if m["type"] == "TOKEN") == "".join(ANSWER_TOKENS)
+    assert messages[-1]["payload"]["context"] is not None
+    assert llm.calls == 1
+
+
+@pytest.fixture(scope="module")
+def api(tmp_path_factory):
+    # The API builds its components at import time: point them at temp dirs and fake models first
+    root = tmp_path_factory.mktemp("api")
+    with pytest.MonkeyPatch.context() as patch:
+        patch.setenv("CHROMA_DIR", str(root / "chroma"))
+        patch.setenv("UPLOAD_DIR", str(root / "uploads"))
+        patch.setenv("JOBS_DB", str(root / "jobs.sqlite3"))
+        patch.setenv("EXTRACTION_CACHE_DIR", str(root / "extraction_cache"))
+        patch.setenv("RERANK_ENABLED", "false")
+        patch.setenv("ANSWER_CACHE_ENABLED", "false")
+
+        from src.registry import registry
+        registry.reset()
+        registry._embedding_agent = SimpleNamespace(embedding_model=FakeEmbeddings())
+        registry._llm = FakeStreamingLLM()
+
+        from fastapi.testclient import TestClient
+        import api.main as main
+
+        main.tenants.get().vector_store.add_documents(
+            [Document(page_content="Paris is the capital of France.", metadata={"source": "france.txt"})]
+        )
+        yield main, TestClient(main.app)
+        main.executor.shutdown()
+        main.tenants.close_all()
+        registry.reset()
+
+
+def test_query_stream_endpoint_streams_llm_tokens(api):
+    main, client = api
+
+    response = client.post("/query/stream", json={"query": "What is the capital of France?"})
+
+    assert response.status_code == 200
+    events = _events(response.text)
+    assert [e["type"] for e in events] == ["SOURCES"] + ["TOKEN"] * len(ANSWER_TOKENS) + ["DONE"]
+    assert events[0]["sources"] == ["france.txt"]
+    assert "".join(e["token"] for e in events if e["type"] == "TOKEN") == "".join(ANSWER_TOKENS)
+    assert main.tenants.get().leases == 0
+
+
+def test_query_stream_maps_errors_like_query(api, monkeypatch):
+    main, client = api
+
+    def mismatched(tenant):
+        raise EmbeddingMismatchError("The collection was embedded with another model.")
+
+    monkeypatch.setattr(main.tenants, "acquire", mismatched)
+
+    assert client.post("/query", json={"query": "anything"}).status_code == 409
+    assert client.post("/query/stream", json={"query": "anything"}).status_code == 409
+    assert client.post("/query/batch", json={"queries": ["anything"]}).status_code == 409
+
+
+def test_query_batch_endpoint_releases_workspace(api):
+    main, client = api
+
+    response = client.post("/query/batch", json={"queries": ["What is the capital of France?"] * 2})
+
+    events = _events(response.text)
+    assert [e["type"] for e in events] == ["RESULT", "RESULT", "DONE"]
+    assert {e["answer"] for e in events[:2]} == {"".join(ANSWER_TOKENS).strip()}
+    assert main.tenants.get().leases == 0
@@ -0,0 +1,90 @@
+from langchain_core.documents import Document
+
+from src.agents import reranker as reranker_module
+from src.agents.reranker import CrossEncoderReranker
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def perf_counter(self):
+        return self.now
+
+
+class FakeCrossEncoder:
+    """Scores pairs by the number in the chunk text; each call costs `costs[i]` ms per pair."""
+
+    def __init__(self, clock, costs, default_ms=1.0):
+        self.clock = clock
+        self.costs = list(costs)
+        self.default_ms = default_ms
+        self.calls = 0
+
+    def predict(self, pairs, batch_size=16):
+        cost = self.costs[self.calls] if self.calls < len(self.costs) else self.default_ms
+        self.calls += 1
+        self.clock.now += cost * len(pairs) / 1000
+        return [float(text.split()[-1]) for _, text in pairs]
+
+
+def _candidates(n):
+    return [Document(page_content=f"chunk {i}", metadata={"doc_id": f"c{i}"}) for i in range(n)]
+
+
+def _reranker(monkeypatch, costs, **kwargs):
+    clock = FakeClock()
+    monkeypatch.setattr(reranker_module.time, "perf_counter", clock.perf_counter)
+    model = FakeCrossEncoder(clock, costs)
+    options = {"batch_size": 8, "budget_ms": 100, "cache_size": 1000, "probe_every": 3}
+    options.update(kwargs)
+    return CrossEncoderReranker(model=model, **options), model
+
+
+def test_slow_first_call_does_not_disable_reranking(monkeypatch):
+    # Warm-up costs 1s per pair, far beyond the budget; later calls take 1ms per pair
+    reranker, model = _reranker(monkeypatch, costs=[1000.0])
+
+    results = [reranker.rerank(f"question {i}", _candidates(20), top_n=3) for i in range(5)]
+
+    # Uncalibrated calls score one batch; once the cost is known all 20 candidates fit
+    assert [doc.metadata["doc_id"] for doc in results[0]] == ["c7", "c6", "c5"]
+    assert [doc.metadata["doc_id"] for doc in results[-1]] == ["c19", "c18", "c17"]
+    assert reranker.skipped == 0
+    assert model.calls == 5
+
+
+def test_probe_recovers_after_a_slow_spike(monkeypatch):
+    # Warm-up, one normal call, then a spike that pushes the estimate over budget
+    reranker, model = _reranker(monkeypatch, costs=[1.0, 1.0, 5000.0])
+    for i in range(3):
+        reranker.rerank(f"question {i}", _candidates(20), top_n=3)
+
+    skipped_before = reranker.skipped
+    results = [reranker.rerank(f"later {i}", _candidates(20), top_n=3) for i in range(40)]
+
+    assert reranker.skipped > skipped_before
+    # Probes re-measure the (fast again) model until reranking is affordable for good
+    assert all("rerank_score" in doc.metadata for doc in results[-1])
+    assert [doc.metadata["doc_id"] for doc in results[-1]] == ["c19", "c18", "c17"]
+
+
+def test_skipped_query_keeps_first_stage_order(monkeypatch):
+    reranker, _ = _reranker(monkeypatch, costs=[1.0, 1000.0], probe_every=100)
+    reranker.rerank("warm up", _candidates(20), top_n=3)
+    reranker.rerank("slow", _candidates(20), top_n=3)
+
+    result = reranker.rerank("over budget", _candidates(20), top_n=3)
+
+    assert reranker.skipped == 1
+    assert [doc.metadata["doc_id"] for doc in result] == ["c0", "c1", "c2"]
+
+
+def test_caller_documents_are_not_modified(monkeypatch):
+    reranker, _ = _reranker(monkeypatch, costs=[])
+    candidates = _candidates(10)
+
+    result = reranker.rerank("question", candidates, top_n=3)
+
+    assert all("rerank_score" in doc.metadata for doc in result)
+    assert all("rerank_score" not in doc.metadata for doc in candidates)
@@ -0,0 +1,258 @@
+import io
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+
+from src.jobs.job_queue import FAILED
+from src.registry import ComponentRegistry
+from src.tenants import MigrationRunningError, TenantManager
+
+
+class FakeEmbeddings(Embeddings):
+    def __init__(self, model_name, dim):
+        self.model_name = model_name
+        self.dim = dim
+
+    def embed_documents(self, texts):
+        return [self.embed_query(text) for text in texts]
+
+    def embed_query(self, text):
+        return [1.0] + [float((len(text) + i) % 7) for i in range(self.dim - 1)]
+
+
+CONFIGURED = FakeEmbeddings("fake-small", 3)
+TARGET = FakeEmbeddings("fake-large", 5)
+
+
+@pytest.fixture(autouse=True)
+def job_queue_path(tmp_path, monkeypatch):
+    # Clearing a tenant cancels its jobs in the registry's job queue
+    monkeypatch.setenv("JOBS_DB", str(tmp_path / "jobs.sqlite3"))
+    monkeypatch.setenv("EXTRACTION_CACHE_ENABLED", "false")
+
+
+def _manager(tmp_path, max_open=16, embeddings=CONFIGURED):
+    # A registry holding the fake models, as a restarted process would build it
+    registry = ComponentRegistry()
+    registry._embedding_agent = SimpleNamespace(embedding_model=embeddings)
+    registry._migration_models[("fake-large", None)] = TARGET
+    registry._tenants = TenantManager(registry, str(tmp_path / "chroma"), str(tmp_path / "uploads"), max_open=max_open)
+    return registry._tenants
+
+
+def _migrate(manager, tenant):
+    manager.migrate_embeddings(tenant, "fake-large", duty_cycle=1.0)
+    return _migrate_status(manager, tenant)
+
+
+def _migrate_status(manager, tenant):
+    # Waits for the tenant's migration to end
+    for _ in range(200):
+        status = manager.migration_status(tenant)
+        if status["state"] != "running":
+            return status
+        time.sleep(0.05)
+    raise AssertionError("migration did not finish")
+
+
+def test_migrated_tenant_reopens_with_the_migrated_model(tmp_path):
+    manager = _manager(tmp_path)
+    store = manager.get("acme").vector_store
+    store.add_documents([Document(page_content=f"invoice {i}", metadata={"source": "a.txt"}) for i in range(5)])
+
+    assert _migrate(manager, "acme")["state"] == "done"
+    assert store.embeddings is TARGET and store.stats()["chunks"] == 5
+    manager.close_all()
+
+    restarted = _manager(tmp_path).get("acme").vector_store
+    assert restarted.fingerprint_mismatch is None and restarted.embeddings is TARGET
+    assert len(restarted.similarity_search("invoice", k=5)) == 5
+
+
+def test_reset_after_a_migration_survives_a_restart(tmp_path):
+    manager = _manager(tmp_path)
+    store = manager.get("acme").vector_store
+    store.add_documents([Document(page_content=f"invoice {i}", metadata={"source": "a.txt"}) for i in range(5)])
+    _migrate(manager, "acme")
+
+    assert manager.clear("acme") == 5
+    manager.close_all()
+
+    # The empty collection still belongs to the migrated model: no mismatch (409) after a restart
+    restarted = _manager(tmp_path).get("acme").vector_store
+    assert restarted.fingerprint_mismatch is None and restarted.embeddings is TARGET
+    restarted.add_documents([Document(page_content="invoice again", metadata={"source": "b.txt"})])
+    assert restarted.stats()["chunks"] == 1
+
+
+def test_second_migration_is_refused_while_the_first_loads_its_model(tmp_path):
+    manager = _manager(tmp_path)
+    manager.get("acme").vector_store.add_documents([Document(page_content="invoice", metadata={"source": "a.txt"})])
+    loading, release = threading.Event(), threading.Event()
+    load = manager.registry.get_migration_model
+
+    def slow_load(model_name, backend=None):
+        loading.set()
+        release.wait(5)
+        return load(model_name, backend)
+
+    manager.registry.get_migration_model = slow_load
+    first = threading.Thread(target=manager.migrate_embeddings, args=("acme", "fake-large"), kwargs={"duty_cycle": 1.0})
+    first.start()
+    assert loading.wait(5)
+
+    with pytest.raises(MigrationRunningError):
+        manager.migrate_embeddings("acme", "fake-large")
+    release.set()
+    first.join(5)
+    assert _migrate_status(manager, "acme")["state"] == "done"
+
+
+def test_failed_model_load_frees_the_reservation(tmp_path):
+    manager = _manager(tmp_path)
+    workspace = manager.get("acme")
+    load = manager.registry.get_migration_model
+
+    def failing_load(model_name, backend=None):
+        raise OSError(f"{model_name} not found")
+
+    manager.registry.get_migration_model = failing_load
+    with pytest.raises(Exception):
+        manager.migrate_embeddings("acme", "missing-model")
+    assert manager.migration_status("acme") is None and workspace.leases == 0
+
+    manager.registry.get_migration_model = load
+    assert _migrate(manager, "acme")["state"] == "done"
+
+
+class GatedEmbeddings(FakeEmbeddings):
+    """Blocks document embedding until `gate` is set, so a job stays running."""
+
+    def __init__(self):
+        super().__init__("fake-small", 3)
+        self.entered, self.gate = threading.Event(), threading.Event()
+
+    def embed_documents(self, texts):
+        self.entered.set()
+        self.gate.wait(5)
+        return super().embed_documents(texts)
+
+
+def test_clear_cancels_queued_and_running_jobs_before_resetting(tmp_path):
+    embeddings = GatedEmbeddings()
+    manager = _manager(tmp_path, embeddings=embeddings)
+    workers = manager.registry.get_job_workers()
+    job_queue = manager.registry.get_job_queue()
+    uploads = manager.get("acme").uploads
+    jobs = []
+    for run, name in (("run1", "a.txt"), ("run2", "b.txt")):
+        record = uploads.save(io.BytesIO(f"invoice {name} ".encode() * 50), name, snapshot=run)
+        jobs.append(job_queue.enqueue("acme", [record["snapshot"]], {record["snapshot"]: record["sha256"]}))
+
+    workers.start()
+    try:
+        workers.notify()
+        assert embeddings.entered.wait(5)
+        threading.Timer(0.2, embeddings.gate.set).start()
+        manager.clear("acme")
+    finally:
+        embeddings.gate.set()
+        workers.stop()
+
+    # The running job stopped (and discarded its chunks) before the reset; the queued one never ran
+    for job_id in jobs:
+        job = job_queue.get(job_id)
+        assert job["status"] == FAILED and job["error"].startswith("Cancelled")
+    assert job_queue.get(jobs[1])["started_at"] is None
+    assert manager.get("acme").vector_store.stats()["chunks"] == 0
+
+
+def test_tenants_do_not_see_each_others_documents(tmp_path):
+    manager = _manager(tmp_path)
+    for tenant in ("acme", "globex"):
+        manager.get(tenant).vector_store.add_documents(
+            [Document(page_content=f"{tenant} invoice {i}", metadata={"source": f"{tenant}.txt"}) for i in range(3)]
+        )
+
+    hits = manager.get("acme").vector_store.keyword_search("invoice", k=10)
+    assert {doc.metadata["source"] for doc in hits} == {"acme.txt"}
+
+    assert manager.clear("acme") == 3
+    assert manager.stats("acme")["chunks"] == 0 and manager.stats("globex")["chunks"] == 3
+    assert manager.known_tenants() == ["acme", "default", "globex"]
+
+
+def test_leased_workspace_is_not_evicted_until_released(tmp_path):
+    manager = _manager(tmp_path, max_open=2)
+    manager.get()                       # The default workspace is never evicted
+    leased = manager.acquire("acme")
+    manager.get("globex")
+
+    # Over the limit, but "acme" is in use and "globex" was just used
+    assert manager.is_open("acme") and manager.is_open("globex")
+
+    manager.release(leased)
+    assert not manager.is_open("acme") and manager.is_open("globex") and manager.is_open("default")
+    # Reopening reads the same collection back
+    assert manager.get("acme").vector_store.active_collection == "tenant_acme"
+
+
+def test_concurrent_callers_share_one_open(tmp_path):
+    manager = _manager(tmp_path)
+    opening, release = threading.Event(), threading.Event()
+    open_workspace, opened = manager._open_workspace, []
+
+    def slow_open(tenant):
+        opened.append(tenant)
+        if tenant == "acme":
+            opening.set()
+            release.wait(5)
+        return open_workspace(tenant)
+
+    manager._open_workspace = slow_open
+    results = []
+    callers = [threading.Thread(target=lambda: results.append(manager.get("acme"))) for _ in range(3)]
+    for caller in callers:
+        caller.start()
+    assert opening.wait(5)
+    # Another tenant opens meanwhile: a slow open only delays its own tenant
+    assert manager.get("default").name == "default"
+    release.set()
+    for caller in callers:
+        caller.join(5)
+
+    assert opened == ["acme", "default"] and len(results) == 3
+    assert all(workspace is results[0] for workspace in results)
+
+
+def test_evicted_tenant_is_reopened_only_after_its_close(tmp_path):
+    manager = _manager(tmp_path, max_open=1)
+    evicted = manager.get("acme")
+    closing, release, events = threading.Event(), threading.Event(), []
+    close = evicted.vector_store.close
+
+    def slow_close():
+        closing.set()
+        release.wait(5)
+        events.append("closed")
+        close()
+
+    evicted.vector_store.close = slow_close
+    evictor = threading.Thread(target=manager.get, args=("globex",))
+    evictor.start()
+    assert closing.wait(5)
+
+    reopener = threading.Thread(target=lambda: events.append(manager.get("acme")))
+    reopener.start()
+    time.sleep(0.1)
+    assert events == []                 # Still waiting for the close
+    release.set()
+    evictor.join(5)
+    reopener.join(5)
+
+    assert events[0] == "closed" and events[1] is not evicted
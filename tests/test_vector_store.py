@@ -0,0 +1,116 @@
+import pytest
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+
+from src.vector_store.chroma_db import ChromaDBHandler
+from src.vector_store.local_store import LocalVectorStore
+
+
+class CountingEmbeddings(Embeddings):
+    model_name = "fake-embeddings"
+
+    def __init__(self):
+        self.embedded = 0
+
+    def embed_documents(self, texts):
+        self.embedded += len(texts)
+        return [self.embed_query(text) for text in texts]
+
+    def embed_query(self, text):
+        return [1.0, float(len(text) % 7), 0.5]
+
+
+@pytest.fixture(params=[ChromaDBHandler, LocalVectorStore], ids=["chroma", "local"])
+def store(request, tmp_path):
+    handler = request.param(str(tmp_path / "store"))
+    handler.create_or_load(CountingEmbeddings())
+    yield handler
+    handler.close()
+
+
+def _pages(texts, source="report.pdf", ingested_at=1):
+    return [Document(page_content=text, metadata={"source": source, "page": page, "page_end": page,
+                                                  "chunk_index": page - 1, "ingested_at": ingested_at})
+            for page, text in enumerate(texts, start=1)]
+
+
+def _stored(store, source="report.pdf"):
+    found = store.db._collection.get(where={"source": source}, include=["documents", "metadatas"])
+    return {text: meta for text, meta in zip(found["documents"], found["metadatas"])}
+
+
+def test_reingested_file_with_inserted_page_updates_unchanged_chunks(store):
+    store.add_documents(_pages(["Intro text.", "Revenue grew.", "Outlook is stable."]))
+    embedded_before = store.embeddings.embedded
+
+    # A page inserted at the front shifts every unchanged chunk by one
+    store.add_documents(_pages(["New summary.", "Intro text.", "Revenue grew.", "Outlook is stable."], ingested_at=2))
+
+    stored = _stored(store)
+    assert {text: meta["page"] for text, meta in stored.items()} == {
+        "New summary.": 1, "Intro text.": 2, "Revenue grew.": 3, "Outlook is stable.": 4,
+    }
+    assert {meta["chunk_index"] for meta in stored.values()} == {0, 1, 2, 3}
+    assert {meta["ingested_at"] for meta in stored.values()} == {2}
+    # Only the new chunk was embedded
+    assert store.embeddings.embedded == embedded_before + 1
+
+
+def test_reingest_removes_metadata_keys_the_new_version_lacks(store):
+    store.add_documents(_pages(["Intro text."]))
+
+    store.add_documents([Document(page_content="Intro text.", metadata={"source": "report.pdf", "page": 5})])
+
+    meta = _stored(store)["Intro text."]
+    assert meta["page"] == 5 and "page_end" not in meta and "chunk_index" not in meta
+
+
+def _ingest(store, source, count):
+    # Stores `count` chunks of one file and records it in the manifest, like a finished ingestion
+    store.add_documents([Document(page_content=f"{source} invoice {i}", metadata={"source": source})
+                         for i in range(count)])
+    ids = store.db._collection.get(where={"source": source}, include=[])["ids"]
+    store.commit_file(source, f"hash-{source}", ids)
+
+
+@pytest.mark.parametrize("mode", ["reset", "paged"])
+def test_clear_collection_empties_vectors_keywords_and_manifest(store, mode):
+    _ingest(store, "a.txt", 5)
+    _ingest(store, "b.txt", 3)
+    changes = []
+    store.add_change_listener(lambda: changes.append(True))
+    collection = store.active_collection
+
+    assert store.clear_collection(mode=mode, page_size=2) == 8
+
+    # "reset" swaps in a new collection, "paged" keeps the same one
+    assert (store.active_collection != collection) == (mode == "reset")
+    assert store.db._collection.count() == 0 and store.keyword_search("invoice") == []
+    assert not store.file_unchanged("a.txt", "hash-a.txt") and changes
+    assert store.fingerprint_mismatch is None
+
+    # The cleared store takes new documents; a reopened handler finds the same collection
+    _ingest(store, "c.txt", 2)
+    active = store.active_collection
+    store.close()
+    reopened = type(store)(store.persist_directory)
+    reopened.create_or_load(CountingEmbeddings())
+    assert reopened.active_collection == active and reopened.db._collection.count() == 2
+    reopened.close()
+
+
+def test_delete_by_source_removes_only_that_file(store):
+    _ingest(store, "a.txt", 5)
+    _ingest(store, "b.txt", 3)
+    changes = []
+    store.add_change_listener(lambda: changes.append(True))
+
+    assert store.delete_by_source("a.txt", page_size=2) == 5
+
+    assert set(_stored(store, "a.txt")) == set() and len(_stored(store, "b.txt")) == 3
+    assert {doc.metadata["source"] for doc in store.keyword_search("invoice", k=10)} == {"b.txt"}
+    assert store.manifest.get("a.txt") is None and store.file_unchanged("b.txt", "hash-b.txt")
+    assert len(changes) == 1
+
+    # Nothing to delete: no change notification
+    assert store.delete_by_source("missing.txt") == 0 and len(changes) == 1
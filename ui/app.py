@@ -2,9 +2,11 @@
 import streamlit as st
 import requests
 import json
+import time
 
 # --- Configuration ---
 API_URL = "http://127.0.0.1:8000" # URL of your FastAPI backend
+JOB_POLL_SECONDS = 1.0            # How often upload job progress is refreshed
 
 # --- Page Configuration ---
 st.set_page_config(
@@ -70,6 +72,10 @@ if "extracted_text" not in st.session_state:
 
 # --- Sidebar for File Upload and Control ---
 with st.sidebar:
+    # Each workspace has its own documents; requests name it with the X-Tenant-ID header
+    workspace = st.text_input("Workspace", value="default", help="Documents and questions are scoped to this workspace.")
+    headers = {"X-Tenant-ID": workspace.strip() or "default"}
+
     st.subheader("Your Documents")
     uploaded_files = st.file_uploader(
         "Upload your documents (PDF, DOCX, CSV, TXT, etc.) and click 'Process'", 
@@ -78,23 +84,48 @@ with st.sidebar:
 
     if st.button("Process"):
         if uploaded_files:
-            with st.spinner("Processing documents... This may take a moment."):
-                files_to_upload = []
-                for uploaded_file in uploaded_files:
-                    files_to_upload.append(
-                        ("files", (uploaded_file.name, uploaded_file.getvalue(), uploaded_file.type))
-                    )
-                
-                try:
-                    response = requests.post(f"{API_URL}/upload-and-process", files=files_to_upload)
-                    if response.status_code == 200:
+            files_to_upload = []
+            for uploaded_file in uploaded_files:
+                # Pass the file object itself rather than a getvalue() copy of its bytes
+                uploaded_file.seek(0)
+                files_to_upload.append(
+                    ("files", (uploaded_file.name, uploaded_file, uploaded_file.type))
+                )
+
+            try:
+                # The upload only queues a background job; progress is polled below
+                with st.spinner("Uploading documents..."):
+                    response = requests.post(f"{API_URL}/upload-and-process", files=files_to_upload, headers=headers)
+                if response.status_code == 200:
+                    # Every file was already indexed with identical content: nothing to process
+                    st.success(response.json()["message"])
+                elif response.status_code == 202:
+                    job_id = response.json()["job_id"]
+                    progress_bar = st.progress(0.0, text="Queued...")
+                    while True:
+                        job = requests.get(f"{API_URL}/jobs/{job_id}", headers=headers).json()
+                        stages = ", ".join(f"{f['filename']}: {f['stage']}" for f in job["files"])
+                        progress_bar.progress(
+                            job["files_done"] / max(job["files_total"], 1),
+                            text=f"{job['status'].capitalize()} - {job['chunks']} chunks stored ({stages})"
+                        )
+                        if job["status"] in ("done", "failed"):
+                            break
+                        time.sleep(JOB_POLL_SECONDS)
+
+                    if job["status"] == "done":
                         st.success("Documents processed successfully!")
-                        # Store extracted text in session state
-                        st.session_state.extracted_text = response.json().get("extracted_text", "")
                     else:
-                        st.error(f"Error: {response.status_code} - {response.text}")
-                except requests.exceptions.RequestException as e:
-                    st.error(f"Could not connect to the backend: {e}")
+                        st.error(f"Processing failed: {job['error']}")
+                    # Files that failed to parse are reported individually
+                    for failed in job.get("failed_files", []):
+                        st.warning(f"Could not process {failed['filename']}: {failed['error']}")
+                    # Store extracted text in session state
+                    st.session_state.extracted_text = job.get("extracted_text") or ""
+                else:
+                    st.error(f"Error: {response.status_code} - {response.text}")
+            except requests.exceptions.RequestException as e:
+                st.error(f"Could not connect to the backend: {e}")
         else:
             st.warning("Please upload at least one document.")
     
@@ -106,12 +137,12 @@ with st.sidebar:
         disabled=True
     )
     
-    if st.button("Clear All Data & Chat"):
-        with st.spinner("Clearing all data..."):
+    if st.button("Clear Workspace Data & Chat"):
+        with st.spinner("Clearing workspace data..."):
             try:
-                response = requests.post(f"{API_URL}/clear")
+                response = requests.post(f"{API_URL}/clear", headers=headers)
                 if response.status_code == 200:
-                    st.success("All data and chat history cleared!")
+                    st.success("Workspace data and chat history cleared!")
                     # Clear session state
                     st.session_state.chat_history = []
                     st.session_state.extracted_text = ""
@@ -139,21 +170,33 @@ if user_question:
     with st.chat_message("user"):
         st.write(user_template.replace("{{MSG}}", user_question), unsafe_allow_html=True)
     
-    # Get bot response
-    with st.spinner("Thinking..."):
+    # Get bot response, rendering tokens as they stream in
+    with st.chat_message("bot"):
+        placeholder = st.empty()
+        placeholder.write(bot_template.replace("{{MSG}}", "Thinking..."), unsafe_allow_html=True)
+        bot_response = ""
         try:
-            response = requests.post(f"{API_URL}/query", json={"query": user_question})
-            if response.status_code == 200:
-                bot_response = response.json()["answer"]
-                # Add bot response to history and display it
-                st.session_state.chat_history.append({"role": "bot", "content": bot_response})
-                with st.chat_message("bot"):
-                    st.write(bot_template.replace("{{MSG}}", bot_response), unsafe_allow_html=True)
-            else:
-                error_msg = f"Error from API: {response.text}"
-                st.error(error_msg)
-                st.session_state.chat_history.append({"role": "bot", "content": error_msg})
+            with requests.post(f"{API_URL}/query/stream", json={"query": user_question}, headers=headers, stream=True) as response:
+                if response.status_code == 200:
+                    for line in response.iter_lines(decode_unicode=True):
+                        # Server-Sent Events: each event is a "data: {...}" line
+                        if not line or not line.startswith("data: "):
+                            continue
+                        event = json.loads(line[len("data: "):])
+
+                        if event["type"] == "TOKEN":
+                            bot_response += event["token"]
+                            placeholder.write(bot_template.replace("{{MSG}}", bot_response), unsafe_allow_html=True)
+                        elif event["type"] == "ERROR":
+                            bot_response = f"Error from API: {event['detail']}"
+                            st.error(bot_response)
+                            break
+                else:
+                    bot_response = f"Error from API: {response.text}"
+                    st.error(bot_response)
         except requests.exceptions.RequestException as e:
-            error_msg = f"Could not get a response from the backend: {e}"
-            st.error(error_msg)
-            st.session_state.chat_history.append({"role": "bot", "content": error_msg})
\ No newline at end of file
+            bot_response = f"Could not get a response from the backend: {e}"
+            st.error(bot_response)
+
+    # Add bot response to history
+    st.session_state.chat_history.append({"role": "bot", "content": bot_response})